@@ -6,30 +6,71 @@
 # 0
 import numpy as np
 from scipy import interpolate, stats
-from _classic.hubdc.core import *
 
-def DASF_retrieval(inputFile, outputName, secondoutputName, thirdoutputName):
+from enmapboxprocessing.driver import Driver
+from enmapboxprocessing.rasterreader import RasterReader
+from qgis.core import Qgis
+
+
+def linregress_block(x, y):
+
+	# ...
+	# Closed-form least squares along the first (band) axis, giving the same results as scipy.stats.linregress
+	# applied to every single pixel profile.
+	#
+	# param x: independent variable as (bands, rows, columns) array
+	# param y: dependent variable as (bands, rows, columns) array
+	# return: slope, intercept, r_value, p_value and std_err as (rows, columns) arrays
+	# ...
+
+	n = x.shape[0]
+	xmean = x.mean(axis=0)
+	ymean = y.mean(axis=0)
+	dx = x - xmean
+	dy = y - ymean
+	ssxm = np.mean(dx * dx, axis=0)
+	ssym = np.mean(dy * dy, axis=0)
+	ssxym = np.mean(dx * dy, axis=0)
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		r_value = ssxym / np.sqrt(ssxm * ssym)
+		degenerate = (ssxm == 0) | (ssym == 0) # the denominator would be 0
+		r_value[degenerate] = np.where(ssxym[degenerate] == 0, np.nan, 0.)
+		r_value = np.clip(r_value, -1., 1.) # numerical error propagation
+
+		slope = ssxym / ssxm
+		intercept = ymean - slope * xmean
+		if n == 2:
+			p_value = np.where(y[0] == y[1], 1., 0.)
+			std_err = np.zeros_like(slope)
+		else:
+			df = n - 2
+			TINY = 1.0e-20
+			t = r_value * np.sqrt(df / ((1.0 - r_value + TINY) * (1.0 + r_value + TINY)))
+			p_value = 2 * stats.t.sf(np.abs(t), df)
+			std_err = np.sqrt((1 - r_value ** 2) * ssym / ssxm / df)
+
+	return slope, intercept, r_value, p_value, std_err
+
+
+def DASF_retrieval(inputFile, outputName, secondoutputName, thirdoutputName, feedback=None):
 
 	# ...
 	# This function derives the directional area scattering factor or DASF function for vegetation canopy with dark background
 	# or sufficiently dense vegetation where the impact of canopy background is negligible.
+	# The image is processed block-wise, so the memory usage is bounded independent of the image size.
 	#
 	# param inputFile: input raster file
 	# param outputFile: name of the outputFile
+	# param feedback: optional processing feedback for progress reporting
 	# ...
 
 
 # 1 open datasets
-	Data = openRasterDataset(filename= inputFile)
-	GridData = Data.grid() # set the Grid to
+	reader = RasterReader(inputFile)
 
-	BRFs = Data.readAsArray()
-	mask_BRFs = BRFs == 0 # mask of 0 values to avoid future error later
-	BRFs[mask_BRFs] = 99999 # apply the mask
-
-	# get single item (list with wavelength casted to float), must be in .hdr file
-	banddata = Data.metadataItem(key='wavelength', domain='ENVI', dtype=float)
-	WL = np.array(banddata) # convert to ndarray
+	# wavelength (in nanometers) must be available for all bands
+	WL = np.array([reader.wavelength(bandNo) for bandNo in reader.bandNumbers()], dtype=float)
 
 	# Set pre-calculated reference Albedo using PROSPECT and the parameters given by Knyazikhin et al. (2012)
 	albedo = np.array ([0.519116253197260,0.543791042621256,0.567102210319844,0.589290220472722,0.610242046668829,
@@ -58,48 +99,44 @@ def DASF_retrieval(inputFile, outputName, secondoutputName, thirdoutputName):
 	wl_albedo = np.arange(700,801,1)
 
 # 2 Interpolation of the Albedo to the Spectrum's wavelength
-	albedo_interp = []
 	# method = linear, fill_value 'extraoplate' allows x_new blow the interpolation range to be extrapolated
 	f = interpolate.interp1d(wl_albedo, albedo, fill_value = "extrapolate")
-	albedo_interp.append(f(WL))
+	albedo_interp = f(WL).reshape((-1, 1, 1))
 
-# 3a Ratio calculation using BRFs and reference albedo
-	a = Data.yprofile(column=Column(x=1, z=0))
-	b = Data.xprofile(row=Row(y=1, z=0))
-	c = Data.zprofile(pixel=Pixel(x=1, y=1))
+	# create outputs
+	writerDASF = Driver(outputName, feedback=feedback).createLike(reader, Qgis.DataType.Float64, 1)
+	writerQuality = Driver(secondoutputName, feedback=feedback).createLike(reader, Qgis.DataType.Float64, 2)
+	writerCSC = Driver(thirdoutputName, feedback=feedback).createLike(reader, Qgis.DataType.Float64)
 
-	ratio = np.empty((len(c),len(a),len(b)))
+	# memory usage: BRFs, ratio, CSC and temporary deviations (float64) for all bands
+	pixelMemoryUsage = reader.pixelMemoryUsage(reader.bandCount() * 5, 8)
+	blockSizeX, blockSizeY = reader.blockSize(pixelMemoryUsage)
+	for block in reader.walkGrid(blockSizeX, blockSizeY, feedback):
+		BRFs = np.array(reader.arrayFromBlock(block), dtype=np.float64)
+		mask_BRFs = BRFs == 0 # mask of 0 values to avoid future error later
+		BRFs[mask_BRFs] = 99999 # apply the mask
 
-	for x in range(len(a)):
-		for y in range(len (b)):
-			ratio[:,x,y] = BRFs[:,x,y] / albedo_interp
+# 3a Ratio calculation using BRFs and reference albedo
+		ratio = BRFs / albedo_interp
 
 # 3b Linear Regression between BRFs/Albedo ratio and BRFs + retrieval of regressions coefficients
-	slope = np.empty((len(a),len(b)))
-	intercept = np.empty((len(a),len(b)))
-	p_value = np.empty((len(a),len(b)))
-	std_err = np.empty((len(a),len(b)))
-	r_value = np.empty((len(a),len(b)))
-
-# from MyTool.linregress_3D import linregress_3D
-	for i in range(len(a)):
-		for j in range(len (b)):
-			# cov[i, j], cor[i, j], slope[i, j], intercept[i, j], pval[i, j], stderr[i, j] = linregress_3D(
-			# x=BRFs[:, i, j], y=ratio[:, i, j])
-			slope[i,j], intercept[i,j], r_value[i,j], p_value[i,j], std_err [i,j]= stats.linregress(BRFs[:, i, j], ratio[:, i, j])
-
+		slope, intercept, r_value, p_value, std_err = linregress_block(BRFs, ratio)
 
 # Step 4 - Ratio estimation of the DASF
-	DASF = intercept / (1-slope)
+		DASF = intercept / (1-slope)
 
 # Step 5 - Optional retrieval of R² as retrieval quality indicator
-	R2 = r_value**2
-	retrieval_quality = np.stack((R2,p_value), axis = 0)
+		R2 = r_value**2
+		retrieval_quality = np.stack((R2,p_value), axis = 0)
 
 # Step 6 - Applying DASF correction
-	CSC = BRFs/DASF
+		CSC = BRFs/DASF
+
+# Write output blocks
+		writerDASF.writeArray(DASF[None], block.xOffset, block.yOffset)
+		writerQuality.writeArray(retrieval_quality, block.xOffset, block.yOffset)
+		writerCSC.writeArray(CSC, block.xOffset, block.yOffset)
 
-# Print output raster from array
-	RasterDataset.fromArray(array=DASF, grid=GridData, filename=outputName, driver=GTiffDriver())
-	RasterDataset.fromArray(array=retrieval_quality, grid=GridData, filename=secondoutputName, driver=GTiffDriver())
-	RasterDataset.fromArray(array=CSC, grid=GridData, filename=thirdoutputName, driver=GTiffDriver())
\ No newline at end of file
+	writerDASF.close()
+	writerQuality.close()
+	writerCSC.close()
@@ -43,7 +43,8 @@ class DASFretrievalAlgorithm(QgsProcessingAlgorithm):
                 inputFile=self.parameterAsRasterLayer(parameters, self.P_INPUT, context).source(),
                 outputName=self.parameterAsOutputLayer(parameters, self.P_OUTPUT, context),
                 secondoutputName=self.parameterAsOutputLayer(parameters, self.P_Retrieval_Quality, context),
-                thirdoutputName= self.parameterAsOutputLayer(parameters, self.P_CSC, context)
+                thirdoutputName= self.parameterAsOutputLayer(parameters, self.P_CSC, context),
+                feedback=feedback
             )
 
             # return all output parameters
@@ -49,6 +49,8 @@ from scipy import optimize
 from scipy import signal
 from scipy import spatial
 
+from enmapboxprocessing.numpyutils import NumpyUtils
+
 # from engeomap import APP_DIR
 
 
@@ -502,6 +504,66 @@ def cvx_hull_oclip(wv, daten):
     return outp
 
 
+# block versions of the hull functions, spectra are given as rows (spectra x bands):
+
+
+def removal_block(daten, hullfinal, cont_switch=0):
+    rmrel = numpy.nan_to_num(daten / hullfinal)
+    rmabs = numpy.nan_to_num(hullfinal - daten)
+    numpy.place(rmrel, rmrel > 1, 1)
+    numpy.place(rmrel, rmrel < 0, 0)
+    numpy.place(rmabs, rmabs < 0, 0)
+    if cont_switch == 1:
+        return rmabs, rmrel, hullfinal
+    if cont_switch == 0:
+        return rmabs, rmrel
+
+
+def cvx_uhull2_block(spc, wv, cont_switch=0):
+    hullfinal = NumpyUtils.upperConvexHull(spc, wv)
+    return removal_block(spc, hullfinal, cont_switch)
+
+
+def interp_block(wv, wavv, huell):
+    # numpy.interp is linear in the function values, so interpolating all spectra at the same positions
+    # is a single matrix product
+    interpolator = numpy.array([numpy.interp(wv, wavv, unit) for unit in numpy.eye(len(wavv))])
+    return numpy.dot(huell, interpolator)
+
+
+def cvx_hull_block(daten, wv, cont_switch=0):
+    wv1 = copy.deepcopy(wv)
+    schp = getrange(wv)
+    well = schp[1, :]
+    if len(well) != 4:
+        raise ValueError('we need the full spectrum with full swir and not only a part')
+    vnirds = generic_1nm_data_feat_grabber(wv[0], schp[1, 0], daten.T, wv1)
+    swir1ds = generic_1nm_data_feat_grabber(schp[1, 1], schp[1, 2], daten.T, wv1)
+    swir2ds = generic_1nm_data_feat_grabber(schp[1, 1], wv1[-1], daten.T, wv1)
+    vnirhull = NumpyUtils.upperConvexHull(vnirds[1].T, vnirds[2])
+    swir1hull = NumpyUtils.upperConvexHull(swir1ds[1].T, swir1ds[2])
+    swir2hull = NumpyUtils.upperConvexHull(swir2ds[1].T, swir2ds[2])
+    wavv = numpy.concatenate([vnirds[2], swir1ds[2], swir2ds[2]])
+    huell = numpy.concatenate([vnirhull, swir1hull, swir2hull], axis=1)
+    hullfinal = interp_block(wv, wavv, huell)
+    return removal_block(daten, hullfinal, cont_switch)
+
+
+def interpolate_cvx_block(wfrom, wto, data, hull_function):
+    # interpolates a block of spectra (bands x spectra) and removes the hull of all spectra without zeroes at once;
+    # returns the interpolated spectra and rmabs, rmrel and hull (spectra x bands) or None if the hull fails
+    outputs = numpy.array([interpolate_1nm_spectrum(wto, wfrom, data[:, j], flag=None) for j in
+                           range(data.shape[1])], dtype=float).reshape(data.shape[1], len(wto))
+    valid = numpy.sum(outputs == 0, axis=1) == 0
+    hulls = numpy.zeros((3,) + outputs.shape)
+    try:
+        hulls[0][valid], hulls[1][valid], hulls[2][valid] = hull_function(outputs[valid], wto, cont_switch=1)
+    except ValueError as error:
+        print(error)
+        hulls = None
+    return outputs, hulls
+
+
 #########
 ############
 ########
@@ -691,9 +753,9 @@ def treat_library_cvx(wv, data, neowave, vnir_thr=0.01, swir_thr=0.02):
     posswirmax = numpy.zeros((arr.shape[0]))
     swirmax = numpy.zeros((arr.shape[0]))
     vnirmax = numpy.zeros((arr.shape[0]))
+    cvxabs, cvxrel, cvxhull = cvx_uhull2_block(arr, nwv, cont_switch=1)  # all library spectra at once
     for j in numpy.arange(0, arr.shape[0], 1):
         try:
-            cvxabs[j, :], cvxrel[j, :], cvxhull[j, :] = cvx_uhull2(arr[j, :], nwv, cont_switch=1)
             cvxabs_mod[j, :], cvxrel_mod[j, :], vnirmax[j], swirmax, posvnirmax[j], posswirmax[j] = scrut_weigh3(
                 cvxabs[j, :], cvxrel[j, :], nwv, vnir_thr, swir_thr)
             w_rel_scale[j, :], w_rel_chm_scale[j, :], a, b, c, d = weighting_lib2(cvxrel_mod[j, :], nwv)
@@ -720,9 +782,13 @@ def treat_library_cvx_full_range(wv, data, neowave, vnir_thr=0.00, swir_thr=0.00
     posswirmax = numpy.zeros((arr.shape[0]))
     swirmax = numpy.zeros((arr.shape[0]))
     vnirmax = numpy.zeros((arr.shape[0]))
+    try:
+        cvxabs, cvxrel, cvxhull = cvx_hull_block(arr, nwv, cont_switch=1)  # all library spectra at once
+    except ValueError as error:
+        print(error)
+        return cvxabs_mod, cvxrel_mod, w_rel_scale, w_rel_chm_scale, vnirmax, swirmax
     for j in numpy.arange(0, arr.shape[0], 1):
         try:
-            cvxabs[j, :], cvxrel[j, :], cvxhull[j, :] = cvx_hull(arr[j, :], nwv, cont_switch=1)
             cvxabs_mod[j, :], cvxrel_mod[j, :], vnirmax[j], swirmax, posvnirmax[j], posswirmax[j] = scrut_weigh3(
                 cvxabs[j, :], cvxrel[j, :], nwv, vnir_thr, swir_thr)
             w_rel_scale[j, :], w_rel_chm_scale[j, :], a, b, c, d = weighting_lib2(cvxrel_mod[j, :], nwv)
@@ -755,9 +821,13 @@ def treat_library_cvx_full_range_lo(wv, data, neowave, vnir_thr=0.00, swir_thr=0
     swirmax = numpy.zeros((arr.shape[0]))
     vnirmax = numpy.zeros((arr.shape[0]))
     cvx_poshull = numpy.zeros_like(arr)
+    try:
+        cvxabs, cvxrel, cvxhull = cvx_hull_block(arr, nwv, cont_switch=1)  # all library spectra at once
+    except ValueError as error:
+        print(error)
+        return cvxabs_mod, cvxrel_mod, w_rel_scale, w_rel_chm_scale, vnirmax, swirmax
     for j in numpy.arange(0, arr.shape[0], 1):
         try:
-            cvxabs[j, :], cvxrel[j, :], cvxhull[j, :] = cvx_hull(arr[j, :], nwv, cont_switch=1)
             cvxabs[j, :], cvxrel_mod[j, :], vnirmax[j], swirmax, posvnirmax[j], posswirmax[j] = scrut_weigh3(
                 cvxabs[j, :], cvxrel[j, :], nwv, vnir_thr, swir_thr)  # cvxabsb
             w_rel_scale[j, :], w_rel_chm_scale[j, :], a, b, c, d = weighting_lib2(cvxrel_mod[j, :], nwv)
@@ -785,7 +855,7 @@ def treat_library_cvx_full_range_lo(wv, data, neowave, vnir_thr=0.00, swir_thr=0
 
 
 def fitting_cvx(wfrom, wto, data, libdat_rel_weighted, libdat_rel_chm_weighted, libdat_abs, vnir_thr=0.01,
-                swir_thr=0.02, lib_flag=0, mix_minerals=6, fit_threshold=0.5):
+                swir_thr=0.02, lib_flag=0, mix_minerals=6, fit_threshold=0.5, block_size=10000):
     dshape2 = data.shape
     data = data.reshape(dshape2[0], dshape2[1] * dshape2[2])
     dshape = data.shape
@@ -803,46 +873,49 @@ def fitting_cvx(wfrom, wto, data, libdat_rel_weighted, libdat_rel_chm_weighted,
     depthsum = numpy.zeros([dshape[1]])
     flsum = numpy.zeros([dshape[1]])
     allessum = numpy.zeros([dshape[1]])
-    for j in numpy.arange(0, dshape[1], 1):
-        output = interpolate_1nm_spectrum(wto, wfrom, data[:, j], flag=None)
-        if numpy.sum(output == 0):
-            rm_abs_dat = output
-            rm_rel_dat = output
-            hull_dat = output
-            correlat[:, j] = numpy.zeros([lshape[0]])
-            vnirdepthmat[j] = -1
-            swirdepthmat[j] = -1
-            vnirposmat[j] = -1
-            swirposmat[j] = -1
-            astsum[j] = -1
-            depthsum[j] = -1
-            flsum[j] = -1
-            allessum[j] = -1
-        else:
-            try:
-                rm_abs_dat, rm_rel_dat, hull_dat = cvx_uhull2(output, wto, cont_switch=1)
-                absolutee, relativee, vnirdepthmat[j], swirdepthmat[j], vnirposmat[j], swirposmat[j] = scrut_weigh3(
-                    rm_abs_dat, rm_rel_dat, wto, vnir_thr, swir_thr)
-                w_rel_scale, w_rel_chm_scale, a, b, c, d = weighting_lib2(relativee, wto)
-                astsum[j] = a
-                depthsum[j] = b
-                flsum[j] = c
-                allessum[j] = d
-                correlat[:, j] = corr(libdat_rel_weighted, w_rel_scale)
-                numpy.nan_to_num(correlat[:, j])
-                correlat[:, j][~numpy.isfinite(correlat[:, j])] = 0
-                numpy.place(correlat[:, j], correlat[:, j] <= 0, 0)
-            except Exception:
-                pass
-            try:
-                bvlss[:, j], bvlserr[j] = unmixxx(libdat_abs, absolutee, correlat[:, j], thresh=0.5)
-            except Exception:
-                bvlserr[j] = 9999
+    for start in numpy.arange(0, dshape[1], block_size):
+        block = numpy.arange(start, min(start + block_size, dshape[1]))
+        outputs, hulls = interpolate_cvx_block(wfrom, wto, data[:, block], cvx_uhull2_block)
+        for i, j in enumerate(block):
+            output = outputs[i]
+            if numpy.sum(output == 0):
+                rm_abs_dat = output
+                rm_rel_dat = output
+                hull_dat = output
+                correlat[:, j] = numpy.zeros([lshape[0]])
+                vnirdepthmat[j] = -1
+                swirdepthmat[j] = -1
+                vnirposmat[j] = -1
+                swirposmat[j] = -1
+                astsum[j] = -1
+                depthsum[j] = -1
+                flsum[j] = -1
+                allessum[j] = -1
+            else:
+                try:
+                    rm_abs_dat, rm_rel_dat, hull_dat = hulls[0][i], hulls[1][i], hulls[2][i]
+                    absolutee, relativee, vnirdepthmat[j], swirdepthmat[j], vnirposmat[j], swirposmat[j] = scrut_weigh3(
+                        rm_abs_dat, rm_rel_dat, wto, vnir_thr, swir_thr)
+                    w_rel_scale, w_rel_chm_scale, a, b, c, d = weighting_lib2(relativee, wto)
+                    astsum[j] = a
+                    depthsum[j] = b
+                    flsum[j] = c
+                    allessum[j] = d
+                    correlat[:, j] = corr(libdat_rel_weighted, w_rel_scale)
+                    numpy.nan_to_num(correlat[:, j])
+                    correlat[:, j][~numpy.isfinite(correlat[:, j])] = 0
+                    numpy.place(correlat[:, j], correlat[:, j] <= 0, 0)
+                except Exception:
+                    pass
+                try:
+                    bvlss[:, j], bvlserr[j] = unmixxx(libdat_abs, absolutee, correlat[:, j], thresh=0.5)
+                except Exception:
+                    bvlserr[j] = 9999
     return correlat, bvlss, bvlserr, vnirposmat, vnirdepthmat, swirposmat, swirdepthmat, astsum, depthsum, flsum, allessum
 
 
 def fitting_cvx_fullrange(wfrom, wto, data, libdat_rel_weighted, libdat_rel_chm_weighted, libdat_abs, vnir_thr=0.00,
-                          swir_thr=0.00, lib_flag=0, mix_minerals=6, fit_threshold=0.5):
+                          swir_thr=0.00, lib_flag=0, mix_minerals=6, fit_threshold=0.5, block_size=10000):
     print('...feature fitting and bvls...')
     dshape2 = data.shape
     data = data.reshape(dshape2[0], dshape2[1] * dshape2[2])
@@ -861,46 +934,49 @@ def fitting_cvx_fullrange(wfrom, wto, data, libdat_rel_weighted, libdat_rel_chm_
     depthsum = numpy.zeros([dshape[1]])
     flsum = numpy.zeros([dshape[1]])
     allessum = numpy.zeros([dshape[1]])
-    for j in numpy.arange(0, dshape[1], 1):
-        output = interpolate_1nm_spectrum(wto, wfrom, data[:, j], flag=None)
-        if numpy.sum(output == 0):
-            rm_abs_dat = output
-            rm_rel_dat = output
-            hull_dat = output
-            correlat[:, j] = numpy.zeros([lshape[0]])
-            vnirdepthmat[j] = -1
-            swirdepthmat[j] = -1
-            vnirposmat[j] = -1
-            swirposmat[j] = -1
-            astsum[j] = -1
-            depthsum[j] = -1
-            flsum[j] = -1
-            allessum[j] = -1
-        else:
-            try:
-                rm_abs_dat, rm_rel_dat, hull_dat = cvx_hull(output, wto, cont_switch=1)
-                absolutee, relativee, vnirdepthmat[j], swirdepthmat[j], vnirposmat[j], swirposmat[j] = scrut_weigh3(
-                    rm_abs_dat, rm_rel_dat, wto, vnir_thr, swir_thr)
-                w_rel_scale, w_rel_chm_scale, a, b, c, d = weighting_lib2(relativee, wto)
-                astsum[j] = a
-                depthsum[j] = b
-                flsum[j] = c
-                allessum[j] = d
-                correlat[:, j] = corr(libdat_rel_weighted, w_rel_scale)
-                numpy.nan_to_num(correlat[:, j])
-                correlat[:, j][~numpy.isfinite(correlat[:, j])] = 0
-                numpy.place(correlat[:, j], correlat[:, j] <= 0, 0)
-            except Exception:
-                pass
-            try:
-                bvlss[:, j], bvlserr[j] = unmixxx(libdat_abs, absolutee, correlat[:, j], thresh=0.5)
-            except Exception:
-                bvlserr[j] = 9999
+    for start in numpy.arange(0, dshape[1], block_size):
+        block = numpy.arange(start, min(start + block_size, dshape[1]))
+        outputs, hulls = interpolate_cvx_block(wfrom, wto, data[:, block], cvx_hull_block)
+        for i, j in enumerate(block):
+            output = outputs[i]
+            if numpy.sum(output == 0):
+                rm_abs_dat = output
+                rm_rel_dat = output
+                hull_dat = output
+                correlat[:, j] = numpy.zeros([lshape[0]])
+                vnirdepthmat[j] = -1
+                swirdepthmat[j] = -1
+                vnirposmat[j] = -1
+                swirposmat[j] = -1
+                astsum[j] = -1
+                depthsum[j] = -1
+                flsum[j] = -1
+                allessum[j] = -1
+            else:
+                try:
+                    rm_abs_dat, rm_rel_dat, hull_dat = hulls[0][i], hulls[1][i], hulls[2][i]
+                    absolutee, relativee, vnirdepthmat[j], swirdepthmat[j], vnirposmat[j], swirposmat[j] = scrut_weigh3(
+                        rm_abs_dat, rm_rel_dat, wto, vnir_thr, swir_thr)
+                    w_rel_scale, w_rel_chm_scale, a, b, c, d = weighting_lib2(relativee, wto)
+                    astsum[j] = a
+                    depthsum[j] = b
+                    flsum[j] = c
+                    allessum[j] = d
+                    correlat[:, j] = corr(libdat_rel_weighted, w_rel_scale)
+                    numpy.nan_to_num(correlat[:, j])
+                    correlat[:, j][~numpy.isfinite(correlat[:, j])] = 0
+                    numpy.place(correlat[:, j], correlat[:, j] <= 0, 0)
+                except Exception:
+                    pass
+                try:
+                    bvlss[:, j], bvlserr[j] = unmixxx(libdat_abs, absolutee, correlat[:, j], thresh=0.5)
+                except Exception:
+                    bvlserr[j] = 9999
     return correlat, bvlss, bvlserr, vnirposmat, vnirdepthmat, swirposmat, swirdepthmat, astsum, depthsum, flsum, allessum
 
 
 def fitting_cvx_fullrange_lo(wfrom, wto, data, libdat_rel_weighted, libdat_rel_chm_weighted, libdat_abs, vnir_thr,
-                             swir_thr, lib_flag, mix_minerals, fit_threshold):
+                             swir_thr, lib_flag, mix_minerals, fit_threshold, block_size=10000):
     dshape2 = data.shape
     data = data.reshape(dshape2[0], dshape2[1] * dshape2[2])
     dshape = data.shape
@@ -918,59 +994,12 @@ def fitting_cvx_fullrange_lo(wfrom, wto, data, libdat_rel_weighted, libdat_rel_c
     depthsum = numpy.zeros([dshape[1]])
     flsum = numpy.zeros([dshape[1]])
     allessum = numpy.zeros([dshape[1]])
-    for j in numpy.arange(0, dshape[1], 1):
-        output = interpolate_1nm_spectrum(wto, wfrom, data[:, j], flag=None)
-        if numpy.sum(output == 0):
-            rm_abs_dat = output
-            rm_rel_dat = output
-            hull_dat = output
-            correlat[:, j] = numpy.zeros([lshape[0]])
-            vnirdepthmat[j] = -1
-            swirdepthmat[j] = -1
-            vnirposmat[j] = -1
-            swirposmat[j] = -1
-            astsum[j] = -1
-            depthsum[j] = -1
-            flsum[j] = -1
-            allessum[j] = -1
-        else:
-            try:
-                rm_abs_dat, rm_rel_dat, hull_dat = cvx_hull(output, wto, cont_switch=1)
-                absolutee, relativee, vnirdepthmat[j], swirdepthmat[j], vnirposmat[j], swirposmat[j] = scrut_weigh3(
-                    rm_abs_dat, rm_rel_dat, wto, vnir_thr, swir_thr)
-                w_rel_scale, w_rel_chm_scale, a, b, c, d = weighting_lib2(relativee, wto)
-            except Exception:
-                bvlserr[j] = 9999
-                rm_abs_dat = output
-                rm_rel_dat = output
-                hull_dat = output
-                correlat[:, j] = numpy.zeros([lshape[0]])
-                vnirdepthmat[j] = -1
-                swirdepthmat[j] = -1
-                vnirposmat[j] = -1
-                swirposmat[j] = -1
-                astsum[j] = -1
-                depthsum[j] = -1
-                flsum[j] = -1
-                allessum[j] = -1
-                pass
-            try:
-                wv1_bil, spc1_bil, hull1_bil, hulllfin1_bil, feinalpos1_bil, relative1_bil = lo_hull(wto, output,
-                                                                                                     w_rel_chm_scale)  #####################NEU Reflectance Peaks#
-                cvxabs_mod_bil, cvxrel_mod_bil, vnirmax_bil, swirmax_bil, posvnirmax_bil, posswirmax_bil = scrut_weigh3(
-                    feinalpos1_bil, relative1_bil, wto, vnir_thr, swir_thr)  #####################NEU Reflectance Peaks
-                w_rel_scale_bil, w_rel_chm_scale_bil, a1, b1, c1, d1 = weighting_lib2(cvxrel_mod_bil,
-                                                                                      wto)  #####################NEU Reflectance Peaks
-                astsum[j] = a1
-                depthsum[j] = b1
-                flsum[j] = c1
-                allessum[j] = d1
-                correlat[:, j] = corr(libdat_rel_weighted, w_rel_scale_bil)
-                numpy.nan_to_num(correlat[:, j])
-                correlat[:, j][~numpy.isfinite(correlat[:, j])] = 0
-                numpy.place(correlat[:, j], correlat[:, j] <= 0, 0)
-            except Exception:
-                bvlserr[j] = 9999
+    for start in numpy.arange(0, dshape[1], block_size):
+        block = numpy.arange(start, min(start + block_size, dshape[1]))
+        outputs, hulls = interpolate_cvx_block(wfrom, wto, data[:, block], cvx_hull_block)
+        for i, j in enumerate(block):
+            output = outputs[i]
+            if numpy.sum(output == 0):
                 rm_abs_dat = output
                 rm_rel_dat = output
                 hull_dat = output
@@ -983,10 +1012,60 @@ def fitting_cvx_fullrange_lo(wfrom, wto, data, libdat_rel_weighted, libdat_rel_c
                 depthsum[j] = -1
                 flsum[j] = -1
                 allessum[j] = -1
-            try:
-                bvlss[:, j], bvlserr[j] = unmixxx(libdat_abs_bil, cvxabs_mod_bil, correlat[:, j], thresh=0.5)
-            except Exception:
-                bvlserr[j] = 9999
+            else:
+                try:
+                    rm_abs_dat, rm_rel_dat, hull_dat = hulls[0][i], hulls[1][i], hulls[2][i]
+                    absolutee, relativee, vnirdepthmat[j], swirdepthmat[j], vnirposmat[j], swirposmat[j] = scrut_weigh3(
+                        rm_abs_dat, rm_rel_dat, wto, vnir_thr, swir_thr)
+                    w_rel_scale, w_rel_chm_scale, a, b, c, d = weighting_lib2(relativee, wto)
+                except Exception:
+                    bvlserr[j] = 9999
+                    rm_abs_dat = output
+                    rm_rel_dat = output
+                    hull_dat = output
+                    correlat[:, j] = numpy.zeros([lshape[0]])
+                    vnirdepthmat[j] = -1
+                    swirdepthmat[j] = -1
+                    vnirposmat[j] = -1
+                    swirposmat[j] = -1
+                    astsum[j] = -1
+                    depthsum[j] = -1
+                    flsum[j] = -1
+                    allessum[j] = -1
+                    pass
+                try:
+                    wv1_bil, spc1_bil, hull1_bil, hulllfin1_bil, feinalpos1_bil, relative1_bil = lo_hull(wto, output,
+                                                                                                         w_rel_chm_scale)  #####################NEU Reflectance Peaks#
+                    cvxabs_mod_bil, cvxrel_mod_bil, vnirmax_bil, swirmax_bil, posvnirmax_bil, posswirmax_bil = scrut_weigh3(
+                        feinalpos1_bil, relative1_bil, wto, vnir_thr, swir_thr)  #####################NEU Reflectance Peaks
+                    w_rel_scale_bil, w_rel_chm_scale_bil, a1, b1, c1, d1 = weighting_lib2(cvxrel_mod_bil,
+                                                                                          wto)  #####################NEU Reflectance Peaks
+                    astsum[j] = a1
+                    depthsum[j] = b1
+                    flsum[j] = c1
+                    allessum[j] = d1
+                    correlat[:, j] = corr(libdat_rel_weighted, w_rel_scale_bil)
+                    numpy.nan_to_num(correlat[:, j])
+                    correlat[:, j][~numpy.isfinite(correlat[:, j])] = 0
+                    numpy.place(correlat[:, j], correlat[:, j] <= 0, 0)
+                except Exception:
+                    bvlserr[j] = 9999
+                    rm_abs_dat = output
+                    rm_rel_dat = output
+                    hull_dat = output
+                    correlat[:, j] = numpy.zeros([lshape[0]])
+                    vnirdepthmat[j] = -1
+                    swirdepthmat[j] = -1
+                    vnirposmat[j] = -1
+                    swirposmat[j] = -1
+                    astsum[j] = -1
+                    depthsum[j] = -1
+                    flsum[j] = -1
+                    allessum[j] = -1
+                try:
+                    bvlss[:, j], bvlserr[j] = unmixxx(libdat_abs_bil, cvxabs_mod_bil, correlat[:, j], thresh=0.5)
+                except Exception:
+                    bvlserr[j] = 9999
     return correlat, bvlss, bvlserr, vnirposmat, vnirdepthmat, swirposmat, swirdepthmat, astsum, depthsum, flsum, allessum
 
 
@@ -82,7 +82,7 @@ def prepare_processor_input_txt(inpath, infile, sensor, txt_ID, txt_columns, txt
     
 
 
-def prepare_processor_input(inpath, infile):
+def prepare_processor_input(inpath, infile, rows = slice(None)):
     
     # Prepare the input to ONNS independently of applied atmospheric correction. 
     # Provide masks and geo information and save them. 
@@ -101,13 +101,13 @@ def prepare_processor_input(inpath, infile):
         
         ncfile          = nc(os.path.join(inpath, infile), 'r')
         
-        lon             = ncfile.variables['lon'][:]
-        lat             = ncfile.variables['lat'][:]
+        lon             = ncfile.variables['lon'][rows]
+        lat             = ncfile.variables['lat'][rows]
         
         # MH: Level 1 quality flags for land, invalid and clouds
         
         qflags          = ncfile['quality_flags']
-        l1_flags        = qflags[:]
+        l1_flags        = qflags[rows]
         
         if isinstance(l1_flags, np.ma.MaskedArray):                             # MH: bug fix for py netcdf4 version inconsistency 
             l1_flags        = np.ma.getdata(l1_flags)       
@@ -120,7 +120,7 @@ def prepare_processor_input(inpath, infile):
         # Order of bits should be correct, but has to be checked in later versions. 
         
         qflags2         = ncfile['c2rcc_flags']
-        l2_flags        = qflags2[:]
+        l2_flags        = qflags2[rows]
         
         if isinstance(l2_flags, np.ma.MaskedArray):                             # MH: bug fix for py netcdf4 version inconsistency 
             l2_flags        = np.ma.getdata(l2_flags)   
@@ -142,7 +142,7 @@ def prepare_processor_input(inpath, infile):
     
         for i in range(0, len(in_varnames)):
          
-            b               = ncfile.variables[in_varnames[i]][:]
+            b               = ncfile.variables[in_varnames[i]][rows]
             #b.shape        = valid.shape
             
             flag_negative[b<0]              = True
@@ -169,15 +169,15 @@ def prepare_processor_input(inpath, infile):
         ncfile          = nc(os.path.join(inpath, infile), 'r')
         
         try:
-            lon             = ncfile.variables['longitude'][:]
-            lat             = ncfile.variables['latitude'][:]
+            lon             = ncfile.variables['longitude'][rows]
+            lat             = ncfile.variables['latitude'][rows]
         except:
-            lon             = ncfile.variables['lon'][:]
-            lat             = ncfile.variables['lat'][:]
+            lon             = ncfile.variables['lon'][rows]
+            lat             = ncfile.variables['lat'][rows]
             
   
         qflags          = ncfile['bitmask']
-        l1_flags        = qflags[:]
+        l1_flags        = qflags[rows]
         
         if isinstance(l1_flags, np.ma.MaskedArray):                             # MH: bug fix for py netcdf4 version inconsistency 
             l1_flags        = np.ma.getdata(l1_flags)
@@ -215,7 +215,7 @@ def prepare_processor_input(inpath, infile):
         flag_strange    = np.full(land.shape, False, dtype = bool)
         
         
-        b                   = ncfile.variables[in_varnames[0]][:]
+        b                   = ncfile.variables[in_varnames[0]][rows]
         flag_strange[b>1]   = True                                              # MH: basically remove any remaining masked data 
         
         
@@ -226,7 +226,7 @@ def prepare_processor_input(inpath, infile):
         
         for i in range(0, len(in_varnames)):
          
-            b                   = ncfile.variables[in_varnames[i]][:]
+            b                   = ncfile.variables[in_varnames[i]][rows]
             #b.shape        = valid.shape
             
             flag_negative[b<0]  = True                                          # MH: marks pixel with any negative Rrs value (mostly in the NIR)
@@ -264,8 +264,8 @@ def prepare_processor_input(inpath, infile):
                 
                 ncfile          = nc(os.path.join(inpath, 'geo_coordinates.nc'), 'r')
                 
-                lon             = ncfile.variables['longitude'][:]
-                lat             = ncfile.variables['latitude'][:]       
+                lon             = ncfile.variables['longitude'][rows]
+                lat             = ncfile.variables['latitude'][rows]       
                 
                 ncfile.close()
                 
@@ -273,7 +273,7 @@ def prepare_processor_input(inpath, infile):
                 ncfile          = nc(os.path.join(inpath, 'wqsf.nc'), 'r')
                 
                 qflags          = ncfile['WQSF']
-                l1_flags        = qflags[:]         
+                l1_flags        = qflags[rows]         
                 
                 if isinstance(l1_flags, np.ma.MaskedArray):                     # MH: bug fix for py netcdf4 version inconsistency 
                     l1_flags        = np.ma.getdata(l1_flags)
@@ -299,7 +299,7 @@ def prepare_processor_input(inpath, infile):
                 # creation of a new "valid" using the first band 
                 ncfile          = nc(os.path.join(inpath, in_varnames_1[i]), 'r')
                 
-                b               = ncfile.variables[in_varnames[i]][:]
+                b               = ncfile.variables[in_varnames[i]][rows]
                 
                 flag_negative[b<0]              = True                          # MH: Mask for negative reflectances
                 flag_suspect[b>10 | ~valid]     = True                          # MH: Mask for fill value(65535) but not captured by cloud + invalid + land 
@@ -316,7 +316,7 @@ def prepare_processor_input(inpath, infile):
             
                 ncfile          = nc(os.path.join(inpath, in_varnames_1[i]), 'r')
             
-                b               = ncfile.variables[in_varnames[i]][:]
+                b               = ncfile.variables[in_varnames[i]][rows]
 
             
             rrs[:, i]       = b[valid]
@@ -347,7 +347,7 @@ def prepare_processor_input(inpath, infile):
 
 
 
-def prepare_processor_input_MERIS(inpath, infile):
+def prepare_processor_input_MERIS(inpath, infile, rows = slice(None)):
     
     # Prepare the input to ONNS independently of applied atmospheric correction. 
     # Provide masks and geo information and save them. 
@@ -371,14 +371,14 @@ def prepare_processor_input_MERIS(inpath, infile):
         
         ncfile.set_auto_mask(False)                                             # MH: for py netcdf4 since v1.2.X ?! to be tested!!!        
         
-        lon             = ncfile.variables['lon'][:]
-        lat             = ncfile.variables['lat'][:]
+        lon             = ncfile.variables['lon'][rows]
+        lat             = ncfile.variables['lat'][rows]
         
         #print type(lat)
         
         # MH: Level 1 quality flags for land, invalid and clouds
         
-        l1_flags        = ncfile.variables['l1_flags'][:]
+        l1_flags        = ncfile.variables['l1_flags'][rows]
         
         if isinstance(l1_flags, np.ma.MaskedArray):                             # MH: bug fix for py netcdf4 version inconsistency 
             l1_flags        = np.ma.getdata(l1_flags)       
@@ -390,7 +390,7 @@ def prepare_processor_input_MERIS(inpath, infile):
         # Order of bits should be correct, but has to be checked in later versions. 
         
         qflags2         = ncfile['c2rcc_flags']
-        l2_flags        = qflags2[:]
+        l2_flags        = qflags2[rows]
         
 #       if isinstance(l2_flags, np.ma.MaskedArray):                             # MH: bug fix for py netcdf4 version inconsistency 
 #           l2_flags        = np.ma.getdata(l2_flags)   
@@ -412,7 +412,7 @@ def prepare_processor_input_MERIS(inpath, infile):
     
         for i in range(0, len(in_varnames)):
          
-            b               = ncfile.variables[in_varnames[i]][:]
+            b               = ncfile.variables[in_varnames[i]][rows]
             
             flag_negative[b<0]              = True
             
@@ -436,11 +436,11 @@ def prepare_processor_input_MERIS(inpath, infile):
         
         ncfile          = nc(os.path.join(inpath, infile), 'r')
         
-        lon             = ncfile.variables['longitude'][:]
-        lat             = ncfile.variables['latitude'][:]
+        lon             = ncfile.variables['longitude'][rows]
+        lat             = ncfile.variables['latitude'][rows]
   
         qflags          = ncfile['bitmask']
-        l1_flags        = qflags[:]
+        l1_flags        = qflags[rows]
         
         if isinstance(l1_flags, np.ma.MaskedArray):                             # MH: bug fix for py netcdf4 version inconsistency 
             l1_flags        = np.ma.getdata(l1_flags)
@@ -478,7 +478,7 @@ def prepare_processor_input_MERIS(inpath, infile):
         flag_strange    = np.full(land.shape, False, dtype = bool)
         
         
-        b                   = ncfile.variables[in_varnames[0]][:]
+        b                   = ncfile.variables[in_varnames[0]][rows]
         flag_strange[b>1]   = True                                              # MH: basically remove any remaining masked data 
         
         
@@ -489,7 +489,7 @@ def prepare_processor_input_MERIS(inpath, infile):
         
         for i in range(0, len(in_varnames)):
          
-            b                   = ncfile.variables[in_varnames[i]][:]
+            b                   = ncfile.variables[in_varnames[i]][rows]
             #b.shape        = valid.shape
             
             flag_negative[b<0]  = True                                          # MH: marks pixel with any negative Rrs value (mostly in the NIR)
@@ -524,7 +524,7 @@ def prepare_processor_input_MERIS(inpath, infile):
 
 
     
-def prepare_processor_input_MODIS(inpath, infile):
+def prepare_processor_input_MODIS(inpath, infile, rows = slice(None)):
     
     # Prepare the input to ONNS independently of applied atmospheric correction. 
     # Provide masks and geo information and save them. 
@@ -546,11 +546,11 @@ def prepare_processor_input_MODIS(inpath, infile):
         
         ncfile          = nc(os.path.join(inpath, infile), 'r')
         
-        lon             = ncfile.variables['longitude'][:]
-        lat             = ncfile.variables['latitude'][:]
+        lon             = ncfile.variables['longitude'][rows]
+        lat             = ncfile.variables['latitude'][rows]
   
         qflags          = ncfile['bitmask']
-        l1_flags        = qflags[:]
+        l1_flags        = qflags[rows]
         
         if isinstance(l1_flags, np.ma.MaskedArray):                             # MH: bug fix for py netcdf4 version inconsistency 
             l1_flags        = np.ma.getdata(l1_flags)
@@ -588,7 +588,7 @@ def prepare_processor_input_MODIS(inpath, infile):
         flag_strange    = np.full(land.shape, False, dtype = bool)
         
         
-        b                   = ncfile.variables[in_varnames[0]][:]
+        b                   = ncfile.variables[in_varnames[0]][rows]
         flag_strange[b>1]   = True                                              # MH: basically remove any remaining masked data 
         
         
@@ -600,7 +600,7 @@ def prepare_processor_input_MODIS(inpath, infile):
         
         for i in range(0, len(in_varnames)):
          
-            b                   = ncfile.variables[in_varnames[i]][:]
+            b                   = ncfile.variables[in_varnames[i]][rows]
             #b.shape        = valid.shape
             
             flag_negative[b<0]  = True                                          # MH: marks pixel with any negative Rrs value (mostly in the NIR)
@@ -636,7 +636,7 @@ def prepare_processor_input_MODIS(inpath, infile):
 
 
 
-def prepare_processor_input_VIIRS(inpath, infile):
+def prepare_processor_input_VIIRS(inpath, infile, rows = slice(None)):
     
     # Prepare the input to ONNS independently of applied atmospheric correction. 
     # Provide masks and geo information and save them. 
@@ -658,11 +658,11 @@ def prepare_processor_input_VIIRS(inpath, infile):
         
         ncfile          = nc(os.path.join(inpath, infile), 'r')
         
-        lon             = ncfile.variables['longitude'][:]
-        lat             = ncfile.variables['latitude'][:]
+        lon             = ncfile.variables['longitude'][rows]
+        lat             = ncfile.variables['latitude'][rows]
   
         qflags          = ncfile['bitmask']
-        l1_flags        = qflags[:]
+        l1_flags        = qflags[rows]
         
         if isinstance(l1_flags, np.ma.MaskedArray):                             # MH: bug fix for py netcdf4 version inconsistency 
             l1_flags        = np.ma.getdata(l1_flags)
@@ -700,7 +700,7 @@ def prepare_processor_input_VIIRS(inpath, infile):
         flag_strange    = np.full(land.shape, False, dtype = bool)
         
         
-        b                   = ncfile.variables[in_varnames[0]][:]
+        b                   = ncfile.variables[in_varnames[0]][rows]
         flag_strange[b>1]   = True                                              # MH: basically remove any remaining masked data 
         
         
@@ -712,7 +712,7 @@ def prepare_processor_input_VIIRS(inpath, infile):
         
         for i in range(0, len(in_varnames)):
          
-            b                   = ncfile.variables[in_varnames[i]][:]
+            b                   = ncfile.variables[in_varnames[i]][rows]
             #b.shape        = valid.shape
             
             flag_negative[b<0]  = True                                          # MH: marks pixel with any negative Rrs value (mostly in the NIR)
@@ -749,6 +749,27 @@ def prepare_processor_input_VIIRS(inpath, infile):
 
 
 
+def scene_shape(inpath, infile):
+    
+    # Number of rows and columns of the scene, taken from the latitude variable without reading the data 
+    
+    if ac == 3:
+        ncfile          = nc(os.path.join(inpath, 'geo_coordinates.nc'), 'r')
+    else:
+        ncfile          = nc(os.path.join(inpath, infile), 'r')
+    
+    if 'latitude' in ncfile.variables:
+        shape           = ncfile.variables['latitude'].shape
+    else:
+        shape           = ncfile.variables['lat'].shape
+    
+    ncfile.close()
+    
+    return shape
+
+
+
+
 def sensor_band_adapter(path_to_NN, Rrs_in, sensor, adapt):
         
     ###
@@ -764,14 +785,11 @@ def sensor_band_adapter(path_to_NN, Rrs_in, sensor, adapt):
         
         if (adapt == 1):                                                        # MH: Option that only 400 band is replaced
         
-            nn3             = nnhs.nnhs(os.path.join(path_to_NN, netz))
+            nn3             = nnhs.load_nnhs(os.path.join(path_to_NN, netz))
             
             out1            = np.zeros([Rrs_in.shape[0], 11])
             
-            for l in range(rrs.shape[0]):
-                
-                input           = np.hstack([rrs[l, 1:]])
-                out1[l, :]      = nn3.ff_nnhs(input)        
+            out1[:, :]      = nn3.ff_nnhs_batch(rrs[:, 1:])
                 
                 
             Rrs_ONNS_new        = np.zeros(out1.shape)
@@ -782,14 +800,11 @@ def sensor_band_adapter(path_to_NN, Rrs_in, sensor, adapt):
             
         elif (adapt == 2):                                                      # MH: Option that all Rrs are replaced
                         
-            nn3             = nnhs.nnhs(os.path.join(path_to_NN, netz))
+            nn3             = nnhs.load_nnhs(os.path.join(path_to_NN, netz))
             
             out1            = np.zeros([Rrs_in.shape[0], 11])
             
-            for l in range(rrs.shape[0]):
-                
-                input       = np.hstack([rrs[l, 1:]])
-                out1[l, :]      = nn3.ff_nnhs(input)        
+            out1[:, :]      = nn3.ff_nnhs_batch(rrs[:, 1:])
                 
                 
             Rrs_ONNS_new        = np.zeros(out1.shape)
@@ -809,14 +824,11 @@ def sensor_band_adapter(path_to_NN, Rrs_in, sensor, adapt):
         
         if (adapt == 1):                                                        # MH: Option that only 400 band is replaced
         
-            nn3             = nnhs.nnhs(os.path.join(path_to_NN, netz))
+            nn3             = nnhs.load_nnhs(os.path.join(path_to_NN, netz))
             
             out1            = np.zeros([Rrs_in.shape[0], 11])
             
-            for l in range(rrs.shape[0]):
-                
-                input           = np.hstack([rrs[l, :]])
-                out1[l, :]      = nn3.ff_nnhs(input)        
+            out1[:, :]      = nn3.ff_nnhs_batch(rrs[:, :])
                 
                 
             Rrs_ONNS_new        = np.zeros(out1.shape)
@@ -827,14 +839,11 @@ def sensor_band_adapter(path_to_NN, Rrs_in, sensor, adapt):
             
         elif (adapt == 2):                                                      # MH: Option that all Rrs are replaced
                         
-            nn3             = nnhs.nnhs(os.path.join(path_to_NN, netz))
+            nn3             = nnhs.load_nnhs(os.path.join(path_to_NN, netz))
             
             out1            = np.zeros([Rrs_in.shape[0], 11])
             
-            for l in range(rrs.shape[0]):
-                
-                input       = np.hstack([rrs[l, :]])
-                out1[l, :]      = nn3.ff_nnhs(input)        
+            out1[:, :]      = nn3.ff_nnhs_batch(rrs[:, :])
                 
                 
             Rrs_ONNS_new        = np.zeros(out1.shape)
@@ -888,16 +897,13 @@ def sensor_band_adapter(path_to_NN, Rrs_in, sensor, adapt):
         
         Rrs_ONNS_new    = np.zeros((rrs.shape[0], 11))
                         
-        nn3             = nnhs.nnhs(os.path.join(path_to_NN, netz))
+        nn3             = nnhs.load_nnhs(os.path.join(path_to_NN, netz))
         
         a               = rrs[:, :]                                        
         
         out1            = np.zeros(Rrs_ONNS_new.shape)
         
-        for l in range(rrs.shape[0]):
-            
-            input           = np.hstack([a[l, :]])
-            out1[l, :]      = nn3.ff_nnhs(input)        
+        out1[:, :]      = nn3.ff_nnhs_batch(a[:, :])
             
         
         Rrs_ONNS_new[:,:]   = 10**out1[:,:] - 0.001     
@@ -1174,7 +1180,7 @@ def ONNS(path_to_NN, Rrs_ONNS, m2):
         netnames        = [s for s in netnames if nntype in s ]
         
 
-        nn2             = nnhs.nnhs(os.path.join(path_to_NN, netnames[0]))
+        nn2             = nnhs.load_nnhs(os.path.join(path_to_NN, netnames[0]))
         outvar          = nn2.outvar
 
         
@@ -1192,16 +1198,13 @@ def ONNS(path_to_NN, Rrs_ONNS, m2):
                         
             ID              = m2[:,i] > 0
                         
-            nn2             = nnhs.nnhs(os.path.join(path_to_NN, NNname))
+            nn2             = nnhs.load_nnhs(os.path.join(path_to_NN, NNname))
             
             out1            = np.zeros((np.sum(ID), nn2.noutp))*np.nan
             
             a               = rrs[ID,:]                                         # MH: log-transformed Rrs + 0.001
             
-            for l in range(np.sum(ID)):
-                
-                input           = np.hstack([a[l, :]])
-                out1[l, :]      = nn2.ff_nnhs(input)
+            out1[:, :]      = nn2.ff_nnhs_batch(a)
             
             
             for k in range(nn2.noutp):
@@ -1327,18 +1330,16 @@ def background_NN(path_to_NN, Rrs_ONNS):
     netz2           = 'ONNS_20180607_Case1_FUK_bNN_97x77x37_9.9.net'
     netz3           = 'ONNS_20180607_Case1_IOP_bNN_37x77x97_14.7.net'
         
-    nn1             = nnhs.nnhs(os.path.join(path_to_NN, netz1))
-    nn2             = nnhs.nnhs(os.path.join(path_to_NN, netz2))
-    nn3             = nnhs.nnhs(os.path.join(path_to_NN, netz3))    
+    nn1             = nnhs.load_nnhs(os.path.join(path_to_NN, netz1))
+    nn2             = nnhs.load_nnhs(os.path.join(path_to_NN, netz2))
+    nn3             = nnhs.load_nnhs(os.path.join(path_to_NN, netz3))    
     
     
-    for l in range(len(ID)):
-        
-        input           = np.hstack([rrs[ID[l], :]])
-        
-        out1[ID[l], :]      = nn1.ff_nnhs(input)    
-        out2[ID[l], :]      = nn2.ff_nnhs(input)    
-        out3[ID[l], :]      = nn3.ff_nnhs(input)    
+    input           = rrs[ID, :]
+    
+    out1[ID, :]     = nn1.ff_nnhs_batch(input)
+    out2[ID, :]     = nn2.ff_nnhs_batch(input)
+    out3[ID, :]     = nn3.ff_nnhs_batch(input)
         
         
     ###
@@ -1350,18 +1351,16 @@ def background_NN(path_to_NN, Rrs_ONNS):
     netz2           = 'ONNS_20180607_Case2_FUK_bNN_97x77x37_3.2.net'
     netz3           = 'ONNS_20180607_Case2_IOP_bNN_23x41x59x43_28.6.net'
         
-    nn1             = nnhs.nnhs(os.path.join(path_to_NN, netz1))
-    nn2             = nnhs.nnhs(os.path.join(path_to_NN, netz2))
-    nn3             = nnhs.nnhs(os.path.join(path_to_NN, netz3))    
+    nn1             = nnhs.load_nnhs(os.path.join(path_to_NN, netz1))
+    nn2             = nnhs.load_nnhs(os.path.join(path_to_NN, netz2))
+    nn3             = nnhs.load_nnhs(os.path.join(path_to_NN, netz3))    
     
     
-    for l in range(len(ID)):
-        
-        input           = np.hstack([rrs[ID[l], :]])
-        
-        out1[ID[l], :]      = nn1.ff_nnhs(input)    
-        out2[ID[l], :]      = nn2.ff_nnhs(input)    
-        out3[ID[l], :]      = nn3.ff_nnhs(input)    
+    input           = rrs[ID, :]
+    
+    out1[ID, :]     = nn1.ff_nnhs_batch(input)
+    out2[ID, :]     = nn2.ff_nnhs_batch(input)
+    out3[ID, :]     = nn3.ff_nnhs_batch(input)
         
         
 
@@ -1410,7 +1409,7 @@ def apply_BIAS_NN(path_to_NN, total_out_weighted, m2):
 
     
     #input_to_BIAS  = np.empty([np.sum(valid), 12])
-    input_to_BIAS   = np.empty([Rrs_ONNS.shape[0], 12])
+    input_to_BIAS   = np.empty([total_out_weighted.shape[0], 12])
     
     BIAS_input_variables    = [0, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]           # MH: not 1 (CDOM)
     
@@ -1437,7 +1436,7 @@ def apply_BIAS_NN(path_to_NN, total_out_weighted, m2):
         netnames        = [s for s in netnames if s[0]!="."]
         netnames        = [s for s in netnames if nntype in s ]
         
-        nn2             = nnhs.nnhs(os.path.join(path_to_NN, netnames[0]))
+        nn2             = nnhs.load_nnhs(os.path.join(path_to_NN, netnames[0]))
         
         total_out       = np.zeros((input_to_BIAS.shape[0], 13, nn2.noutp))
                 
@@ -1446,16 +1445,13 @@ def apply_BIAS_NN(path_to_NN, total_out_weighted, m2):
             
             ID          = m2[:,i] > 0
             
-            nn2         = nnhs.nnhs(os.path.join(path_to_NN, NNname))
+            nn2         = nnhs.load_nnhs(os.path.join(path_to_NN, NNname))
             out1        = np.zeros((np.sum(ID), nn2.noutp))*np.nan
             
             a           = input_to_BIAS[ID,:]
             
             
-            for l in range(np.sum(ID)):
-                
-                input           = np.hstack([a[l, :]])
-                out1[l, :]      = nn2.ff_nnhs(input)
+            out1[:, :]      = nn2.ff_nnhs_batch(a)
             
             
             for k in range(nn2.noutp):
@@ -1516,15 +1512,83 @@ def merge_products(total_membership, total_out_weighted, total_out_bNN, Case):
     return total_out_merged, flag_Case_bNN
     
     
+    
+    
+def process_block(path_to_NN, path_to_classes, Rrs_in, sensor, adapt, output_size):
+    
+    ###
+    # Application of the complete processing chain to one block of spectra 
+    
+    if Rrs_in.shape[0] == 0:                                                    # MH: nothing to process, e.g. a block with clouds or land only 
+        
+        no_flag         = np.zeros(0, dtype = bool)
+        
+        return np.zeros((0, 11)), no_flag, np.zeros((0, 13)), np.zeros((0, 13)), np.zeros(0), np.zeros(0, dtype = int), no_flag, no_flag, no_flag, no_flag, no_flag, no_flag, np.zeros((0, 13)), np.zeros((0, 13)), no_flag, np.zeros(0), np.zeros((0, 13)), np.zeros(0), np.zeros((0, 12))
+    
+    Rrs_ONNS, flag_adapter_fail             = sensor_band_adapter(path_to_NN, Rrs_in, sensor, adapt)
+    
+    m, m2, total_membership, maxMemb, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid     = classify_clustering_fuzzy(output_size, Rrs_ONNS, path_to_classes = path_to_classes)
+    
+    total_out_weighted, Chl_unweighted      = ONNS(path_to_NN, Rrs_ONNS, m2)
+    
+    total_out_bNN, Case, lambda_Rrs_max     = background_NN(path_to_NN, Rrs_ONNS)
+    
+    total_out_merged, flag_Case_bNN         = merge_products(total_membership, total_out_weighted, total_out_bNN, Case)
+    
+    total_BIAS_out_weighted                 = apply_BIAS_NN(path_to_NN, total_out_weighted, m2)
+    
+    return Rrs_ONNS, flag_adapter_fail, m, m2, total_membership, maxMemb, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid, total_out_weighted, total_out_bNN, Case, lambda_Rrs_max, total_out_merged, flag_Case_bNN, total_BIAS_out_weighted
+
+
+
+
+def process_blockwise(path_to_NN, path_to_classes, Rrs_in, sensor, adapt, output_size, block_size = 100000):
+    
+    ###
+    # Application of the complete processing chain block by block, i.e. the (large) intermediate results are only 
+    # kept in memory for block_size spectra at a time; yields the spectra range and the results of each block, 
+    # at least one (empty) block is yielded if there are no spectra at all 
+    
+    nblocks         = max(Rrs_in.shape[0] - 1, 0) // block_size + 1
+    
+    for start in range(0, max(Rrs_in.shape[0], 1), block_size):
+        
+        print('Block {:d} of {:d} ...'.format(start // block_size + 1, nblocks))
+        
+        stop            = min(start + block_size, Rrs_in.shape[0])
+        
+        yield start, stop, process_block(path_to_NN, path_to_classes, Rrs_in[start:stop, :], sensor, adapt, output_size)
+
+
+
+
+def block_variable(out, name, *args, **kwargs):
+    
+    # Output variables are created when the first block is saved, later blocks write into the existing ones 
+    
+    if name in out.variables:
+        return out.variables[name]
+    
+    return out.createVariable(name, *args, **kwargs)
+    
+    
 
 
-def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted, total_out_bNN, total_out_merged, total_BIAS_out_weighted, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid, Rrs_ONNS, valid, flag_adapter_fail, flag_Case_bNN, version, output_size, lambda_Rrs_max):
+def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted, total_out_bNN, total_out_merged, total_BIAS_out_weighted, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid, Rrs_ONNS, valid, flag_adapter_fail, flag_Case_bNN, version, output_size, lambda_Rrs_max, rows = slice(None), shape = None):
         
         
     # One output file for all processor results 
         
+    # Scenes are saved block by block: valid and all results cover the scene rows given by rows, 
+    # the first block creates the file for the full scene shape and later blocks are added to it 
+    
+    if shape is None:
+        shape           = valid.shape
+    
+    create          = not rows.start
+    
     #out             = nc(outname, 'w', format = 'NETCDF4')
-    out             = nc(outname, 'w')
+    out             = nc(outname, 'w' if create else 'a')
     #out            = nc(outname, 'a')                                          # MH: adds data to existing nc file 
     
     
@@ -1587,12 +1651,13 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
     ### 
     # Save all masks and L1 and L2 information
     
-    out.createDimension('x', valid.shape[0])
-    out.createDimension('y', valid.shape[1])
+    if create:
+        out.createDimension('x', shape[0])
+        out.createDimension('y', shape[1])
         
     
-    test        = out.createVariable('longitude', 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)       
-    test[:,:]   = lon[:,:]
+    test        = block_variable(out, 'longitude', 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)       
+    test[rows, :] = lon[:,:]
     
     test.units              = 'degrees_east'
     test.standard_name      = 'longitude' 
@@ -1600,8 +1665,8 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
     test.coordinates        = 'lat lon' 
         
     
-    test        = out.createVariable('latitude', 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
-    test[:,:]   = lat[:,:]
+    test        = block_variable(out, 'latitude', 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
+    test[rows, :] = lat[:,:]
     
     test.units              = 'degrees_north'
     test.standard_name      = 'latitude' 
@@ -1609,8 +1674,8 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
     test.coordinates        = 'lat lon' 
     
     
-    test        = out.createVariable('ONNS_water', 'b', ('x', 'y'), zlib = True)
-    test[:,:]   = valid[:,:]
+    test        = block_variable(out, 'ONNS_water', 'b', ('x', 'y'), zlib = True)
+    test[rows, :] = valid[:,:]
     
     test.units              = '1'
     test.standard_name      = 'ONNS_water' 
@@ -1618,8 +1683,8 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
     test.coordinates        = 'lat lon' 
 
     
-    test        = out.createVariable('land', 'b', ('x', 'y'), zlib = True)
-    test[:,:]   = land[:,:]
+    test        = block_variable(out, 'land', 'b', ('x', 'y'), zlib = True)
+    test[rows, :] = land[:,:]
     
     test.units              = '1'
     test.standard_name      = 'land' 
@@ -1627,8 +1692,8 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
     test.coordinates        = 'lat lon' 
     
     
-    test        = out.createVariable('cloud', 'b', ('x', 'y'), zlib = True)
-    test[:,:]   = cloud[:,:]
+    test        = block_variable(out, 'cloud', 'b', ('x', 'y'), zlib = True)
+    test[rows, :] = cloud[:,:]
     
     test.units              = '1'
     test.standard_name      = 'cloud' 
@@ -1642,8 +1707,8 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
     
     if (output_size > 0):
     
-        test        = out.createVariable('AC_flag_negative_reflectance', 'b', ('x', 'y'), zlib = True)
-        test[:,:]   = flag_negative[:,:]
+        test        = block_variable(out, 'AC_flag_negative_reflectance', 'b', ('x', 'y'), zlib = True)
+        test[rows, :] = flag_negative[:,:]
         
         test.units              = '1'
         test.standard_name      = 'AC_flag_negative_reflectance' 
@@ -1651,8 +1716,8 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         test.coordinates        = 'lat lon' 
         
         
-        test        = out.createVariable('AC_flag_suspect_pixel', 'b', ('x', 'y'), zlib = True)
-        test[:,:]   = flag_suspect[:,:]
+        test        = block_variable(out, 'AC_flag_suspect_pixel', 'b', ('x', 'y'), zlib = True)
+        test[rows, :] = flag_suspect[:,:]
         
         test.units              = '1'
         test.standard_name      = 'AC_flag_suspect_pixel' 
@@ -1660,10 +1725,10 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         test.coordinates        = 'lat lon' 
             
         
-        test        = out.createVariable('OWT_flag_not_classifiable', 'b', ('x', 'y'), zlib = True)
+        test        = block_variable(out, 'OWT_flag_not_classifiable', 'b', ('x', 'y'), zlib = True)
         b           = np.zeros(valid.shape)
         b[valid]    = flag_nonclassify
-        test[:,:]   = b 
+        test[rows, :] = b 
         
         test.units              = '1'
         test.standard_name      = 'OWT_flag_not_classifiable' 
@@ -1671,10 +1736,10 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         test.coordinates        = 'lat lon' 
     
         
-        test        = out.createVariable('OWT_flag_insufficient_memberships', 'b', ('x', 'y'), zlib = True)
+        test        = block_variable(out, 'OWT_flag_insufficient_memberships', 'b', ('x', 'y'), zlib = True)
         b           = np.zeros(valid.shape)
         b[valid]    = flag_lowmember_01
-        test[:,:]   = b 
+        test[rows, :] = b 
         
         test.units              = '1'
         test.standard_name      = 'OWT_flag_insufficient_memberships' 
@@ -1682,10 +1747,10 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         test.coordinates        = 'lat lon'     
         
         
-        test        = out.createVariable('OWT_flag_low_memberships', 'b', ('x', 'y'), zlib = True)
+        test        = block_variable(out, 'OWT_flag_low_memberships', 'b', ('x', 'y'), zlib = True)
         b           = np.zeros(valid.shape)
         b[valid]    = flag_lowmember_03
-        test[:,:]   = b 
+        test[rows, :] = b 
         
         test.units              = '1'
         test.standard_name      = 'OWT_flag_low_memberships' 
@@ -1693,10 +1758,10 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         test.coordinates        = 'lat lon'     
     
         
-        test        = out.createVariable('OWT_flag_low_max_memberships', 'b', ('x', 'y'), zlib = True)
+        test        = block_variable(out, 'OWT_flag_low_max_memberships', 'b', ('x', 'y'), zlib = True)
         b           = np.zeros(valid.shape)
         b[valid]    = flag_lowmember_05
-        test[:,:]   = b 
+        test[rows, :] = b 
         
         test.units              = '1'
         test.standard_name      = 'OWT_flag_low_max_memberships' 
@@ -1704,10 +1769,10 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         test.coordinates        = 'lat lon'     
     
         
-        test        = out.createVariable('ONNS_valid', 'b', ('x', 'y'), zlib = True)
+        test        = block_variable(out, 'ONNS_valid', 'b', ('x', 'y'), zlib = True)
         b           = np.zeros(valid.shape)
         b[valid]    = flag_ONNS_valid
-        test[:,:]   = b 
+        test[rows, :] = b 
         
         test.units              = '1'
         test.standard_name      = 'ONNS_valid' 
@@ -1715,10 +1780,10 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         test.coordinates        = 'lat lon'     
     
             
-        test        = out.createVariable('Band_adapter_fail', 'b', ('x', 'y'), zlib = True)
+        test        = block_variable(out, 'Band_adapter_fail', 'b', ('x', 'y'), zlib = True)
         b           = np.zeros(valid.shape)
         b[valid]    = flag_adapter_fail
-        test[:,:]   = b 
+        test[rows, :] = b 
         
         test.units              = '1'
         test.standard_name      = 'Band_adapter_fail' 
@@ -1726,10 +1791,10 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         test.coordinates        = 'lat lon'     
         
         
-        test        = out.createVariable('flag_Case_bNN', 'i1', ('x', 'y'), zlib = True)
+        test        = block_variable(out, 'flag_Case_bNN', 'i1', ('x', 'y'), zlib = True)
         b           = np.zeros(valid.shape)
         b[valid]    = flag_Case_bNN
-        test[:,:]   = b 
+        test[rows, :] = b 
         
         test.units              = '1'
         test.standard_name      = 'flag_Case_bNN' 
@@ -1741,13 +1806,13 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         ### 
         # Save all related to optical water type classification 
     
-        test        = out.createVariable('OWT_max_membership', 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
+        test        = block_variable(out, 'OWT_max_membership', 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
         
         b           = np.zeros(valid.shape)
         b[valid]    = maxMemb
         b[~valid]   = np.nan
         
-        test[:,:]   = b
+        test[rows, :] = b
         
         test.units              = '1'
         test.standard_name      = 'OWT_max_membership' 
@@ -1756,13 +1821,13 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         
         
         
-        test        = out.createVariable('OWT_total_membership', 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
+        test        = block_variable(out, 'OWT_total_membership', 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
         
         b           = np.zeros(valid.shape)
         b[valid]    = total_membership
         b[~valid]   = np.nan
         
-        test[:,:]   = b
+        test[rows, :] = b
         
         test.units              = '1'
         test.standard_name      = 'OWT_total_membership' 
@@ -1775,16 +1840,16 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
             for N in range(1, 14):      # 1 to 13 
              
                 if N < 10:
-                    test            = out.createVariable('OWT_original_weights_0' + str(N), 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
-                    test2           = out.createVariable('OWT_proportional_weights_0' + str(N), 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
+                    test            = block_variable(out, 'OWT_original_weights_0' + str(N), 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
+                    test2           = block_variable(out, 'OWT_proportional_weights_0' + str(N), 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
                 else: 
-                    test            = out.createVariable('OWT_original_weights_' + str(N), 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
-                    test2           = out.createVariable('OWT_proportional_weights_' + str(N), 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
+                    test            = block_variable(out, 'OWT_original_weights_' + str(N), 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
+                    test2           = block_variable(out, 'OWT_proportional_weights_' + str(N), 'f4', ('x', 'y'), zlib = True, fill_value = np.nan)
                 
                 b           = np.zeros(valid.shape)
                 b[valid]    = m[:, N-1]
                 b[~valid]   = np.nan
-                test[:,:]   = b[:,:]
+                test[rows, :] = b[:,:]
                 
                 test.units              = '1'
                 test.standard_name      = 'OWT_original_weights' 
@@ -1795,7 +1860,7 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
                 b           = np.zeros(valid.shape)
                 b[valid]    = m2[:, N-1]
                 b[~valid]   = np.nan
-                test2[:,:]  = b[:,:]
+                test2[rows, :] = b[:,:]
                 
                 test2.units             = '1'
                 test2.standard_name     = 'OWT_proportional_weights' 
@@ -1821,14 +1886,14 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         
         if (output_size == 2):
             
-            test            = out.createVariable(Variables_OWT[i], 'f4', ('x','y'), zlib = True, fill_value = np.nan)
+            test            = block_variable(out, Variables_OWT[i], 'f4', ('x','y'), zlib = True, fill_value = np.nan)
             
             a               = total_out_weighted[:,i]
             b               = np.zeros(valid.shape)
             b[valid]        = a
             b[~valid]       = np.nan
             
-            test[:,:]       = b
+            test[rows, :]     = b
             
             test.units              = Units_1[i]
             test.standard_name      = Variables_1[i]
@@ -1837,14 +1902,14 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
             
             
             
-            test            = out.createVariable(Variables_bNN[i], 'f4', ('x','y'), zlib = True, fill_value = np.nan)
+            test            = block_variable(out, Variables_bNN[i], 'f4', ('x','y'), zlib = True, fill_value = np.nan)
             
             a               = total_out_bNN[:,i]
             b               = np.zeros(valid.shape)
             b[valid]        = a
             b[~valid]       = np.nan
             
-            test[:,:]       = b
+            test[rows, :]     = b
             
             test.units              = Units_1[i]
             test.standard_name      = Variables_1[i]
@@ -1853,14 +1918,14 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
             
         
         
-        test            = out.createVariable(Variables_1[i], 'f4', ('x','y'), zlib = True, fill_value = np.nan)
+        test            = block_variable(out, Variables_1[i], 'f4', ('x','y'), zlib = True, fill_value = np.nan)
 
         a               = total_out_merged[:,i]
         b               = np.zeros(valid.shape)
         b[valid]        = a
         b[~valid]       = np.nan
         
-        test[:,:]       = b
+        test[rows, :]     = b
         
         test.units              = Units_1[i]
         test.standard_name      = Variables_1[i]
@@ -1878,14 +1943,14 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
 
     for i in range(len(Variables_2)):
         
-        test            = out.createVariable(Variables_2[i], 'f4', ('x','y'), zlib = True, fill_value = np.nan)
+        test            = block_variable(out, Variables_2[i], 'f4', ('x','y'), zlib = True, fill_value = np.nan)
         
         a               = total_BIAS_out_weighted[:,i]
         b               = np.zeros(valid.shape)
         b[valid]        = a
         b[~valid]       = np.nan
         
-        test[:,:]       = b
+        test[rows, :]     = b
 
         test.units              = 'percent'
         test.standard_name      = Variables_2[i]
@@ -1905,12 +1970,12 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         
         for i in range(0, 11):
             
-            test            = out.createVariable(Variables_3[i], 'f4', ('x','y'), zlib = True, fill_value = np.nan)
+            test            = block_variable(out, Variables_3[i], 'f4', ('x','y'), zlib = True, fill_value = np.nan)
             
             b               = np.zeros(valid.shape)
             b[valid]        = Rrs_ONNS[:, i]
             b[~valid]       = np.nan
-            test[:,:]       = b[:,:]
+            test[rows, :]     = b[:,:]
             
             test.units              = 'sr-1'
             test.standard_name      = Variables_3[i] 
@@ -1920,13 +1985,13 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
                     
 
         
-        test            = out.createVariable('lambda_Rrs_max', 'f4', ('x','y'), zlib = True, fill_value = np.nan)
+        test            = block_variable(out, 'lambda_Rrs_max', 'f4', ('x','y'), zlib = True, fill_value = np.nan)
         
         b               = np.zeros(valid.shape)
         b[valid]        = lambda_Rrs_max
         b[~valid]       = np.nan
         
-        test[:,:]       = b
+        test[rows, :]     = b
         
         test.units              = 'nm'
         test.standard_name      = 'lambda_Rrs_max' 
@@ -1943,14 +2008,14 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         
         atot            = np.zeros((total_out_merged.shape[0]))
         
-        test            = out.createVariable('a_tot_440_ONNS', 'f4', ('x','y'), zlib = True, fill_value = np.nan)
+        test            = block_variable(out, 'a_tot_440_ONNS', 'f4', ('x','y'), zlib = True, fill_value = np.nan)
             
         atot            = total_out_merged[:,3] + total_out_merged[:,4] + total_out_merged[:,5] + aw_440_20deg_30psu    # MH: a_cdom + a_p + a_m + a_w
         b               = np.zeros(valid.shape)
         b[valid]        = atot
         b[~valid]       = np.nan
         
-        test[:,:]       = b
+        test[rows, :]     = b
         
         test.units              = 'm-1'
         test.standard_name      = 'a_tot_440_ONNS'
@@ -1961,14 +2026,14 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
             
         a               = np.zeros((total_out_merged.shape[0]))
         
-        test            = out.createVariable('b_tot_440_ONNS', 'f4', ('x','y'), zlib = True, fill_value = np.nan)
+        test            = block_variable(out, 'b_tot_440_ONNS', 'f4', ('x','y'), zlib = True, fill_value = np.nan)
             
         a               = total_out_merged[:,6] + total_out_merged[:,7] + bw_440_20deg_30psu        # MH: b_p + b_m + b_w
         b               = np.zeros(valid.shape)
         b[valid]        = a
         b[~valid]       = np.nan
         
-        test[:,:]       = b
+        test[rows, :]     = b
         
         test.units              = 'm-1'
         test.standard_name      = 'b_tot_440_ONNS'
@@ -2006,13 +2071,13 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
     
     
     
-        test            = out.createVariable('Optical_dominance_ONNS', 'f4', ('x','y'), zlib = True, fill_value = np.nan)
+        test            = block_variable(out, 'Optical_dominance_ONNS', 'f4', ('x','y'), zlib = True, fill_value = np.nan)
             
         #b          = np.zeros(valid.shape)
         b[valid]        = Dominance
         b[~valid]       = np.nan
         
-        test[:,:]       = b
+        test[rows, :]     = b
         
         test.units              = '-'
         test.standard_name      = 'Optical_dominance_ONNS'
@@ -2028,14 +2093,14 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
         
         a               = np.zeros((total_out_merged.shape[0]))
         
-        test            = out.createVariable('DOC', 'f4', ('x','y'), zlib = True, fill_value = np.nan)
+        test            = block_variable(out, 'DOC', 'f4', ('x','y'), zlib = True, fill_value = np.nan)
             
         a               = 10**2.525 * total_out_merged[:,3]**0.659              # MH:  10**2.525* ag440**0.659 according Juhls et al. (2019)  
         b               = np.zeros(valid.shape)
         b[valid]        = a
         b[~valid]       = np.nan
         
-        test[:,:]       = b
+        test[rows, :]     = b
         
         test.units              = 'mg.m-3'
         test.standard_name      = 'DOC'
@@ -2051,8 +2116,10 @@ def save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted,
 
 
 #def save_results_txt(outname, outname_1, maxMemb, m, m2, total_membership, total_out_weighted, total_out_weighted_with_Unc, total_out_bNN, total_out_merged, total_BIAS_out_weighted, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid, Rrs_ONNS, flag_Case_bNN, version, output_size, lambda_Rrs_max, P_ID):
-def save_results_txt(outname, outname_1, outname_2, outname_3, maxMemb, m, m2, total_membership, total_out_weighted, total_out_bNN, total_out_merged, total_BIAS_out_weighted, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid, Rrs_ONNS, flag_Case_bNN, version, output_size, lambda_Rrs_max, P_ID):
+def save_results_txt(outname, outname_1, outname_2, outname_3, maxMemb, m, m2, total_membership, total_out_weighted, total_out_bNN, total_out_merged, total_BIAS_out_weighted, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid, Rrs_ONNS, flag_Case_bNN, version, output_size, lambda_Rrs_max, P_ID, header = True):
    
+    # Results of further blocks are appended to the files of the first block, header = False skips the header lines 
+
     ###
     # One file with ONNS products - reduced or full output
     
@@ -2062,7 +2129,8 @@ def save_results_txt(outname, outname_1, outname_2, outname_3, maxMemb, m, m2, t
         
         Header          = ['%      P_ID    Chl_ONNS   CDOM_ONNS    ISM_ONNS  ag440_ONNS  ap440_ONNS  am440_ONNS  bp440_ONNS  bm440_ONNS     FU_ONNS  Kd490_ONNS  Ku490_ONNS adg412_ONNS bbp510_ONNS']
     
-        np.savetxt(f, X = Header, delimiter = '\t', fmt = '%s')
+        if header:
+            np.savetxt(f, X = Header, delimiter = '\t', fmt = '%s')
         
         data            = np.zeros((total_out_merged.shape[0], 14))
         
@@ -2115,7 +2183,8 @@ def save_results_txt(outname, outname_1, outname_2, outname_3, maxMemb, m, m2, t
             
         Header          = ['%        ID    Chl_ONNS   CDOM_ONNS    ISM_ONNS  ag440_ONNS  ap440_ONNS  am440_ONNS  bp440_ONNS  bm440_ONNS     FU_ONNS  Kd490_ONNS  Ku490_ONNS adg412_ONNS bbp510_ONNS     atot440     btot440   dominance   POC_TSM_1   POC_TSM_2   POC_Phy_1   POC_Phy_2    POC_ONNS    DOC_ONNS     MaxMemb     Rrs_max']
 
-        np.savetxt(f, X = Header,  fmt = '%s')
+        if header:
+            np.savetxt(f, X = Header,  fmt = '%s')
         
         data            = np.zeros((total_out_merged.shape[0], 25))
         
@@ -2152,7 +2221,8 @@ def save_results_txt(outname, outname_1, outname_2, outname_3, maxMemb, m, m2, t
     
     Header      = ['%        ID   UChl_ONNS   UISM_ONNS Uag440_ONNS Uap440_ONNS Uam440_ONNS Ubp440_ONNS Ubm440_ONNS    UFU_ONNS UKd490_ONNS UKu490_ONNS Uad412_ONNS Ubb510_ONNS']
     
-    np.savetxt(f, X = Header, delimiter = '\t', fmt = '%s')
+    if header:
+        np.savetxt(f, X = Header, delimiter = '\t', fmt = '%s')
     
     data        = np.zeros((total_out_merged.shape[0], 13))
     
@@ -2178,7 +2248,8 @@ def save_results_txt(outname, outname_1, outname_2, outname_3, maxMemb, m, m2, t
         
         Header      = ['%        ID      Rrs400      Rrs412      Rrs443      Rrs490      Rrs510      Rrs560      Rrs620      Rrs665      Rrs755      Rrs778      Rrs865']
         
-        np.savetxt(f, X = Header, delimiter = '\t', fmt = '%s')
+        if header:
+            np.savetxt(f, X = Header, delimiter = '\t', fmt = '%s')
         
         data        = np.zeros((Rrs_ONNS.shape[0], 12))
         
@@ -2205,7 +2276,8 @@ def save_results_txt(outname, outname_1, outname_2, outname_3, maxMemb, m, m2, t
         Header      = ['%        ID      Rrs400      Rrs412      Rrs443      Rrs490      Rrs510      Rrs560      Rrs620      Rrs665      Rrs755      Rrs778      Rrs865']
         Header      = ['%        ID       OWT01       OWT02       OWT03       OWT04       OWT05       OWT06       OWT07       OWT08       OWT09       OWT10       OWT11       OWT12       OWT13']
         
-        np.savetxt(f, X = Header, delimiter = '\t', fmt = '%s')
+        if header:
+            np.savetxt(f, X = Header, delimiter = '\t', fmt = '%s')
         
         data        = np.zeros((m.shape[0], 14))
         
@@ -2248,6 +2320,7 @@ if __name__=='__main__':
     parser.add_argument('-txt_header', action = 'store', help = 'For in situ data (txt format): 0 = no header, 1 = header line (default), n = number of header lines') 
     parser.add_argument('-txt_ID', action = 'store', help = 'For in situ data (txt format): 0 = no line IDs (e.g. station number), 1 = first column with ID (default)') 
     parser.add_argument('-txt_columns', '--list', nargs = '+', action = 'store', help = 'For in situ data (txt format) and depending on sensor: Specification of used columns, e.g. [0, 1, 2, 3, 4, 5, 6, 7, 11, 15, 16] = columns of OLCI bands used for ONNS', required = True)
+    parser.add_argument('-block_size', action = 'store', help = 'Number of spectra processed at a time (default 100000); smaller blocks need less memory')
     
     
     args                = parser.parse_args()
@@ -2547,6 +2620,12 @@ if __name__=='__main__':
 
     
     
+    if args.block_size is not None:
+        block_size      = int(args.block_size)
+    else:
+        block_size      = 100000
+    
+    
     ### -------------------------------------------------------------------
    
     print('Start: ', str(dt.now()))
@@ -2557,25 +2636,11 @@ if __name__=='__main__':
         
         Rrs_in, P_ID                            = prepare_processor_input_txt(inpath, infile, sensor, txt_ID, txt_columns, txt_header)
         
-        Rrs_ONNS, flag_adapter_fail             = sensor_band_adapter(path_to_NN, Rrs_in, sensor, adapt)        
-
-        m, m2, total_membership, maxMemb, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid     = classify_clustering_fuzzy(output_size, Rrs_ONNS, path_to_classes = path_to_classes)
-            
-        print('Approx. 15 % - ONNS application ...')    
-        
-        total_out_weighted, Chl_unweighted      = ONNS(path_to_NN, Rrs_ONNS, m2)
+        for start, stop, results in process_blockwise(path_to_NN, path_to_classes, Rrs_in, sensor, adapt, output_size, block_size = block_size):
             
-        print('Approx. 50 % - ONNS Background NN ...')
-        
-        total_out_bNN, Case, lambda_Rrs_max     = background_NN(path_to_NN, Rrs_ONNS)   
-        
-        print('Approx. 75 % - ONNS BIAS application ...')
-        
-        total_out_merged, flag_Case_bNN         = merge_products(total_membership, total_out_weighted, total_out_bNN, Case)
-
-        total_BIAS_out_weighted                 = apply_BIAS_NN(path_to_NN, total_out_weighted, m2)
+            Rrs_ONNS, flag_adapter_fail, m, m2, total_membership, maxMemb, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid, total_out_weighted, total_out_bNN, Case, lambda_Rrs_max, total_out_merged, flag_Case_bNN, total_BIAS_out_weighted     = results
                 
-        save_results_txt(outname, outname_1, outname_2, outname_3, maxMemb, m, m2, total_membership, total_out_weighted, total_out_bNN, total_out_merged, total_BIAS_out_weighted, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid, Rrs_ONNS, flag_Case_bNN, version, output_size, lambda_Rrs_max, P_ID)
+            save_results_txt(outname, outname_1, outname_2, outname_3, maxMemb, m, m2, total_membership, total_out_weighted, total_out_bNN, total_out_merged, total_BIAS_out_weighted, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid, Rrs_ONNS, flag_Case_bNN, version, output_size, lambda_Rrs_max, P_ID[start:stop], header = (start == 0))
 
         
         
@@ -2584,40 +2649,38 @@ if __name__=='__main__':
             
         if (sensor == 'OLCI'):
             
-            Rrs_in, valid, scene_in_rhow, lat, lon, cloud, land, AC, flag_negative, flag_suspect  = prepare_processor_input(inpath, infile)
+            prepare_input   = prepare_processor_input
         
         elif (sensor == 'MERIS'):
             
-            Rrs_in, valid, scene_in_rhow, lat, lon, cloud, land, AC, flag_negative, flag_suspect  = prepare_processor_input_MERIS(inpath, infile)
+            prepare_input   = prepare_processor_input_MERIS
             
         elif (sensor == 'MODIS'):
             
-            Rrs_in, valid, scene_in_rhow, lat, lon, cloud, land, AC, flag_negative, flag_suspect  = prepare_processor_input_MODIS(inpath, infile)
+            prepare_input   = prepare_processor_input_MODIS
                            
         elif (sensor == 'VIIRS'):
             
-            Rrs_in, valid, scene_in_rhow, lat, lon, cloud, land, AC, flag_negative, flag_suspect  = prepare_processor_input_VIIRS(inpath, infile)
+            prepare_input   = prepare_processor_input_VIIRS
 
 
-        Rrs_ONNS, flag_adapter_fail             = sensor_band_adapter(path_to_NN, Rrs_in, sensor, adapt)
+        # MH: the scene is read, processed and saved in blocks of whole rows with about block_size pixels each 
         
-        m, m2, total_membership, maxMemb, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid     = classify_clustering_fuzzy(output_size, Rrs_ONNS, path_to_classes = path_to_classes)
-            
-        print('Approx. 15 % - ONNS application ...')    
-        
-        total_out_weighted, Chl_unweighted      = ONNS(path_to_NN, Rrs_ONNS, m2)
-            
-        print('Approx. 50 % - ONNS Background NN ...')
+        shape           = scene_shape(inpath, infile)
         
-        total_out_bNN, Case, lambda_Rrs_max     = background_NN(path_to_NN, Rrs_ONNS)   
+        block_rows      = max(block_size // shape[1], 1)
         
-        print('Approx. 75 % - ONNS BIAS application ...')
-               
-        total_out_merged, flag_Case_bNN         = merge_products(total_membership, total_out_weighted, total_out_bNN, Case)
-
-        total_BIAS_out_weighted                 = apply_BIAS_NN(path_to_NN, total_out_weighted, m2)
+        for row in range(0, shape[0], block_rows):
+            
+            print('Rows {:d} to {:d} of {:d} ...'.format(row + 1, min(row + block_rows, shape[0]), shape[0]))
+            
+            rows            = slice(row, min(row + block_rows, shape[0]))
+            
+            Rrs_in, valid, scene_in_rhow, lat, lon, cloud, land, AC, flag_negative, flag_suspect  = prepare_input(inpath, infile, rows)
+            
+            Rrs_ONNS, flag_adapter_fail, m, m2, total_membership, maxMemb, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid, total_out_weighted, total_out_bNN, Case, lambda_Rrs_max, total_out_merged, flag_Case_bNN, total_BIAS_out_weighted     = process_block(path_to_NN, path_to_classes, Rrs_in, sensor, adapt, output_size)
                 
-        save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted, total_out_bNN, total_out_merged, total_BIAS_out_weighted, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid, Rrs_ONNS, valid, flag_adapter_fail, flag_Case_bNN, version, output_size, lambda_Rrs_max)
+            save_results(outname, maxMemb, m, m2, total_membership, total_out_weighted, total_out_bNN, total_out_merged, total_BIAS_out_weighted, flag_nonclassify, flag_lowmember_01, flag_lowmember_03, flag_lowmember_05, flag_lowmember_09, flag_ONNS_valid, Rrs_ONNS, valid, flag_adapter_fail, flag_Case_bNN, version, output_size, lambda_Rrs_max, rows = rows, shape = shape)
     
     
     
@@ -61,7 +61,7 @@ class nnhs():
 					h[i, j]=fp.readline()
 			self.wgt.append(h) #fscanf(fp,'%g',self.size(npl+1))  
 		fp.close()
-		self.oorange=np.zeros(self.ninp, dtype=np.int)
+		self.oorange=np.zeros(self.ninp, dtype=int)
 	
 	def ff_nnhs(self,  inp):
 		act=(inp-self.inrange[0,:])/(self.inrange[1,:]-self.inrange[0,:])
@@ -77,6 +77,16 @@ class nnhs():
 		res=act*(self.outrange[1,:]-self.outrange[0,:])+self.outrange[0,:]
 		return res
 	
+	def ff_nnhs_batch(self,  inp):
+		# batched version of ff_nnhs: inp holds one input vector per row (pixels x ninp), returns (pixels x noutp)
+		act=(np.asarray(inp, dtype='float')-self.inrange[0,:])/(self.inrange[1,:]-self.inrange[0,:])
+		for npl in range(self.nplanes-1):
+			sum=np.dot(act, self.wgt[npl].T)+self.bias[npl]
+			np.clip(sum, -10., 10., out=sum)
+			act=1./(1.+np.exp(-sum))
+		res=act*(self.outrange[1,:]-self.outrange[0,:])+self.outrange[0,:]
+		return res
+	
 #	def info(self):
 #		for  inp in self.input:
 #			#print inp, 	                                                   # MH: 20181207 - python 3.0 ney syntax!
@@ -118,6 +128,15 @@ class nnhs():
 			#print 'input:',self.invar[i], 'out of range:', self.oorange[i]  
 			print('input:',self.invar[i], 'out of range:', self.oorange[i])    # MH: 20181207 - python 3.0 ney syntax!
 
+_loaded={}
+
+def load_nnhs(nnhs_file):
+	# returns the network of nnhs_file; each file is parsed only once, afterwards the weights are taken from the cache
+	nnhs_file=os.path.abspath(nnhs_file)
+	if nnhs_file not in _loaded:
+		_loaded[nnhs_file]=nnhs(nnhs_file)
+	return _loaded[nnhs_file]
+
 ####################################################################### 
 #test
 if __name__=='__main__':
@@ -168,6 +168,8 @@ class LUT:
         self.est_time = None
         self.nodat = None
         self.intboost = None
+        self.n_jobs = 1  # number of processes which create the LUT in parallel
+        self.store = "npy"  # "npy": one file per split, "memmap": one memory-mapped LUT file
         self.speed = None
         self.bg_spec = None
         self.bg_type = "default"
@@ -856,6 +858,8 @@ class LUT:
         self.ns = int(self.gui.spinNS.value())
         self.intboost = int(self.gui.spinIntBoost.value())
         self.nodat = int(self.gui.spinNoData.value())
+        self.n_jobs = int(self.gui.spinJobs.value())
+        self.store = "memmap" if self.gui.chkMemmap.isChecked() else "npy"
 
     def check_inputs(self):
         # check if inputs are valid and respond with errors if values are missing, out of range etc.
@@ -1049,7 +1053,7 @@ class LUT:
                                         cbc=self.dict_vals['cbc'], LAIu=self.dict_vals['LAIu'],
                                         cd=self.dict_vals['cd'], sd=self.dict_vals['sd'], h=self.dict_vals['h'],
                                         prgbar_widget=self.main.prg_widget, qgis_app=self.main.qgis_app,
-                                        depends=self.depends)
+                                        depends=self.depends, n_jobs=self.n_jobs, store=self.store)
 
         except ValueError as e:
             self.abort(message="An error occurred while creating the LUT: %s" % str(e))
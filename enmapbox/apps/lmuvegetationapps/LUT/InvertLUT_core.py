@@ -28,7 +28,10 @@
 # The idea is to browse through all spectra of the LUT, treating it as a library, and detect the spectra with closest
 # relation to the measured reflectances; The median of the n-best fits is considered the valid result
 
+from concurrent.futures import ThreadPoolExecutor
+
 from enmapbox.coreapps._classic.hubflow.core import *
+from lmuvegetationapps.Resources.PROSAIL.call_model import read_lut_ensemble
 from matplotlib import pyplot as plt
 import numpy as np
 
@@ -40,6 +43,10 @@ class RTMInversion:
         self.error = None
         self.ctype = 0  # cost function type
         self.nbfits = 0  # number of best fits to invert
+        self.fit_statistic = "median"  # how to combine the parameters of the n best fits: "median" or "mean"
+        self.search = "brute"  # "brute": compare against all LUT members, "kdtree": use a KD-tree (RMSE only)
+        self.n_jobs = 1  # number of threads inverting chunks of pixels in parallel
+        self.chunk_memory = 2 ** 28  # memory (in bytes) for comparing a chunk of pixels against the LUT
         self.noisetype = 0  # 0: off, 1: additive, 2: multiplicative, 3: inverse multiplicative
         self.noiselevel = 0  # std of the noise
         self.nodat = [0] * 3  # 0: input image, 1: geometry image, 2: output image
@@ -68,10 +75,13 @@ class RTMInversion:
 
     def inversion_setup(self, image, image_out, LUT_path, ctype, nbfits, nbfits_type, noisetype, noiselevel,
                         wl_image, exclude_bands, out_mode, geo_image=None, geo_fixed=None, spatial_geo=False,
-                        nodat=None, mask_image=None):
+                        nodat=None, mask_image=None, fit_statistic="median", search="brute", n_jobs=1):
 
         self.ctype = ctype
         self.nbfits = nbfits
+        self.fit_statistic = fit_statistic
+        self.search = search
+        self.n_jobs = n_jobs
         self.nbfits_type = nbfits_type
         self.noisetype = noisetype
         self.noiselevel = noiselevel
@@ -230,6 +240,47 @@ class RTMInversion:
 
         return delta
 
+    @staticmethod
+    def _costfun_batch(image_ref, model_ref, ctype, model_sqnorm=None):
+        # Batched version of _costfun: image_ref holds one spectrum per row (npixel x nbands) and model_ref one LUT
+        # member per column (nbands x nlut); returns the distances of all pixels to all LUT members (npixel x nlut)
+        nbands = image_ref.shape[1]
+        if ctype == 1:  # RMSE, with squared distances obtained as ||a||² + ||b||² - 2ab by a fast matrix product
+            if model_sqnorm is None:
+                model_sqnorm = np.einsum('ij,ij->j', model_ref, model_ref, dtype=np.float64)
+            delta = np.sum(image_ref ** 2, axis=1)[:, np.newaxis] + model_sqnorm[np.newaxis, :]
+            delta -= 2 * np.dot(image_ref, model_ref)
+            np.maximum(delta, 0, out=delta)  # floating point inaccuracies may result in small negative values
+            delta = np.sqrt(delta / nbands)
+        elif ctype == 2 or ctype == 3:  # MAE or mNSE, accumulated band by band to keep memory usage low
+            delta = np.zeros(shape=(image_ref.shape[0], model_ref.shape[1]))
+            for iband in range(nbands):
+                delta += np.abs(image_ref[:, iband, np.newaxis] - model_ref[np.newaxis, iband, :])
+            if ctype == 3:
+                image_dev = np.sum(np.abs(image_ref - np.mean(image_ref, axis=1)[:, np.newaxis]), axis=1)
+                delta = 1.0 - delta / image_dev[:, np.newaxis]
+        else:
+            delta = None
+            exit("wrong cost function type. Expected 1, 2 or 3; got %i instead" % ctype)
+
+        return delta
+
+    def _nbest_fits(self, image_ref, lut, lut_sqnorm=None, tree=None):
+        # Find the indices of the n best fitting LUT members for each pixel (npixel x nbfits)
+        nbfits = max(1, min(self.nbfits, lut.shape[1]))
+        if tree is not None:  # KD-tree search: Euclidean distance gives the same ranking as RMSE
+            _, nbest_subset = tree.query(image_ref, k=nbfits)
+            return nbest_subset.reshape(image_ref.shape[0], nbfits)
+        estimates = self._costfun_batch(image_ref=image_ref, model_ref=lut, ctype=self.ctype, model_sqnorm=lut_sqnorm)
+        return np.argpartition(estimates, nbfits - 1, axis=1)[:, :nbfits]
+
+    def _combine_fits(self, lut_params, nbest_subset):
+        # Obtain the final result for each pixel from the parameters of the n best fits (npara x npixel)
+        params = lut_params[:, nbest_subset]  # npara x npixel x nbfits
+        if self.fit_statistic == "mean":
+            return np.mean(params, axis=2)
+        return np.median(params, axis=2)
+
     def get_lutmeta(self, file):
         with open(file, 'r') as metafile:
             metacontent = metafile.readlines()
@@ -271,6 +322,8 @@ class RTMInversion:
         # parameters are added later on!
         self.whichpara = metacontent[13].split("=")[1].split(";")
         self.npara = len(self.whichpara)
+        # LUTs created before the memory-mapped store was introduced do not have this entry
+        self.store = metacontent[15].split("=")[1] if len(metacontent) > 15 else "npy"
 
         self.nangles_LUT = [len(self.tts_LUT), len(self.tto_LUT), len(self.psi_LUT)]
         if self.nbfits_type == "rel":
@@ -312,49 +365,55 @@ class RTMInversion:
         for i_ilut, ilut in enumerate(self.whichLUT_unique):
             if whichLUT_coords[i_ilut][0].size == 0:
                 continue  # after masking, not all 'iluts' are present in the image_copy
-            # make a list of all files that make up one LUT from splits
-            load_objects = [np.load(self.LUT_base + "_" + str(ilut) + "_" + str(split) + ".npy")
-                            for split in range(self.splits)]
-            lut = np.hstack(load_objects)  # load all splits of the current geo_ensembles into "lut"
-
-            lut_params = lut[:self.npara, :]  # extract parameters - they are at the beginning rows of lut
-            lut = np.delete(lut, self.exclude_bands_model, axis=0)  # delete exclude_bands_model - members
-            lut = self.add_noise(ref_array=lut, noise_type=self.noisetype, sigma=self.noiselevel)  # add noise
-
-            samples_size = len(whichLUT_coords[i_ilut][0])  # how many pixels in the current iLUT (whichLUT member)
+            # load all splits of the current geo_ensembles into "lut" (a view for memory-mapped LUTs)
+            lut = read_lut_ensemble(self.LUT_base, ilut, self.splits, self.store)
+
+            lut_params = np.array(lut[:self.npara, :])  # extract parameters - they are at the beginning rows of lut
+            # select all rows except exclude_bands_model - members; a contiguous selection stays a view into the LUT
+            keep_rows = np.setdiff1d(np.arange(lut.shape[0]), self.exclude_bands_model)
+            if np.all(np.diff(keep_rows) == 1):
+                lut = lut[keep_rows[0]:keep_rows[-1] + 1, :]
+            else:
+                lut = lut[keep_rows, :]
+            if self.noisetype in [1, 2, 3]:  # add noise to a copy, the LUT itself may be a read-only view
+                lut = self.add_noise(ref_array=lut, noise_type=self.noisetype, sigma=self.noiselevel)
+
+            pixel_rows, pixel_cols = whichLUT_coords[i_ilut]
+            samples_size = len(pixel_rows)  # how many pixels in the current iLUT (whichLUT member)
             result = np.zeros(shape=(self.npara, samples_size))
 
-            # Iterate over each pixel sample (whichLUT)
-            for isample in range(samples_size):
-                # Get reflectance data of the current sample (all pixels at once)
-                mydata = self.image[:, whichLUT_coords[i_ilut][0][isample], whichLUT_coords[i_ilut][1][isample]]
-
-                # calculate distances between sample and all LUT-members of iLUT
-                estimates = self._costfun(image_ref=mydata[:, np.newaxis], model_ref=lut, ctype=self.ctype)
-                pix_current += 1
-                if isample % 1000 == 0:  # update the progress bar every 1000 pixels
-                    if prg_widget:
-                        pix_limit = pix_current + 999
-                        if pix_limit > npixel_valid:
-                            pix_limit = npixel_valid
+            # Prepare the LUT once for all pixels: squared norms for RMSE or a KD-tree index
+            lut_sqnorm = np.einsum('ij,ij->j', lut, lut, dtype=np.float64) if self.ctype == 1 else None
+            tree = None
+            if self.search == "kdtree" and self.ctype == 1:
+                from scipy.spatial import cKDTree
+                tree = cKDTree(lut.T)
+
+            # Pixels are inverted in chunks, each chunk is compared against all LUT members at once; per pixel and LUT
+            # member this needs the distance and a matrix product temporary (float64) and the argpartition result (int64)
+            chunk_size = max(1, self.chunk_memory // (lut.shape[1] * 8 * 3))
+            chunks = [slice(start, min(start + chunk_size, samples_size))
+                      for start in range(0, samples_size, chunk_size)]
+
+            def invert_chunk(chunk):
+                # Get reflectance data of the current chunk (one pixel per row)
+                mydata = self.image[:, pixel_rows[chunk], pixel_cols[chunk]].T.astype(np.float64)
+                nbest_subset = self._nbest_fits(image_ref=mydata, lut=lut, lut_sqnorm=lut_sqnorm, tree=tree)
+                return chunk, self._combine_fits(lut_params=lut_params, nbest_subset=nbest_subset)
+
+            with ThreadPoolExecutor(max_workers=max(1, self.n_jobs)) as pool:
+                for chunk, chunk_result in pool.map(invert_chunk, chunks):
+                    result[:, chunk] = chunk_result
+                    pix_first = pix_current + 1
+                    pix_current += chunk.stop - chunk.start
+                    if prg_widget:  # update the progress bar after each chunk
                         prg_widget.gui.lblCaption_r.setText('Inverting pixels {:d}-{:d} of {:d}'
-                                                            .format(pix_current, pix_limit, npixel_valid))
+                                                            .format(pix_first, pix_current, npixel_valid))
                         prg_widget.gui.prgBar.setValue(pix_current * 100 // npixel_valid)
                         qgis_app.processEvents()
                     else:
-                        print("LUT_unique #{:d} of {:d}: Checking sample {:d} of {:d}"
-                              .format(i_ilut, len(self.whichLUT_unique), isample, samples_size))
-
-                # nbest_subset is a subset of LUT for the n best performing entries
-                nbest_subset = np.argpartition(estimates, self.nbfits)[0:self.nbfits]
-                # sort in order of distance: closest match is nbest_subset[0]
-                nbest_subset = nbest_subset[np.argsort(estimates[nbest_subset])]
-
-                # Obtain the final result for this sample: The median of the subset
-                result[:, isample] = np.median(lut_params[:, nbest_subset], axis=1)
-
-                # Visualize: turn this on and specify WHEN to visualize if necessary
-                # self._visualize(image_ref == mydata, model_ref=nbest_subset[0])
+                        print("LUT_unique #{:d} of {:d}: Checking samples {:d}-{:d} of {:d}"
+                              .format(i_ilut, len(self.whichLUT_unique), chunk.start, chunk.stop, samples_size))
 
             # Place all results for this whichLUT run in the out_matrix
             self.out_matrix[:, whichLUT_coords[i_ilut][0], whichLUT_coords[i_ilut][1]] = result
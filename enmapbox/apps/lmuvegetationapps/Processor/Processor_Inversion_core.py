@@ -46,6 +46,7 @@ from sklearn.metrics import mean_squared_error, r2_score
 # from modAL.models import BayesianOptimizer
 from sklearn.metrics import pairwise_distances
 from sklearn.linear_model import LinearRegression
+from lmuvegetationapps.Resources.PROSAIL.call_model import read_lut_ensemble
 
 
 # from modAL.uncertainty import uncertainty_sampling
@@ -337,6 +338,7 @@ class ProcessorTraining:
         # LUT
         self.get_meta_LUT(lut_metafile=lut_metafile)  # read meta information of the LUT to be trained
         self.splits = int(self.meta_dict['splits'])  # number of splits per geo-ensemble in the LUT
+        self.store = self.meta_dict.get('store', 'npy')  # one .npy-file per split or a memory-mapped LUT
         self.conversion_factor = int(self.meta_dict['multiplication_factor'])  # LUT boost e.g. 10000 for EnMAP
         self.lut_metafile = lut_metafile  # full path to the LUT metafile
         self.lut_basedir = os.path.dirname(lut_metafile)  # basic directory in which the LUT is stored
@@ -510,8 +512,7 @@ class ProcessorTraining:
 
     def read_lut(self, geo):
         # open a lut-file and reads the content; loads all splits of one geo-ensemble which is passed into the method
-        lut = np.hstack([np.load(self.lut_base + '_{:d}_{:d}'.format(geo, split) + ".npy")
-                        for split in range(self.splits)])  # load all splits of the current geo_ensembles
+        lut = read_lut_ensemble(self.lut_base, geo, self.splits, self.store)  # all splits of the current geo_ensembles
         # only select the rows with correct band information, then transpose into columns
         X = np.asarray(lut[self.subset_bands_lut, :]).T
         y = np.zeros(shape=(lut.shape[1], len(self.para_list)))  # open up a new array for PROSAIL parameters
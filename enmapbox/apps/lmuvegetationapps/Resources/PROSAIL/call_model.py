@@ -28,6 +28,9 @@
 """
 
 import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 from scipy.stats import truncnorm
 import lmuvegetationapps.Resources.PROSAIL.SAIL as SAIL_v
@@ -41,6 +44,65 @@ import time
 warnings.filterwarnings('ignore')  # do not show warnings (set to 'all' if you want to see warnings, too)
 
 
+def read_lut_ensemble(lut_base, geo_ensemble, splits, store="npy"):
+    # Returns all runs of one geometry ensemble of a LUT (npara + nbands rows, one column per run)
+    # store "npy": the splits are loaded from their .npy-files and concatenated
+    # store "memmap": the ensemble is a view into the memory-mapped LUT file, no data is read before it is accessed
+    if store == "memmap":
+        return np.load(lut_base + "_lut.npy", mmap_mode="r")[geo_ensemble]
+    return np.hstack([np.load("{}_{:d}_{:d}.npy".format(lut_base, geo_ensemble, split)) for split in range(splits)])
+
+
+_lut_worker_model = None  # InitModel instance of a worker process of the LUT creation
+
+
+def _init_lut_worker(model):
+    # Receives the model once per worker process, so that it is not pickled again for every chunk
+    global _lut_worker_model
+    _lut_worker_model = model
+
+
+def _lut_pool_context():
+    # Returns the multiprocessing context for the worker processes of the LUT creation, or None if no worker processes
+    # can be started. The spawn start method (Windows, macOS) launches the workers with sys.executable, which is the
+    # QGIS binary when running inside QGIS, so the Python interpreter shipped with QGIS is used instead
+    context = multiprocessing.get_context()
+    if context.get_start_method() == "fork":
+        return context
+    executable = sys.executable
+    if not os.path.basename(executable).lower().startswith("python"):
+        name = "python.exe" if os.name == "nt" else "python3"
+        candidates = [os.path.join(sys.exec_prefix, name), os.path.join(sys.exec_prefix, "bin", name)]
+        executable = next((candidate for candidate in candidates if os.path.isfile(candidate)), None)
+        if executable is None:
+            return None
+    context.set_executable(executable)
+    return context
+
+
+def _run_lut_chunk(para_chunk, lut_base, geo_ensemble, split, offset, store, model=None):
+    # Runs PROSAIL for one (geometry ensemble, split) chunk of the para_grid and stores the results; this is a module
+    # level function, so that it can be sent to the worker processes of the LUT creation, which use the model received
+    # by _init_lut_worker
+    if model is None:
+        model = _lut_worker_model
+    npara = para_chunk.shape[1]
+    spectra = model.run_model(paras=dict(zip(model.para_names, para_chunk.T))).T
+    nruns = para_chunk.shape[0]
+    if store == "memmap":  # write into the slot of the chunk in the pre-sized LUT
+        lut = np.load(lut_base + "_lut.npy", mmap_mode="r+")
+        lut[geo_ensemble, :npara, offset:offset + nruns] = para_chunk.T
+        lut[geo_ensemble, npara:, offset:offset + nruns] = spectra
+        lut.flush()
+        del lut
+    else:  # save each split to a new file (.npy)
+        save_array = np.empty((npara + spectra.shape[0], nruns))
+        save_array[:npara, :] = para_chunk.T
+        save_array[npara:, :] = spectra
+        np.save("{}_{:d}_{:d}".format(lut_base, geo_ensemble, split), save_array)
+    return geo_ensemble, split, nruns
+
+
 # This class creates instances of the actual models and is fed with parameter inputs
 class CallModel:
 
@@ -336,9 +398,12 @@ class InitModel:
         self.run_model(paras=dict(zip(self.para_names, para_grid.T)))
 
     def initialize_vectorized(self, LUT_dir, LUT_name, ns, max_per_file=5000, soil=None,
-                            prgbar_widget=None, qgis_app=None, depends=False, testmode=False, **paras):
+                            prgbar_widget=None, qgis_app=None, depends=False, testmode=False, n_jobs=1, store="npy",
+                            **paras):
         # This is the most important function for initializing PROSAIL
         # It calls instances of PROSAIL and provides blocks of the para_grid
+        # n_jobs: number of processes which run the (geometry, split) chunks in parallel
+        # store: "npy" writes one .npy-file per chunk, "memmap" writes all chunks into one memory-mapped LUT file
         self.soil = soil
         if len(paras["tts"]) > 1 or len(paras["tto"]) > 1 or len(paras["psi"]) > 1:
             self.geo_mode = "sort"  # LUT-Files are (firstly) sorted by geometry
@@ -436,6 +501,7 @@ class InitModel:
             meta.write("\nmultiplication_factor=%i" % self.int_boost)
             meta.write("\nparameters={}".format(";".join(i for i in self.para_names)))
             meta.write("\nwavelengths={}".format(";".join(str(i) for i in wl_sensor)))
+            meta.write("\nstore=%s" % store)
 
         # Write another metafile which contains the ranges of all parameters (for information and restoring in the GUI)
         with open("%s_00paras.txt" % (LUT_dir + LUT_name), "w") as paras_meta:
@@ -465,18 +531,47 @@ class InitModel:
             prgbar_widget.gui.lblCaption_l.setText("Creating LUT")
             qgis_app.processEvents()
 
+        # Each (geometry ensemble, split) is one chunk of at most max_per_file runs
+        chunks = list()
         for geo_ensemble in range(n_ensembles_geo):  # iterate through all ensembles of geometries
-            rest = crun_pergeo
             for split in range(n_ensembles_split):  # iterate through all "splits" (max_per_file)
+                offset = split * max_per_file  # first run of the split within the current geometry ensemble
+                nruns = min(max_per_file, crun_pergeo - offset)
+                run = geo_ensemble * crun_pergeo + offset  # current run (first of the current split)
+                chunks.append((geo_ensemble, split, run, offset, nruns))
+
+        if store == "memmap":  # create the LUT file in its final size; the chunks are written into their slots
+            lut = np.lib.format.open_memmap("{}_lut.npy".format(LUT_dir + LUT_name), mode="w+", dtype=np.float64,
+                                            shape=(n_ensembles_geo, npara + nbands, crun_pergeo))
+            lut.flush()
+            del lut
+
+        # Execute the model for all chunks, either one after another or distributed to a pool of processes
+        # The first "npara" rows of each chunk are reserved for the parameter-values
+        # The rest is reserved for the spectral results of PROSAIL
+        pool = None
+        if n_jobs > 1:
+            context = _lut_pool_context()
+            if context is None:
+                print("No Python interpreter found for the worker processes, creating the LUT serially")
+            else:
+                pool = ProcessPoolExecutor(max_workers=n_jobs, mp_context=context, initializer=_init_lut_worker,
+                                           initargs=(self,))
+        if pool:
+            futures = [pool.submit(_run_lut_chunk, para_grid[run:run + nruns, :], LUT_dir + LUT_name,
+                                   geo_ensemble, split, offset, store)
+                       for geo_ensemble, split, run, offset, nruns in chunks]
+            finished = (future.result() for future in as_completed(futures))
+        else:
+            futures = []
+            finished = (_run_lut_chunk(para_grid[run:run + nruns, :], LUT_dir + LUT_name, geo_ensemble,
+                                       split, offset, store, model=self)
+                        for geo_ensemble, split, run, offset, nruns in chunks)
 
-                if rest >= max_per_file:  # if there are more runs left than max_per_file allows...
-                    save_array = np.empty((nbands + npara, max_per_file))  # build an empty array
-                    nruns = max_per_file  # runs is max
-                else:
-                    nruns = rest  # otherwise, nruns is what's left
-                    save_array = np.empty((nbands + npara, rest))
-
-                run = geo_ensemble * crun_pergeo + split * max_per_file  # current run (first of the current split)
+        crun_done = 0
+        try:
+            for geo_ensemble, split, nruns in finished:
+                crun_done += nruns
 
                 if prgbar_widget:
                     if prgbar_widget.gui.lblCancel.text() == "-1":
@@ -487,6 +582,7 @@ class InitModel:
                     prgbar_widget.gui.lblCaption_r.setText('Ensemble Geo {:d} of {:d} | Split {:d} of {:d}'.
                                                            format(geo_ensemble + 1, n_ensembles_geo, split+1,
                                                                   n_ensembles_split))
+                    prgbar_widget.gui.prgBar.setValue(int(crun_done * 100 / crun_max))  # set value of the progress bar
                     qgis_app.processEvents()
 
                 else:
@@ -494,24 +590,12 @@ class InitModel:
                         "LUT ensemble struct #{:d} of {:d}; ensemble geo #{:d} of {:d}; split #{:d} of {:d}; "
                         "total #{:d} of {:d}"
                         .format(struct_ensemble, n_struct_ensembles - 1, geo_ensemble,
-                                n_ensembles_geo - 1, split, n_ensembles_split - 1, run, crun_max))
-
-                if prgbar_widget:
-                    prgbar_widget.gui.prgBar.setValue(int(run * 100 / crun_max))  # set value of the progress bar
-                    qgis_app.processEvents()
-
-                # Execute the model and fill the results into the prepared array
-                # The double transpose of the matrix (.T) fits the paras in the necessary shape run_model expects
-                # The first "npara" rows are reserved for the parameter-values
-                # The rest is reserved for the spectral results of PROSAIL
-                save_array[npara:, :] = self.run_model(paras=
-                                                       dict(zip(self.para_names, para_grid[run:run + nruns, :].T))).T
-                save_array[:npara, :] = para_grid[run:run + nruns, :].T
-
-                rest -= max_per_file  # calculate what's left for next iteration
-
-                # Save each split to a new file (.npy)
-                np.save("{}_{:d}_{:d}".format(LUT_dir + LUT_name, geo_ensemble, split), save_array)
+                                n_ensembles_geo - 1, split, n_ensembles_split - 1, crun_done, crun_max))
+        finally:
+            if pool:
+                for future in futures:
+                    future.cancel()  # only has an effect if the LUT creation was cancelled
+                pool.shutdown(wait=True)
 
         if prgbar_widget:
             prgbar_widget.gui.lblCaption_r.setText('File {:d} of {:d}'.format(crun_max, crun_max))
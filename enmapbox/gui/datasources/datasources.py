@@ -310,8 +310,13 @@ class ModelDataSource(DataSource):
         pkl_obj = None
         try:
             if source.endswith('.pkl'):
-                with open(source, 'rb') as f:
-                    pkl_obj = pickle.load(f)
+                from enmapboxprocessing.modelartifact import ModelArtifact
+                if ModelArtifact.isModelArtifact(source):
+                    # only load the metadata, but not the estimator and the training sample
+                    pkl_obj = ModelArtifact.readMetadata(source)
+                else:
+                    with open(source, 'rb') as f:
+                        pkl_obj = pickle.load(f)
             elif source.endswith('.json'):
                 with open(source, 'r', encoding='utf-8') as f:
                     pkl_obj = json.load(f)
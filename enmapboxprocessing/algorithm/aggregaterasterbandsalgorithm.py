@@ -1,9 +1,10 @@
-from math import ceil, nan, inf
+from math import nan, inf
 from typing import Dict, Any, List, Tuple
 
 import numpy as np
 from osgeo import gdal
 
+from enmapboxprocessing.blockexecutor import BlockExecutor
 from enmapboxprocessing.driver import Driver
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
 from enmapboxprocessing.numpyutils import NumpyUtils
@@ -17,6 +18,7 @@ from enmapbox.typeguard import typechecked
 class AggregateRasterBandsAlgorithm(EnMAPProcessingAlgorithm):
     P_RASTER, _RASTER = 'raster', 'Raster layer'
     P_FUNCTION, _FUNCTION = 'function', 'Aggregation functions'
+    P_WORKER_COUNT, _WORKER_COUNT = 'workerCount', 'Number of workers'
     P_OUTPUT_RASTER, _OUTPUT_RASTER = 'outputRaster', 'Output raster layer'
 
     O_FUNCTION = [
@@ -42,6 +44,8 @@ class AggregateRasterBandsAlgorithm(EnMAPProcessingAlgorithm):
             (self._RASTER, 'A raster layer with bands to be aggregated.'),
             (self._FUNCTION, 'Functions to be used. '
                              'Number and order of selected functions equals number and order of output bands.'),
+            (self._WORKER_COUNT, 'Number of parallel workers. '
+                                 'Use -1 for using all CPU cores. If not specified, processing runs serially.'),
             (self._OUTPUT_RASTER, self.RasterFileDestination)
         ]
 
@@ -51,6 +55,7 @@ class AggregateRasterBandsAlgorithm(EnMAPProcessingAlgorithm):
     def initAlgorithm(self, configuration: Dict[str, Any] = None):
         self.addParameterRasterLayer(self.P_RASTER, self._RASTER)
         self.addParameterEnum(self.P_FUNCTION, self._FUNCTION, self.O_FUNCTION, True, None)
+        self.addParameterInt(self.P_WORKER_COUNT, self._WORKER_COUNT, None, True, -1, None, True)
         self.addParameterRasterDestination(self.P_OUTPUT_RASTER, self._OUTPUT_RASTER)
 
     def processAlgorithm(
@@ -58,6 +63,7 @@ class AggregateRasterBandsAlgorithm(EnMAPProcessingAlgorithm):
     ) -> Dict[str, Any]:
         raster = self.parameterAsRasterLayer(parameters, self.P_RASTER, context)
         functionIndices = self.parameterAsEnums(parameters, self.P_FUNCTION, context)
+        workerCount = self.parameterAsInt(parameters, self.P_WORKER_COUNT, context)
         filename = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_RASTER, context)
 
         with open(filename + '.log', 'w') as logfile:
@@ -68,12 +74,18 @@ class AggregateRasterBandsAlgorithm(EnMAPProcessingAlgorithm):
             bandCount = len(functionIndices)
             writer = Driver(filename, feedback=feedback).createLike(reader, Qgis.Float32, bandCount)
             noDataValue = Utils.defaultNoDataValue(np.float32)
-            lineMemoryUsage = reader.lineMemoryUsage(reader.bandCount() + bandCount, 4)
-            blockSizeY = min(raster.height(), ceil(gdal.GetCacheMax() / lineMemoryUsage))
-            blockSizeX = raster.width()
-            for block in reader.walkGrid(blockSizeX, blockSizeY, feedback):
+            # memory usage: float32 input, mask, output
+            pixelMemoryUsage = reader.pixelMemoryUsage(reader.bandCount() + bandCount, 4) + reader.bandCount()
+            blockSizeX, blockSizeY = reader.blockSize(pixelMemoryUsage, gdal.GetCacheMax(), writer)
+
+            def read(block):
                 array = np.array(reader.arrayFromBlock(block), dtype=np.float32)
                 mask = reader.maskArray(array)
+                return array, mask
+
+            def compute(data):
+                array, mask = data
+                outarrays = [None] * bandCount
                 invalid = np.logical_not(np.any(mask, axis=0))  # whole pixel is no data (see  #1424)
                 array[np.logical_not(mask)] = nan
 
@@ -85,7 +97,7 @@ class AggregateRasterBandsAlgorithm(EnMAPProcessingAlgorithm):
                 for i, outarray in enumerate(NumpyUtils.nanpercentile(array, q)):
                     bandNo = functionIndices.index(q[i] + self.P0) + 1
                     outarray[np.isnan(outarray)] = noDataValue
-                    writer.writeArray2d(outarray, bandNo, xOffset=block.xOffset, yOffset=block.yOffset)
+                    outarrays[bandNo - 1] = outarray
 
                 # Calculate all other indices individually.
                 for bandNo, functionIndex in enumerate(functionIndices, 1):
@@ -142,8 +154,16 @@ class AggregateRasterBandsAlgorithm(EnMAPProcessingAlgorithm):
                     # explicitely mask pixel with all-no-data (see #1424)
                     outarray[invalid] = noDataValue
 
-                    # write result
-                    writer.writeArray2d(outarray, bandNo, xOffset=block.xOffset, yOffset=block.yOffset)
+                    # collect result
+                    outarrays[bandNo - 1] = outarray
+
+                return outarrays
+
+            def write(block, outarrays):
+                writer.writeArray(outarrays, xOffset=block.xOffset, yOffset=block.yOffset)
+
+            executor = BlockExecutor(workerCount, feedback=feedback)
+            executor.run(reader.walkGrid(blockSizeX, blockSizeY), read, compute, write)
 
             for bandNo, functionIndex in enumerate(functionIndices, 1):
                 bandName = self.O_FUNCTION[functionIndex]
@@ -2,9 +2,13 @@ import inspect
 from inspect import signature
 from typing import Dict, Any, List, Tuple, Optional
 
+import numpy as np
+
+from enmapboxprocessing.blockexecutor import BlockExecutor
 from enmapboxprocessing.driver import Driver
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm
 from enmapboxprocessing.rasterreader import RasterReader
+from enmapboxprocessing.utils import Utils
 from qgis.core import (QgsProcessingContext, QgsProcessingFeedback, Qgis)
 from enmapbox.typeguard import typechecked
 
@@ -13,14 +17,27 @@ from enmapbox.typeguard import typechecked
 class ApplyBandFunctionAlgorithmBase(EnMAPProcessingAlgorithm):
     P_RASTER, _RASTER = 'raster', 'Raster layer'
     P_FUNCTION, _FUNCTION = 'function', 'Function'
+    P_OVERLAP, _OVERLAP = 'overlap', 'Block overlap'
+    P_WORKER_COUNT, _WORKER_COUNT = 'workerCount', 'Number of workers'
     P_OUTPUT_RASTER, _OUTPUT_RASTER = 'outputRaster', 'Output raster layer'
 
     def helpParameters(self) -> List[Tuple[str, str]]:
-        return [
+        helpParameters = [
             (self._RASTER, 'Raster layer to be processed band-wise.'),
-            (self._FUNCTION, self.helpParameterCode()),
-            (self._OUTPUT_RASTER, self.RasterFileDestination)
+            (self._FUNCTION, self.helpParameterCode())
         ]
+        if self.isTileable():
+            helpParameters.append(
+                (self._OVERLAP, 'The number of columns and rows to read from the neighbouring blocks. '
+                                'Must cover the neighbourhood used by the function, '
+                                'to avoid artifacts at block borders.')
+            )
+        helpParameters.extend([
+            (self._WORKER_COUNT, 'Number of parallel workers. '
+                                 'Use -1 for using all CPU cores. If not specified, processing runs serially.'),
+            (self._OUTPUT_RASTER, self.RasterFileDestination)
+        ])
+        return helpParameters
 
     def displayName(self) -> str:
         raise NotImplementedError()
@@ -40,6 +57,9 @@ class ApplyBandFunctionAlgorithmBase(EnMAPProcessingAlgorithm):
     def initAlgorithm(self, configuration: Dict[str, Any] = None):
         self.addParameterRasterLayer(self.P_RASTER, self._RASTER)
         self.addParameterCode(self.P_FUNCTION, self._FUNCTION, self.defaultCodeAsString())
+        if self.isTileable():
+            self.addParameterInt(self.P_OVERLAP, self._OVERLAP, self.overlap(), True, 0, None, True)
+        self.addParameterInt(self.P_WORKER_COUNT, self._WORKER_COUNT, None, True, -1, None, True)
         self.addParameterRasterDestination(self.P_OUTPUT_RASTER, self._OUTPUT_RASTER)
 
     def defaultCodeAsString(self):
@@ -62,33 +82,88 @@ class ApplyBandFunctionAlgorithmBase(EnMAPProcessingAlgorithm):
     ) -> Dict[str, Any]:
         raster = self.parameterAsRasterLayer(parameters, self.P_RASTER, context)
         function = self.parameterAsFunction(parameters, self.P_FUNCTION, context)
+        overlap = self.parameterAsInt(parameters, self.P_OVERLAP, context)
+        workerCount = self.parameterAsInt(parameters, self.P_WORKER_COUNT, context)
         filename = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_RASTER, context)
 
+        if overlap is None:
+            overlap = self.overlap()
+
         with open(filename + '.log', 'w') as logfile:
             feedback, feedback2 = self.createLoggingFeedback(feedback, logfile)
             self.tic(feedback, parameters, context)
 
             feedback.pushInfo('Apply function')
-            self.reader = RasterReader(raster)
-            self.writer = Driver(filename, feedback=feedback).createLike(self.reader, self.outputDataType())
-            for i in range(self.reader.bandCount()):
-                feedback.setProgress(i / self.reader.bandCount() * 100)
-                bandList = [i + 1]
-                self.array = self.reader.array(bandList=bandList)[0]
-                self.prepareInput()
-                self.marray = self.reader.maskArray(self.array[None], bandList=bandList)[0]
-                if len(signature(function).parameters) == 1:
-                    self.outarray = function(self.array)
-                else:
-                    self.outarray = function(self.array, self.reader.noDataValue(i + 1))
-                self.prepareOutput()
-                self.writer.writeArray(self.outarray[None], bandList=bandList)
-
-            self.writer.setMetadata(self.reader.metadata())
-            self.writer.setNoDataValue(self.outputNoDataValue())
-            for i in range(self.reader.bandCount()):
-                self.writer.setBandName(self.reader.bandName(i + 1), i + 1)
-            self.writer.close()
+            reader = RasterReader(raster)
+            writer = Driver(filename, feedback=feedback).createLike(reader, self.outputDataType())
+            bandCount = reader.bandCount()
+            passNoDataValue = len(signature(function).parameters) != 1
+            executor = BlockExecutor(workerCount, feedback=feedback)
+
+            # memory usage per band: input, Float32 copy, mask and output (up to Float64)
+            bandPixelMemoryUsage = reader.pixelMemoryUsage(1) + 4 + 1 + 8
+            maximumMemoryUsage = Utils.maximumMemoryUsage()
+            if executor.isParallel():
+                maximumMemoryUsage = maximumMemoryUsage // executor.maxInFlight
+            if self.isTileable():
+                # process all bands of a tile at once
+                blockSizeX, blockSizeY = reader.blockSize(
+                    bandPixelMemoryUsage * bandCount, maximumMemoryUsage, writer
+                )
+                bandBatchSize = bandCount
+            else:
+                # process whole bands, batched as far as memory permits
+                blockSizeX, blockSizeY = reader.width(), reader.height()
+                bandMemoryUsage = bandPixelMemoryUsage * reader.width() * reader.height()
+                bandBatchSize = min(bandCount, max(1, maximumMemoryUsage // bandMemoryUsage))
+                overlap = 0
+            bandLists = [list(range(bandNo, min(bandNo + bandBatchSize, bandCount + 1)))
+                         for bandNo in range(1, bandCount + 1, bandBatchSize)]
+
+            tasks = [(block, bandList)
+                     for block in reader.walkGrid(blockSizeX, blockSizeY)
+                     for bandList in bandLists]
+
+            def read(task):
+                block, bandList = task
+                # read the block with overlap, but don't read beyond the raster borders
+                xOffset = max(block.xOffset - overlap, 0)
+                yOffset = max(block.yOffset - overlap, 0)
+                width = min(block.xOffset + block.width + overlap, reader.width()) - xOffset
+                height = min(block.yOffset + block.height + overlap, reader.height()) - yOffset
+                array = reader.arrayFromPixelOffsetAndSize(xOffset, yOffset, width, height, bandList)
+                marray = [reader.maskArray(a[None], bandList=[bandNo])[0] for bandNo, a in zip(bandList, array)]
+                noDataValues = [reader.noDataValue(bandNo) for bandNo in bandList]
+                window = (
+                    slice(block.yOffset - yOffset, block.yOffset - yOffset + block.height),
+                    slice(block.xOffset - xOffset, block.xOffset - xOffset + block.width)
+                )
+                return array, marray, noDataValues, window
+
+            def compute(data):
+                array, marray, noDataValues, window = data
+                outarrays = list()
+                for array_, marray_, noDataValue in zip(array, marray, noDataValues):
+                    array_ = self.prepareInput(array_)
+                    if passNoDataValue:
+                        outarray = function(array_, noDataValue)
+                    else:
+                        outarray = function(array_)
+                    outarray = self.prepareOutput(outarray, marray_)
+                    outarrays.append(outarray[window])
+                return outarrays
+
+            def write(task, outarrays):
+                block, bandList = task
+                writer.writeArray(outarrays, block.xOffset, block.yOffset, bandList)
+
+            executor.run(tasks, read, compute, write)
+
+            writer.setMetadata(reader.metadata())
+            writer.setNoDataValue(self.outputNoDataValue())
+            for i in range(bandCount):
+                writer.setBandName(reader.bandName(i + 1), i + 1)
+            writer.close()
 
             result = {self.P_OUTPUT_RASTER: filename}
             self.toc(feedback, result)
@@ -101,8 +176,16 @@ class ApplyBandFunctionAlgorithmBase(EnMAPProcessingAlgorithm):
     def outputNoDataValue(self) -> Optional[float]:
         return None
 
-    def prepareInput(self):
-        pass
+    def isTileable(self) -> bool:
+        """Return False, if the function requires the whole band, e.g. for filling holes."""
+        return True
+
+    def overlap(self) -> int:
+        """Return the default block overlap required by the default function."""
+        return 0
+
+    def prepareInput(self, array: np.ndarray) -> np.ndarray:
+        return array
 
-    def prepareOutput(self):
-        pass
+    def prepareOutput(self, outarray: np.ndarray, marray: np.ndarray) -> np.ndarray:
+        return outarray
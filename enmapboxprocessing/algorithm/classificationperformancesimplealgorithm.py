@@ -1,13 +1,11 @@
+import json
 import webbrowser
 from typing import Dict, Any, List, Tuple
 
 from enmapboxprocessing.algorithm.classificationperformancestratifiedalgorithm import \
     ClassificationPerformanceStratifiedAlgorithm
-from enmapboxprocessing.algorithm.rastermathalgorithm.rastermathalgorithm import RasterMathAlgorithm
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
-from enmapboxprocessing.typing import Category
-from enmapboxprocessing.utils import Utils
-from qgis.core import QgsProcessingContext, QgsProcessingFeedback, QgsRasterLayer, QgsMapLayer
+from qgis.core import QgsProcessingContext, QgsProcessingFeedback, QgsUnitTypes
 from enmapbox.typeguard import typechecked
 
 
@@ -60,32 +58,16 @@ class ClassificationPerformanceSimpleAlgorithm(EnMAPProcessingAlgorithm):
             feedback, feedback2 = self.createLoggingFeedback(feedback, logfile)
             self.tic(feedback, parameters, context)
 
-            # create (pseudo) stratification with only one stratum
-            alg = RasterMathAlgorithm()
-            alg.initAlgorithm()
-            parameters = {
-                alg.P_R1: classification,
-                alg.P_CODE: 'R1*0 + 1',
-                alg.P_OUTPUT_RASTER: Utils.tmpFilename(filename, 'pseudo-stratification.tif')
-            }
-            result = self.runAlg(alg, parameters, None, feedback2, context, True)
-            stratification = QgsRasterLayer(result[alg.P_OUTPUT_RASTER])
-            categories = [Category(1, 'Stratum 1', '#FF0000')]
-            renderer = Utils.palettedRasterRendererFromCategories(stratification.dataProvider(), 1, categories)
-            stratification.setRenderer(renderer)
-            stratification.saveDefaultStyle(QgsMapLayer.StyleCategory.AllStyleCategories)
-
-            # run stratified version
-            alg = ClassificationPerformanceStratifiedAlgorithm()
-            alg.initAlgorithm()
-            parameters = {
-                alg.P_CLASSIFICATION: classification,
-                alg.P_REFERENCE: reference,
-                alg.P_STRATIFICATION: stratification,
-                alg.P_OPEN_REPORT: False,
-                alg.P_OUTPUT_REPORT: filename,
-            }
-            result = self.runAlg(alg, parameters, None, feedback2, context, True)
+            # use the stratified estimator with exactly one stratum covering the whole map
+            alg = ClassificationPerformanceStratifiedAlgorithm
+            stats = alg.estimateStatistics(classification, reference, None, filename, feedback, feedback2, context)
+            pixelUnits = QgsUnitTypes.toString(classification.crs().mapUnits())
+            pixelArea = classification.rasterUnitsPerPixelX() * classification.rasterUnitsPerPixelY()
+            alg.writeReport(filename, stats, pixelUnits=pixelUnits, pixelArea=pixelArea)
+            # dump json
+            with open(filename + '.json', 'w') as file:
+                file.write(json.dumps(stats.__dict__, indent=4))
+            result = {self.P_OUTPUT_REPORT: filename}
 
             if openReport:
                 webbrowser.open_new_tab(filename)
@@ -5,17 +5,20 @@ from dataclasses import dataclass
 from math import isnan
 from os import makedirs
 from os.path import exists, dirname
-from typing import Dict, Any, List, Tuple, Iterable
+from typing import Dict, Any, List, Tuple, Iterable, Optional
 
 import numpy as np
 
 from enmapboxprocessing.algorithm.rasterizecategorizedvectoralgorithm import RasterizeCategorizedVectorAlgorithm
 from enmapboxprocessing.algorithm.translatecategorizedrasteralgorithm import TranslateCategorizedRasterAlgorithm
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
+from enmapboxprocessing.pipeline import Pipeline
 from enmapboxprocessing.rasterreader import RasterReader
 from enmapboxprocessing.reportwriter import HtmlReportWriter, CsvReportWriter, MultiReportWriter
+from enmapboxprocessing.typing import Category
 from enmapboxprocessing.utils import Utils
-from qgis.core import (QgsProcessingContext, QgsProcessingFeedback, QgsVectorLayer, QgsRasterLayer, QgsUnitTypes)
+from qgis.core import (QgsProcessingContext, QgsProcessingFeedback, QgsVectorLayer, QgsRasterLayer, QgsUnitTypes,
+                       QgsMapLayer)
 from enmapbox.typeguard import typechecked
 
 
@@ -110,79 +113,8 @@ class ClassificationPerformanceStratifiedAlgorithm(EnMAPProcessingAlgorithm):
             feedback, feedback2 = self.createLoggingFeedback(feedback, logfile)
             self.tic(feedback, parameters, context)
 
-            # resample reference
-            if isinstance(reference, QgsVectorLayer):
-                feedback.pushInfo('Rasterize observed category layer')
-                alg = RasterizeCategorizedVectorAlgorithm()
-                alg.initAlgorithm()
-                parameters = {
-                    alg.P_CATEGORIZED_VECTOR: reference,
-                    alg.P_GRID: classification,
-                    alg.P_MAJORITY_VOTING: False,  # simple NN resampling
-                    alg.P_OUTPUT_CATEGORIZED_RASTER: Utils.tmpFilename(filename, 'observation.tif')
-                }
-                self.runAlg(alg, parameters, None, feedback2, context, True)
-                reference = QgsRasterLayer(parameters[alg.P_OUTPUT_CATEGORIZED_RASTER])
-            elif isinstance(reference, QgsRasterLayer):
-                alg = TranslateCategorizedRasterAlgorithm()
-                alg.initAlgorithm()
-                parameters = {
-                    alg.P_CATEGORIZED_RASTER: reference,
-                    alg.P_GRID: classification,
-                    alg.P_MAJORITY_VOTING: False,
-                    alg.P_OUTPUT_CATEGORIZED_RASTER: Utils.tmpFilename(filename, 'observation.vrt')
-                }
-                self.runAlg(alg, parameters, None, feedback2, context, True)
-                reference = QgsRasterLayer(parameters[alg.P_OUTPUT_CATEGORIZED_RASTER])
-
-            # resample stratification
-            alg = TranslateCategorizedRasterAlgorithm()
-            alg.initAlgorithm()
-            parameters = {
-                alg.P_CATEGORIZED_RASTER: stratification,
-                alg.P_GRID: classification,
-                alg.P_MAJORITY_VOTING: False,
-                alg.P_OUTPUT_CATEGORIZED_RASTER: Utils.tmpFilename(filename, 'stratification.tif')
-            }
-            self.runAlg(alg, parameters, None, feedback2, context, True)
-            stratification = QgsRasterLayer(parameters[alg.P_OUTPUT_CATEGORIZED_RASTER])
-
-            feedback.pushInfo('Read data')
-            # Note that we can be sure that all pixel grids match!
-            arrayReference = RasterReader(reference).array()[0]
-            categoriesReference = Utils.categoriesFromPalettedRasterRenderer(reference.renderer())
-            arrayPrediction = RasterReader(classification).array()[0]
-            categoriesPrediction = Utils.categoriesFromPalettedRasterRenderer(classification.renderer())
-            arrayStratification = RasterReader(stratification).array()[0]
-            categoriesStratification = Utils.categoriesFromPalettedRasterRenderer(stratification.renderer())
-            # - get valid reference location
-            valid = np.full_like(arrayReference, False, bool)
-            for c in categoriesReference:
-                np.logical_or(valid, arrayReference == c.value, out=valid)
-            yReference = arrayReference[valid].astype(np.float32)
-            yMap = arrayPrediction[valid].astype(np.float32)
-            # - remap class ids by name
-            yMapRemapped = np.zeros_like(yMap)
-            for cP in categoriesPrediction:
-                for cR in categoriesReference:
-                    if cR.name == cP.name:
-                        yMapRemapped[yMap == cP.value] = cR.value
-            yMap = yMapRemapped
-            # - prepare strata
-            stratum = arrayStratification[valid]
-            h_all, N_h_all = np.unique(arrayStratification, return_counts=True)
-            h = list()
-            N_h = list()
-            for i, category in enumerate(categoriesStratification):
-                if category.value not in h_all:
-                    continue
-                h.append(category.value)
-                N_h.append(N_h_all[i])
-
-            feedback.pushInfo('Estimate statistics and create report')
-            classValues = [c.value for c in categoriesReference]
-            classNames = [c.name for c in categoriesReference]
-            stats = stratifiedAccuracyAssessment(stratum, yReference, yMap, h, N_h, classValues, classNames)
+            stats = self.estimateStatistics(classification, reference, stratification, filename, feedback, feedback2,
+                                            context)
             pixelUnits = QgsUnitTypes.toString(classification.crs().mapUnits())
             pixelArea = classification.rasterUnitsPerPixelX() * classification.rasterUnitsPerPixelY()
             self.writeReport(filename, stats, pixelUnits=pixelUnits, pixelArea=pixelArea)
@@ -198,6 +130,103 @@ class ClassificationPerformanceStratifiedAlgorithm(EnMAPProcessingAlgorithm):
 
         return result
 
+    @classmethod
+    def estimateStatistics(
+            cls, classification: QgsRasterLayer, reference: QgsMapLayer, stratification: Optional[QgsRasterLayer],
+            filename: str, feedback: QgsProcessingFeedback, feedback2: QgsProcessingFeedback,
+            context: QgsProcessingContext, pipeline: Pipeline = None
+    ) -> 'StratifiedAccuracyAssessmentResult':
+        """
+        Estimate accuracy and area statistics block-wise.
+        If no stratification is given, all pixels of the classification belong to a single stratum.
+        Resampled observation and stratification layers are pipeline intermediates, which are removed afterwards.
+        """
+        if pipeline is None:
+            with Pipeline(filename) as pipeline:
+                return cls.estimateStatistics(
+                    classification, reference, stratification, filename, feedback, feedback2, context, pipeline
+                )
+
+        # resample reference
+        if isinstance(reference, QgsVectorLayer):
+            feedback.pushInfo('Rasterize observed category layer')
+            alg = RasterizeCategorizedVectorAlgorithm()
+            alg.initAlgorithm()
+            parameters = {
+                alg.P_CATEGORIZED_VECTOR: reference,
+                alg.P_GRID: classification,
+                alg.P_MAJORITY_VOTING: False,  # simple NN resampling
+                alg.P_OUTPUT_CATEGORIZED_RASTER: pipeline.intermediateFilename('observation.tif')
+            }
+            cls.runAlg(alg, parameters, None, feedback2, context, True)
+            reference = QgsRasterLayer(parameters[alg.P_OUTPUT_CATEGORIZED_RASTER])
+        elif isinstance(reference, QgsRasterLayer):
+            alg = TranslateCategorizedRasterAlgorithm()
+            alg.initAlgorithm()
+            parameters = {
+                alg.P_CATEGORIZED_RASTER: reference,
+                alg.P_GRID: classification,
+                alg.P_MAJORITY_VOTING: False,
+                alg.P_OUTPUT_CATEGORIZED_RASTER: pipeline.intermediateFilename('observation.vrt')
+            }
+            cls.runAlg(alg, parameters, None, feedback2, context, True)
+            reference = QgsRasterLayer(parameters[alg.P_OUTPUT_CATEGORIZED_RASTER])
+
+        # resample stratification
+        if stratification is None:
+            categoriesStratification = [Category(1, 'Stratum 1', '#FF0000')]
+        else:
+            alg = TranslateCategorizedRasterAlgorithm()
+            alg.initAlgorithm()
+            parameters = {
+                alg.P_CATEGORIZED_RASTER: stratification,
+                alg.P_GRID: classification,
+                alg.P_MAJORITY_VOTING: False,
+                alg.P_OUTPUT_CATEGORIZED_RASTER: pipeline.intermediateFilename('stratification.vrt')
+            }
+            cls.runAlg(alg, parameters, None, feedback2, context, True)
+            stratification = QgsRasterLayer(parameters[alg.P_OUTPUT_CATEGORIZED_RASTER])
+            categoriesStratification = Utils.categoriesFromPalettedRasterRenderer(stratification.renderer())
+
+        feedback.pushInfo('Read data')
+        # Note that we can be sure that all pixel grids match!
+        categoriesReference = Utils.categoriesFromPalettedRasterRenderer(reference.renderer())
+        categoriesPrediction = Utils.categoriesFromPalettedRasterRenderer(classification.renderer())
+        # - remap class ids by name
+        predictionMapping = dict()
+        for cP in categoriesPrediction:
+            for cR in categoriesReference:
+                if cR.name == cP.name:
+                    predictionMapping[cP.value] = cR.value
+        accumulator = StratifiedSampleAccumulator(
+            [c.value for c in categoriesReference], predictionMapping, [c.value for c in categoriesStratification]
+        )
+
+        readerReference = RasterReader(reference)
+        readerPrediction = RasterReader(classification)
+        readerStratification = None if stratification is None else RasterReader(stratification)
+        # memory usage: reference, prediction, stratification and valid mask
+        pixelMemoryUsage = readerReference.pixelMemoryUsage(1) + readerPrediction.pixelMemoryUsage(1) + 8 + 1
+        blockSizeX, blockSizeY = readerReference.blockSize(pixelMemoryUsage)
+        for block in readerReference.walkGrid(blockSizeX, blockSizeY, feedback):
+            if readerStratification is None:
+                arrayStratification = None
+            else:
+                arrayStratification = readerStratification.arrayFromBlock(block, [1])[0]
+            accumulator.addStratumCounts(arrayStratification, block.width * block.height)
+            arrayReference = readerReference.arrayFromBlock(block, [1])[0]
+            valid = accumulator.referenceMask(arrayReference)
+            if not np.any(valid):
+                continue  # skip prediction reading for blocks without observations
+            arrayPrediction = readerPrediction.arrayFromBlock(block, [1])[0]
+            accumulator.addSample(valid, arrayReference, arrayPrediction, arrayStratification)
+
+        feedback.pushInfo('Estimate statistics and create report')
+        classValues = [c.value for c in categoriesReference]
+        classNames = [c.name for c in categoriesReference]
+        stratum, yReference, yMap, h, N_h = accumulator.sample()
+        return stratifiedAccuracyAssessment(stratum, yReference, yMap, h, N_h, classValues, classNames)
+
     @classmethod
     def writeReport(cls, filename: str, stats: 'StratifiedAccuracyAssessmentResult', pixelUnits='pixel', pixelArea=1.):
 
@@ -304,6 +333,71 @@ class ClassificationPerformanceStratifiedAlgorithm(EnMAPProcessingAlgorithm):
             )
 
 
+@typechecked
+class StratifiedSampleAccumulator(object):
+    """
+    Accumulates stratum pixel counts and the sparse sample of reference, prediction and stratum values block by block.
+    If no stratification array is given, all pixels are counted for the first stratum.
+    """
+
+    def __init__(self, referenceValues: List[Any], predictionMapping: Dict[Any, Any], strataValues: List[Any]):
+        self.referenceValues = np.array(referenceValues)
+        self.predictionMapping = predictionMapping
+        self.strataValues = np.array(strataValues)
+        self.N_h = np.zeros(len(strataValues), np.int64)
+        self.stratum = list()
+        self.reference = list()
+        self.map = list()
+
+    def addStratumCounts(self, arrayStratification: Optional[np.ndarray], pixelCount: int):
+        # N_h counts the pixels of each stratum category; pixels with no data or non-category values are not counted
+        # (versions before the block-wise accumulation paired np.unique counts with category positions instead)
+        if arrayStratification is None:
+            self.N_h[0] += pixelCount
+            return
+        order = np.argsort(self.strataValues)
+        positions = np.searchsorted(self.strataValues, arrayStratification.ravel(), sorter=order)
+        indices = order[np.clip(positions, 0, len(self.strataValues) - 1)]
+        indices = indices[self.strataValues[indices] == arrayStratification.ravel()]
+        self.N_h += np.bincount(indices, minlength=len(self.strataValues))
+
+    def referenceMask(self, arrayReference: np.ndarray) -> np.ndarray:
+        return np.isin(arrayReference, self.referenceValues)
+
+    def addSample(
+            self, valid: np.ndarray, arrayReference: np.ndarray, arrayPrediction: np.ndarray,
+            arrayStratification: Optional[np.ndarray]
+    ):
+        yPrediction = arrayPrediction[valid]
+        yMap = np.zeros(len(yPrediction), np.float32)  # unmatched predictions are mapped to 0
+        for valuePrediction, valueReference in self.predictionMapping.items():
+            yMap[yPrediction == valuePrediction] = valueReference
+        if arrayStratification is None:
+            stratum = np.full(len(yMap), self.strataValues[0])
+        else:
+            stratum = arrayStratification[valid]
+        self.reference.append(arrayReference[valid].astype(np.float32))
+        self.map.append(yMap)
+        self.stratum.append(stratum)
+
+    def sample(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Any], List[int]]:
+        """Return stratum, reference and map sample, and the non-empty strata with their pixel counts."""
+        if len(self.reference) == 0:
+            stratum = reference = map = np.array([], np.float32)
+        else:
+            stratum = np.concatenate(self.stratum)
+            reference = np.concatenate(self.reference)
+            map = np.concatenate(self.map)
+        h = list()
+        N_h = list()
+        for value, count in zip(self.strataValues.tolist(), self.N_h.tolist()):
+            if count == 0:
+                continue
+            h.append(value)
+            N_h.append(count)
+        return stratum, reference, map, h, N_h
+
+
 @typechecked()
 @dataclass
 class StratifiedAccuracyAssessmentResult(object):
@@ -5,6 +5,7 @@ from enmapboxprocessing.algorithm.fitgenericclassifieralgorithm import FitGeneri
 from enmapboxprocessing.algorithm.predictclassificationalgorithm import PredictClassificationAlgorithm
 from enmapboxprocessing.algorithm.predictclassprobabilityalgorithm import PredictClassPropabilityAlgorithm
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
+from enmapboxprocessing.modelartifact import ModelArtifact
 from qgis.core import (QgsProcessingContext, QgsProcessingFeedback)
 from enmapbox.typeguard import typechecked
 
@@ -20,6 +21,7 @@ class ClassificationWorkflowAlgorithm(EnMAPProcessingAlgorithm):
     P_OUTPUT_CLASSIFIER, _OUTPUT_CLASSIFIER = 'outputClassifier', 'Output classifier'
     P_OUTPUT_CLASSIFICATION, _OUTPUT_CLASSIFICATION = 'outputClassification', 'Output classification layer'
     P_OUTPUT_PROBABILITY, _OUTPUT_PROBABILITY = 'outputProbability', 'Output class probability layer'
+    P_OUTPUT_UNCERTAINTY, _OUTPUT_UNCERTAINTY = 'outputUncertainty', 'Output classification uncertainty layer'
     P_OUTPUT_REPORT, _OUTPUT_REPORT = 'outputClassifierPerformance', 'Output classifier performance report'
 
     def displayName(self) -> str:
@@ -38,7 +40,14 @@ class ClassificationWorkflowAlgorithm(EnMAPProcessingAlgorithm):
             (self._OPEN_REPORT, self.ReportOpen),
             (self._OUTPUT_CLASSIFIER, self.PickleFileDestination),
             (self._OUTPUT_CLASSIFICATION, self.RasterFileDestination),
-            (self._OUTPUT_PROBABILITY, self.RasterFileDestination),
+            (self._OUTPUT_PROBABILITY, 'If the classifier supports class probabilities, the classification layer '
+                                       'is derived from the class probabilities (class with highest probability) '
+                                       'and both layers are predicted in a single pass.\n'
+                                       + self.RasterFileDestination),
+            (self._OUTPUT_UNCERTAINTY, 'Classification uncertainty layer derived from the class probabilities, '
+                                       'with bands: 1) uncertainty = 1 - highest probability and '
+                                       '2) margin = highest probability - second highest probability. '
+                                       'Requires the class probability layer.\n' + self.RasterFileDestination),
             (self._OUTPUT_REPORT, self.ReportFileDestination)
         ]
 
@@ -55,6 +64,9 @@ class ClassificationWorkflowAlgorithm(EnMAPProcessingAlgorithm):
         self.addParameterFileDestination(self.P_OUTPUT_CLASSIFIER, self._OUTPUT_CLASSIFIER, self.PickleFileFilter)
         self.addParameterRasterDestination(self.P_OUTPUT_CLASSIFICATION, self._OUTPUT_CLASSIFICATION, None, True, True)
         self.addParameterRasterDestination(self.P_OUTPUT_PROBABILITY, self._OUTPUT_PROBABILITY, None, True, False)
+        self.addParameterRasterDestination(
+            self.P_OUTPUT_UNCERTAINTY, self._OUTPUT_UNCERTAINTY, None, True, False, advanced=True
+        )
         self.addParameterFileDestination(
             self.P_OUTPUT_REPORT, self._OUTPUT_REPORT, self.ReportFileFilter, None, True, False
         )
@@ -62,10 +74,13 @@ class ClassificationWorkflowAlgorithm(EnMAPProcessingAlgorithm):
     def checkParameterValues(self, parameters: Dict[str, Any], context: QgsProcessingContext) -> Tuple[bool, str]:
         filenameClassification = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_CLASSIFICATION, context)
         filenameProbability = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_PROBABILITY, context)
+        filenameUncertainty = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_UNCERTAINTY, context)
         raster = self.parameterAsRasterLayer(parameters, self.P_RASTER, context)
         if (filenameClassification is not None) or (filenameProbability is not None):
             if raster is None:
                 return False, f'Wrong or missing parameter value: {self._RASTER}'
+        if filenameUncertainty is not None and filenameProbability is None:
+            return False, f'Wrong or missing parameter value: {self._OUTPUT_PROBABILITY}'
         return True, ''
 
     def processAlgorithm(
@@ -80,6 +95,7 @@ class ClassificationWorkflowAlgorithm(EnMAPProcessingAlgorithm):
         filenameClassifier = self.parameterAsFileOutput(parameters, self.P_OUTPUT_CLASSIFIER, context)
         filenameClassification = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_CLASSIFICATION, context)
         filenameProbability = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_PROBABILITY, context)
+        filenameUncertainty = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_UNCERTAINTY, context)
         filenameReport = self.parameterAsFileOutput(parameters, self.P_OUTPUT_REPORT, context)
 
         with open(filenameClassifier + '.log', 'w') as logfile:
@@ -96,8 +112,27 @@ class ClassificationWorkflowAlgorithm(EnMAPProcessingAlgorithm):
             }
             self.runAlg(alg, parameters, None, feedback2, context, True)
 
+            # predict classification and probability in a single pass, if the classifier supports it
+            fusedPrediction = False
+            if filenameProbability is not None:
+                classifier = ModelArtifact.read(filenameClassifier, ['classifier'])['classifier']
+                fusedPrediction = hasattr(classifier, 'predict_proba')
+
+            if fusedPrediction:
+                alg = PredictClassPropabilityAlgorithm()
+                alg.initAlgorithm()
+                parameters = {
+                    alg.P_RASTER: raster,
+                    alg.P_CLASSIFIER: filenameClassifier,
+                    alg.P_MATCH_BY_NAME: matchByName,
+                    alg.P_OUTPUT_PROBABILITY: filenameProbability,
+                    alg.P_OUTPUT_CLASSIFICATION: filenameClassification,
+                    alg.P_OUTPUT_UNCERTAINTY: filenameUncertainty
+                }
+                self.runAlg(alg, parameters, None, feedback2, context, True)
+
             # prediction classification
-            if filenameClassification is not None:
+            if filenameClassification is not None and not fusedPrediction:
                 alg = PredictClassificationAlgorithm()
                 alg.initAlgorithm()
                 parameters = {
@@ -109,7 +144,7 @@ class ClassificationWorkflowAlgorithm(EnMAPProcessingAlgorithm):
                 self.runAlg(alg, parameters, None, feedback2, context, True)
 
             # prediction probability
-            if filenameProbability is not None:
+            if filenameProbability is not None and not fusedPrediction:
                 alg = PredictClassPropabilityAlgorithm()
                 alg.initAlgorithm()
                 parameters = {
@@ -136,6 +171,7 @@ class ClassificationWorkflowAlgorithm(EnMAPProcessingAlgorithm):
                 self.P_OUTPUT_CLASSIFIER: filenameClassifier,
                 self.P_OUTPUT_CLASSIFICATION: filenameClassification,
                 self.P_OUTPUT_PROBABILITY: filenameProbability,
+                self.P_OUTPUT_UNCERTAINTY: filenameUncertainty,
                 self.P_OUTPUT_REPORT: filenameReport,
             }
             self.toc(feedback, result)
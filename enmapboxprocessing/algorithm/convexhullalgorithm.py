@@ -1,4 +1,4 @@
-from math import ceil, isnan
+from math import isnan
 from typing import Dict, Any, List, Tuple
 
 import numpy as np
@@ -6,6 +6,7 @@ import numpy as np
 from enmapbox.typeguard import typechecked
 from enmapboxprocessing.driver import Driver
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
+from enmapboxprocessing.numpyutils import NumpyUtils
 from enmapboxprocessing.rasterreader import RasterReader
 from enmapboxprocessing.utils import Utils
 from qgis.core import (QgsProcessingContext, QgsProcessingFeedback, Qgis)
@@ -91,10 +92,18 @@ class ConvexHullAlgorithm(EnMAPProcessingAlgorithm):
                     filenameContinuumRemoved, feedback=feedback
                 ).createLike(reader, Qgis.Float32)
 
-            lineMemoryUsage = reader.lineMemoryUsage(dataTypeSize=4) * 3
-            blockSizeY = min(raster.height(), ceil(Utils.maximumMemoryUsage() / lineMemoryUsage))
-            blockSizeX = raster.width()
+            # input, convex hull and valid profiles in the raster data type, mask and float32 outputs,
+            # plus up to 12 float64/int64 and 2 bool temporaries per value in NumpyUtils.upperConvexHull
+            bandCount = len(bandList)
+            pixelMemoryUsage = reader.pixelMemoryUsage(bandCount) * 3 \
+                               + reader.pixelMemoryUsage(bandCount, 1 + 4 + 4 + 12 * 8 + 2)
+            if filenameConvexHull is not None:
+                writer = writerConvexHull
+            else:
+                writer = writerContinuumRemoved
+            blockSizeX, blockSizeY = reader.blockSize(pixelMemoryUsage, writer=writer)
             for block in reader.walkGrid(blockSizeX, blockSizeY, feedback):
+                feedback.setProgress(block.yOffset / reader.height() * 100)
                 array = np.array(reader.arrayFromBlock(block, bandList))
                 invalid = np.logical_not(reader.maskArray(array, bandList))
                 array[invalid] = 0  # filling no data values with zeroes should be fine (fixes #397)
@@ -103,18 +112,12 @@ class ConvexHullAlgorithm(EnMAPProcessingAlgorithm):
                 noDataValueContinuumRemoved = Utils.defaultNoDataValue(np.float32)
                 arrayContinuumRemoved = np.full_like(array, noDataValueContinuumRemoved, np.float32)
 
-                for yi in range(array.shape[1]):
-                    feedback.setProgress((block.yOffset + yi) / reader.height() * 100)
-                    for xi in range(array.shape[2]):
-                        yValues = array[:, yi, xi]
-                        if np.all(yValues == 0):
-                            continue
-                        try:
-                            continuumRemovedValues, convexHullValues = self.convexHullRemoval(yValues, xValues)
-                            arrayConvexHull[:, yi, xi] = convexHullValues
-                            arrayContinuumRemoved[:, yi, xi] = continuumRemovedValues
-                        except Exception as error:
-                            print(f'Skip pixel {xi, yi}: {str(error)}')
+                # process all profiles of the block at once (profiles with all zeroes are skipped)
+                profiles = array.reshape((len(bandList), -1)).T
+                valid = np.any(profiles != 0, axis=1)
+                continuumRemovedValues, convexHullValues = self.convexHullRemoval(profiles[valid], xValues)
+                arrayConvexHull.reshape((len(bandList), -1))[:, valid] = convexHullValues.T
+                arrayContinuumRemoved.reshape((len(bandList), -1))[:, valid] = continuumRemovedValues.T
 
                 if filenameConvexHull is not None:
                     writerConvexHull.writeArray(arrayConvexHull, xOffset=block.xOffset, yOffset=block.yOffset)
@@ -143,27 +146,13 @@ class ConvexHullAlgorithm(EnMAPProcessingAlgorithm):
         return result
 
     @staticmethod
-    def convexHullRemoval(yValues, xValues):
-        # Code was adopted from pysptools.spectro.hull_removal:
-        #     https://pysptools.sourceforge.io/_modules/pysptools/spectro/hull_removal.html#convex_hull_removal
-        # We use scipy.spatial.ConvexHull instead of _jarvis.convex_hull to avoid external dependencies.
-
-        from scipy import interpolate
-        from scipy.spatial import ConvexHull
-        points = list(zip(xValues, yValues))
-
-        # add extra points to close the polygon
-        points = [(xValues[0], 0)] + points + [(xValues[-1], 0)]
-
-        # calculate hull
-        vertices = ConvexHull(points).vertices
-        vertices = list(sorted(vertices - 1))[1:-1]  # remove extra points
-        x_hull = [xValues[v] for v in vertices]
-        y_hull = [yValues[v] for v in vertices]
-
-        # interpolate to all bands
-        tck = interpolate.splrep(x_hull, y_hull, k=1)
-        convexHullValues = interpolate.splev(xValues, tck, der=0)
-        continuumRemovedValues = np.true_divide(yValues, convexHullValues, dtype=np.float32)
-
+    def convexHullRemoval(yValues: np.ndarray, xValues: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return continuum-removed values and convex hull values.
+
+        Profiles are given as rows of a 2d array (or as a single 1d profile).
+        """
+        convexHullValues = NumpyUtils.upperConvexHull(np.atleast_2d(yValues), xValues).reshape(np.shape(yValues))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            continuumRemovedValues = np.true_divide(yValues, convexHullValues, dtype=np.float32)
         return continuumRemovedValues, convexHullValues
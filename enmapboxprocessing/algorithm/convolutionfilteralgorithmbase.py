@@ -1,10 +1,10 @@
 import inspect
 import traceback
-from math import ceil
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Optional
 
 import numpy as np
 
+from enmapboxprocessing.blockexecutor import BlockExecutor
 from enmapboxprocessing.driver import Driver
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
 from enmapboxprocessing.rasterreader import RasterReader
@@ -19,8 +19,14 @@ class ConvolutionFilterAlgorithmBase(EnMAPProcessingAlgorithm):
     P_KERNEL, _KERNEL = 'kernel', 'Kernel'
     P_NORMALIZE, _NORMALIZE = 'normalize', 'Normalize kernel'
     P_INTERPOLATE, _INTERPOLATE = 'interpolate', 'Interpolate no data pixel'
+    P_BACKEND, _BACKEND = 'backend', 'Convolution backend'
+    O_BACKEND = ['automatic', 'direct', 'FFT', 'separable']
+    AutomaticBackend, DirectBackend, FftBackend, SeparableBackend = range(len(O_BACKEND))
+    P_WORKER_COUNT, _WORKER_COUNT = 'workerCount', 'Number of workers'
     P_OUTPUT_RASTER, _OUTPUT_RASTER = 'outputRaster', 'Output raster layer'
 
+    FftKernelSizeThreshold = 121  # number of kernel elements (e.g. 11x11) from which on FFT convolution is faster
+
     def helpParameters(self) -> List[Tuple[str, str]]:
         return [
             (self._RASTER, 'Raster layer to be filtered.'),
@@ -29,6 +35,14 @@ class ConvolutionFilterAlgorithmBase(EnMAPProcessingAlgorithm):
             (self._INTERPOLATE, 'Whether to interpolate no data pixel. '
                                 'Will result in renormalization of the kernel at each position ignoring '
                                 'pixels with no data values.'),
+            (self._BACKEND, 'Convolution backend. '
+                            'Direct summation (astropy convolve) is used for small kernels. '
+                            'FFT convolution is used for large kernels. '
+                            'Separable kernels are applied as 1-D passes along each axis; '
+                            'purely spectral kernels are applied without reading neighbouring pixels. '
+                            'By default, the backend is selected automatically.'),
+            (self._WORKER_COUNT, 'Number of parallel workers. '
+                                 'Use -1 for using all CPU cores. If not specified, processing runs serially.'),
             (self._OUTPUT_RASTER, self.RasterFileDestination)
         ]
 
@@ -58,6 +72,10 @@ class ConvolutionFilterAlgorithmBase(EnMAPProcessingAlgorithm):
         self.addParameterCode(self.P_KERNEL, self._KERNEL, self.defaultCodeAsString())
         self.addParameterBoolean(self.P_NORMALIZE, self._NORMALIZE, self.normalizeByDefault(), False, True)
         self.addParameterBoolean(self.P_INTERPOLATE, self._INTERPOLATE, self.interpolateByDefault(), False, True)
+        self.addParameterEnum(
+            self.P_BACKEND, self._BACKEND, self.O_BACKEND, False, self.AutomaticBackend, True, True
+        )
+        self.addParameterInt(self.P_WORKER_COUNT, self._WORKER_COUNT, None, True, -1, None, True)
         self.addParameterRasterDestination(self.P_OUTPUT_RASTER, self._OUTPUT_RASTER)
 
     def defaultCodeAsString(self):
@@ -87,6 +105,10 @@ class ConvolutionFilterAlgorithmBase(EnMAPProcessingAlgorithm):
             assert 1 <= kernel.dimension <= 3
         except Exception:
             return False, traceback.format_exc()
+        backend = self.parameterAsEnum(parameters, self.P_BACKEND, context)
+        if backend == self.SeparableBackend:
+            if self.separableKernel(self.kernelArray3d(kernel.array)) is None:
+                return False, 'Kernel is not separable, select another convolution backend.'
         return True, ''
 
     def processAlgorithm(
@@ -99,6 +121,8 @@ class ConvolutionFilterAlgorithmBase(EnMAPProcessingAlgorithm):
             nan_treatment = 'interpolate'
         else:
             nan_treatment = 'fill'
+        backend = self.parameterAsEnum(parameters, self.P_BACKEND, context)
+        workerCount = self.parameterAsInt(parameters, self.P_WORKER_COUNT, context)
         filename = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_RASTER, context)
         maximumMemoryUsage = Utils.maximumMemoryUsage()
 
@@ -108,35 +132,52 @@ class ConvolutionFilterAlgorithmBase(EnMAPProcessingAlgorithm):
             self.tic(feedback, parameters, context)
 
             feedback.pushInfo(f'Filter kernel {list(kernel.array.shape)}: {kernel.array.tolist()}')
-            if kernel.dimension == 3:
-                pass
-            elif kernel.dimension == 2:
-                kernel = CustomKernel(array=kernel.array[None])
-            elif kernel.dimension == 1:
-                kernel = CustomKernel(array=kernel.array.reshape(-1, 1, 1))
+            kernel = CustomKernel(array=self.kernelArray3d(kernel.array))
+            if backend == self.AutomaticBackend:
+                backend = self.selectBackend(kernel.array, nan_treatment == 'interpolate')
+            feedback.pushInfo(f'Use {self.O_BACKEND[backend]} convolution backend')
 
             zsize, ysize, xsize = kernel.shape
-            overlap = int((max(ysize, xsize) + 1) / 2.)
+            overlap = max(ysize, xsize) // 2  # kernel radius; purely spectral kernels don't need any overlap
 
             feedback.pushInfo('Convolve raster')
             rasterReader = RasterReader(raster)
             writer = Driver(filename, feedback=feedback).createLike(rasterReader, Qgis.Float32)
-            lineMemoryUsage = rasterReader.lineMemoryUsage(dataTypeSize=Qgis.Float32)
-            lineMemoryUsage *= 2  # output has same size
-            blockSizeY = min(raster.height(), ceil(maximumMemoryUsage / lineMemoryUsage))
-            blockSizeX = raster.width()
-            for block in rasterReader.walkGrid(blockSizeX, blockSizeY, feedback):
-                feedback.setProgress(block.yOffset / rasterReader.height() * 100)
+            executor = BlockExecutor(workerCount, feedback=feedback)
+            if executor.isParallel():
+                maximumMemoryUsage = maximumMemoryUsage // executor.maxInFlight
+            # memory usage: input, mask, float64 output and, for FFT and separable backends, float64 temporaries
+            pixelMemoryUsage = rasterReader.pixelMemoryUsage() + rasterReader.pixelMemoryUsage(dataTypeSize=1 + 8)
+            if backend != self.DirectBackend:
+                pixelMemoryUsage += rasterReader.pixelMemoryUsage(dataTypeSize=3 * 8)
+            blockSizeX, blockSizeY = rasterReader.blockSize(pixelMemoryUsage, maximumMemoryUsage, writer)
+            noDataValue = float(np.finfo(np.float32).min)
+
+            def read(block):
                 array = rasterReader.arrayFromBlock(block, overlap=overlap)
                 mask = rasterReader.maskArray(array)
-                outarray = convolve(
-                    array, kernel, fill_value=np.nan, nan_treatment=nan_treatment,
-                    normalize_kernel=normalize_kernel, mask=np.logical_not(mask)
-                )
-                noDataValue = float(np.finfo(np.float32).min)
+                return array, mask
+
+            def compute(data):
+                array, mask = data
+                if backend == self.DirectBackend:
+                    outarray = convolve(
+                        array, kernel, fill_value=np.nan, nan_treatment=nan_treatment,
+                        normalize_kernel=normalize_kernel, mask=np.logical_not(mask)
+                    )
+                else:
+                    outarray = self.convolveMasked(
+                        np.array(array), np.array(mask), kernel.array, normalize_kernel,
+                        nan_treatment == 'interpolate', backend == self.FftBackend
+                    )
                 outarray[np.isnan(outarray)] = noDataValue
+                return outarray
+
+            def write(block, outarray):
                 writer.writeArray(outarray, block.xOffset, block.yOffset, overlap=overlap)
 
+            executor.run(rasterReader.walkGrid(blockSizeX, blockSizeY), read, compute, write)
+
             writer.setMetadata(rasterReader.metadata())
             writer.setNoDataValue(noDataValue)
             for i in range(rasterReader.bandCount()):
@@ -146,3 +187,92 @@ class ConvolutionFilterAlgorithmBase(EnMAPProcessingAlgorithm):
             self.toc(feedback, result)
 
         return result
+
+    @staticmethod
+    def kernelArray3d(kernel: np.ndarray) -> np.ndarray:
+        """Return kernel as (z, y, x) array; 2d kernels are spatial, 1d kernels are spectral."""
+        if kernel.ndim == 2:
+            return kernel[None]
+        if kernel.ndim == 1:
+            return kernel.reshape(-1, 1, 1)
+        return kernel
+
+    @classmethod
+    def selectBackend(cls, kernel: np.ndarray, interpolate: bool) -> int:
+        """Select the fastest backend for the given (z, y, x) kernel."""
+        if interpolate and np.isclose(np.sum(kernel), 0):
+            return cls.DirectBackend  # kernel can't be renormalized, keep astropy behaviour
+        if cls.separableKernel(kernel) is not None:
+            return cls.SeparableBackend
+        if kernel.size >= cls.FftKernelSizeThreshold:
+            return cls.FftBackend
+        return cls.DirectBackend
+
+    @staticmethod
+    def separableKernel(kernel: np.ndarray) -> Optional[List[np.ndarray]]:
+        """
+        Return 1d kernels for the z, y and x axes, if the (z, y, x) kernel is separable.
+        Only purely spectral kernels and rank 1 spatial kernels are considered.
+        """
+        zsize, ysize, xsize = kernel.shape
+        if ysize == 1 and xsize == 1:
+            return [kernel[:, 0, 0], np.ones(1), np.ones(1)]
+        if zsize != 1:
+            return None
+        u, s, vh = np.linalg.svd(kernel[0])
+        if len(s) > 1 and s[1] > 1e-10 * s[0]:
+            return None
+        return [np.ones(1), u[:, 0] * np.sqrt(s[0]), vh[0] * np.sqrt(s[0])]
+
+    @classmethod
+    def convolveMasked(
+            cls, array: np.ndarray, mask: np.ndarray, kernel: np.ndarray, normalize_kernel: bool, interpolate: bool,
+            fft: bool
+    ) -> np.ndarray:
+        """
+        Convolve (z, y, x) array with (z, y, x) kernel using FFT or separable 1d convolutions.
+
+        Invalid pixels are treated like in astropy convolve with fill_value=NaN:
+        if interpolate is True, the kernel is renormalized at each position ignoring invalid pixels,
+        otherwise, pixels with any invalid pixel inside the kernel footprint are set to NaN.
+        """
+        from scipy.ndimage import convolve1d
+        from scipy.signal import oaconvolve
+
+        if fft:
+            def convolve(a: np.ndarray, k: np.ndarray) -> np.ndarray:
+                return oaconvolve(a, k, mode='same')
+        else:
+            kernels = cls.separableKernel(kernel)
+            assert kernels is not None, 'kernel is not separable'
+
+            def convolve(a: np.ndarray, k: np.ndarray) -> np.ndarray:
+                ks = kernels if k is kernel else [np.ones(size) for size in k.shape]
+                for axis, k1d in enumerate(ks):
+                    if len(k1d) > 1:
+                        a = convolve1d(a, k1d, axis=axis, mode='constant', cval=0.)
+                return a
+
+        valid = mask.astype(np.float64)
+        data = np.where(mask, array, 0.).astype(np.float64)
+        footprint = np.ones_like(kernel)
+        kernelSum = np.sum(kernel)
+
+        top = convolve(data, kernel)
+        if interpolate:
+            # positions without any valid pixel inside the kernel footprint stay invalid
+            hasValid = convolve(valid, footprint) > 0.5
+            bottom = convolve(valid, kernel)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result = top / bottom
+            result[np.logical_not(hasValid)] = np.nan
+            if not normalize_kernel:
+                result *= kernelSum
+        else:
+            # pixel outside the array are invalid, like with astropy fill_value=NaN
+            hasInvalid = convolve(valid, footprint) < footprint.size - 0.5
+            result = top
+            if normalize_kernel:
+                result /= kernelSum
+            result[hasInvalid] = np.nan
+        return result
@@ -1,17 +1,21 @@
+import ast
 from collections import OrderedDict
+from types import CodeType
 from typing import Dict, Any, List, Tuple, Optional
 import re
 
+import numpy as np
 from osgeo import gdal
 
 from enmapboxprocessing.algorithm.vrtbandmathalgorithm import VrtBandMathAlgorithm
+from enmapboxprocessing.driver import Driver
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
 from enmapboxprocessing.gdalutils import GdalUtils
 from enmapboxprocessing.rasterreader import RasterReader
 from enmapboxprocessing.rasterwriter import RasterWriter
 from enmapboxprocessing.utils import Utils
 from qgis.core import (QgsProcessingContext, QgsProcessingFeedback, QgsProcessingException,
-                       QgsRasterLayer)
+                       QgsRasterLayer, Qgis)
 from enmapbox.typeguard import typechecked
 
 
@@ -46,7 +50,7 @@ class CreateSpectralIndicesAlgorithm(EnMAPProcessingAlgorithm):
     P_sla, _sla = 'sla', 'Soil line slope'
     P_slb, _slb = 'slb', 'Soil line intercept'
 
-    P_OUTPUT_VRT, _OUTPUT_VRT = 'outputVrt', 'Output VRT layer'
+    P_OUTPUT_VRT, _OUTPUT_VRT = 'outputVrt', 'Output raster layer'
 
     ShortNames = ['A', 'B', 'G', 'R', 'RE1', 'RE2', 'RE3', 'RE4', 'N', 'S1', 'S2', 'T1', 'T2']
 
@@ -103,7 +107,10 @@ class CreateSpectralIndicesAlgorithm(EnMAPProcessingAlgorithm):
              'If the source raster has proper wavelength information, mapping is done automatically.'),
             ('Canopy background adjustment (L), ..., Soil line intercept (slb)',
              'Standardized additional index parameters L, ..., slb used in the formulas.'),
-            (self._OUTPUT_VRT, 'VRT file destination.'),
+            (self._OUTPUT_VRT, self.RasterFileDestination + ' All indices are calculated block-wise in a single '
+                                                            'pass over the data. If a VRT file destination is chosen, '
+                                                            'a lazy VRT layer with Python pixel functions is created '
+                                                            'instead.'),
         ]
         keys = [self._A, self._B, self._G, self._R, self._RE1, self._RE2, self._RE3, self._RE4, self._N, self._S1,
                 self._S2, self._T1, self._T2, self._L, self._g, self._C1, self._C2, self._cexp, self._nexp, self._alpha,
@@ -124,7 +131,7 @@ class CreateSpectralIndicesAlgorithm(EnMAPProcessingAlgorithm):
         for name in self.ConstantMapping:
             description = getattr(self, '_' + name)
             self.addParameterFloat(name, description, self.ConstantMapping[name], True, None, None, True)
-        self.addParameterVrtDestination(self.P_OUTPUT_VRT, self._OUTPUT_VRT)
+        self.addParameterRasterDestination(self.P_OUTPUT_VRT, self._OUTPUT_VRT, allowVrt=True)
 
     def processAlgorithm(
             self, parameters: Dict[str, Any], context: QgsProcessingContext, feedback: QgsProcessingFeedback
@@ -191,42 +198,146 @@ class CreateSpectralIndicesAlgorithm(EnMAPProcessingAlgorithm):
                     bandList.append(bandNo)
 
                 code = self.deriveParameters(short_name, formula, bands, bandList, reader, scale)
-                indices[short_name] = long_name, formula, bandList, code, bandName
-
-            # build index VRTs
-            filenames = list()
-            metadatas = list()
-            for short_name, (long_name, formula, bandList, code, bandName) in indices.items():
-                alg = VrtBandMathAlgorithm()
-                parameters = {
-                    alg.P_RASTER: raster,
-                    alg.P_BAND_LIST: bandList,
-                    alg.P_BAND_NAME: bandName,
-                    alg.P_NODATA: -9999,
-                    alg.P_DATA_TYPE: self.Float32,
-                    alg.P_CODE: code,
-                    alg.P_OUTPUT_VRT: Utils.tmpFilename(filename, short_name + '.vrt')
-                }
-                result = self.runAlg(alg, parameters, None, feedback2, context, True)
-                filenames.append(result[alg.P_OUTPUT_VRT])
-                metadatas.append({'short_name': short_name, 'long_name': long_name, 'formula': formula})
-
-            # create stack VRT
-            filenameTmpStack = Utils.tmpFilename(filename, 'stack.vrt')
-            GdalUtils.stackVrtBands(filenameTmpStack, filenames, [1] * len(filenames))
-            ds = gdal.Translate(filename, filenameTmpStack)
-            writer = RasterWriter(ds)
-            for bandNo, (ifilename, metadata) in enumerate(zip(filenames, metadatas), 1):
-                writer.setBandName(f"{metadata['short_name']} - {metadata['long_name']}", bandNo)
-                writer.setMetadataDomain(metadata, '', bandNo)
-            writer = None
-            ds = None
+                indices[short_name] = long_name, formula, bands, bandList, code, bandName
+
+            if filename.lower().endswith('.vrt'):
+                self.createLazyVrt(raster, indices, filename, feedback2, context)
+            else:
+                self.createRaster(reader, indices, bandNos, scale, filename, feedback)
 
             result = {self.P_OUTPUT_VRT: filename}
             self.toc(feedback, result)
 
         return result
 
+    def createLazyVrt(
+            self, raster: QgsRasterLayer, indices: Dict[str, Tuple], filename: str, feedback2: QgsProcessingFeedback,
+            context: QgsProcessingContext
+    ):
+        """Create a VRT layer that calculates the indices on-the-fly via Python pixel functions."""
+        # build index VRTs
+        filenames = list()
+        metadatas = list()
+        for short_name, (long_name, formula, bands, bandList, code, bandName) in indices.items():
+            alg = VrtBandMathAlgorithm()
+            parameters = {
+                alg.P_RASTER: raster,
+                alg.P_BAND_LIST: bandList,
+                alg.P_BAND_NAME: bandName,
+                alg.P_NODATA: -9999,
+                alg.P_DATA_TYPE: self.Float32,
+                alg.P_CODE: code,
+                alg.P_OUTPUT_VRT: Utils.tmpFilename(filename, short_name + '.vrt')
+            }
+            result = self.runAlg(alg, parameters, None, feedback2, context, True)
+            filenames.append(result[alg.P_OUTPUT_VRT])
+            metadatas.append({'short_name': short_name, 'long_name': long_name, 'formula': formula})
+
+        # create stack VRT
+        filenameTmpStack = Utils.tmpFilename(filename, 'stack.vrt')
+        GdalUtils.stackVrtBands(filenameTmpStack, filenames, [1] * len(filenames))
+        ds = gdal.Translate(filename, filenameTmpStack)
+        writer = RasterWriter(ds)
+        for bandNo, (ifilename, metadata) in enumerate(zip(filenames, metadatas), 1):
+            writer.setBandName(f"{metadata['short_name']} - {metadata['long_name']}", bandNo)
+            writer.setMetadataDomain(metadata, '', bandNo)
+        writer = None
+        ds = None
+
+    def createRaster(
+            self, reader: RasterReader, indices: Dict[str, Tuple], bandNos: Dict[str, Optional[int]], scale: float,
+            filename: str, feedback: QgsProcessingFeedback
+    ):
+        """Calculate all indices block-wise and write them into a single raster."""
+        formulas = [formula for long_name, formula, bands, bandList, code, bandName in indices.values()]
+        bandsByIndex = [bands for long_name, formula, bands, bandList, code, bandName in indices.values()]
+        names = sorted(set(name for bands in bandsByIndex for name in bands))
+        for name in names:
+            if bandNos[name] is None:
+                raise QgsProcessingException(f'band not found: {name}')
+        bandList = sorted(set(bandNos[name] for name in names))
+        code = self.compileFormulas(formulas)
+        constants = {name: value for name, value in self.ConstantMapping.items()
+                     if any(name in formula for formula in formulas)}
+
+        # memory usage: input data, scaled Float32 bands and masks, Float32 indices and intermediate results
+        pixelMemoryUsage = reader.pixelMemoryUsage(len(bandList)) + len(bandList) * (4 + 1) + len(indices) * 4 * 2
+        blockSizeX, blockSizeY = reader.blockSize(pixelMemoryUsage)
+
+        noDataValue = -9999
+        writer = Driver(filename, feedback=feedback).createLike(reader, Qgis.DataType.Float32, len(indices))
+        for block in reader.walkGrid(blockSizeX, blockSizeY, feedback):
+            array = reader.arrayFromBlock(block, bandList)
+            arrays = dict()
+            invalids = dict()
+            for bandNo, bandArray in zip(bandList, array):
+                noDataValue_ = reader.noDataValue(bandNo)
+                if noDataValue_ is None:
+                    invalids[bandNo] = np.zeros_like(bandArray, bool)
+                else:
+                    invalids[bandNo] = bandArray == noDataValue_
+                arrays[bandNo] = bandArray.astype(np.float32)
+                if scale != 1:
+                    arrays[bandNo] /= scale
+
+            namespace = {'np': np, 'math': np, 'nan': np.nan}  # math functions are evaluated element-wise
+            namespace.update(constants)
+            namespace.update({name: arrays[bandNos[name]] for name in names})
+            with np.errstate(all='ignore'):
+                exec(code, namespace)
+
+            for i, bands in enumerate(bandsByIndex):
+                outarray = np.broadcast_to(np.float32(namespace[f'_index{i}']), (block.height, block.width)).copy()
+                for name in bands:
+                    outarray[invalids[bandNos[name]]] = noDataValue
+                writer.writeArray2d(outarray, i + 1, block.xOffset, block.yOffset)
+
+        for bandNo, (short_name, (long_name, formula, bands, bandList, code, bandName)) in enumerate(indices.items(), 1):
+            writer.setNoDataValue(noDataValue, bandNo)
+            writer.setBandName(bandName, bandNo)
+            writer.setMetadataDomain({'short_name': short_name, 'long_name': long_name, 'formula': formula}, '', bandNo)
+        writer.close()
+
+    @classmethod
+    def compileFormulas(cls, formulas: List[str]) -> CodeType:
+        """
+        Compile index formulas into a single code object.
+        Subexpressions that occur more than once are evaluated only once and assigned to temporary variables.
+        After execution, the result of the i-th formula is available as _index<i>.
+        """
+        trees = [ast.parse(formula.strip(), mode='eval').body for formula in formulas]
+
+        # count subexpressions
+        counts = dict()
+        for tree in trees:
+            for node in ast.walk(tree):
+                if isinstance(node, (ast.BinOp, ast.UnaryOp, ast.Call)):
+                    key = ast.dump(node)
+                    counts[key] = counts.get(key, 0) + 1
+
+        # replace common subexpressions by temporary variables, inner subexpressions first
+        statements = list()
+        temporaries = dict()
+
+        class Transformer(ast.NodeTransformer):
+
+            def generic_visit(self, node):
+                key = ast.dump(node)
+                node = super().generic_visit(node)
+                if counts.get(key, 0) < 2:
+                    return node
+                if key not in temporaries:
+                    temporaries[key] = f'_tmp{len(temporaries)}'
+                    statements.append(ast.Assign(targets=[ast.Name(temporaries[key], ast.Store())], value=node))
+                return ast.Name(temporaries[key], ast.Load())
+
+        for i, tree in enumerate(trees):
+            value = Transformer().visit(tree)
+            statements.append(ast.Assign(targets=[ast.Name(f'_index{i}', ast.Store())], value=value))
+
+        module = ast.fix_missing_locations(ast.Module(body=statements, type_ignores=[]))
+        return compile(module, '<indices>', 'exec')
+
     def deriveParameters(
             self, short_name: str, formula: str, bands: List[str], bandList: List[int], reader: RasterReader,
             scale: Optional[float]
@@ -6,6 +6,7 @@ from enmapbox.typeguard import typechecked
 from enmapboxprocessing.algorithm.prepareclassificationdatasetfromjsonalgorithm import \
     PrepareClassificationDatasetFromJsonAlgorithm
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
+from enmapboxprocessing.modelartifact import ModelArtifact
 from enmapboxprocessing.typing import ClassifierDump
 from enmapboxprocessing.utils import Utils
 from qgis.core import QgsProcessingContext, QgsProcessingFeedback
@@ -101,7 +102,7 @@ class FitClassifierAlgorithmBase(EnMAPProcessingAlgorithm):
                 dump = ClassifierDump(None, None, None, None, classifier)
 
             dump = ClassifierDump(dump.categories, dump.features, dump.X, dump.y, classifier)
-            Utils.pickleDump(dump.__dict__, filename)
+            ModelArtifact.write(dump.__dict__, filename)
 
             result = {self.P_OUTPUT_CLASSIFIER: filename}
             self.toc(feedback, result)
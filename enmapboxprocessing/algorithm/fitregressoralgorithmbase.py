@@ -3,8 +3,8 @@ import traceback
 from typing import Dict, Any, List, Tuple
 
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
+from enmapboxprocessing.modelartifact import ModelArtifact
 from enmapboxprocessing.typing import RegressorDump
-from enmapboxprocessing.utils import Utils
 from qgis.core import QgsProcessingContext, QgsProcessingFeedback
 from enmapbox.typeguard import typechecked
 
@@ -93,7 +93,7 @@ class FitRegressorAlgorithmBase(EnMAPProcessingAlgorithm):
                 dump = RegressorDump(None, None, None, None, regressor)
 
             dump.regressor = regressor
-            Utils.pickleDump(dump.__dict__, filename)
+            ModelArtifact.write(dump.__dict__, filename)
 
             result = {self.P_OUTPUT_REGRESSOR: filename}
             self.toc(feedback, result)
@@ -1,8 +1,8 @@
-from math import ceil
 from typing import Dict, Any, List, Tuple
 
 import numpy as np
 
+from enmapboxprocessing.blockexecutor import BlockExecutor
 from enmapboxprocessing.driver import Driver
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
 from enmapboxprocessing.rasterreader import RasterReader
@@ -18,6 +18,7 @@ class PredictClassificationAlgorithm(EnMAPProcessingAlgorithm):
     P_RASTER, _RASTER = 'raster', 'Raster layer with features'
     P_CLASSIFIER, _CLASSIFIER = 'classifier', 'Classifier'
     P_MATCH_BY_NAME, _MATCH_BY_NAME = 'matchByName', 'Match features and bands by name'
+    P_WORKER_COUNT, _WORKER_COUNT = 'workerCount', 'Number of workers'
     P_OUTPUT_CLASSIFICATION, _OUTPUT_CLASSIFICATION = 'outputClassification', 'Output classification layer'
 
     def displayName(self) -> str:
@@ -39,6 +40,8 @@ class PredictClassificationAlgorithm(EnMAPProcessingAlgorithm):
                            'but overall number of bands and features do match, raster bands are used in original order.'),
             (self._CLASSIFIER, 'A fitted classifier.'),
             (self._MATCH_BY_NAME, 'Whether to match raster bands and classifier features by name.'),
+            (self._WORKER_COUNT, 'Number of parallel workers used for prediction. '
+                                 'Use -1 for using all CPU cores. If not specified, prediction runs serially.'),
             (self._OUTPUT_CLASSIFICATION, self.RasterFileDestination)
         ]
 
@@ -49,6 +52,7 @@ class PredictClassificationAlgorithm(EnMAPProcessingAlgorithm):
         self.addParameterRasterLayer(self.P_RASTER, self._RASTER)
         self.addParameterPickleFile(self.P_CLASSIFIER, self._CLASSIFIER)
         self.addParameterBoolean(self.P_MATCH_BY_NAME, self._MATCH_BY_NAME, False, True)
+        self.addParameterInt(self.P_WORKER_COUNT, self._WORKER_COUNT, None, True, -1, None, True)
         self.addParameterRasterDestination(self.P_OUTPUT_CLASSIFICATION, self._OUTPUT_CLASSIFICATION)
 
     def checkParameterValues(self, parameters: Dict[str, Any], context: QgsProcessingContext) -> Tuple[bool, str]:
@@ -62,8 +66,9 @@ class PredictClassificationAlgorithm(EnMAPProcessingAlgorithm):
             self, parameters: Dict[str, Any], context: QgsProcessingContext, feedback: QgsProcessingFeedback
     ) -> Dict[str, Any]:
         raster = self.parameterAsRasterLayer(parameters, self.P_RASTER, context)
-        dump = self.parameterAsClassifierDump(parameters, self.P_CLASSIFIER, context)
+        dump = self.parameterAsClassifierDump(parameters, self.P_CLASSIFIER, context, loadSample=False)
         matchByName = self.parameterAsBoolean(parameters, self.P_MATCH_BY_NAME, context)
+        workerCount = self.parameterAsInt(parameters, self.P_WORKER_COUNT, context)
         filename = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_CLASSIFICATION, context)
         maximumMemoryUsage = Utils.maximumMemoryUsage()
 
@@ -96,25 +101,42 @@ class PredictClassificationAlgorithm(EnMAPProcessingAlgorithm):
 
             dataType = Utils.smallesUIntDataType(max([c.value for c in dump.categories]))
             writer = Driver(filename, feedback=feedback).createLike(rasterReader, dataType, 1)
-            lineMemoryUsage = rasterReader.lineMemoryUsage()
-            blockSizeY = min(raster.height(), ceil(maximumMemoryUsage / lineMemoryUsage))
-            blockSizeX = raster.width()
-            for block in rasterReader.walkGrid(blockSizeX, blockSizeY, feedback):
-                arrayX = rasterReader.arrayFromBlock(block, bandList)
-                valid = np.all(rasterReader.maskArray(arrayX, bandList), axis=0)
-                X = list()
-                for a in arrayX:
-                    X.append(a[valid])
-                y = dump.classifier.predict(np.transpose(X))
+            # memory usage: features and mask, feature matrix, output
+            pixelMemoryUsage = rasterReader.pixelMemoryUsage() * 2 + rasterReader.bandCount() + 4
+            blockSizeX, blockSizeY = rasterReader.blockSize(pixelMemoryUsage, maximumMemoryUsage, writer)
+            numpyDataType = Utils.qgisDataTypeToNumpyDataType(dataType)
+
+            dtype = Utils.qgisDataTypeToNumpyDataType(rasterReader.dataType())
+            buffer = np.empty((rasterReader.bandCount(), blockSizeY, blockSizeX), dtype)  # reused for reading
+
+            def read(block):
+                arrayX = rasterReader.arrayFromBlock(block, bandList, buffer=buffer)
+                with self.stage('mask'):
+                    valid = np.all(rasterReader.maskArray(arrayX, bandList), axis=0)
+                    X = list()
+                    for a in arrayX:
+                        X.append(a[valid])
+                    return valid, np.transpose(X)
+
+            def compute(data):
+                valid, X = data
+                with self.stage('predict'):
+                    y = dump.classifier.predict(X)
 
                 # classifier may return 2d array (e.g. CatBoostClassifier) -> need to flatten data
                 if y.ndim == 2 and y.shape[1] == 1:
                     y = y.flatten()
 
-                arrayY = np.zeros_like(valid, Utils.qgisDataTypeToNumpyDataType(dataType))
+                arrayY = np.zeros_like(valid, numpyDataType)
                 arrayY[valid] = y
+                return arrayY
+
+            def write(block, arrayY):
                 writer.writeArray2d(arrayY, 1, xOffset=block.xOffset, yOffset=block.yOffset)
 
+            executor = BlockExecutor(workerCount, feedback=feedback)
+            executor.run(rasterReader.walkGrid(blockSizeX, blockSizeY), read, compute, write)
+
             writer.close()
             outraster = QgsRasterLayer(filename)
             renderer = Utils.palettedRasterRendererFromCategories(outraster.dataProvider(), 1, dump.categories)
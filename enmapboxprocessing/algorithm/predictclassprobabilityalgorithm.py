@@ -1,15 +1,16 @@
-from math import ceil
 from typing import Dict, Any, List, Tuple
 
 import numpy as np
 from osgeo import gdal
 
+from enmapboxprocessing.blockexecutor import BlockExecutor
 from enmapboxprocessing.driver import Driver
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
 from enmapboxprocessing.rasterreader import RasterReader
 from enmapboxprocessing.typing import ClassifierDump
 from enmapboxprocessing.utils import Utils
-from qgis.core import (QgsProcessingContext, QgsProcessingFeedback, Qgis, QgsProcessingException)
+from qgis.core import (QgsProcessingContext, QgsProcessingFeedback, Qgis, QgsProcessingException, QgsRasterLayer,
+                       QgsMapLayer)
 from enmapbox.typeguard import typechecked
 
 
@@ -18,7 +19,10 @@ class PredictClassPropabilityAlgorithm(EnMAPProcessingAlgorithm):
     P_RASTER, _RASTER = 'raster', 'Raster layer with features'
     P_CLASSIFIER, _CLASSIFIER = 'classifier', 'Classifier'
     P_MATCH_BY_NAME, _MATCH_BY_NAME = 'matchByName', 'Match features and bands by name'
+    P_WORKER_COUNT, _WORKER_COUNT = 'workerCount', 'Number of workers'
     P_OUTPUT_PROBABILITY, _OUTPUT_PROBABILITY = 'outputProbability', 'Output class probability layer'
+    P_OUTPUT_CLASSIFICATION, _OUTPUT_CLASSIFICATION = 'outputClassification', 'Output classification layer'
+    P_OUTPUT_UNCERTAINTY, _OUTPUT_UNCERTAINTY = 'outputUncertainty', 'Output classification uncertainty layer'
 
     def displayName(self) -> str:
         return 'Predict class probability layer'
@@ -32,7 +36,18 @@ class PredictClassPropabilityAlgorithm(EnMAPProcessingAlgorithm):
                            'Classifier features and raster bands are matched by name.'),
             (self._CLASSIFIER, 'A fitted classifier.'),
             (self._MATCH_BY_NAME, 'Whether to match raster bands and classifier features by name.'),
-            (self._OUTPUT_PROBABILITY, self.RasterFileDestination)
+            (self._WORKER_COUNT, 'Number of parallel workers used for prediction. '
+                                 'Use -1 for using all CPU cores. If not specified, prediction runs serially.'),
+            (self._OUTPUT_PROBABILITY, self.RasterFileDestination),
+            (self._OUTPUT_CLASSIFICATION, 'Classification layer derived from the class probabilities '
+                                          '(class with highest probability). '
+                                          'Computed in the same pass as the class probability layer.\n'
+                                          + self.RasterFileDestination),
+            (self._OUTPUT_UNCERTAINTY, 'Classification uncertainty layer derived from the class probabilities, '
+                                       'with bands: 1) uncertainty = 1 - highest probability and '
+                                       '2) margin = highest probability - second highest probability. '
+                                       'Computed in the same pass as the class probability layer.\n'
+                                       + self.RasterFileDestination)
         ]
 
     def group(self):
@@ -42,7 +57,14 @@ class PredictClassPropabilityAlgorithm(EnMAPProcessingAlgorithm):
         self.addParameterRasterLayer(self.P_RASTER, self._RASTER)
         self.addParameterPickleFile(self.P_CLASSIFIER, self._CLASSIFIER)
         self.addParameterBoolean(self.P_MATCH_BY_NAME, self._MATCH_BY_NAME, False, True)
+        self.addParameterInt(self.P_WORKER_COUNT, self._WORKER_COUNT, None, True, -1, None, True)
         self.addParameterRasterDestination(self.P_OUTPUT_PROBABILITY, self._OUTPUT_PROBABILITY)
+        self.addParameterRasterDestination(
+            self.P_OUTPUT_CLASSIFICATION, self._OUTPUT_CLASSIFICATION, None, True, False, advanced=True
+        )
+        self.addParameterRasterDestination(
+            self.P_OUTPUT_UNCERTAINTY, self._OUTPUT_UNCERTAINTY, None, True, False, advanced=True
+        )
 
     def checkParameterValues(self, parameters: Dict[str, Any], context: QgsProcessingContext) -> Tuple[bool, str]:
         try:
@@ -57,9 +79,12 @@ class PredictClassPropabilityAlgorithm(EnMAPProcessingAlgorithm):
             self, parameters: Dict[str, Any], context: QgsProcessingContext, feedback: QgsProcessingFeedback
     ) -> Dict[str, Any]:
         raster = self.parameterAsRasterLayer(parameters, self.P_RASTER, context)
-        dump = self.parameterAsClassifierDump(parameters, self.P_CLASSIFIER, context)
+        dump = self.parameterAsClassifierDump(parameters, self.P_CLASSIFIER, context, loadSample=False)
         matchByName = self.parameterAsBoolean(parameters, self.P_MATCH_BY_NAME, context)
+        workerCount = self.parameterAsInt(parameters, self.P_WORKER_COUNT, context)
         filename = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_PROBABILITY, context)
+        filenameClassification = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_CLASSIFICATION, context)
+        filenameUncertainty = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_UNCERTAINTY, context)
         maximumMemoryUsage = gdal.GetCacheMax()
 
         with open(filename + '.log', 'w') as logfile:
@@ -93,26 +118,100 @@ class PredictClassPropabilityAlgorithm(EnMAPProcessingAlgorithm):
             dataType = Qgis.DataType.Float32
             gdalDataType = Utils.qgisDataTypeToNumpyDataType(dataType)
             writer = Driver(filename, feedback=feedback).createLike(rasterReader, dataType, nBands)
-            lineMemoryUsage = rasterReader.lineMemoryUsage() + rasterReader.lineMemoryUsage(nBands, 32 // 4)
-            blockSizeY = min(raster.height(), ceil(maximumMemoryUsage / lineMemoryUsage))
-            blockSizeX = raster.width()
-            for block in rasterReader.walkGrid(blockSizeX, blockSizeY, feedback):
-                arrayX = rasterReader.arrayFromBlock(block, bandList)
+            # memory usage: features and mask, feature matrix, probabilities (float64) and output
+            pixelMemoryUsage = rasterReader.pixelMemoryUsage() * 2 + rasterReader.bandCount() \
+                + rasterReader.pixelMemoryUsage(nBands, 8 + 4)
+
+            # additional outputs are derived from the probabilities, so we don't need to read and predict twice
+            classValues = np.array([c.value for c in dump.categories])
+            writerClassification = None
+            if filenameClassification is not None:
+                classificationDataType = Utils.smallesUIntDataType(max(classValues))
+                classificationNumpyDataType = Utils.qgisDataTypeToNumpyDataType(classificationDataType)
+                writerClassification = Driver(filenameClassification, feedback=feedback).createLike(
+                    rasterReader, classificationDataType, 1
+                )
+                pixelMemoryUsage += 4
+            writerUncertainty = None
+            if filenameUncertainty is not None:
+                writerUncertainty = Driver(filenameUncertainty, feedback=feedback).createLike(
+                    rasterReader, dataType, 2
+                )
+                pixelMemoryUsage += rasterReader.pixelMemoryUsage(2, 4)
+
+            blockSizeX, blockSizeY = rasterReader.blockSize(pixelMemoryUsage, maximumMemoryUsage, writer)
+
+            dtype = Utils.qgisDataTypeToNumpyDataType(rasterReader.dataType())
+            buffer = np.empty((rasterReader.bandCount(), blockSizeY, blockSizeX), dtype)  # reused for reading
+
+            def read(block):
+                arrayX = rasterReader.arrayFromBlock(block, bandList, buffer=buffer)
                 valid = np.all(rasterReader.maskArray(arrayX, bandList), axis=0)
                 X = list()
                 for a in arrayX:
                     X.append(a[valid])
-                y = dump.classifier.predict_proba(np.transpose(X))
+                return valid, np.transpose(X)
+
+            def compute(data):
+                valid, X = data
+                y = dump.classifier.predict_proba(X)
                 arrayY = np.full((nBands, *valid.shape), -1, gdalDataType)
                 for i, aY in enumerate(arrayY):
                     aY[valid] = y[:, i]
-                    writer.writeArray2d(aY, i + 1, xOffset=block.xOffset, yOffset=block.yOffset)
+
+                arrayClassification = None
+                if writerClassification is not None:
+                    arrayClassification = np.zeros_like(valid, classificationNumpyDataType)
+                    if len(y) > 0:
+                        arrayClassification[valid] = classValues[np.argmax(y, axis=1)]
+
+                arrayUncertainty = None
+                if writerUncertainty is not None:
+                    arrayUncertainty = np.full((2, *valid.shape), -1, gdalDataType)
+                    if len(y) > 0:
+                        ySorted = np.sort(y, axis=1)
+                        arrayUncertainty[0][valid] = 1 - ySorted[:, -1]
+                        if nBands > 1:
+                            arrayUncertainty[1][valid] = ySorted[:, -1] - ySorted[:, -2]
+                        else:
+                            arrayUncertainty[1][valid] = ySorted[:, -1]
+
+                return arrayY, arrayClassification, arrayUncertainty
+
+            def write(block, arrays):
+                arrayY, arrayClassification, arrayUncertainty = arrays
+                writer.writeArray(arrayY, xOffset=block.xOffset, yOffset=block.yOffset)
+                if writerClassification is not None:
+                    writerClassification.writeArray2d(
+                        arrayClassification, 1, xOffset=block.xOffset, yOffset=block.yOffset
+                    )
+                if writerUncertainty is not None:
+                    writerUncertainty.writeArray(arrayUncertainty, xOffset=block.xOffset, yOffset=block.yOffset)
+
+            executor = BlockExecutor(workerCount, feedback=feedback)
+            executor.run(rasterReader.walkGrid(blockSizeX, blockSizeY), read, compute, write)
 
             for bandNo, c in enumerate(dump.categories, 1):
                 writer.setBandName(c.name, bandNo)
             writer.setNoDataValue(-1)
 
-            result = {self.P_OUTPUT_PROBABILITY: filename}
+            if writerClassification is not None:
+                writerClassification.close()
+                outraster = QgsRasterLayer(filenameClassification)
+                renderer = Utils.palettedRasterRendererFromCategories(outraster.dataProvider(), 1, dump.categories)
+                outraster.setRenderer(renderer)
+                outraster.saveDefaultStyle(QgsMapLayer.StyleCategory.AllStyleCategories)
+
+            if writerUncertainty is not None:
+                writerUncertainty.setBandName('uncertainty', 1)
+                writerUncertainty.setBandName('margin', 2)
+                writerUncertainty.setNoDataValue(-1)
+
+            result = {
+                self.P_OUTPUT_PROBABILITY: filename,
+                self.P_OUTPUT_CLASSIFICATION: filenameClassification,
+                self.P_OUTPUT_UNCERTAINTY: filenameUncertainty
+            }
             self.toc(feedback, result)
 
         return result
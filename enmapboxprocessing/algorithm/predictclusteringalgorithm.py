@@ -1,4 +1,3 @@
-from math import ceil
 from random import randint
 from typing import Dict, Any, List, Tuple
 
@@ -98,9 +97,9 @@ class PredictClusteringAlgorithm(EnMAPProcessingAlgorithm):
             numpyDataType = Utils.qgisDataTypeToNumpyDataType(qgisDataType)
             writer = Driver(filename, feedback=feedback).createLike(rasterReader, qgisDataType, 1)
             noDataValue = 0
-            lineMemoryUsage = rasterReader.lineMemoryUsage()
-            blockSizeY = min(raster.height(), ceil(maximumMemoryUsage / lineMemoryUsage))
-            blockSizeX = raster.width()
+            # memory usage: features and mask, feature matrix, output
+            pixelMemoryUsage = rasterReader.pixelMemoryUsage() * 2 + rasterReader.bandCount() + 4
+            blockSizeX, blockSizeY = rasterReader.blockSize(pixelMemoryUsage, maximumMemoryUsage, writer)
             for block in rasterReader.walkGrid(blockSizeX, blockSizeY, feedback):
                 arrayX = rasterReader.arrayFromBlock(block, bandList)
                 valid = np.all(rasterReader.maskArray(arrayX, bandList), axis=0)
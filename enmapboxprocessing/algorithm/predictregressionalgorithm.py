@@ -1,8 +1,8 @@
-from math import ceil
 from typing import Dict, Any, List, Tuple
 
 import numpy as np
 
+from enmapboxprocessing.blockexecutor import BlockExecutor
 from enmapboxprocessing.driver import Driver
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
 from enmapboxprocessing.rasterreader import RasterReader
@@ -18,6 +18,7 @@ class PredictRegressionAlgorithm(EnMAPProcessingAlgorithm):
     P_RASTER, _RASTER = 'raster', 'Raster layer with features'
     P_REGRESSOR, _REGRESSOR = 'regressor', 'Regressor'
     P_MATCH_BY_NAME, _MATCH_BY_NAME = 'matchByName', 'Match features and bands by name'
+    P_WORKER_COUNT, _WORKER_COUNT = 'workerCount', 'Number of workers'
     P_OUTPUT_REGRESSION, _OUTPUT_REGRESSION = 'outputRegression', 'Output regression layer'
 
     def displayName(self) -> str:
@@ -32,6 +33,8 @@ class PredictRegressionAlgorithm(EnMAPProcessingAlgorithm):
                            'Regressor features and raster bands are matched by name.'),
             (self._REGRESSOR, 'A fitted regressor.'),
             (self._MATCH_BY_NAME, 'Whether to match raster bands and regressor features by name.'),
+            (self._WORKER_COUNT, 'Number of parallel workers used for prediction. '
+                                 'Use -1 for using all CPU cores. If not specified, prediction runs serially.'),
             (self._OUTPUT_REGRESSION, self.RasterFileDestination)
         ]
 
@@ -42,6 +45,7 @@ class PredictRegressionAlgorithm(EnMAPProcessingAlgorithm):
         self.addParameterRasterLayer(self.P_RASTER, self._RASTER)
         self.addParameterPickleFile(self.P_REGRESSOR, self._REGRESSOR)
         self.addParameterBoolean(self.P_MATCH_BY_NAME, self._MATCH_BY_NAME, False, True)
+        self.addParameterInt(self.P_WORKER_COUNT, self._WORKER_COUNT, None, True, -1, None, True)
         self.addParameterRasterDestination(self.P_OUTPUT_REGRESSION, self._OUTPUT_REGRESSION)
 
     def checkParameterValues(self, parameters: Dict[str, Any], context: QgsProcessingContext) -> Tuple[bool, str]:
@@ -57,8 +61,9 @@ class PredictRegressionAlgorithm(EnMAPProcessingAlgorithm):
             self, parameters: Dict[str, Any], context: QgsProcessingContext, feedback: QgsProcessingFeedback
     ) -> Dict[str, Any]:
         raster = self.parameterAsRasterLayer(parameters, self.P_RASTER, context)
-        dump = self.parameterAsRegressorDump(parameters, self.P_REGRESSOR, context)
+        dump = self.parameterAsRegressorDump(parameters, self.P_REGRESSOR, context, loadSample=False)
         matchByName = self.parameterAsBoolean(parameters, self.P_MATCH_BY_NAME, context)
+        workerCount = self.parameterAsInt(parameters, self.P_WORKER_COUNT, context)
         filename = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_REGRESSION, context)
         maximumMemoryUsage = Utils.maximumMemoryUsage()
 
@@ -92,22 +97,37 @@ class PredictRegressionAlgorithm(EnMAPProcessingAlgorithm):
             nBands = len(dump.targets)
             writer = Driver(filename, feedback=feedback).createLike(rasterReader, Qgis.DataType.Float32, nBands)
             noDataValue = Utils.defaultNoDataValue(np.float32)
-            lineMemoryUsage = rasterReader.lineMemoryUsage() + rasterReader.lineMemoryUsage(nBands, 4)
-            blockSizeY = min(raster.height(), ceil(maximumMemoryUsage / lineMemoryUsage))
-            blockSizeX = raster.width()
-            for block in rasterReader.walkGrid(blockSizeX, blockSizeY, feedback):
-                arrayX = rasterReader.arrayFromBlock(block, bandList)
+            # memory usage: features and mask, feature matrix, output
+            pixelMemoryUsage = rasterReader.pixelMemoryUsage() * 2 + rasterReader.bandCount() \
+                + rasterReader.pixelMemoryUsage(nBands, 4)
+            blockSizeX, blockSizeY = rasterReader.blockSize(pixelMemoryUsage, maximumMemoryUsage, writer)
+
+            dtype = Utils.qgisDataTypeToNumpyDataType(rasterReader.dataType())
+            buffer = np.empty((rasterReader.bandCount(), blockSizeY, blockSizeX), dtype)  # reused for reading
+
+            def read(block):
+                arrayX = rasterReader.arrayFromBlock(block, bandList, buffer=buffer)
                 valid = np.all(rasterReader.maskArray(arrayX, bandList), axis=0)
                 X = list()
                 for a in arrayX:
                     X.append(a[valid])
-                y = dump.regressor.predict(np.transpose(X))
+                return valid, np.transpose(X)
+
+            def compute(data):
+                valid, X = data
+                y = dump.regressor.predict(X)
                 if y.ndim == 1:
                     y = y.reshape((-1, 1))
                 arrayY = np.full((nBands, *valid.shape), noDataValue, np.float32)
                 for i, aY in enumerate(arrayY):
                     aY[valid] = y[:, i]
-                    writer.writeArray2d(aY, i + 1, xOffset=block.xOffset, yOffset=block.yOffset)
+                return arrayY
+
+            def write(block, arrayY):
+                writer.writeArray(arrayY, xOffset=block.xOffset, yOffset=block.yOffset)
+
+            executor = BlockExecutor(workerCount, feedback=feedback)
+            executor.run(rasterReader.walkGrid(blockSizeX, blockSizeY), read, compute, write)
 
             for bandNo, t in enumerate(dump.targets, 1):
                 writer.setBandName(t.name, bandNo)
@@ -1,4 +1,3 @@
-from math import ceil
 from typing import Dict, Any, List, Tuple
 
 import numpy as np
@@ -135,36 +134,32 @@ class PrepareClassificationDatasetFromCategorizedRasterAlgorithm(EnMAPProcessing
         assert raster.extent() == classification.extent()
         assert (raster.width(), raster.height()) == (classification.width(), classification.height())
 
-        maximumMemoryUsage = Utils.maximumMemoryUsage()
         reader = RasterReader(raster)
         classificationReader = RasterReader(classification)
-        lineMemoryUsage = reader.lineMemoryUsage(1)
-        lineMemoryUsage += classificationReader.width() * classificationReader.dataTypeSize()
-        blockSizeY = min(raster.height(), ceil(maximumMemoryUsage / lineMemoryUsage))
-        blockSizeX = raster.width()
 
-        X = list()
+        # scan the (cheap) classification band for labeled pixels, ...
+        blockSizeX, blockSizeY = classificationReader.blockSize(classificationReader.pixelMemoryUsage(2, 8))
+        classValues = [c.value for c in categories]
+        xs = list()
+        ys = list()
         y = list()
-        XMask = list()
-        for block in reader.walkGrid(blockSizeX, blockSizeY, feedback):
+        for block in classificationReader.walkGrid(blockSizeX, blockSizeY, feedback):
             blockClassification = classificationReader.arrayFromBlock(block, [classBandNo])[0]
-            labeled = np.full_like(blockClassification, False, bool)
-            for c in categories:
-                np.logical_or(labeled, blockClassification == c.value, out=labeled)
-            blockY = blockClassification[labeled]
-            blockX = list()
-            blockXMask = list()
-            for bandNo in range(1, reader.bandCount() + 1):
-                blockBand = reader.arrayFromBlock(block, [bandNo])
-                blockBandMask = reader.maskArray(blockBand, [bandNo])
-                blockX.append(blockBand[0][labeled])
-                blockXMask.append(blockBandMask[0][labeled])
-            X.append(blockX)
-            y.append(blockY)
-            XMask.append(blockXMask)
-        X = np.concatenate(X, axis=1).T
-        XMask = np.concatenate(XMask, axis=1).T
-        y = np.expand_dims(np.concatenate(y), 1)
+            labeled = np.isin(blockClassification, classValues)
+            blockYs, blockXs = np.where(labeled)
+            xs.append(blockXs + block.xOffset)
+            ys.append(blockYs + block.yOffset)
+            y.append(blockClassification[labeled])
+        xs = np.concatenate(xs)
+        ys = np.concatenate(ys)
+        order = np.lexsort((xs, ys))  # keep row-major sample order
+        xs, ys = xs[order], ys[order]
+        y = np.expand_dims(np.concatenate(y)[order], 1)
+
+        # ... and only read feature data at labeled pixels
+        X = reader.arrayFromPixelLocations(xs, ys)
+        XMask = np.array(reader.maskArray(X)).T
+        X = X.T
 
         # skip bad bands (see issue #560)
         if excludeBadBands:
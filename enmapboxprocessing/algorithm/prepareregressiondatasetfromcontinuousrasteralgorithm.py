@@ -1,4 +1,3 @@
-from math import ceil
 from typing import Dict, Any, List, Tuple
 
 import numpy as np
@@ -108,36 +107,31 @@ class PrepareRegressionDatasetFromContinuousRasterAlgorithm(EnMAPProcessingAlgor
         assert raster.extent() == regression.extent()
         assert (raster.width(), raster.height()) == (regression.width(), regression.height())
 
-        maximumMemoryUsage = Utils.maximumMemoryUsage()
         reader = RasterReader(raster)
         regressionReader = RasterReader(regression)
-        lineMemoryUsage = reader.lineMemoryUsage(1)
-        lineMemoryUsage += regressionReader.lineMemoryUsage()
-        blockSizeY = min(raster.height(), ceil(maximumMemoryUsage / lineMemoryUsage))
-        blockSizeX = raster.width()
 
-        X = list()
+        # scan the (cheap) target bands for labeled pixels, ...
+        blockSizeX, blockSizeY = regressionReader.blockSize(regressionReader.pixelMemoryUsage() * 2 + 16)
+        xs = list()
+        ys = list()
         Y = list()
-        XMask = list()
-        for block in reader.walkGrid(blockSizeX, blockSizeY, feedback):
+        for block in regressionReader.walkGrid(blockSizeX, blockSizeY, feedback):
             arrayRegression = regressionReader.arrayFromBlock(block)
             labeled = np.all(regressionReader.maskArray(arrayRegression), axis=0)
-            blockY = list()
-            for a in arrayRegression:
-                blockY.append(a[labeled])
-            blockX = list()
-            blockXMask = list()
-            for bandNo in range(1, reader.bandCount() + 1):
-                blockBand = reader.arrayFromBlock(block, [bandNo])
-                blockBandMask = reader.maskArray(blockBand, [bandNo])
-                blockX.append(blockBand[0][labeled])
-                blockXMask.append(blockBandMask[0][labeled])
-            X.append(blockX)
-            Y.append(blockY)
-            XMask.append(blockXMask)
-        X = np.concatenate(X, axis=1).T
-        XMask = np.concatenate(XMask, axis=1).T
-        Y = np.concatenate(Y, axis=1).T
+            blockYs, blockXs = np.where(labeled)
+            xs.append(blockXs + block.xOffset)
+            ys.append(blockYs + block.yOffset)
+            Y.append([a[labeled] for a in arrayRegression])
+        xs = np.concatenate(xs)
+        ys = np.concatenate(ys)
+        order = np.lexsort((xs, ys))  # keep row-major sample order
+        xs, ys = xs[order], ys[order]
+        Y = np.concatenate(Y, axis=1).T[order]
+
+        # ... and only read feature data at labeled pixels
+        X = reader.arrayFromPixelLocations(xs, ys)
+        XMask = np.array(reader.maskArray(X)).T
+        X = X.T
 
         # skip bad bands (see issue #560)
         if excludeBadBands:
@@ -1,5 +1,5 @@
 from math import ceil
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Optional
 
 import numpy as np
 
@@ -7,7 +7,7 @@ from enmapboxprocessing.algorithm.rasterizevectoralgorithm import RasterizeVecto
 from enmapboxprocessing.algorithm.translaterasteralgorithm import TranslateRasterAlgorithm
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
 from enmapboxprocessing.rasterreader import RasterReader
-from enmapboxprocessing.typing import TransformerDump
+from enmapboxprocessing.typing import TransformerDump, SampleX
 from enmapboxprocessing.utils import Utils
 from qgis.core import (QgsProcessingContext, QgsProcessingFeedback, QgsRasterLayer, QgsVectorLayer)
 from enmapbox.typeguard import typechecked
@@ -95,55 +95,15 @@ class PrepareUnsupervisedDatasetFromRasterAlgorithm(EnMAPProcessingAlgorithm):
 
             # sample data
             reader = RasterReader(raster)
+            readerMask = None
             if mask is not None:
                 isinstance(mask, QgsRasterLayer)
                 readerMask = RasterReader(mask)
 
-            if sampleSize == 0:
-                lineMemoryUsage = reader.lineMemoryUsage() * 2  # x2, becaused we may extract all data
-                if mask is not None:
-                    lineMemoryUsage += readerMask.lineMemoryUsage()
-                blockSizeY = min(raster.height(), ceil(Utils.maximumMemoryUsage() / lineMemoryUsage))
+            if mask is not None and sampleSize == 0:
+                X, goodBandNumbers = self.sampleMaskedData(reader, readerMask, excludeBadBands, feedback)
             else:
-                blockSizeY = raster.height()
-
-            blockSizeX = raster.width()
-            X = list()
-            for block in reader.walkGrid(blockSizeX, blockSizeY, feedback):
-
-                if sampleSize == 0:
-                    array = reader.arrayFromBlock(block)
-                else:
-                    width, height = reader.samplingWidthAndHeight(1, block.extent, sampleSize)
-                    array = reader.arrayFromBoundingBoxAndSize(block.extent, width, height)
-
-                maskArray = reader.maskArray(array)
-
-                # skip bad bands (see issue #560)
-                if excludeBadBands:
-                    goodBands = np.any(np.reshape(maskArray, (reader.bandCount(), -1)), 1)
-                    goodBandNumbers = list(map(int, np.where(goodBands)[0] + 1))
-                    badBandNumbers = list(map(str, np.where(~goodBands)[0] + 1))
-                    if len(badBandNumbers) > 0:
-                        feedback.pushInfo(f'Removed bad bands: {", ".join(badBandNumbers)}')
-                else:
-                    goodBands = [True] * reader.bandCount()
-                    goodBandNumbers = list(reader.bandNumbers())
-
-                # skip samples that contain a no data value
-                maskArray = np.all(np.asarray(maskArray)[goodBands], axis=0)
-                if mask is not None:
-                    array2 = readerMask.arrayFromBlock(block)
-                    maskArray2 = np.all(readerMask.maskArray(array2, defaultNoDataValue=0), axis=0)
-                    maskArray = np.logical_and(maskArray, maskArray2)
-
-                blockX = list()
-                for a, goodBand in zip(array, goodBands):
-                    if goodBand:
-                        blockX.append(a[maskArray])
-                X.append(blockX)
-            X = np.concatenate(X, axis=1).T
-            reader = RasterReader(raster)
+                X, goodBandNumbers = self.sampleData(reader, readerMask, sampleSize, excludeBadBands, feedback)
             features = [reader.bandName(bandNo) for bandNo in goodBandNumbers]
             feedback.pushInfo(f'Sampled data: X=array{list(X.shape)}')
 
@@ -154,3 +114,95 @@ class PrepareUnsupervisedDatasetFromRasterAlgorithm(EnMAPProcessingAlgorithm):
             result = {self.P_OUTPUT_DATASET: filename}
             self.toc(feedback, result)
         return result
+
+    @classmethod
+    def sampleData(
+            cls, reader: RasterReader, readerMask: Optional[RasterReader], sampleSize: int, excludeBadBands: bool,
+            feedback: QgsProcessingFeedback = None
+    ) -> Tuple[SampleX, List[int]]:
+        if sampleSize == 0:
+            lineMemoryUsage = reader.lineMemoryUsage() * 2  # x2, becaused we may extract all data
+            if readerMask is not None:
+                lineMemoryUsage += readerMask.lineMemoryUsage()
+            blockSizeY = min(reader.height(), ceil(Utils.maximumMemoryUsage() / lineMemoryUsage))
+        else:
+            blockSizeY = reader.height()
+
+        blockSizeX = reader.width()
+        X = list()
+        for block in reader.walkGrid(blockSizeX, blockSizeY, feedback):
+
+            if sampleSize == 0:
+                array = reader.arrayFromBlock(block)
+            else:
+                width, height = reader.samplingWidthAndHeight(1, block.extent, sampleSize)
+                array = reader.arrayFromBoundingBoxAndSize(block.extent, width, height)
+
+            maskArray = reader.maskArray(array)
+
+            # skip bad bands (see issue #560)
+            if excludeBadBands:
+                goodBands = np.any(np.reshape(maskArray, (reader.bandCount(), -1)), 1)
+                goodBandNumbers = list(map(int, np.where(goodBands)[0] + 1))
+                badBandNumbers = list(map(str, np.where(~goodBands)[0] + 1))
+                if len(badBandNumbers) > 0:
+                    feedback.pushInfo(f'Removed bad bands: {", ".join(badBandNumbers)}')
+            else:
+                goodBands = [True] * reader.bandCount()
+                goodBandNumbers = list(reader.bandNumbers())
+
+            # skip samples that contain a no data value
+            maskArray = np.all(np.asarray(maskArray)[goodBands], axis=0)
+            if readerMask is not None:
+                array2 = readerMask.arrayFromBlock(block)
+                maskArray2 = np.all(readerMask.maskArray(array2, defaultNoDataValue=0), axis=0)
+                maskArray = np.logical_and(maskArray, maskArray2)
+
+            blockX = list()
+            for a, goodBand in zip(array, goodBands):
+                if goodBand:
+                    blockX.append(a[maskArray])
+            X.append(blockX)
+        X = np.concatenate(X, axis=1).T
+        return X, goodBandNumbers
+
+    @classmethod
+    def sampleMaskedData(
+            cls, reader: RasterReader, readerMask: RasterReader, excludeBadBands: bool,
+            feedback: QgsProcessingFeedback = None
+    ) -> Tuple[SampleX, List[int]]:
+        assert (reader.width(), reader.height()) == (readerMask.width(), readerMask.height())
+
+        # scan the (cheap) mask for selected pixels, ...
+        blockSizeX, blockSizeY = readerMask.blockSize(readerMask.pixelMemoryUsage() * 2 + 16)
+        xs = list()
+        ys = list()
+        for block in readerMask.walkGrid(blockSizeX, blockSizeY, feedback):
+            array = readerMask.arrayFromBlock(block)
+            maskArray = np.all(readerMask.maskArray(array, defaultNoDataValue=0), axis=0)
+            blockYs, blockXs = np.where(maskArray)
+            xs.append(blockXs + block.xOffset)
+            ys.append(blockYs + block.yOffset)
+        xs = np.concatenate(xs)
+        ys = np.concatenate(ys)
+        order = np.lexsort((xs, ys))  # keep row-major sample order
+
+        # ... and only read feature data at selected pixels
+        X = reader.arrayFromPixelLocations(xs[order], ys[order])
+        maskArray = np.array(reader.maskArray(X))
+
+        # skip bad bands (see issue #560)
+        if excludeBadBands:
+            goodBands = np.any(maskArray, 1)
+            goodBandNumbers = list(map(int, np.where(goodBands)[0] + 1))
+            badBandNumbers = list(map(str, np.where(~goodBands)[0] + 1))
+            if len(badBandNumbers) > 0:
+                feedback.pushInfo(f'Removed bad bands: {", ".join(badBandNumbers)}')
+        else:
+            goodBands = np.full((reader.bandCount(),), True)
+            goodBandNumbers = list(reader.bandNumbers())
+
+        # skip samples that contain a no data value
+        valid = np.all(maskArray[goodBands], axis=0)
+        X = X[goodBands][:, valid].T
+        return X, goodBandNumbers
@@ -1,21 +1,20 @@
 from typing import Dict, Any, List, Tuple
 
-from osgeo import gdal
+import numpy as np
+from osgeo import gdal, ogr
 
-import processing
-from enmapboxprocessing.algorithm.creategridalgorithm import CreateGridAlgorithm
 from enmapboxprocessing.algorithm.rasterizevectoralgorithm import RasterizeVectorAlgorithm
-from enmapboxprocessing.algorithm.rastermathalgorithm.rastermathalgorithm import RasterMathAlgorithm
-from enmapboxprocessing.algorithm.translaterasteralgorithm import TranslateRasterAlgorithm
+from enmapboxprocessing.driver import Driver
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
-from enmapboxprocessing.rasterwriter import RasterWriter
+from enmapboxprocessing.pipeline import Pipeline
+from enmapboxprocessing.rasterreader import RasterReader
 from enmapboxprocessing.typing import HexColor, Category
 from enmapboxprocessing.utils import Utils
 from qgis.PyQt.QtCore import QVariant
 from qgis.core import (QgsProcessingContext, QgsProcessingFeedback, QgsVectorLayer, QgsRectangle,
                        QgsCoordinateReferenceSystem, QgsVectorFileWriter,
                        QgsProject, QgsField, QgsCoordinateTransform, QgsRasterLayer, QgsProcessingException,
-                       QgsMapLayer)
+                       QgsMapLayer, Qgis)
 from qgis.core import edit
 from enmapbox.typeguard import typechecked
 
@@ -69,18 +68,19 @@ class RasterizeCategorizedVectorAlgorithm(EnMAPProcessingAlgorithm):
     ) -> Dict[str, Any]:
         vector = self.parameterAsVectorLayer(parameters, self.P_CATEGORIZED_VECTOR, context)
         grid = self.parameterAsRasterLayer(parameters, self.P_GRID, context)
-        minCoverage = self.parameterAsInt(parameters, self.P_COVERAGE, context) / 100.
+        minCoverage = self.parameterAsInt(parameters, self.P_COVERAGE, context)
         majorityVoting = self.parameterAsBoolean(parameters, self.P_MAJORITY_VOTING, context)
         filename = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_CATEGORIZED_RASTER, context)
 
-        with open(filename + '.log', 'w') as logfile:
+        with open(filename + '.log', 'w') as logfile, Pipeline(filename) as pipeline:
             feedback, feedback2 = self.createLoggingFeedback(feedback, logfile)
             self.tic(feedback, parameters, context)
 
             # make category ids from 1, ..., n
             fieldName = 'derived_id'
             tmpVector, names, colors = self.categoriesToField(
-                vector, fieldName, grid.extent(), grid.crs(), Utils.tmpFilename(filename, 'categorized.gpkg'), feedback2
+                vector, fieldName, grid.extent(), grid.crs(), pipeline.intermediateFilename('categorized.gpkg'),
+                feedback2
             )
 
             geometryType = vector.geometryType()
@@ -98,78 +98,11 @@ class RasterizeCategorizedVectorAlgorithm(EnMAPProcessingAlgorithm):
                 }
                 self.runAlg(alg, parameters, None, feedback2, context, True)
             else:
-                # create x10 grid
-                alg = CreateGridAlgorithm()
-                parameters = {
-                    alg.P_CRS: grid.crs(),
-                    alg.P_EXTENT: grid.extent(),
-                    alg.P_WIDTH: grid.width() * 10,
-                    alg.P_HEIGHT: grid.height() * 10,
-                    alg.P_UNIT: alg.PixelUnits,
-                    alg.P_OUTPUT_GRID: Utils.tmpFilename(filename, 'grid.x10.vrt')
-                }
-                gridX10 = processing.run(alg, parameters, None, feedback2, context, True)[alg.P_OUTPUT_GRID]
-
-                # burn classes at x10 grid
-                feedback.pushInfo('Burn classes at x10 finer resolution')
-                alg = RasterizeVectorAlgorithm()
-                parameters = {
-                    alg.P_GRID: gridX10,
-                    alg.P_VECTOR: tmpVector,
-                    alg.P_DATA_TYPE: self.O_DATA_TYPE.index(Utils.qgisDataTypeName(dataType)),
-                    alg.P_BURN_ATTRIBUTE: fieldName,
-                    alg.P_OUTPUT_RASTER: Utils.tmpFilename(filename, 'classification.x10.tif')
-                }
-                classificationX10 = processing.run(alg, parameters, None, feedback2, context, True)[alg.P_OUTPUT_RASTER]
-                ds = gdal.Open(classificationX10, gdal.OF_UPDATE)
-                writer = RasterWriter(ds)
-                writer.setNoDataValue(0)
-                del writer, ds
-
-                # select classes via majority voting
-                feedback.pushInfo('Apply class majority voting')
-                alg = TranslateRasterAlgorithm()
-                parameters = {
-                    alg.P_GRID: grid,
-                    alg.P_RASTER: classificationX10,
-                    alg.P_RESAMPLE_ALG: alg.ModeResampleAlg,
-                    alg.P_OUTPUT_RASTER: Utils.tmpFilename(filename, 'classification.vrt')
-                }
-                classification = processing.run(alg, parameters, None, feedback2, context, True)[alg.P_OUTPUT_RASTER]
-
-                # calculate pixel coverage
-                # - mask at x10 grid
-                feedback.pushInfo('Create pixel mask at x10 finer resolution')
-                alg = RasterMathAlgorithm()
-                parameters = {
-                    alg.P_R1: classificationX10,
-                    alg.P_CODE: 'R1 != 0',
-                    alg.P_OUTPUT_RASTER: Utils.tmpFilename(filename, 'mask.x10.tif')
-                }
-                maskX10 = processing.run(alg, parameters, None, feedback2, context, True)[alg.P_OUTPUT_RASTER]
-                # - aggregate mask to coverage fraction
-                feedback.pushInfo('Aggregate pixel mask to coverage fraction at final resolution')
-                alg = TranslateRasterAlgorithm()
-                parameters = {
-                    alg.P_GRID: grid,
-                    alg.P_RASTER: maskX10,
-                    alg.P_RESAMPLE_ALG: alg.AverageResampleAlg,
-                    alg.P_DATA_TYPE: alg.Float32,
-                    alg.P_OUTPUT_RASTER: Utils.tmpFilename(filename, 'coverage.vrt')
-                }
-                coverage = processing.run(alg, parameters, None, feedback2, context, True)[alg.P_OUTPUT_RASTER]
-
-                # mask classification pixel with low coverage
-                # - mask at x10 grid
-                feedback.pushInfo('Mask pixel with low coverage')
-                alg = RasterMathAlgorithm()
-                parameters = {
-                    alg.P_R1: classification,
-                    alg.P_R2: coverage,
-                    alg.P_CODE: f'R1 * (R2 >= {minCoverage})',
-                    alg.P_OUTPUT_RASTER: filename
-                }
-                classification = processing.run(alg, parameters, None, feedback2, context, True)[alg.P_OUTPUT_RASTER]
+                feedback.pushInfo('Burn classes at x10 finer resolution and apply class majority voting')
+                with self.stage('majority voting'):
+                    self.rasterizeMajority(
+                        tmpVector, fieldName, len(names), grid, dataType, minCoverage, filename, feedback
+                    )
 
             # setup renderer
             layer = QgsRasterLayer(filename)
@@ -185,6 +118,67 @@ class RasterizeCategorizedVectorAlgorithm(EnMAPProcessingAlgorithm):
 
         return result
 
+    @classmethod
+    def rasterizeMajority(
+            cls, vector: QgsVectorLayer, fieldName: str, categoryCount: int, grid: QgsRasterLayer,
+            dataType: Qgis.DataType, minCoverage: int, filename: str, feedback: QgsProcessingFeedback = None
+    ):
+        """
+        Burn category ids at x10 finer resolution and aggregate to the grid using majority voting.
+        Pixel with a coverage [%] smaller than the given minimum are set to 0.
+
+        The x10 raster is never materialised: each block is rasterized into a MEM dataset and aggregated right away.
+        """
+        sourceFilename, layerName = Utils.splitQgsVectorLayerSourceString(vector.source())
+        ogrDataSource = ogr.Open(sourceFilename)
+        if layerName is None:
+            ogrLayer = ogrDataSource.GetLayer(0)
+        else:
+            ogrLayer = ogrDataSource.GetLayerByName(layerName)
+        memDriver = gdal.GetDriverByName('MEM')
+        gdalDataType = Utils.qgisDataTypeToGdalDataType(dataType)
+
+        reader = RasterReader(grid)
+        writer = Driver(filename, feedback=feedback).createLike(reader, dataType, 1)
+        resX = reader.rasterUnitsPerPixelX()
+        resY = reader.rasterUnitsPerPixelY()
+        dataTypeSize = np.dtype(Utils.qgisDataTypeToNumpyDataType(dataType)).itemsize
+        # x10 ids, Int64 bincount indices (built in place), category counts and output
+        pixelMemoryUsage = 100 * dataTypeSize + 100 * 8 + (categoryCount + 1) * 8 + 8
+        blockSizeX, blockSizeY = reader.blockSize(pixelMemoryUsage, writer=writer)
+        for block in reader.walkGrid(blockSizeX, blockSizeY, feedback):
+            x10Raster = memDriver.Create('', block.width * 10, block.height * 10, 1, gdalDataType)
+            x10Raster.SetGeoTransform(
+                (block.extent.xMinimum(), resX / 10, 0, block.extent.yMaximum(), 0, -resY / 10)
+            )
+            ogrLayer.SetSpatialFilterRect(
+                block.extent.xMinimum(), block.extent.yMinimum(), block.extent.xMaximum(), block.extent.yMaximum()
+            )
+            gdal.RasterizeLayer(x10Raster, [1], ogrLayer, options=[f'ATTRIBUTE={fieldName}'])
+            x10Array = x10Raster.ReadAsArray()
+            del x10Raster
+
+            # count category ids of the 10x10 subpixel of each pixel (id 0 is no data)
+            # - indices are built in place in x10 layout, so that no transposed copy is needed
+            pixelCount = block.height * block.width
+            indices = x10Array.astype(np.int64).reshape((block.height, 10, block.width, 10))
+            del x10Array
+            indices += np.arange(pixelCount).reshape((block.height, 1, block.width, 1)) * (categoryCount + 1)
+            counts = np.bincount(indices.reshape(-1), minlength=pixelCount * (categoryCount + 1))
+            del indices
+            counts = counts.reshape((pixelCount, categoryCount + 1))
+
+            # subpixel are 1% of the pixel, so the count of valid subpixel is the coverage [%]
+            coverage = 100 - counts[:, 0]
+            outarray = np.argmax(counts[:, 1:], axis=1) + 1
+            outarray[np.logical_or(coverage < minCoverage, coverage == 0)] = 0
+            writer.writeArray2d(
+                outarray.reshape((block.height, block.width)), 1, xOffset=block.xOffset, yOffset=block.yOffset
+            )
+        ogrLayer.SetSpatialFilter(None)
+        writer.setNoDataValue(0)
+        writer.close()
+
     @classmethod
     def categoriesToField(
             cls, vector: QgsVectorLayer, fieldName: str, extent: QgsRectangle, crs: QgsCoordinateReferenceSystem,
@@ -1,4 +1,3 @@
-from math import ceil
 from typing import List, Tuple, Dict, Any
 
 import numpy as np
@@ -6,7 +5,7 @@ import numpy as np
 from enmapboxprocessing.enmapalgorithm import Group, EnMAPProcessingAlgorithm
 from enmapboxprocessing.rasterreader import RasterReader
 from enmapboxprocessing.utils import Utils
-from qgis.core import Qgis, QgsProcessingContext, QgsProcessingFeedback
+from qgis.core import QgsProcessingContext, QgsProcessingFeedback
 from enmapbox.typeguard import typechecked
 
 
@@ -14,8 +13,19 @@ from enmapbox.typeguard import typechecked
 class RasterLayerZonalAggregationAlgorithm(EnMAPProcessingAlgorithm):
     P_RASTER, _RASTER = 'raster', 'Raster layer'
     P_CATEGORIZED_RASTER, _CATEGORIZED_RASTER = 'categorizedRaster', 'Categorized raster layer'
+    P_STATISTIC, _STATISTIC = 'statistic', 'Statistics'
+    O_STATISTIC = [
+        'arithmetic mean', 'standard deviation', 'variance', 'minimum', 'maximum', 'sum', 'count',
+        'median (approximated)'
+    ]
+    (
+        ArithmeticMeanStatistic, StandardDeviationStatistic, VarianceStatistic, MinimumStatistic, MaximumStatistic,
+        SumStatistic, CountStatistic, MedianStatistic
+    ) = range(len(O_STATISTIC))
     P_OUTPUT_TABLE, _OUTPUT_TABLE = 'outputTable', 'Output table'
 
+    HistogramBinCount = 256  # number of histogram bins used for approximating the median
+
     def displayName(self) -> str:
         return 'Raster layer zonal aggregation'
 
@@ -29,12 +39,20 @@ class RasterLayerZonalAggregationAlgorithm(EnMAPProcessingAlgorithm):
         return [
             (self._RASTER, 'Raster layer to be aggregated.'),
             (self._CATEGORIZED_RASTER, 'Categorized raster layer specifying the zones.'),
+            (self._STATISTIC, 'Statistics to be calculated for each zone and band. '
+                              'Columns of the arithmetic mean are named "Band <i>", '
+                              'columns of all other statistics are named "Band <i> <statistic>". '
+                              f'The median is approximated from a {self.HistogramBinCount}-bin histogram, '
+                              'which requires a second pass over the data.'),
             (self._OUTPUT_TABLE, self.TableFileDestination)
         ]
 
     def initAlgorithm(self, configuration: Dict[str, Any] = None):
         self.addParameterRasterLayer(self.P_RASTER, self._RASTER)
         self.addParameterRasterLayer(self.P_CATEGORIZED_RASTER, self._CATEGORIZED_RASTER)
+        self.addParameterEnum(
+            self.P_STATISTIC, self._STATISTIC, self.O_STATISTIC, True, [self.ArithmeticMeanStatistic], True, True
+        )
         self.addParameterVectorDestination(self.P_OUTPUT_TABLE, self._OUTPUT_TABLE)
 
     def processAlgorithm(
@@ -42,46 +60,84 @@ class RasterLayerZonalAggregationAlgorithm(EnMAPProcessingAlgorithm):
     ) -> Dict[str, Any]:
         raster = self.parameterAsRasterLayer(parameters, self.P_RASTER, context)
         zoneRaster = self.parameterAsRasterLayer(parameters, self.P_CATEGORIZED_RASTER, context)
+        statistics = self.parameterAsEnums(parameters, self.P_STATISTIC, context)
         filename = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_TABLE, context)
 
+        if len(statistics) == 0:
+            statistics = [self.ArithmeticMeanStatistic]
+
         with open(filename + '.log', 'w') as logfile:
             feedback, feedback2 = self.createLoggingFeedback(feedback, logfile)
             self.tic(feedback, parameters, context)
 
             categories, classBandNo = Utils.categoriesFromRasterLayer(zoneRaster)
-
-            categorySum = dict()
-            categoryN = dict()
-            for category in categories:
-                for bandNo in range(1, raster.bandCount() + 1):
-                    categorySum[(category.value, bandNo)] = 0.
-                    categoryN[(category.value, bandNo)] = 0
+            zoneValues = np.array([category.value for category in categories])
+            zoneCount = len(categories)
+            bandCount = raster.bandCount()
 
             rasterReader = RasterReader(raster)
             zoneReader = RasterReader(zoneRaster)
-            lineMemoryUsage = rasterReader.lineMemoryUsage(1, Qgis.Float32)
-            blockSizeY = min(raster.height(), ceil(Utils.maximumMemoryUsage() / lineMemoryUsage))
-            blockSizeX = raster.width()
+            # memory usage: data and mask, 3d zone indices (int64), flat zone indices (int64), values (float64) and
+            # temporaries of up to three 8 byte arrays (squared values or sort order with sorted indices and values)
+            pixelMemoryUsage = rasterReader.pixelMemoryUsage() \
+                               + rasterReader.pixelMemoryUsage(None, 1 + 8 + 8 + 8 + 3 * 8)
+            blockSizeX, blockSizeY = rasterReader.blockSize(pixelMemoryUsage)
+
+            # accumulate count, sum, sum of squares, min and max for all zones and bands in one pass
+            n = np.zeros((bandCount, zoneCount), np.int64)
+            sum1 = np.zeros((bandCount, zoneCount), np.float64)
+            sum2 = np.zeros((bandCount, zoneCount), np.float64)
+            minimum = np.full((bandCount, zoneCount), np.inf)
+            maximum = np.full((bandCount, zoneCount), -np.inf)
             for block in rasterReader.walkGrid(blockSizeX, blockSizeY, feedback):
-                feedback.setProgress(block.yOffset / rasterReader.height() * 100)
-                arrayZones = zoneReader.arrayFromBlock(block, [classBandNo])[0]
-                for bandNo in range(1, raster.bandCount() + 1):
-                    arrayFeatures = rasterReader.arrayFromBlock(block, [bandNo])
-                    arrayMask = rasterReader.maskArray(arrayFeatures, [bandNo])[0]
-                    features = arrayFeatures[0][arrayMask]
-                    zones = arrayZones[arrayMask]
-                    for category in categories:
-                        zoneIndices = zones == category.value
-                        categoryN[(category.value, bandNo)] += np.sum(zoneIndices)
-                        categorySum[(category.value, bandNo)] += np.sum(features[zoneIndices])
+                indices, values = self.readZoneIndicesAndValues(block, rasterReader, zoneReader, classBandNo, zoneValues)
+                size = bandCount * zoneCount
+                n += np.bincount(indices, minlength=size).reshape((bandCount, zoneCount))
+                sum1 += np.bincount(indices, values, minlength=size).reshape((bandCount, zoneCount))
+                sum2 += np.bincount(indices, values ** 2, minlength=size).reshape((bandCount, zoneCount))
+                uniqueIndices, blockMinimum, blockMaximum = self.segmentMinimumAndMaximum(indices, values)
+                minimum.flat[uniqueIndices] = np.minimum(minimum.flat[uniqueIndices], blockMinimum)
+                maximum.flat[uniqueIndices] = np.maximum(maximum.flat[uniqueIndices], blockMaximum)
+
+            # accumulate histograms in a second pass (only if needed)
+            median = None
+            if self.MedianStatistic in statistics:
+                feedback.pushInfo('Calculate histograms for median approximation')
+                median = self.approximateMedian(
+                    rasterReader, zoneReader, classBandNo, zoneValues, blockSizeX, blockSizeY, n, minimum, maximum,
+                    feedback
+                )
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = sum1 / n
+                variance = sum2 / n - mean ** 2
+                variance[variance < 0] = 0  # numerical issue
+            minimum[n == 0] = np.nan
+            maximum[n == 0] = np.nan
+            results = {
+                self.ArithmeticMeanStatistic: mean,
+                self.StandardDeviationStatistic: np.sqrt(variance),
+                self.VarianceStatistic: variance,
+                self.MinimumStatistic: minimum,
+                self.MaximumStatistic: maximum,
+                self.SumStatistic: sum1,
+                self.CountStatistic: n,
+                self.MedianStatistic: median
+            }
 
             # prepare output tabele
-            header = ['Zone Name', 'Zone Value'] + [f'Band {bandNo}' for bandNo in range(1, raster.bandCount() + 1)]
+            header = ['Zone Name', 'Zone Value']
+            for statistic in statistics:
+                if statistic == self.ArithmeticMeanStatistic:
+                    header.extend([f'Band {bandNo}' for bandNo in range(1, bandCount + 1)])
+                else:
+                    name = self.O_STATISTIC[statistic]
+                    header.extend([f'Band {bandNo} {name}' for bandNo in range(1, bandCount + 1)])
             table = [header]
-            for category in categories:
+            for i, category in enumerate(categories):
                 row = [category.name, category.value]
-                for bandNo in range(1, raster.bandCount() + 1):
-                    row.append(categorySum[(category.value, bandNo)] / categoryN[(category.value, bandNo)])
+                for statistic in statistics:
+                    row.extend(results[statistic][:, i].tolist())
                 table.append(row)
 
             # we always create a CSV file
@@ -97,3 +153,65 @@ class RasterLayerZonalAggregationAlgorithm(EnMAPProcessingAlgorithm):
             result = {self.P_OUTPUT_TABLE: filename}
 
         return result
+
+    @staticmethod
+    def readZoneIndicesAndValues(
+            block, rasterReader: RasterReader, zoneReader: RasterReader, classBandNo: int, zoneValues: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return flat (band, zone) indices and values of all valid pixel of a block.
+        The flat index is given by bandIndex * zoneCount + zoneIndex.
+        """
+        zoneCount = len(zoneValues)
+        if zoneCount == 0:  # no categories, nothing to aggregate
+            return np.zeros(0, np.int64), np.zeros(0, np.float64)
+        arrayZones = zoneReader.arrayFromBlock(block, [classBandNo])[0]
+        order = np.argsort(zoneValues)
+        positions = np.clip(np.searchsorted(zoneValues, arrayZones, sorter=order), 0, zoneCount - 1)
+        zoneIndices = order[positions]
+        isZone = zoneValues[zoneIndices] == arrayZones
+
+        array = np.array(rasterReader.arrayFromBlock(block))
+        valid = np.array(rasterReader.maskArray(array))
+        np.logical_and(valid, isZone[None], out=valid)
+        bandIndices = np.arange(len(array)).reshape((-1, 1, 1))
+        indices = (bandIndices * zoneCount + zoneIndices[None])[valid]
+        values = array[valid].astype(np.float64)
+        return indices, values
+
+    @staticmethod
+    def segmentMinimumAndMaximum(indices: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """Return unique indices and corresponding minimum and maximum values."""
+        if len(indices) == 0:
+            return indices, values, values
+        order = np.argsort(indices, kind='stable')
+        indices = indices[order]
+        values = values[order]
+        starts = np.flatnonzero(np.diff(indices, prepend=-1))
+        return indices[starts], np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts)
+
+    @classmethod
+    def approximateMedian(
+            cls, rasterReader: RasterReader, zoneReader: RasterReader, classBandNo: int, zoneValues: np.ndarray,
+            blockSizeX: int, blockSizeY: int, n: np.ndarray, minimum: np.ndarray, maximum: np.ndarray,
+            feedback: QgsProcessingFeedback
+    ) -> np.ndarray:
+        """Return median approximated from histograms binned between the zone minimum and maximum."""
+        bins = cls.HistogramBinCount
+        with np.errstate(invalid='ignore'):
+            binWidth = (maximum - minimum) / bins
+        binWidth[~(binWidth > 0)] = 1  # handle zones with constant or without values
+        histogram = np.zeros(n.size * bins, np.int64)
+        for block in rasterReader.walkGrid(blockSizeX, blockSizeY, feedback):
+            indices, values = cls.readZoneIndicesAndValues(block, rasterReader, zoneReader, classBandNo, zoneValues)
+            binIndices = ((values - minimum.flat[indices]) / binWidth.flat[indices]).astype(np.int64)
+            np.clip(binIndices, 0, bins - 1, out=binIndices)
+            histogram += np.bincount(indices * bins + binIndices, minlength=histogram.size)
+
+        histogram = histogram.reshape((*n.shape, bins))
+        cumulated = np.cumsum(histogram, axis=-1)
+        binIndex = np.argmax(cumulated >= (n / 2)[..., None], axis=-1)
+        median = minimum + (binIndex + 0.5) * binWidth
+        median[n == 0] = np.nan
+        median[minimum == maximum] = minimum[minimum == maximum]
+        return median
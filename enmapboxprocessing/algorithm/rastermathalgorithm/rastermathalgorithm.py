@@ -1,9 +1,11 @@
 import traceback
 import warnings
 from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
 from math import ceil
 from os.path import basename, splitext, join, dirname
-from re import finditer, Match
+from re import finditer, Match, search
+from types import CodeType
 from typing import Dict, Any, List, Tuple, Union, Optional
 from unittest.mock import Mock
 
@@ -14,6 +16,7 @@ from osgeo import gdal
 from enmapbox.typeguard import typechecked
 from enmapboxprocessing.algorithm.rasterizevectoralgorithm import RasterizeVectorAlgorithm
 from enmapboxprocessing.algorithm.translaterasteralgorithm import TranslateRasterAlgorithm
+from enmapboxprocessing.blockexecutor import BlockExecutor
 from enmapboxprocessing.driver import Driver
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
 from enmapboxprocessing.parameter.processingparameterrastermathcodeeditwidget import \
@@ -35,6 +38,7 @@ class RasterMathAlgorithm(EnMAPProcessingAlgorithm):
     P_NO_DATA_VALUE, _NO_DATA_VALUE = 'noDataValue', 'No data value'
     P_OVERLAP, _OVERLAP = 'overlap', 'Block overlap'
     P_MONOLITHIC, _MONOLITHIC = 'monolithic', 'Monolithic processing'
+    P_WORKER_COUNT, _WORKER_COUNT = 'workerCount', 'Number of workers'
     P_R1 = 'R1'
     P_R2 = 'R2'
     P_R3 = 'R3'
@@ -91,6 +95,10 @@ class RasterMathAlgorithm(EnMAPProcessingAlgorithm):
              'This may be useful for some spatially unbound operations, '
              'like segmentation or region growing, when calculating global statistics, '
              'or if RAM is not an issue at all.'),
+            (self._WORKER_COUNT, 'Number of parallel workers. '
+                                 'Use -1 for using all CPU cores. If not specified, processing runs serially. '
+                                 'Code that queries or sets raster properties '
+                                 '(e.g. R1.noDataValue() or outputRaster.setBandName(...)) always runs serially.'),
             ('Raster layer mapped to R1, ..., R10', 'Additional raster layers mapped to Ri.'),
             ('Vector layer mapped to V1, ..., V10', 'Additional vector layers mapped to Vi.'),
             (self._RS, 'Additional list of raster layers mapped to a list variable RS.'),
@@ -137,6 +145,7 @@ class RasterMathAlgorithm(EnMAPProcessingAlgorithm):
         self.addParameterFloat(self.P_NO_DATA_VALUE, self._NO_DATA_VALUE, None, True, None, None, True)
         self.addParameterInt(self.P_OVERLAP, self._OVERLAP, None, True, 0)
         self.addParameterBoolean(self.P_MONOLITHIC, self._MONOLITHIC, False, True)
+        self.addParameterInt(self.P_WORKER_COUNT, self._WORKER_COUNT, None, True, -1, None, True)
         for name, description in self.inputRasterNames():
             self.addParameterRasterLayer(name, description, None, True, True)
         for name, description in self.inputVectorNames():
@@ -159,6 +168,7 @@ class RasterMathAlgorithm(EnMAPProcessingAlgorithm):
         floatInput = self.parameterAsBoolean(parameters, self.P_FLOAT_INPUT, context)
         overlap = self.parameterAsInt(parameters, self.P_OVERLAP, context)
         monolithic = self.parameterAsBoolean(parameters, self.P_MONOLITHIC, context)
+        workerCount = self.parameterAsInt(parameters, self.P_WORKER_COUNT, context)
         filename = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_RASTER, context)
 
         with open(filename + '.log', 'w') as logfile:
@@ -275,13 +285,22 @@ class RasterMathAlgorithm(EnMAPProcessingAlgorithm):
             writers = self.makeWriter(
                 code, filename, grid, readers, readers2, floatInput, noDataValue, feedback)
 
+            # reader and writer objects used inside the code aren't thread-safe
+            plan = self.compileCode(code, readers, writers, feedback)
+            if plan.usesObjects:
+                workerCount = None
+            executor = BlockExecutor(workerCount, feedback=feedback)
+
             # get block size
             lineMemoryUsage = 0
             for reader in readers.values():
                 lineMemoryUsage += grid.lineMemoryUsage(reader.bandCount(), reader.dataTypeSize())
             for writer in writers.values():
                 lineMemoryUsage += grid.lineMemoryUsage(writer.bandCount(), writer.dataTypeSize())
-            blockSizeY = min(grid.height(), ceil(Utils.maximumMemoryUsage() / lineMemoryUsage))
+            maximumMemoryUsage = Utils.maximumMemoryUsage()
+            if executor.isParallel():
+                maximumMemoryUsage = maximumMemoryUsage // executor.maxInFlight
+            blockSizeY = min(grid.height(), ceil(maximumMemoryUsage / lineMemoryUsage))
             blockSizeX = grid.width()
             if monolithic:
                 blockSizeY = grid.height()
@@ -290,11 +309,14 @@ class RasterMathAlgorithm(EnMAPProcessingAlgorithm):
             # process
             if overlap is None:
                 overlap = 0
-            for block in grid.walkGrid(blockSizeX, blockSizeY, feedback):
 
-                results = self.processBlock(
-                    code, block, readers, readers2, writers, floatInput, noDataValue, overlap, feedback
-                )
+            def read(block):
+                return self.readBlock(plan, block, readers, readers2, writers, noDataValue, overlap, feedback)
+
+            def compute(namespace):
+                return self.executeBlock(plan, namespace, readers, floatInput, overlap, feedback)
+
+            def write(block, results):
                 for key in results:
                     if self.isTemporaryVariable(key):
                         continue
@@ -303,6 +325,8 @@ class RasterMathAlgorithm(EnMAPProcessingAlgorithm):
                     result = results[key]
                     writer.writeArray(result, block.xOffset, block.yOffset, overlap=overlap)
 
+            executor.run(grid.walkGrid(blockSizeX, blockSizeY), read, compute, write)
+
             # prepare results
             result = {self.P_OUTPUT_RASTER: None}
             for key, writer in writers.items():
@@ -357,9 +381,10 @@ class RasterMathAlgorithm(EnMAPProcessingAlgorithm):
                     writers[identifier] = Mock()  # silently ignore all writer interaction
 
         results = {}
+        plan = self.compileCode(code, readers, writers, feedback)
         for block in grid.walkGrid(1, 1, None):
             results = self.processBlock(
-                code, block, readers, readers2, writers, floatInput, noDataValue, 0, feedback, True
+                plan, block, readers, readers2, writers, floatInput, noDataValue, 0, feedback, True
             )
             break  # stop after processing the first pixel
 
@@ -391,77 +416,43 @@ class RasterMathAlgorithm(EnMAPProcessingAlgorithm):
 
         return writers
 
-    def processBlock(
-            self, code: str, block: RasterBlockInfo, readers: Dict[str, RasterReader],
-            readers2: Dict[str, RasterReader], writers: Dict[str, Union[RasterWriter, Mock]],
-            floatInput: bool, noDataValue: Optional[float], overlap: int, feedback: ProcessingFeedback, dryRun=False
-    ) -> Dict[str, np.ndarray]:
-
-        # add modules
-        namespace = dict()
-        namespace['np'] = np
-        namespace['numpy'] = numpy
-
-        # add special variables
-        if dryRun:
-            namespace['feedback'] = Mock()  # silently ignore all feedback
-        else:
-            namespace['feedback'] = feedback
-        namespace['block'] = block
-        namespace['dryRun'] = dryRun
+    def compileCode(
+            self, code: str, readers: Dict[str, RasterReader], writers: Dict[str, Union[RasterWriter, Mock]],
+            feedback: ProcessingFeedback = None
+    ) -> 'RasterMathPlan':
+        """Parse and compile the code once, so that it can be executed for each block without re-parsing."""
 
-        # add data arrays and readers
+        needAllData = dict()
+        atBands = dict()
+        rasterListNames = [name for name, _ in zip(self.inputRasterListNames(), range(len(readers)))]
         atIdentifiers = list()  # collect all @identifiers that need to be substitution with valid identifier
         for rasterName in readers:
             reader = readers[rasterName]  # used for querying metadata etc.
-            reader2 = readers2[rasterName]  # used for reading the resampled data
 
             # only read all the data if really required, maybe we just need single bands indicated by the usage of'@'
-            needAllData = False
+            needAllData[rasterName] = False
 
-            # - check if we use the actual array
+            # - check if we use the actual array or mask array
             match_: Match
             for line in code.splitlines():
                 if line.startswith('#'):
                     continue
                 line += '    '  # add some space for avoiding index errors when checking
-                for match_ in finditer(rasterName, line):
+                for match_ in finditer(r'\b' + rasterName + r'(Mask)?\b', line):
                     if line[match_.end()] in '@.':
                         continue  # not using the actual array, but only a single band or the reader
-                needAllData = True
-
-            # - check if we use the actual mask array
-            match_: Match
-            for line in code.splitlines():
-                if line.startswith('#'):
-                    continue
-                line += '    '  # add some space for avoiding index errors when checking
-                for match_ in finditer(rasterName + 'Mask', line):
-                    if line[match_.end()] in '@':
-                        continue  # not using the actual mask array, but only a single band
-                needAllData = True
+                    needAllData[rasterName] = True
 
-            if needAllData:
-                # check if the raster is a rasterized vector ...
-                isRasterizedVector = reader.bandName(reader.bandCount()) == 'None'
-                if isRasterizedVector:  # ... if so, we just assign the 0/1 mask, instead of all burned fields
-                    array = np.array(reader2.arrayFromBlock(block, [reader.bandCount()], overlap))
-                    namespace[rasterName] = array
-                    namespace[rasterName + 'Mask'] = array == 1
-                else:
-                    array = np.array(reader2.arrayFromBlock(block, None, overlap))
-
-                    # replace no data values (see #479)
-                    if noDataValue is not None:
-                        for bandNo, arr in enumerate(array, 1):
-                            if reader.noDataValue(bandNo) is not None:
-                                arr[arr == reader.noDataValue(bandNo)] = noDataValue
-
-                    namespace[rasterName] = array
-                    namespace[rasterName + 'Mask'] = np.array(reader2.maskArray(array, None))
+            # - check if we use the raster list (RS, RS_ or RSMask), which requires all list items
+            if rasterName in rasterListNames:
+                for line in code.splitlines():
+                    if line.startswith('#'):
+                        continue
+                    for match_ in finditer(r'\bRS(Mask|_)?\b', line):
+                        needAllData[rasterName] = True
 
             #  find single band usages indicated by '@'
-            atBands: Dict[Tuple, List[str]] = defaultdict(list)
+            atBands[rasterName] = defaultdict(list)
             match_: Match
 
             for line in code.splitlines():
@@ -514,10 +505,101 @@ class RasterMathAlgorithm(EnMAPProcessingAlgorithm):
                         bandNos = tuple(set(bandsToUse).difference(bandsToExclude))
 
                     identifier = text.replace('Mask@', '@') + unit
-                    atBands[bandNos].append(identifier)  # collect all identifiers for each band
+                    atBands[rasterName][bandNos].append(identifier)  # collect all identifiers for each band
+
+        # inject writer objects
+        for rasterName in writers:
+            code = code.replace(rasterName + '.set', rasterName + '_.set', )
+
+        # inject reader objects
+        for rasterName in readers:
+            for method in RasterReader.__dict__:
+                code = code.replace(rasterName + '.' + method, rasterName + '_.' + method)
+
+        # strip empty lines
+        code = code.strip()
+
+        # remove all comments
+        code = '\n'.join([line for line in code.splitlines() if not line.strip().startswith('#')])
+
+        # substitute all @"<band name>" identifier with valid identifier
+        for atIdentifier in set(atIdentifiers):
+            code = code.replace(atIdentifier, Utils.makeIdentifier(atIdentifier.replace('@', 'At')))
+
+        # enable single line expressions
+        isSingleLineCode = '\n' not in code
+        if isSingleLineCode:
+            code = self.P_OUTPUT_RASTER + ' = ' + code  # make it a statement
+
+        # replace @
+        code = code.replace('@', 'At')
+
+        # check for reader or writer objects, e.g. R1_.noDataValue() or outputRaster_.setNoDataValue(...)
+        usesObjects = search(r'\b\w+_\.', code) is not None
+
+        # compile code
+        try:
+            code = code.replace(r'\n', '\n')  # convert raw new lines (only required when executed via qgis_process)
+            codeObject = compile(code, '<string>', 'exec')
+        except Exception as error:
+            self.reportCodeError(error, feedback)
+
+        return RasterMathPlan(codeObject, isSingleLineCode, needAllData, atBands, usesObjects)
+
+    def processBlock(
+            self, plan: 'RasterMathPlan', block: RasterBlockInfo, readers: Dict[str, RasterReader],
+            readers2: Dict[str, RasterReader], writers: Dict[str, Union[RasterWriter, Mock]],
+            floatInput: bool, noDataValue: Optional[float], overlap: int, feedback: ProcessingFeedback, dryRun=False
+    ) -> Dict[str, np.ndarray]:
+        namespace = self.readBlock(plan, block, readers, readers2, writers, noDataValue, overlap, feedback, dryRun)
+        return self.executeBlock(plan, namespace, readers, floatInput, overlap, feedback)
+
+    def readBlock(
+            self, plan: 'RasterMathPlan', block: RasterBlockInfo, readers: Dict[str, RasterReader],
+            readers2: Dict[str, RasterReader], writers: Dict[str, Union[RasterWriter, Mock]],
+            noDataValue: Optional[float], overlap: int, feedback: ProcessingFeedback, dryRun=False
+    ) -> Dict[str, Any]:
+        """Return the code namespace with all data arrays of the block."""
+
+        # add modules
+        namespace = dict()
+        namespace['np'] = np
+        namespace['numpy'] = numpy
+
+        # add special variables
+        if dryRun:
+            namespace['feedback'] = Mock()  # silently ignore all feedback
+        else:
+            namespace['feedback'] = feedback
+        namespace['block'] = block
+        namespace['dryRun'] = dryRun
+
+        # add data arrays and readers
+        for rasterName in readers:
+            reader = readers[rasterName]  # used for querying metadata etc.
+            reader2 = readers2[rasterName]  # used for reading the resampled data
+
+            if plan.needAllData[rasterName]:
+                # check if the raster is a rasterized vector ...
+                isRasterizedVector = reader.bandName(reader.bandCount()) == 'None'
+                if isRasterizedVector:  # ... if so, we just assign the 0/1 mask, instead of all burned fields
+                    array = np.array(reader2.arrayFromBlock(block, [reader.bandCount()], overlap))
+                    namespace[rasterName] = array
+                    namespace[rasterName + 'Mask'] = array == 1
+                else:
+                    array = np.array(reader2.arrayFromBlock(block, None, overlap))
+
+                    # replace no data values (see #479)
+                    if noDataValue is not None:
+                        for bandNo, arr in enumerate(array, 1):
+                            if reader.noDataValue(bandNo) is not None:
+                                arr[arr == reader.noDataValue(bandNo)] = noDataValue
+
+                    namespace[rasterName] = array
+                    namespace[rasterName + 'Mask'] = np.array(reader2.maskArray(array, None))
 
             # add single band data
-            for bandNos, identifiers in atBands.items():
+            for bandNos, identifiers in plan.atBands[rasterName].items():
                 array = np.array(reader2.arrayFromBlock(block, list(bandNos), overlap))
 
                 # replace no data values (see #479)
@@ -549,32 +631,14 @@ class RasterMathAlgorithm(EnMAPProcessingAlgorithm):
         for rasterName, writer in writers.items():
             namespace[rasterName + '_'] = writer
 
-        # inject writer objects
-        for rasterName in writers:
-            code = code.replace(rasterName + '.set', rasterName + '_.set', )
-
-        # inject reader objects
-        for rasterName in readers:
-            for method in RasterReader.__dict__:
-                code = code.replace(rasterName + '.' + method, rasterName + '_.' + method)
-
-        # strip empty lines
-        code = code.strip()
-
-        # remove all comments
-        code = '\n'.join([line for line in code.splitlines() if not line.strip().startswith('#')])
+        return namespace
 
-        # substitute all @"<band name>" identifier with valid identifier
-        for atIdentifier in set(atIdentifiers):
-            code = code.replace(atIdentifier, Utils.makeIdentifier(atIdentifier.replace('@', 'At')))
-
-        # enable single line expressions
-        isSingleLineCode = '\n' not in code
-        if isSingleLineCode:
-            code = self.P_OUTPUT_RASTER + ' = ' + code  # make it a statement
-
-        # replace @
-        code = code.replace('@', 'At')
+    def executeBlock(
+            self, plan: 'RasterMathPlan', namespace: Dict[str, Any], readers: Dict[str, RasterReader],
+            floatInput: bool, overlap: int, feedback: ProcessingFeedback
+    ) -> Dict[str, np.ndarray]:
+        """Execute the code on the namespace returned by readBlock and return the output arrays."""
+        block = namespace['block']
 
         # cast inputs to float32
         if floatInput:
@@ -587,16 +651,12 @@ class RasterMathAlgorithm(EnMAPProcessingAlgorithm):
 
         # execute code
         try:
-            code = code.replace(r'\n', '\n')  # convert raw new lines (only required when executed via qgis_process)
-            exec(code, namespace)
+            exec(plan.code, namespace)
         except Exception as error:
-            traceback.print_exc()
-            text = traceback.format_exc()
-            text = text[text.index('File "<string>"'):]
-            feedback.reportError(text)
-            raise QgsProcessingException(str(error))
+            self.reportCodeError(error, feedback)
 
         # prepare output data
+        isSingleLineCode = plan.isSingleLineCode
         results = dict()
         for key, value in namespace.items():  # skip all input arrays
             if key in readers:
@@ -634,5 +694,24 @@ class RasterMathAlgorithm(EnMAPProcessingAlgorithm):
             results.pop(self.P_OUTPUT_RASTER)
         return results
 
+    def reportCodeError(self, error: Exception, feedback: Optional[ProcessingFeedback]):
+        traceback.print_exc()
+        text = traceback.format_exc()
+        text = text[text.index('File "<string>"'):]
+        if feedback is not None:
+            feedback.reportError(text)
+        raise QgsProcessingException(str(error))
+
     def isTemporaryVariable(self, name) -> bool:
         return name.startswith('_') or name.endswith('_') or name.startswith('tmp') or name.startswith('temp')
+
+
+@typechecked
+@dataclass
+class RasterMathPlan(object):
+    """Raster math code compiled once and executed for each block."""
+    code: CodeType
+    isSingleLineCode: bool
+    needAllData: Dict[str, bool]  # whether the full raster (and mask) array is used
+    atBands: Dict[str, Dict[Tuple, List[str]]]  # @-identifiers grouped by raster name and resolved band numbers
+    usesObjects: bool = False  # whether reader or writer objects are used
@@ -1,4 +1,4 @@
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Callable
 
 import numpy as np
 
@@ -66,16 +66,18 @@ class ReclassifyRasterAlgorithm(EnMAPProcessingAlgorithm):
 
             reader = RasterReader(raster)
             writer = Driver(filename, feedback=feedback).createLike(reader, Qgis.DataType.Int32, reader.bandCount())
-            for bandNo in reader.bandNumbers():
-                feedback.setProgress(bandNo / reader.bandCount() * 100)
 
-                inarray = reader.array(bandList=[bandNo])[0]
-                outarray = np.full_like(inarray, noDataValue, np.int32)
-
-                for v1, v2 in mapping.items():
-                    outarray[inarray == v1] = v2
-
-                writer.writeArray2d(outarray, bandNo)
+            # memory usage: input data, Int32 output, intermediate lookup indices and masks
+            pixelMemoryUsage = reader.pixelMemoryUsage() + reader.bandCount() * (4 + 8 + 1)
+            blockSizeX, blockSizeY = reader.blockSize(pixelMemoryUsage, writer=writer)
+            reclassifiers = dict()  # reclassifier by input data type
+            for block in reader.walkGrid(blockSizeX, blockSizeY, feedback):
+                array = reader.arrayFromBlock(block)
+                for bandNo, inarray in enumerate(array, 1):
+                    if inarray.dtype not in reclassifiers:
+                        reclassifiers[inarray.dtype] = self.makeReclassifier(mapping, noDataValue, inarray.dtype)
+                    outarray = reclassifiers[inarray.dtype](inarray)
+                    writer.writeArray2d(outarray, bandNo, block.xOffset, block.yOffset)
 
             writer.setNoDataValue(noDataValue)
             writer.close()
@@ -91,3 +93,56 @@ class ReclassifyRasterAlgorithm(EnMAPProcessingAlgorithm):
             self.toc(feedback, result)
 
         return result
+
+    MaximumLookupTableSize = 2 ** 20
+
+    @classmethod
+    def makeReclassifier(
+            cls, mapping: Dict[float, float], noDataValue: int, dtype: np.dtype
+    ) -> Callable[[np.ndarray], np.ndarray]:
+        """
+        Return function that reclassifies an array of given data type into an Int32 array.
+        Unmapped values are set to the no data value.
+
+        For integer inputs, where the mapped values span at most MaximumLookupTableSize values, a dense lookup table
+        is used. Otherwise, the mapped values are looked up via binary search.
+        """
+        dtype = np.dtype(dtype)
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            mapping = {int(v1): v2 for v1, v2 in mapping.items() if float(v1).is_integer() and
+                       info.min <= v1 <= info.max}  # other values can't match
+        if len(mapping) == 0:
+            return lambda inarray: np.full_like(inarray, noDataValue, np.int32)
+
+        sources = np.array(list(mapping.keys()), dtype)
+        targets = np.array(list(mapping.values()), np.int32)
+        order = np.argsort(sources)
+        sources = sources[order]
+        targets = targets[order]
+
+        if np.issubdtype(dtype, np.integer):
+            start = int(sources[0])
+            size = int(sources[-1]) - start + 1
+            if size <= cls.MaximumLookupTableSize:
+                lookupTable = np.full(size, noDataValue, np.int32)
+                lookupTable[sources.astype(np.int64) - start] = targets
+
+                def reclassify(inarray: np.ndarray) -> np.ndarray:
+                    indices = inarray.astype(np.int64) - start
+                    valid = np.logical_and(indices >= 0, indices < size)
+                    if np.all(valid):
+                        return lookupTable[indices]
+                    outarray = np.full_like(inarray, noDataValue, np.int32)
+                    outarray[valid] = lookupTable[indices[valid]]
+                    return outarray
+
+                return reclassify
+
+        def reclassify(inarray: np.ndarray) -> np.ndarray:
+            indices = np.searchsorted(sources, inarray)
+            np.clip(indices, 0, len(sources) - 1, out=indices)
+            found = sources[indices] == inarray
+            return np.where(found, targets[indices], np.int32(noDataValue)).astype(np.int32)
+
+        return reclassify
@@ -1,20 +1,20 @@
+from math import floor, ceil
 from typing import Dict, Any, List, Tuple
 
 import numpy as np
+from osgeo import gdal, ogr
 
 import processing
 from enmapbox.typeguard import typechecked
-from enmapboxprocessing.algorithm.creategridalgorithm import CreateGridAlgorithm
-from enmapboxprocessing.algorithm.rasterizevectoralgorithm import RasterizeVectorAlgorithm
-from enmapboxprocessing.driver import Driver
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group, AlgorithmCanceledException
 from enmapboxprocessing.processingfeedback import ProcessingFeedback
 from enmapboxprocessing.rasterreader import RasterReader
 from enmapboxprocessing.utils import Utils
 from qgis.PyQt.QtCore import QVariant
 from qgis.core import (QgsProcessingContext, QgsProcessingFeedback, QgsVectorLayer, QgsRasterLayer,
-                       QgsFeature, QgsField, QgsProcessingFeatureSourceDefinition, QgsApplication,
-                       QgsVectorDataProvider, QgsRasterDataProvider, QgsPoint)
+                       QgsFeature, QgsField, QgsProcessingFeatureSourceDefinition, QgsFields, QgsGeometry,
+                       QgsVectorDataProvider, QgsRasterDataProvider, QgsPoint, QgsPointXY, QgsCoordinateTransform,
+                       QgsVectorFileWriter)
 from qgis.core.additions.edit import edit
 
 
@@ -37,9 +37,8 @@ class SampleRasterValuesAlgorithm(EnMAPProcessingAlgorithm):
                '2) attributes SAMPLE_{i}, one for each input raster band, ' \
                '3) two attributes PIXEL_X, PIXEL_Y for storing the raster pixel locations (zero-based),' \
                'and 4), in case of polygon locations, an attribute COVER for storing the pixel coverage (%).\n' \
-               'Note that we assume non-overlapping feature geometries! ' \
-               'In case of overlapping geometries, split the Locations layer into non-overlapping subsets, ' \
-               'perform the sampling for each subset individually, and finally concatenate the results.'
+               'Note that in case of overlapping polygons, ' \
+               'pixels covered by more than one polygon are sampled once for each polygon.'
 
     def helpParameters(self) -> List[Tuple[str, str]]:
         return [
@@ -145,114 +144,133 @@ class SampleRasterValuesAlgorithm(EnMAPProcessingAlgorithm):
     ):
         assert Utils.isPolygonGeometry(vector.geometryType())
 
-        # create oversampling grid
-        alg = CreateGridAlgorithm()
-        alg.initAlgorithm()
-        parameters = {
-            alg.P_CRS: raster.crs(),
-            alg.P_EXTENT: raster.extent(),
-            alg.P_UNIT: alg.PixelUnits,
-            alg.P_WIDTH: raster.width() * 10,
-            alg.P_HEIGHT: raster.height() * 10,
-            alg.P_OUTPUT_GRID: Utils.tmpFilename(filename, 'grid.x10.vrt')
-        }
-        result = processing.run(alg, parameters, None, feedback2, context, True)
-        x10Grid = QgsRasterLayer(result[alg.P_OUTPUT_GRID])
-
-        if feedback.isCanceled():
-            raise AlgorithmCanceledException()
-
-        feedback.pushInfo('Rasterize polygon IDs at x10 finer resolution')
-        alg = RasterizeVectorAlgorithm()
-        alg.initAlgorithm()
-        parameters = {
-            alg.P_VECTOR: vector,
-            alg.P_GRID: x10Grid,
-            alg.P_BURN_FID: True,
-            alg.P_OUTPUT_RASTER: Utils.tmpFilename(filename, 'fid.x10.tif'),
-        }
-        result = processing.run(alg, parameters, None, feedback2, context, True)
-        x10FidArray = RasterReader(result[alg.P_OUTPUT_RASTER]).array()[0]
-
-        sampleVectors = list()
+        reader = RasterReader(raster)
+        extent = raster.extent()
+        resX = raster.rasterUnitsPerPixelX()
+        resY = raster.rasterUnitsPerPixelY()
+        toRasterCrs = QgsCoordinateTransform(vector.crs(), raster.crs(), context.transformContext())
+        toVectorCrs = QgsCoordinateTransform(raster.crs(), vector.crs(), context.transformContext())
+
+        # single polygon layer used for rasterizing the coverage of the current polygon
+        ogrDataSource = ogr.GetDriverByName('Memory').CreateDataSource('')
+        ogrLayer = ogrDataSource.CreateLayer('polygon', geom_type=ogr.wkbMultiPolygon)
+        memDriver = gdal.GetDriverByName('MEM')
+
+        if selectedFeaturesOnly:
+            polygonFeatures = vector.getSelectedFeatures()
+            n = vector.selectedFeatureCount()
+        else:
+            polygonFeatures = vector.getFeatures()
+            n = vector.featureCount()
+
+        xs = list()
+        ys = list()
+        covers = list()
+        polygonIndices = list()
+        polygonAttributes = list()
         polygonFeature: QgsFeature
-        refs = list()  # don't loose your C refs!
-        n = vector.featureCount()
-        for i, polygonFeature in enumerate(vector.getFeatures()):
-
-            if feedback.isCanceled():
-                raise AlgorithmCanceledException()
-
-            feedback.pushInfo(f'Sample polygon [{i + 1}/{n}]')
-
-            fid = polygonFeature.id()
-            # calculate coverage
-            x10MaskArray = x10FidArray == fid
-            percentArray = x10MaskArray.reshape((raster.height(), 10, raster.width(), 10)).sum(axis=3).sum(axis=1)
-            # mask coverage outside valid range
-            if coverageMin != 0:
-                percentArray[percentArray < coverageMin] = 0
-            if coverageMax != 100:
-                percentArray[percentArray > coverageMax] = 0
-
-            driver = Driver(Utils.tmpFilename(filename, f'cover{fid}.tif'), feedback=feedback2)
-            coverRaster = driver.createFromArray([percentArray], raster.extent(), raster.crs())
-            coverRaster.setNoDataValue(0)
-            coverRaster.close()
+        for i, polygonFeature in enumerate(polygonFeatures):
 
             if feedback.isCanceled():
                 raise AlgorithmCanceledException()
+            feedback.setProgress(i / n * 100)
 
-            # create sample locations with cover > 0%
-            alg = QgsApplication.processingRegistry().createAlgorithmById('native:pixelstopoints')
-            parameters = {
-                'FIELD_NAME': 'COVER',
-                'INPUT_RASTER': coverRaster.source(),
-                'OUTPUT': Utils.tmpFilename(filename, f'locations{fid}.gpkg'),
-                'RASTER_BAND': 1
-            }
-            result = processing.run(alg, parameters, None, feedback2, context, True)
-            locationVector = QgsVectorLayer(result['OUTPUT'])
-            refs.append(locationVector)
-            nFields = locationVector.fields().count()
-
-            if feedback.isCanceled():
-                raise AlgorithmCanceledException()
-
-            # add polygon attributes to each point (extremly redundant, but we want all data in one table)
-            provider: QgsVectorDataProvider = locationVector.dataProvider()
-            fields = [QgsField(field) for field in vector.fields()
-                      if field.name() not in ['fid', 'temp_fid']]
-            refs.append(fields)
-            provider.addAttributes(fields)
-            locationVector.updateFields()
-
-            polygonFeatureAttributes = [value for field, value in zip(vector.fields(), polygonFeature.attributes())
-                                        if field.name() not in ['fid', 'temp_fid']]
-            with edit(locationVector):
-                pointFeature: QgsFeature
-                for pointFeature in locationVector.getFeatures():
-                    values = [pointFeature.attribute(i) for i in range(nFields)] + polygonFeatureAttributes
-                    pointFeature.setAttributes(values)
-                    locationVector.updateFeature(pointFeature)
-
-            if feedback.isCanceled():
-                raise AlgorithmCanceledException()
+            polygonAttributes.append(
+                [value for field, value in zip(vector.fields(), polygonFeature.attributes())
+                 if field.name() not in ['fid', 'temp_fid']]
+            )
 
-            sampleVector = cls.samplePoints(
-                Utils.tmpFilename(filename, f'sample{fid}.gpkg'), raster, locationVector, selectedFeaturesOnly,
-                skipNoDataPixel, feedback, feedback2, context
+            geometry = QgsGeometry(polygonFeature.geometry())
+            if geometry.isNull():
+                continue
+            geometry.transform(toRasterCrs)
+
+            # polygon bounding window in pixel coordinates
+            boundingBox = geometry.boundingBox()
+            xOffset = max(int(floor((boundingBox.xMinimum() - extent.xMinimum()) / resX)), 0)
+            yOffset = max(int(floor((extent.yMaximum() - boundingBox.yMaximum()) / resY)), 0)
+            xEnd = min(int(ceil((boundingBox.xMaximum() - extent.xMinimum()) / resX)), raster.width())
+            yEnd = min(int(ceil((extent.yMaximum() - boundingBox.yMinimum()) / resY)), raster.height())
+            width = xEnd - xOffset
+            height = yEnd - yOffset
+            if width <= 0 or height <= 0:
+                continue
+
+            # calculate coverage by rasterizing at x10 finer resolution
+            x10Raster = memDriver.Create('', width * 10, height * 10, 1, gdal.GDT_Byte)
+            x10Raster.SetGeoTransform(
+                (extent.xMinimum() + xOffset * resX, resX / 10, 0, extent.yMaximum() - yOffset * resY, 0, -resY / 10)
             )
-            sampleVectors.append(sampleVector)
+            ogrFeature = ogr.Feature(ogrLayer.GetLayerDefn())
+            ogrFeature.SetGeometry(ogr.CreateGeometryFromWkb(bytes(geometry.asWkb())))
+            ogrLayer.CreateFeature(ogrFeature)
+            gdal.RasterizeLayer(x10Raster, [1], ogrLayer, burn_values=[1])
+            ogrLayer.DeleteFeature(ogrFeature.GetFID())
+            x10MaskArray = x10Raster.ReadAsArray()
+            percentArray = x10MaskArray.reshape((height, 10, width, 10)).sum(axis=3).sum(axis=1)
+
+            # sample locations with cover > 0% and inside valid range
+            valid = np.logical_and(percentArray >= max(coverageMin, 1), percentArray <= coverageMax)
+            blockYs, blockXs = np.where(valid)
+            xs.append(blockXs + xOffset)
+            ys.append(blockYs + yOffset)
+            covers.append(percentArray[valid])
+            polygonIndices.append(np.full_like(blockXs, len(polygonAttributes) - 1))
 
         if feedback.isCanceled():
             raise AlgorithmCanceledException()
 
-        # merge all samples
-        alg = QgsApplication.processingRegistry().createAlgorithmById('native:mergevectorlayers')
-        parameters = {
-            'LAYERS': sampleVectors,
-            'CRS': vector.crs(),
-            'OUTPUT': filename
-        }
-        processing.run(alg, parameters, None, feedback, context, True)
+        # read raster values for all locations at once
+        feedback.pushInfo('Read raster values')
+        if len(xs) > 0:
+            xs = np.concatenate(xs)
+            ys = np.concatenate(ys)
+            covers = np.concatenate(covers)
+            polygonIndices = np.concatenate(polygonIndices)
+        else:
+            xs = ys = covers = polygonIndices = np.array([], int)
+        values = reader.arrayFromPixelLocations(xs, ys, feedback=feedback2)
+        valid = np.array(reader.maskArray(values))
+        if skipNoDataPixel:
+            selected = np.any(valid, axis=0)
+        else:
+            selected = np.full_like(xs, True, bool)
+
+        # write all samples into one layer
+        feedback.pushInfo('Write samples')
+        fields = QgsFields()
+        fields.append(QgsField('COVER', QVariant.Double))
+        for field in vector.fields():
+            if field.name() not in ['fid', 'temp_fid']:
+                fields.append(QgsField(field))
+        for bandNo in reader.bandNumbers():
+            fields.append(QgsField(f'SAMPLE_{bandNo}', QVariant.Double))
+        fields.append(QgsField('PIXEL_X', QVariant.LongLong))
+        fields.append(QgsField('PIXEL_Y', QVariant.LongLong))
+
+        sample = QgsVectorLayer('Point', 'sample', 'memory')
+        sample.setCrs(vector.crs())
+        sample.dataProvider().addAttributes(fields)
+        sample.updateFields()
+
+        pointFeatures = list()
+        for k in np.flatnonzero(selected):
+            x = int(xs[k])
+            y = int(ys[k])
+            point = QgsPointXY(extent.xMinimum() + (x + 0.5) * resX, extent.yMaximum() - (y + 0.5) * resY)
+            pointFeature = QgsFeature(sample.fields())
+            pointFeature.setGeometry(QgsGeometry.fromPointXY(toVectorCrs.transform(point)))
+            sampleValues = [float(v) if m else None for v, m in zip(values[:, k], valid[:, k])]
+            pointFeature.setAttributes(
+                [float(covers[k])] + polygonAttributes[polygonIndices[k]] + sampleValues + [x, y]
+            )
+            pointFeatures.append(pointFeature)
+        sample.dataProvider().addFeatures(pointFeatures)
+
+        saveVectorOptions = QgsVectorFileWriter.SaveVectorOptions()
+        saveVectorOptions.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteFile
+        saveVectorOptions.feedback = feedback2
+        error, message, newFilename, newLayer = QgsVectorFileWriter.writeAsVectorFormatV3(
+            sample, filename, context.transformContext(), saveVectorOptions
+        )
+        assert error == QgsVectorFileWriter.NoError, f'Fail error {error}:{message}'
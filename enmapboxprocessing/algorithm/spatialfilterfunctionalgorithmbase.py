@@ -14,8 +14,12 @@ class SpatialFilterFunctionAlgorithmBase(ApplyBandFunctionAlgorithmBase):
     def outputNoDataValue(self) -> float:
         return float(np.finfo(np.float32).min)
 
-    def prepareInput(self):
-        self.array = np.float32(self.array)
+    def overlap(self) -> int:
+        return 1  # covers the 3x3 neighbourhood used by most default functions
 
-    def prepareOutput(self):
-        self.outarray[np.logical_not(self.marray)] = self.outputNoDataValue()
+    def prepareInput(self, array: np.ndarray) -> np.ndarray:
+        return np.float32(array)
+
+    def prepareOutput(self, outarray: np.ndarray, marray: np.ndarray) -> np.ndarray:
+        outarray[np.logical_not(marray)] = self.outputNoDataValue()
+        return outarray
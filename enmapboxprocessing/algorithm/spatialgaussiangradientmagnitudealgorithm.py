@@ -27,3 +27,6 @@ class SpatialGaussianGradientMagnitudeAlgorithm(SpatialFilterFunctionAlgorithmBa
 
         function = lambda array: gaussian_gradient_magnitude(array, sigma=1)
         return function
+
+    def overlap(self) -> int:
+        return 4  # Gaussian kernel is truncated at 4 sigma
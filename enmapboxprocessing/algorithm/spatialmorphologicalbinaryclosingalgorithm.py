@@ -35,3 +35,6 @@ class SpatialMorphologicalBinaryClosingAlgorithm(SpatialFilterFunctionAlgorithmB
         structure = iterate_structure(structure=structure, iterations=1)
         function = lambda array: binary_closing(array, structure=structure, iterations=1)
         return function
+
+    def overlap(self) -> int:
+        return 2  # dilation followed by erosion
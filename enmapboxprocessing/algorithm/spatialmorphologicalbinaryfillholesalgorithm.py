@@ -34,3 +34,6 @@ class SpatialMorphologicalBinaryFillHolesAlgorithm(SpatialFilterFunctionAlgorith
         structure = iterate_structure(structure=structure, iterations=1)
         function = lambda array: binary_fill_holes(array, structure=structure)
         return function
+
+    def isTileable(self) -> bool:
+        return False  # holes may extend over the whole band
@@ -35,3 +35,6 @@ class SpatialMorphologicalBinaryPropagationAlgorithm(SpatialFilterFunctionAlgori
         function = lambda array: binary_propagation(array, structure=structure)
 
         return function
+
+    def isTileable(self) -> bool:
+        return False  # propagation may extend over the whole band
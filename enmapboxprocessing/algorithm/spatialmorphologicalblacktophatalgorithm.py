@@ -35,3 +35,6 @@ class SpatialMorphologicalBlackTophatAlgorithm(SpatialFilterFunctionAlgorithmBas
         structure = iterate_structure(structure=structure, iterations=1)
         function = lambda array: black_tophat(array, structure=structure)
         return function
+
+    def overlap(self) -> int:
+        return 2  # based on closing, i.e. dilation followed by erosion
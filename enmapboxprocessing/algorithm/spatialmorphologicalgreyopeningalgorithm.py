@@ -35,3 +35,6 @@ class SpatialMorphologicalGreyOpeningAlgorithm(SpatialFilterFunctionAlgorithmBas
         structure = iterate_structure(structure=structure, iterations=1)
         function = lambda array: grey_opening(array, structure=structure)
         return function
+
+    def overlap(self) -> int:
+        return 2  # erosion followed by dilation
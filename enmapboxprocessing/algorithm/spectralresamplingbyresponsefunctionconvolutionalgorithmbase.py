@@ -1,6 +1,6 @@
 import inspect
 from collections import OrderedDict
-from math import ceil, sqrt, pi, exp
+from math import sqrt, pi, exp
 from os.path import splitext
 from typing import Dict, Any, List, Tuple, Union
 from warnings import warn
@@ -9,6 +9,7 @@ import numpy as np
 from osgeo import gdal
 
 from enmapbox.typeguard import typechecked
+from enmapboxprocessing.blockexecutor import BlockExecutor
 from enmapboxprocessing.driver import Driver
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
 from enmapboxprocessing.geojsonlibrarywriter import GeoJsonLibraryWriter
@@ -24,6 +25,7 @@ RESPONSE_CUTOFF_DIGITS = 3
 class SpectralResamplingByResponseFunctionConvolutionAlgorithmBase(EnMAPProcessingAlgorithm):
     P_RASTER, _RASTER = 'raster', 'Spectral raster layer'
     P_CODE, _CODE = 'response', 'Spectral response function'
+    P_WORKER_COUNT, _WORKER_COUNT = 'workerCount', 'Number of workers'
     P_OUTPUT_LIBRARY, _OUTPUT_LIBRARY = 'outputResponseFunctionLibrary', 'Output spectral response function library'
     P_OUTPUT_RASTER, _OUTPUT_RASTER = 'outputResampledRaster', 'Output raster layer'
     A_CODE = False
@@ -38,6 +40,8 @@ class SpectralResamplingByResponseFunctionConvolutionAlgorithmBase(EnMAPProcessi
         return [
             (self._RASTER, 'A spectral raster layer to be resampled.'),
             (self._CODE, 'Python code specifying the spectral response function.'),
+            (self._WORKER_COUNT, 'Number of parallel workers. '
+                                 'Use -1 for using all CPU cores. If not specified, processing runs serially.'),
             (self._OUTPUT_LIBRARY, self.GeoJsonFileDestination),
             (self._OUTPUT_RASTER, self.RasterFileDestination)
         ]
@@ -68,6 +72,7 @@ class SpectralResamplingByResponseFunctionConvolutionAlgorithmBase(EnMAPProcessi
     def initAlgorithm(self, configuration: Dict[str, Any] = None):
         self.addParameterRasterLayer(self.P_RASTER, self._RASTER)
         self.addParameterCode(self.P_CODE, self._CODE, self.defaultCodeAsString(), advanced=self.A_CODE)
+        self.addParameterInt(self.P_WORKER_COUNT, self._WORKER_COUNT, None, True, -1, None, True)
         self.addParameterFileDestination(
             self.P_OUTPUT_LIBRARY, self._OUTPUT_LIBRARY, self.GeoJsonFileFilter, None, True, True
         )
@@ -78,6 +83,7 @@ class SpectralResamplingByResponseFunctionConvolutionAlgorithmBase(EnMAPProcessi
     ) -> Dict[str, Any]:
         raster = self.parameterAsSpectralRasterLayer(parameters, self.P_RASTER, context)
         responses = self.parameterAsResponses(parameters, self.P_CODE, context)
+        workerCount = self.parameterAsInt(parameters, self.P_WORKER_COUNT, context)
         filenameSrf = self.parameterAsFileOutput(parameters, self.P_OUTPUT_LIBRARY, context)
         filename = self.parameterAsOutputLayer(parameters, self.P_OUTPUT_RASTER, context)
         maximumMemoryUsage = gdal.GetCacheMax()
@@ -129,18 +135,31 @@ class SpectralResamplingByResponseFunctionConvolutionAlgorithmBase(EnMAPProcessi
                 outputNoDataValue = 0
 
             writer = Driver(filename, feedback=feedback).createLike(reader, reader.dataType(), outputBandCount)
-            lineMemoryUsage = reader.lineMemoryUsage() * 2
-            blockSizeY = min(raster.height(), ceil(maximumMemoryUsage / lineMemoryUsage))
-            blockSizeX = raster.width()
-            isFirstBlock = True
-            for block in reader.walkGrid(blockSizeX, blockSizeY, feedback):
+            executor = BlockExecutor(workerCount, feedback=feedback)
+            if executor.isParallel():
+                maximumMemoryUsage = maximumMemoryUsage // executor.maxInFlight
+            # memory usage: input, mask and Float32 output (the chunk temporaries have a fixed size)
+            pixelMemoryUsage = reader.pixelMemoryUsage() + reader.pixelMemoryUsage(dataTypeSize=1) \
+                               + reader.pixelMemoryUsage(outputBandCount, 4)
+            blockSizeX, blockSizeY = reader.blockSize(pixelMemoryUsage, maximumMemoryUsage, writer)
+            weights = self.responseMatrix(wavelength, responses)  # compile response functions only once
+            self.warnUncoveredBands(wavelength, responses, weights, feedback)
+
+            def read(block):
                 array = reader.arrayFromBlock(block)
                 marray = reader.maskArray(array)
-                outarray = self.resampleData(
-                    array, marray, wavelength, responses, outputNoDataValue, feedback, isFirstBlock
+                return array, marray
+
+            def compute(data):
+                array, marray = data
+                return self.resampleData(
+                    array, marray, wavelength, responses, outputNoDataValue, feedback, False, weights
                 )
+
+            def write(block, outarray):
                 writer.writeArray(outarray, block.xOffset, block.yOffset)
-                isFirstBlock = False
+
+            executor.run(reader.walkGrid(blockSizeX, blockSizeY), read, compute, write)
 
             outputWavelength = list()
             for name in responses:
@@ -180,40 +199,84 @@ class SpectralResamplingByResponseFunctionConvolutionAlgorithmBase(EnMAPProcessi
         return result
 
     @staticmethod
-    def resampleData(
-            array: Array3d, marray: Array3d, wavelength: List, responses: Dict[str, List[Tuple[int, float]]],
-            noDataValue: float, feedback: QgsProcessingFeedback, isFirstBlock=True
-    ) -> Array3d:
+    def responseMatrix(wavelength: List, responses: Dict[str, List[Tuple[int, float]]]):
+        """
+        Return response functions as sparse (target bands x source bands) weight matrix.
+        Source band wavelength are rounded to full nanometers.
+        """
+        from scipy.sparse import csr_matrix
+
         wavelength = [int(round(v)) for v in wavelength]
-        outarray = list()
-        for name in responses:
+        rows = list()
+        columns = list()
+        weights = list()
+        for row, name in enumerate(responses):
             weightsByWavelength = dict(responses[name])
-            indices = list()
-            weights = list()
-            for index, wl in enumerate(wavelength):
+            for column, wl in enumerate(wavelength):
                 weight = weightsByWavelength.get(wl)
                 if weight is not None:
-                    indices.append(index)
+                    rows.append(row)
+                    columns.append(column)
                     weights.append(weight)
-            if len(indices) == 0:
-                if isFirstBlock:
-                    message = f'no source bands ({min(wavelength)} to {max(wavelength)} nanometers) ' \
-                              f'are covert by target band "{name}" ' \
-                              f'({min(weightsByWavelength.keys())} to {max(weightsByWavelength.keys())} nanometers), ' \
-                              f'which will result in output band filled with no data values'
-                    warn(message)
-                    feedback.pushWarning(message)
-                outarray.append(np.full_like(array[0], noDataValue, dtype=array[0].dtype))
-            else:
-                tmparray = np.asarray(array, np.float32)[indices]
-                tmpmarray = np.asarray(marray)[indices]
-                warray = np.array(weights).reshape((-1, 1, 1)) * np.ones_like(tmparray)
-                for tmparr, warr, marr in zip(tmparray, warray, tmpmarray):
-                    invalid = np.logical_not(marr)
-                    tmparr[invalid] = np.nan
-                    warr[invalid] = np.nan
-                outarr = np.nansum(tmparray * warray, 0) / np.nansum(warray, 0)
-                outarr[np.isnan(outarr)] = noDataValue
-                outarray.append(outarr)
-
-        return outarray
+        return csr_matrix((weights, (rows, columns)), shape=(len(responses), len(wavelength)), dtype=np.float32)
+
+    @staticmethod
+    def warnUncoveredBands(
+            wavelength: List, responses: Dict[str, List[Tuple[int, float]]], weights, feedback: QgsProcessingFeedback
+    ):
+        """Warn about target bands, that aren't covered by any source band."""
+        bandWeightCounts = np.diff(weights.indptr)
+        for name, count in zip(responses, bandWeightCounts):
+            if count != 0:
+                continue
+            weightsByWavelength = dict(responses[name])
+            message = f'no source bands ({min(wavelength)} to {max(wavelength)} nanometers) ' \
+                      f'are covert by target band "{name}" ' \
+                      f'({min(weightsByWavelength.keys())} to {max(weightsByWavelength.keys())} nanometers), ' \
+                      f'which will result in output band filled with no data values'
+            warn(message)
+            feedback.pushWarning(message)
+
+    @staticmethod
+    def resampleData(
+            array: Array3d, marray: Array3d, wavelength: List, responses: Dict[str, List[Tuple[int, float]]],
+            noDataValue: float, feedback: QgsProcessingFeedback, isFirstBlock=True, weights=None
+    ) -> Array3d:
+        """
+        Resample data by response function convolution.
+
+        Convolution is implemented as masked matrix product with the sparse response matrix.
+        Results are normalized by the sum of weights of the valid source bands,
+        which is derived by a second matrix product with the mask.
+        Computation is done in Float32.
+        Pixels are processed in chunks, so the Float32 temporaries are limited to 2**22 values per array.
+        """
+        if weights is None:
+            weights = SpectralResamplingByResponseFunctionConvolutionAlgorithmBase.responseMatrix(
+                wavelength, responses
+            )
+
+        if isFirstBlock:
+            SpectralResamplingByResponseFunctionConvolutionAlgorithmBase.warnUncoveredBands(
+                wavelength, responses, weights, feedback
+            )
+
+        array = np.asarray(array)
+        marray = np.asarray(marray)
+        bandCount, height, width = array.shape
+        outputBandCount = weights.shape[0]
+        array = array.reshape((bandCount, -1))
+        marray = marray.reshape((bandCount, -1))
+        outarray = np.empty((outputBandCount, height * width), np.float32)
+        chunkSize = max(1, 2 ** 22 // max(bandCount, outputBandCount))  # number of pixels per chunk
+        for start in range(0, height * width, chunkSize):
+            chunk = slice(start, start + chunkSize)
+            mchunk = marray[:, chunk]
+            numerator = weights @ np.where(mchunk, array[:, chunk], 0).astype(np.float32)
+            denominator = weights @ mchunk.astype(np.float32)
+            valid = denominator != 0
+            outchunk = outarray[:, chunk]
+            outchunk[valid] = numerator[valid] / denominator[valid]
+            outchunk[~valid] = noDataValue
+
+        return outarray.reshape((outputBandCount, height, width))
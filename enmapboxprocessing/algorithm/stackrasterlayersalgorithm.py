@@ -1,13 +1,13 @@
 from typing import Dict, Any, List, Tuple
+from xml.sax.saxutils import escape
 
 from osgeo import gdal
 
-from enmapboxprocessing.algorithm.translaterasteralgorithm import TranslateRasterAlgorithm
 from enmapboxprocessing.enmapalgorithm import EnMAPProcessingAlgorithm, Group
 from enmapboxprocessing.rasterreader import RasterReader
 from enmapboxprocessing.rasterwriter import RasterWriter
 from enmapboxprocessing.utils import Utils
-from qgis.core import (QgsProcessingContext, QgsProcessingFeedback, QgsProcessing)
+from qgis.core import (QgsProcessingContext, QgsProcessingFeedback, QgsProcessing, QgsProcessingException)
 from enmapbox.typeguard import typechecked
 
 
@@ -32,7 +32,8 @@ class StackRasterLayersAlgorithm(EnMAPProcessingAlgorithm):
         return [
             (self._RASTERS, 'Source raster layers.'),
             (self._GRID, 'Reference grid specifying the destination extent, pixel size and projection. '
-                         'If not defined, gdal.BuildVrt defaults are used.'),
+                         'If not defined, gdal.BuildVrt defaults are used. '
+                         'In that case, all raster layers must have the same CRS.'),
             (self._BAND, 'Specify a band number used for stacking, instead of using all bands.'),
             (self._OUTPUT_RASTER, self.RasterFileDestination)
         ]
@@ -58,40 +59,94 @@ class StackRasterLayersAlgorithm(EnMAPProcessingAlgorithm):
             feedback, feedback2 = self.createLoggingFeedback(feedback, logfile)
             self.tic(feedback, parameters, context)
 
-            # translate into grid and split into individual bands (required for gdal.BuildVrt)
-            filenames = list()
+            # derive destination grid
+            if grid is None:
+                # sources are not warped, so they must share the CRS
+                for raster in rasters[1:]:
+                    if raster.crs() != rasters[0].crs():
+                        raise QgsProcessingException(
+                            f'Raster layers have different CRS, specify a grid: {raster.source()}'
+                        )
+
+                # use gdal.BuildVrt defaults (union extent and average resolution)
+                sources = [RasterReader(raster).gdalDataset for raster in rasters]
+                ds: gdal.Dataset = gdal.BuildVRT('', sources, options=gdal.BuildVRTOptions(separate=True))
+                geoTransform = ds.GetGeoTransform()
+                width, height, projection = ds.RasterXSize, ds.RasterYSize, ds.GetProjection()
+                del ds
+            else:
+                extent = grid.extent()
+                geoTransform = (
+                    extent.xMinimum(), grid.rasterUnitsPerPixelX(), 0., extent.yMaximum(), 0.,
+                    -grid.rasterUnitsPerPixelY()
+                )
+                width, height, projection = grid.width(), grid.height(), grid.crs().toWkt()
+
+            # stack bands, with one simple source per band
+            ds: gdal.Dataset = gdal.GetDriverByName(self.VrtFormat).Create(filename, width, height, 0)
+            ds.SetGeoTransform(geoTransform)
+            ds.SetProjection(projection)
             bandNames = list()
-            bandNo = 1
-            for raster in rasters:
+            noDataValues = list()
+            scales = list()
+            offsets = list()
+            for i, raster in enumerate(rasters):
                 reader = RasterReader(raster)
 
                 if band is None:
-                    bandNumbers = reader.bandNumbers()
+                    bandNumbers = list(reader.bandNumbers())
                 else:
                     bandNumbers = [band]
 
+                # align into grid once per raster, warp only if CRS differs
+                if grid is not None and raster.crs() != grid.crs():
+                    source: gdal.Dataset = gdal.Warp(
+                        Utils.tmpFilename(filename, f'raster {i + 1}.vrt'), reader.gdalDataset,
+                        options=gdal.WarpOptions(
+                            format=self.VrtFormat, width=width, height=height, dstSRS=projection,
+                            outputBounds=(extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum())
+                        )
+                    )
+                else:
+                    source = reader.gdalDataset
+                xOff, yOff, xSize, ySize = self.destinationWindow(source, geoTransform)
+
                 for ibandNo in bandNumbers:
-                    alg = TranslateRasterAlgorithm()
-                    parameters = {
-                        alg.P_RASTER: raster,
-                        alg.P_GRID: grid,
-                        alg.P_BAND_LIST: [ibandNo],
-                        alg.P_CREATION_PROFILE: self.DefaultVrtCreationProfile,
-                        alg.P_OUTPUT_RASTER: Utils.tmpFilename(filename, f'band {bandNo}.vrt')
-                    }
-                    self.runAlg(alg, parameters, None, feedback2, context, True)
-                    filenames.append(parameters[alg.P_OUTPUT_RASTER])
+                    sourceBand: gdal.Band = source.GetRasterBand(ibandNo)
+                    ds.AddBand(sourceBand.DataType)
+                    xml = '<SimpleSource>' \
+                          f'<SourceFilename relativeToVRT="0">{escape(source.GetDescription())}</SourceFilename>' \
+                          f'<SourceBand>{ibandNo}</SourceBand>' \
+                          f'<SrcRect xOff="0" yOff="0" xSize="{source.RasterXSize}" ySize="{source.RasterYSize}"/>' \
+                          f'<DstRect xOff="{xOff}" yOff="{yOff}" xSize="{xSize}" ySize="{ySize}"/>' \
+                          '</SimpleSource>'
+                    ds.GetRasterBand(ds.RasterCount).SetMetadataItem('source_0', xml, 'new_vrt_sources')
                     bandNames.append(reader.bandName(ibandNo))
-                    bandNo += 1
+                    noDataValues.append(sourceBand.GetNoDataValue())
+                    scales.append(reader.scale(ibandNo))
+                    offsets.append(reader.offset(ibandNo))
 
-            # stack bands
-            options = gdal.BuildVRTOptions(separate=True)
-            ds: gdal.Dataset = gdal.BuildVRT(filename, filenames, options=options)
             writer = RasterWriter(ds)
-            for bandNo, bandName in enumerate(bandNames, 1):
+            for bandNo, (bandName, noDataValue, scale, offset) in enumerate(
+                    zip(bandNames, noDataValues, scales, offsets), 1
+            ):
                 writer.setBandName(bandName, bandNo)
+                writer.setNoDataValue(noDataValue, bandNo)
+                writer.setScale(scale, bandNo)
+                writer.setOffset(offset, bandNo)
+            writer.close()
 
             result = {self.P_OUTPUT_RASTER: filename}
             self.toc(feedback, result)
 
         return result
+
+    @staticmethod
+    def destinationWindow(source: gdal.Dataset, geoTransform: Tuple[float, ...]) -> Tuple[float, float, float, float]:
+        """Return window (xOff, yOff, xSize, ySize) of the source raster inside the destination grid."""
+        sourceGeoTransform = source.GetGeoTransform()
+        xOff = (sourceGeoTransform[0] - geoTransform[0]) / geoTransform[1]
+        yOff = (sourceGeoTransform[3] - geoTransform[3]) / geoTransform[5]
+        xSize = source.RasterXSize * sourceGeoTransform[1] / geoTransform[1]
+        ySize = source.RasterYSize * sourceGeoTransform[5] / geoTransform[5]
+        return xOff, yOff, xSize, ySize
@@ -0,0 +1,101 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from multiprocessing import cpu_count
+from typing import Callable, Iterable, Any, Deque, Tuple
+
+from enmapbox.typeguard import typechecked
+from qgis.core import QgsProcessingFeedback, QgsProcessingException
+
+
+@typechecked
+class BlockExecutor(object):
+    """
+    Block-wise executor with optional multi-threaded computation.
+
+    Reading and writing are always done in the calling thread, because GDAL datasets and QGIS data providers are not
+    thread-safe. Only the compute step is distributed to a thread pool.
+    Numpy and most estimators release the GIL, so threads scale well and compute can be a closure.
+    Results are written in block order, so a single RasterWriter can be used safely.
+    The number of blocks held in memory at the same time is bounded by maxInFlight.
+
+    Worker count follows the convention of the legacy applier:
+    None or 1 means serial execution, -1 means one worker per CPU core.
+    """
+
+    def __init__(self, workerCount: int = None, maxInFlight: int = None, feedback: QgsProcessingFeedback = None):
+        if workerCount == -1:
+            workerCount = cpu_count()
+        if workerCount is None or workerCount < 1:
+            workerCount = 1
+        if maxInFlight is None:
+            maxInFlight = 2 * workerCount
+        self.workerCount = workerCount
+        self.maxInFlight = max(1, maxInFlight)
+        self.feedback = feedback
+
+    def isParallel(self) -> bool:
+        return self.workerCount > 1
+
+    def run(
+            self, blocks: Iterable[Any], read: Callable[[Any], Any],
+            compute: Callable[[Any], Any], write: Callable[[Any, Any], None]
+    ) -> int:
+        """
+        Process all blocks and return the number of processed blocks.
+
+        For each block, read(block) returns the input data, compute(data) returns the result and
+        write(block, result) stores the result.
+        A block is usually a RasterBlockInfo, but can be any object, e.g. a (block, bandList) tuple,
+        if read and write need additional per-block information.
+        """
+        blocks = list(blocks)
+        if self.isParallel():
+            return self._runParallel(blocks, read, compute, write)
+        else:
+            return self._runSerial(blocks, read, compute, write)
+
+    def _runSerial(self, blocks, read, compute, write) -> int:
+        for i, block in enumerate(blocks):
+            self._checkCanceled()
+            write(block, compute(read(block)))
+            self._setProgress(i + 1, len(blocks))
+        return len(blocks)
+
+    def _runParallel(self, blocks, read, compute, write) -> int:
+        pool = ThreadPoolExecutor(max_workers=self.workerCount)
+        inFlight: Deque[Tuple[Any, Future]] = deque()
+        written = 0
+        try:
+            for block in blocks:
+                self._checkCanceled()
+                if len(inFlight) >= self.maxInFlight:
+                    written += self._writeNext(inFlight, write)
+                    self._setProgress(written, len(blocks))
+                inFlight.append((block, pool.submit(compute, read(block))))
+
+            while len(inFlight) > 0:
+                self._checkCanceled()
+                written += self._writeNext(inFlight, write)
+                self._setProgress(written, len(blocks))
+        except BaseException:
+            for block, future in inFlight:
+                future.cancel()
+            raise
+        finally:
+            pool.shutdown(wait=True)
+
+        return written
+
+    @staticmethod
+    def _writeNext(inFlight: Deque[Tuple[Any, Future]], write: Callable) -> int:
+        block, future = inFlight.popleft()
+        write(block, future.result())
+        return 1
+
+    def _checkCanceled(self):
+        if self.feedback is not None and self.feedback.isCanceled():
+            raise QgsProcessingException()
+
+    def _setProgress(self, i: int, n: int):
+        if self.feedback is not None:
+            self.feedback.setProgress(i / n * 100)
@@ -1,4 +1,5 @@
 import traceback
+from contextlib import contextmanager
 from enum import Enum
 from math import nan
 from os import makedirs
@@ -13,8 +14,10 @@ import processing
 from enmapbox.typeguard import typechecked
 from enmapboxprocessing.driver import Driver
 from enmapboxprocessing.glossary import injectGlossaryLinks
+from enmapboxprocessing.modelartifact import ModelArtifact
 from enmapboxprocessing.parameter.processingparameterrasterdestination import ProcessingParameterRasterDestination
 from enmapboxprocessing.processingfeedback import ProcessingFeedback
+from enmapboxprocessing.profiler import Profiler
 from enmapboxprocessing.typing import CreationOptions, GdalResamplingAlgorithm, ClassifierDump, \
     TransformerDump, RegressorDump, ClustererDump
 from enmapboxprocessing.utils import Utils
@@ -226,23 +229,26 @@ class EnMAPProcessingAlgorithm(QgsProcessingAlgorithm):
         return filename
 
     def parameterAsClassifierDump(
-            self, parameters: Dict[str, Any], name: str, context: QgsProcessingContext
+            self, parameters: Dict[str, Any], name: str, context: QgsProcessingContext, loadSample=True
     ) -> Optional[ClassifierDump]:
+        """Return classifier dump. If loadSample is False, the training sample (X and y) is not loaded."""
         filename = super().parameterAsFile(parameters, name, context)
         if filename == '':
             return None
-        dump = Utils.pickleLoad(filename)
+        dump = ModelArtifact.read(filename, None if loadSample else ['classifier'])
         dump = ClassifierDump.fromDict(dump)
         return dump
 
     def parameterAsRegressorDump(
             self, parameters: Dict[str, Any], name: str, context: QgsProcessingContext,
-            optionalTargets=False, optionalFeatures=False, optionalX=False, optionalY=False, optionalRegressor=True
+            optionalTargets=False, optionalFeatures=False, optionalX=False, optionalY=False, optionalRegressor=True,
+            loadSample=True
     ) -> Optional[RegressorDump]:
+        """Return regressor dump. If loadSample is False, the training sample (X and y) is not loaded."""
         filename = super().parameterAsFile(parameters, name, context)
         if filename == '':
             return None
-        dump = Utils.pickleLoad(filename)
+        dump = ModelArtifact.read(filename, None if loadSample else ['regressor'])
         try:
             dump = RegressorDump.fromDict(dump)
         except Exception:
@@ -253,7 +259,7 @@ class EnMAPProcessingAlgorithm(QgsProcessingAlgorithm):
             ('targets', optionalTargets), ('features', optionalFeatures), ('X', optionalX), ('y', optionalY),
             ('regressor', optionalRegressor)
         ]:
-            if optional:
+            if optional or (not loadSample and attr in ['X', 'y']):
                 continue
             if getattr(dump, attr) is None:
                 raise QgsProcessingException(f'Not a valid regression dataset, missing attribute "{attr}": {filename}')
@@ -1005,13 +1011,50 @@ class EnMAPProcessingAlgorithm(QgsProcessingAlgorithm):
 
     def tic(self, feedback: ProcessingFeedback, parameters: Dict[str, Any], context: QgsProcessingContext):
         self._startTime = time()
+        self._profiler = Profiler(self.id())
+        self._profiler.start()
 
     def toc(self, feedback: ProcessingFeedback, result: Dict):
+        profiler: Optional[Profiler] = getattr(self, '_profiler', None)
+        if profiler is not None:
+            profiler.stop()
+            for line in profiler.summary():
+                feedback.log(line)
+            logfile = feedback.logfile()
+            if logfile is not None and hasattr(logfile, 'name'):
+                profiler.writeJson(self.profileFilename(logfile.name))
         feedback.pushTiming(time() - self._startTime)
 
+    @staticmethod
+    def profileFilename(logFilename: str) -> str:
+        """Return the filename of the JSON profile written next to the log file."""
+        return splitext(logFilename)[0] + '.profile.json'
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Context manager measuring the wall time of a named stage inside processAlgorithm, e.g.:
+
+            with self.stage('predict'):
+                ...
+
+        Stage timings are summarized in the log and written to the JSON profile.
+        """
+        profiler: Optional[Profiler] = getattr(self, '_profiler', None)
+        if profiler is None:
+            yield
+        else:
+            with profiler.stage(name):
+                yield
+
     @staticmethod
     def runAlg(algOrName, parameters, onFinish=None, feedback=None, context=None, is_child_algorithm=False) -> Dict:
-        return processing.run(algOrName, parameters, onFinish, feedback, context, is_child_algorithm)
+        profiler = Profiler.current()
+        if profiler is None:
+            return processing.run(algOrName, parameters, onFinish, feedback, context, is_child_algorithm)
+        name = algOrName if isinstance(algOrName, str) else algOrName.id()
+        with profiler.child(name):
+            return processing.run(algOrName, parameters, onFinish, feedback, context, is_child_algorithm)
 
 
 class Group(Enum):
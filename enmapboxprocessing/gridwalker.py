@@ -1,3 +1,6 @@
+from math import sqrt, gcd
+from typing import List, Tuple
+
 from enmapboxprocessing.extentwalker import ExtentWalker
 from qgis.core import QgsRectangle, QgsProcessingFeedback
 from enmapbox.typeguard import typechecked
@@ -13,3 +16,49 @@ class GridWalker(ExtentWalker):
         blockSizeX = float(blockSizeX * pixelSizeX)
         blockSizeY = float(blockSizeY * pixelSizeY)
         super().__init__(extent, blockSizeX, blockSizeY, feedback)
+
+    @staticmethod
+    def planBlockSize(
+            width: int, height: int, pixelMemoryUsage: int, maximumMemoryUsage: int,
+            naturalBlockSizes: List[Tuple[int, int]] = None
+    ) -> Tuple[int, int]:
+        """
+        Return block size (x, y) that fits into the given memory budget and is aligned to the natural block sizes.
+
+        The pixel memory usage should cover all inputs, outputs and temporary arrays per pixel.
+        Untiled (strip) layouts result in full-width blocks with a height aligned to the strip height.
+        Tiled layouts result in full-width rows of tiles, if a single row of tiles fits into memory,
+        and in square-ish blocks of whole tiles otherwise.
+        """
+        if naturalBlockSizes is None:
+            naturalBlockSizes = []
+
+        # align to all natural block sizes (least common multiple)
+        tileX = tileY = 1
+        for naturalX, naturalY in naturalBlockSizes:
+            tileX = tileX * max(1, naturalX) // gcd(tileX, max(1, naturalX))
+            tileY = tileY * max(1, naturalY) // gcd(tileY, max(1, naturalY))
+        tileX = min(tileX, width)
+        tileY = min(tileY, height)
+
+        budget = max(1, maximumMemoryUsage // max(1, pixelMemoryUsage))  # in pixel
+        if tileX == width or width * tileY <= budget:
+            # full-width blocks, aligned to the strip or tile height
+            blockSizeX = width
+            blockSizeY = max(1, budget // width)
+            if blockSizeY >= tileY:
+                blockSizeY = blockSizeY // tileY * tileY
+        else:
+            nTiles = budget // (tileX * tileY)
+            if nTiles >= 1:
+                # square-ish blocks of whole tiles
+                nTilesY = max(1, int(sqrt(nTiles)))
+                nTilesX = max(1, nTiles // nTilesY)
+                blockSizeX = nTilesX * tileX
+                blockSizeY = nTilesY * tileY
+            else:
+                # not even a single tile fits, use a square-ish sub-tile block
+                blockSizeX = max(1, min(tileX, int(sqrt(budget))))
+                blockSizeY = max(1, min(tileY, budget // blockSizeX))
+
+        return min(blockSizeX, width), min(blockSizeY, height)
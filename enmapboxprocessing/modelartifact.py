@@ -0,0 +1,173 @@
+import pickle
+from io import BytesIO
+from os.path import abspath
+from typing import Dict, Any, List, Optional, BinaryIO
+
+import numpy as np
+
+from enmapbox.typeguard import typechecked
+
+
+@typechecked
+class ModelArtifact(object):
+    """
+    Lean model file format for classifier, regressor, transformer and clusterer dumps.
+
+    The file is a sequence of members:
+      1. a pickled magic string identifying the format,
+      2. a pickled header with all metadata (e.g. categories, features or targets) and a member table,
+      3. the pickled estimator,
+      4. sample arrays (e.g. X and y) in .npy format, which can be memory-mapped.
+
+    Because the file starts with a valid pickle, it keeps the ".pkl" extension.
+    Readers only load the members they need: the header for the GUI, the estimator for prediction and
+    the sample arrays for refitting.
+    Plain pickle files of earlier versions are still supported by all readers.
+    """
+    Magic = 'EnMAP-Box model artifact'
+    Version = 1
+    Protocol = 4
+    EstimatorKeys = ['classifier', 'regressor', 'transformer', 'clusterer']
+    PickleMember = 'pickle'
+    NpyMember = 'npy'
+
+    @classmethod
+    def magicBytes(cls) -> bytes:
+        return pickle.dumps(cls.Magic, protocol=cls.Protocol)
+
+    @classmethod
+    def isModelArtifact(cls, filename: str) -> bool:
+        """Return whether the file is a model artifact. Only the first few bytes are read."""
+        magicBytes = cls.magicBytes()
+        try:
+            with open(filename, 'rb') as file:
+                return file.read(len(magicBytes)) == magicBytes
+        except OSError:
+            return False
+
+    @classmethod
+    def write(cls, obj: Dict[str, Any], filename: str):
+        """Write dump dictionary, storing estimators and arrays as separate members."""
+        metadata = dict()
+        members = dict()
+        for key, value in obj.items():
+            if key in cls.EstimatorKeys and value is not None:
+                members[key] = pickle.dumps(value, protocol=cls.Protocol)
+            elif isinstance(value, np.ndarray) and value.dtype != object:
+                if isinstance(value, np.memmap) and value.filename == abspath(filename):
+                    value = np.array(value)  # array is mapped from the file we are about to overwrite
+                members[key] = value
+            else:
+                metadata[key] = value
+
+        # offsets are relative to the end of the header
+        memberTable = dict()
+        offset = 0
+        for key, value in members.items():
+            if isinstance(value, bytes):
+                memberTable[key] = {'type': cls.PickleMember, 'offset': offset, 'size': len(value)}
+                offset += len(value)
+            else:
+                size = len(cls._npyHeader(value)) + value.nbytes
+                memberTable[key] = {
+                    'type': cls.NpyMember, 'offset': offset, 'size': size, 'shape': value.shape,
+                    'dtype': value.dtype.str
+                }
+                offset += size
+        header = {'version': cls.Version, 'metadata': metadata, 'members': memberTable}
+
+        with open(filename, 'wb') as file:
+            file.write(cls.magicBytes())
+            pickle.dump(header, file, protocol=cls.Protocol)
+            for key, value in members.items():
+                if isinstance(value, bytes):
+                    file.write(value)
+                else:
+                    file.write(cls._npyHeader(value))
+                    file.write(np.ascontiguousarray(value).tobytes())
+
+    @classmethod
+    def read(cls, filename: str, members: List[str] = None, mmap=True) -> Dict[str, Any]:
+        """
+        Return dump dictionary.
+
+        Only the given members (e.g. ['classifier'] for prediction) are loaded, all other members are set to None.
+        By default, all members are loaded. Arrays are memory-mapped (copy-on-write), if mmap is True.
+        Plain pickle files are loaded completely.
+        """
+        if not cls.isModelArtifact(filename):
+            with open(filename, 'rb') as file:
+                obj = pickle.load(file)
+            if members is not None and isinstance(obj, dict):
+                for key, value in obj.items():
+                    if key in cls.EstimatorKeys or isinstance(value, np.ndarray):
+                        if key not in members:
+                            obj[key] = None
+            return obj
+
+        with open(filename, 'rb') as file:
+            header = cls._readHeader(file)
+            start = file.tell()
+            obj = dict(header['metadata'])
+            for key, info in header['members'].items():
+                if members is not None and key not in members:
+                    obj[key] = None
+                    continue
+                if info['type'] == cls.PickleMember:
+                    file.seek(start + info['offset'])
+                    obj[key] = pickle.loads(file.read(info['size']))
+                elif info['type'] == cls.NpyMember:
+                    obj[key] = cls._readArray(file, filename, start + info['offset'], mmap)
+                else:
+                    raise ValueError(f'unknown member type: {info["type"]}')
+        return obj
+
+    @classmethod
+    def readMetadata(cls, filename: str) -> Dict[str, Any]:
+        """
+        Return dump dictionary without loading estimators and arrays, which are replaced by short descriptions.
+        Plain pickle files are loaded completely.
+        """
+        if not cls.isModelArtifact(filename):
+            return cls.read(filename)
+
+        with open(filename, 'rb') as file:
+            header = cls._readHeader(file)
+        obj = dict(header['metadata'])
+        for key, info in header['members'].items():
+            if info['type'] == cls.NpyMember:
+                obj[key] = f'array{list(info["shape"])} ({np.dtype(info["dtype"]).name})'
+            else:
+                obj[key] = f'{key} ({info["size"]} bytes, not loaded)'
+        return obj
+
+    @classmethod
+    def _readHeader(cls, file: BinaryIO) -> Dict[str, Any]:
+        if pickle.load(file) != cls.Magic:
+            raise ValueError(f'not a model artifact: {file.name}')
+        header = pickle.load(file)
+        if header['version'] > cls.Version:
+            raise ValueError(f'unsupported model artifact version: {header["version"]}')
+        return header
+
+    @staticmethod
+    def _npyHeader(array: np.ndarray) -> bytes:
+        header = {'descr': np.lib.format.dtype_to_descr(array.dtype), 'fortran_order': False, 'shape': array.shape}
+        buffer = BytesIO()
+        np.lib.format.write_array_header_2_0(buffer, header)  # includes the magic string
+        return buffer.getvalue()
+
+    @staticmethod
+    def _readArray(file: BinaryIO, filename: str, offset: int, mmap: bool) -> Optional[np.ndarray]:
+        file.seek(offset)
+        version = np.lib.format.read_magic(file)
+        if version != (2, 0):
+            raise ValueError(f'unsupported npy format version: {version}')
+        shape, fortranOrder, dtype = np.lib.format.read_array_header_2_0(file)
+        if mmap:
+            if np.prod(shape) == 0:
+                return np.empty(shape, dtype)
+            return np.memmap(filename, dtype, 'c', file.tell(), shape, 'F' if fortranOrder else 'C')
+        count = int(np.prod(shape))
+        array = np.fromfile(file, dtype, count)
+        return array.reshape(shape, order='F' if fortranOrder else 'C')
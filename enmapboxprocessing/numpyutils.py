@@ -67,3 +67,48 @@ class NumpyUtils(object):
         assert a.ndim == 2
         shape_ = shape[0], a.shape[0] // shape[0], shape[1], a.shape[1] // shape[1]
         return a.reshape(shape_).sum(-1).sum(1)
+
+    @staticmethod
+    def upperConvexHull(profiles: np.ndarray, xValues: np.ndarray) -> np.ndarray:
+        """
+        Return the upper convex hull of each profile, evaluated at all x values.
+
+        Profiles are given as rows of a 2d array and x values must be strictly increasing.
+        Hull vertices are found with Andrew's monotone chain algorithm, which is vectorized over all profiles,
+        i.e. the loop runs over the x values only.
+        """
+        assert profiles.ndim == 2
+        y = np.asarray(profiles, dtype=np.float64)
+        x = np.asarray(xValues, dtype=np.float64)
+        n, m = y.shape
+        assert len(x) == m
+        rows = np.arange(n)
+
+        # build the upper hull of all profiles point by point; stack holds the hull vertex indices of each profile
+        stack = np.zeros((n, m), np.int64)
+        top = np.zeros(n, np.int64)  # number of hull vertices
+        for i in range(m):
+            candidates = rows[top >= 2]
+            while len(candidates) > 0:
+                a = stack[candidates, top[candidates] - 2]
+                b = stack[candidates, top[candidates] - 1]
+                ya = y[candidates, a]
+                cross = (x[b] - x[a]) * (y[candidates, i] - ya) - (y[candidates, b] - ya) * (x[i] - x[a])
+                candidates = candidates[cross >= 0]  # no clockwise turn: last vertex is not on the upper hull
+                top[candidates] -= 1
+                candidates = candidates[top[candidates] >= 2]
+            stack[rows, top] = i
+            top += 1
+
+        # interpolate linearly between the left and right hull vertex of each x value
+        isVertex = np.zeros((n, m), bool)
+        valid = np.arange(m)[None] < top[:, None]
+        isVertex[np.broadcast_to(rows[:, None], (n, m))[valid], stack[valid]] = True
+        indices = np.broadcast_to(np.arange(m), (n, m))
+        left = np.maximum.accumulate(np.where(isVertex, indices, 0), axis=1)
+        right = np.minimum.accumulate(np.where(isVertex, indices, m - 1)[:, ::-1], axis=1)[:, ::-1]
+        yLeft = np.take_along_axis(y, left, 1)
+        yRight = np.take_along_axis(y, right, 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.where(right > left, (x[None] - x[left]) / (x[right] - x[left]), 0.)
+        return yLeft + weight * (yRight - yLeft)
@@ -0,0 +1,75 @@
+from glob import glob
+from os import environ, remove, rmdir, listdir
+from os.path import splitext, dirname, exists, isdir, join, basename
+from shutil import rmtree
+from typing import List
+
+from enmapboxprocessing.utils import Utils
+from enmapbox.typeguard import typechecked
+
+
+@typechecked
+class Pipeline(object):
+    """
+    Intermediate data management for composite algorithms.
+
+    Composite algorithms request the filenames of their intermediates from the pipeline.
+    Intermediates should be lazy (e.g. VRT) wherever possible; stages that can be fused should exchange numpy blocks
+    or GDAL MEM datasets directly and never touch the disk.
+    Materialised intermediates are written into the _temp_ folder next to the final output
+    and are deleted when the pipeline is closed, so only the final output remains.
+
+    Set keepIntermediates to True, or the ENMAPBOX_KEEP_INTERMEDIATES environment variable to 1, to keep all
+    intermediates for debugging.
+    """
+    KeepIntermediatesVariable = 'ENMAPBOX_KEEP_INTERMEDIATES'
+
+    def __init__(self, filename: str, keepIntermediates: bool = None):
+        if keepIntermediates is None:
+            keepIntermediates = self.keepIntermediatesDefault()
+        self.filename = filename
+        self.keepIntermediates = keepIntermediates
+        self.filenames: List[str] = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @classmethod
+    def keepIntermediatesDefault(cls) -> bool:
+        return environ.get(cls.KeepIntermediatesVariable, '0').lower() not in ['', '0', 'false', 'no']
+
+    def intermediateFilename(self, basename_: str) -> str:
+        """Return filename for an intermediate. Use a .vrt extension for lazy raster intermediates."""
+        filename = Utils.tmpFilename(self.filename, basename_)
+        self.filenames.append(filename)
+        return filename
+
+    def close(self):
+        """Delete all intermediates (including sidecar files and temp folders of child algorithms), unless kept."""
+        if self.keepIntermediates:
+            return
+        tmpDirnames = set()
+        for filename in self.filenames:
+            tmpDirnames.add(dirname(filename))
+            sidecars = glob(filename + '*') + glob(splitext(filename)[0] + '.*')
+            sidecars.append(join(dirname(filename), f'_temp_{basename(filename)}'))  # temp folder of child algorithm
+            for sidecar in set(sidecars):
+                if not exists(sidecar):
+                    continue
+                try:
+                    if isdir(sidecar):
+                        rmtree(sidecar)
+                    else:
+                        remove(sidecar)
+                except OSError:
+                    pass  # file may still be opened (e.g. on Windows), just leave it
+        for tmpDirname in tmpDirnames:
+            try:
+                if exists(tmpDirname) and len(listdir(tmpDirname)) == 0:
+                    rmdir(tmpDirname)
+            except OSError:
+                pass
+        self.filenames.clear()
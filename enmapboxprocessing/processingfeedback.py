@@ -1,4 +1,4 @@
-from typing import TextIO
+from typing import TextIO, Optional
 
 from qgis.core import QgsProcessingFeedback
 from enmapbox.typeguard import typechecked
@@ -90,6 +90,11 @@ class ProcessingFeedback(QgsProcessingFeedback):
         if not self._isChildFeedback:
             self.pushInfo(f'Execution completed in {round(seconds, 2)} seconds')
 
+    def logfile(self) -> Optional[TextIO]:
+        if self._logfile is None and isinstance(self.feedback, ProcessingFeedback):
+            return self.feedback.logfile()
+        return self._logfile
+
     def log(self, info: str):
         if self._logfile is not None:
             print(info, file=self._logfile)
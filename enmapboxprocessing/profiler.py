@@ -0,0 +1,191 @@
+import json
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock, local
+from time import perf_counter, time
+from typing import Dict, Any, List, Optional
+
+from enmapbox.typeguard import typechecked
+
+
+@typechecked
+class Profiler(object):
+    """
+    Per-run instrumentation of processing algorithms.
+
+    Collects wall time of named stages, bytes and time spent reading and writing raster data,
+    the number of processed blocks and timings of child algorithms.
+
+    Profilers are kept on a per-thread stack of active profilers. RasterReader and RasterWriter report their I/O to
+    all active profilers of the calling thread, so the counters of a parent algorithm include the I/O of its child
+    algorithms, while algorithms running concurrently in different threads do not interfere.
+    """
+    _threadState = local()
+
+    def __init__(self, name: str = None):
+        self.name = name
+        self.stages: Dict[str, Dict[str, float]] = OrderedDict()
+        self.children: List[Dict[str, Any]] = list()
+        self.bytesRead = 0
+        self.bytesWritten = 0
+        self.secondsRead = 0.
+        self.secondsWritten = 0.
+        self.blockCount = 0
+        self.startTime: Optional[float] = None
+        self.seconds: Optional[float] = None
+        self._startCounter: Optional[float] = None
+        self._threadLocal = local()  # stage nesting is tracked per thread
+        self._openChildren: List[Dict[str, Any]] = list()
+        self._lock = Lock()
+
+    @classmethod
+    def _active(cls) -> List['Profiler']:
+        if not hasattr(cls._threadState, 'active'):
+            cls._threadState.active = list()
+        return cls._threadState.active
+
+    @classmethod
+    def current(cls) -> Optional['Profiler']:
+        """Return the innermost active profiler."""
+        active = cls._active()
+        if len(active) == 0:
+            return None
+        return active[-1]
+
+    def start(self):
+        """Start profiling and make the profiler active."""
+        self.startTime = time()
+        self._startCounter = perf_counter()
+        active = self._active()
+        if len(active) > 0 and len(active[-1]._openChildren) == 0:
+            active.clear()  # not started as a child algorithm, so remaining profilers are left over from failed runs
+        active.append(self)
+
+    def stop(self):
+        """Stop profiling and deactivate the profiler (and all profilers that were left active above it)."""
+        self.seconds = perf_counter() - self._startCounter
+        active = self._active()
+        if self in active:
+            del active[active.index(self):]
+        if len(active) > 0 and len(active[-1]._openChildren) > 0:
+            active[-1]._openChildren[-1]['profile'] = self.toDict()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Context manager measuring the wall time of a named stage. Nested stage names are joined by '/'.
+        Stages may be used from worker threads; the reported time is then summed over all threads.
+        """
+        if not hasattr(self._threadLocal, 'stageNames'):
+            self._threadLocal.stageNames = list()
+        stageNames: List[str] = self._threadLocal.stageNames
+        stageNames.append(name)
+        key = '/'.join(stageNames)
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - t0
+            stageNames.pop()
+            with self._lock:
+                stage = self.stages.setdefault(key, {'seconds': 0., 'calls': 0})
+                stage['seconds'] += seconds
+                stage['calls'] += 1
+
+    @contextmanager
+    def child(self, name: str):
+        """Context manager measuring the wall time of a child algorithm."""
+        entry = {'algorithm': name, 'seconds': None}
+        self._openChildren.append(entry)
+        t0 = perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['seconds'] = perf_counter() - t0
+            self._openChildren.remove(entry)
+            self.children.append(entry)
+            active = self._active()  # remove profilers of child algorithms that failed before stopping
+            if self in active:
+                del active[active.index(self) + 1:]
+
+    def addRead(self, nbytes: int, seconds: float):
+        with self._lock:
+            self.bytesRead += nbytes
+            self.secondsRead += seconds
+
+    def addWritten(self, nbytes: int, seconds: float):
+        with self._lock:
+            self.bytesWritten += nbytes
+            self.secondsWritten += seconds
+
+    def addBlocks(self, n: int = 1):
+        with self._lock:
+            self.blockCount += n
+
+    @classmethod
+    def accountRead(cls, nbytes: int, seconds: float):
+        """Report bytes read to all active profilers."""
+        for profiler in cls._active():
+            profiler.addRead(nbytes, seconds)
+
+    @classmethod
+    def accountWritten(cls, nbytes: int, seconds: float):
+        """Report bytes written to all active profilers."""
+        for profiler in cls._active():
+            profiler.addWritten(nbytes, seconds)
+
+    @classmethod
+    def accountBlocks(cls, n: int = 1):
+        """Report processed blocks to all active profilers."""
+        for profiler in cls._active():
+            profiler.addBlocks(n)
+
+    @staticmethod
+    def peakMemoryUsage() -> Optional[int]:
+        """Return peak resident set size (in bytes) of the process, or None, if not available on this platform."""
+        try:
+            import resource
+        except ImportError:  # e.g. on Windows
+            return None
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            return int(maxrss)  # bytes
+        return int(maxrss) * 1024  # kilobytes
+
+    def toDict(self) -> Dict[str, Any]:
+        return OrderedDict([
+            ('algorithm', self.name),
+            ('startTime', self.startTime),
+            ('seconds', self.seconds),
+            ('stages', self.stages),
+            ('read', {'bytes': self.bytesRead, 'seconds': self.secondsRead}),
+            ('written', {'bytes': self.bytesWritten, 'seconds': self.secondsWritten}),
+            ('blocks', self.blockCount),
+            ('peakMemoryUsage', self.peakMemoryUsage()),
+            ('children', self.children)
+        ])
+
+    def writeJson(self, filename: str):
+        with open(filename, 'w') as file:
+            json.dump(self.toDict(), file, indent=2)
+
+    def summary(self) -> List[str]:
+        """Return a human-readable summary."""
+        mb = 2 ** 20
+        lines = ['Profile:']
+        for name, stage in self.stages.items():
+            lines.append(f'  stage {name}: {round(stage["seconds"], 2)} seconds ({stage["calls"]} calls)')
+        lines.append(
+            f'  read: {round(self.bytesRead / mb, 2)} MB in {round(self.secondsRead, 2)} seconds'
+        )
+        lines.append(
+            f'  written: {round(self.bytesWritten / mb, 2)} MB in {round(self.secondsWritten, 2)} seconds'
+        )
+        lines.append(f'  blocks: {self.blockCount}')
+        for child in self.children:
+            lines.append(f'  child algorithm {child["algorithm"]}: {round(child["seconds"], 2)} seconds')
+        peakMemoryUsage = self.peakMemoryUsage()
+        if peakMemoryUsage is not None:
+            lines.append(f'  peak memory usage: {round(peakMemoryUsage / mb, 2)} MB')
+        return lines
@@ -1,5 +1,7 @@
-from math import isnan
-from typing import Iterable, List, Union, Optional, Tuple, Iterator
+from functools import partial
+from math import isnan, nan
+from time import perf_counter
+from typing import Iterable, List, Union, Optional, Tuple, Iterator, Dict, Any
 
 import numpy as np
 from osgeo import gdal
@@ -9,7 +11,9 @@ from enmapbox.qgispluginsupport.qps.utils import SpatialPoint
 from enmapbox.typeguard import typechecked
 from enmapboxprocessing.gridwalker import GridWalker
 from enmapboxprocessing.numpyutils import NumpyUtils
+from enmapboxprocessing.profiler import Profiler
 from enmapboxprocessing.rasterblockinfo import RasterBlockInfo
+from enmapboxprocessing.rasterwriter import RasterWriter
 from enmapboxprocessing.typing import RasterSource, Array3d, Metadata, MetadataValue, MetadataDomain, Array2d
 from enmapboxprocessing.utils import Utils
 from qgis.PyQt.QtCore import QSizeF, QDateTime, QDate, QPoint
@@ -24,6 +28,13 @@ from qgis.core import (QgsRasterLayer, QgsRasterDataProvider, QgsCoordinateRefer
 class RasterReader(object):
     Nanometers = 'Nanometers'
     Micrometers = 'Micrometers'
+    WavelengthKeys = [
+        'wavelength',
+        'Wavelength'  # support for FORCE BOA files
+    ]
+
+    # lazily build band metadata indices by layer id, shared by all readers of a layer, see _metadataIndex()
+    _metadataIndexCaches: Dict[str, Dict[str, Any]] = dict()
 
     def __init__(self, source: RasterSource, openWithGdal: bool = True):
 
@@ -53,6 +64,8 @@ class RasterReader(object):
         self.gdalDataset = gdalDataset
         assert self.gdalDataset is not None
 
+        self._metadataWarnings = set()
+
     def bandCount(self) -> int:
         """Return iterator over all band numbers."""
         return self.provider.bandCount()
@@ -168,6 +181,28 @@ class RasterReader(object):
         """Return pixel resolution."""
         return QSizeF(self.rasterUnitsPerPixelX(), self.rasterUnitsPerPixelY())
 
+    def gdalBlockSize(self, bandNo: int = None) -> Tuple[int, int]:
+        """Return the natural block size (x, y) of the underlying GDAL band."""
+        blockSizeX, blockSizeY = self.gdalBand(bandNo if bandNo is not None else 1).GetBlockSize()
+        return blockSizeX, blockSizeY
+
+    def blockSize(
+            self, pixelMemoryUsage: int, maximumMemoryUsage: int = None, writer: RasterWriter = None
+    ) -> Tuple[int, int]:
+        """
+        Return block size (x, y) for walking the grid, aligned to the natural block size of the source and,
+        optionally, of the output raster.
+        The pixel memory usage should cover inputs, outputs and temporary arrays.
+        """
+        if maximumMemoryUsage is None:
+            maximumMemoryUsage = Utils.maximumMemoryUsage()
+        naturalBlockSizes = [self.gdalBlockSize()]
+        if writer is not None:
+            naturalBlockSizes.append(writer.gdalBlockSize())
+        return GridWalker.planBlockSize(
+            self.width(), self.height(), pixelMemoryUsage, maximumMemoryUsage, naturalBlockSizes
+        )
+
     def walkGrid(
             self, blockSizeX: int, blockSizeY: int, feedback: QgsProcessingFeedback = None
     ) -> Iterator[RasterBlockInfo]:
@@ -182,24 +217,32 @@ class RasterReader(object):
             height = min(blockSizeY, int(round((blockExtent.yMaximum() - blockExtent.yMinimum()) / pixelSizeY)))
             if width == 0 or height == 0:
                 continue  # empty blocks may occure, but can just skip over
+            Profiler.accountBlocks()
             yield RasterBlockInfo(blockExtent, xOffset, yOffset, width, height)
 
     def arrayFromBlock(
             self, block: RasterBlockInfo, bandList: List[int] = None, overlap: int = None,
-            feedback: QgsRasterBlockFeedback = None
+            feedback: QgsRasterBlockFeedback = None, buffer: np.ndarray = None
     ):
         """Return data for given block."""
         return self.arrayFromBoundingBoxAndSize(
-            block.extent, block.width, block.height, bandList, overlap, feedback
+            block.extent, block.width, block.height, bandList, overlap, feedback, buffer
         )
 
     def arrayFromBoundingBoxAndSize(
             self, boundingBox: QgsRectangle, width: int, height: int, bandList: List[int] = None,
-            overlap: int = None, feedback: QgsRasterBlockFeedback = None
+            overlap: int = None, feedback: QgsRasterBlockFeedback = None, buffer: np.ndarray = None
     ) -> Array3d:
-        """Return data for given bounding box and size."""
+        """
+        Return data for given bounding box and size.
+
+        For GDAL-backed sources, all bands are read with a single GDAL call, if the bounding box is aligned to the
+        pixel grid. Optionally, pass a 3d buffer that is reused for reading; if the buffer is too small or has the
+        wrong data type, a new one is allocated.
+        Note that returned arrays are views into the buffer and are overwritten by the next read into it.
+        """
         if bandList is None:
-            bandList = range(1, self.provider.bandCount() + 1)
+            bandList = list(range(1, self.provider.bandCount() + 1))
         if overlap is not None:
             xres = boundingBox.width() / width
             yres = boundingBox.height() / height
@@ -211,13 +254,100 @@ class RasterReader(object):
             )
             width = width + 2 * overlap
             height = height + 2 * overlap
-        arrays = list()
+
+        t0 = perf_counter()
+        arrays = self._gdalArrayFromBoundingBoxAndSize(boundingBox, width, height, bandList, buffer)
+        if arrays is None:
+            arrays = list()
+            for bandNo in bandList:
+                assert 0 < bandNo <= self.bandCount(), f'bandNo is {bandNo}'
+                block: QgsRasterBlock = self.provider.block(bandNo, boundingBox, width, height, feedback)
+                array = Utils.qgsRasterBlockToNumpyArray(block=block)
+                arrays.append(array)
+        Profiler.accountRead(sum(array.nbytes for array in arrays), perf_counter() - t0)
+        return arrays
+
+    def _gdalArrayFromBoundingBoxAndSize(
+            self, boundingBox: QgsRectangle, width: int, height: int, bandList: List[int],
+            buffer: Optional[np.ndarray]
+    ) -> Optional[List[Array2d]]:
+        """
+        Return data read directly via GDAL, or None, if the fast path is not applicable.
+
+        The fast path requires a GDAL provider, a bounding box aligned to the pixel grid at native resolution,
+        a common data type and no band scale or offset.
+        Areas outside the raster extent are filled with the source no data value; if a band has no (used) source
+        no data value, the request is handled by the provider.
+        """
+        if self.provider.name() != 'gdal' or len(bandList) == 0:
+            return None
+
+        # check alignment to the pixel grid at native resolution
+        extent = self.extent()
+        xres = self.rasterUnitsPerPixelX()
+        yres = self.rasterUnitsPerPixelY()
+        xOffset = (boundingBox.xMinimum() - extent.xMinimum()) / xres
+        yOffset = (extent.yMaximum() - boundingBox.yMaximum()) / yres
+        if abs(boundingBox.width() / width - xres) > 1e-6 * xres:
+            return None
+        if abs(boundingBox.height() / height - yres) > 1e-6 * yres:
+            return None
+        if abs(xOffset - round(xOffset)) > 1e-3 or abs(yOffset - round(yOffset)) > 1e-3:
+            return None
+        xOffset = int(round(xOffset))
+        yOffset = int(round(yOffset))
+
+        # check data type and scaling
+        dataType = self.provider.dataType(bandList[0])
         for bandNo in bandList:
             assert 0 < bandNo <= self.bandCount(), f'bandNo is {bandNo}'
-            block: QgsRasterBlock = self.provider.block(bandNo, boundingBox, width, height, feedback)
-            array = Utils.qgsRasterBlockToNumpyArray(block=block)
-            arrays.append(array)
-        return arrays
+            if self.provider.dataType(bandNo) != dataType:
+                return None
+            if self.provider.bandScale(bandNo) != 1 or self.provider.bandOffset(bandNo) != 0:
+                return None
+        dtype = Utils.qgisDataTypeToNumpyDataType(dataType)
+        if Utils.gdalDataTypeToNumpyDataType(self.gdalBand(bandList[0]).DataType) != dtype:
+            return None
+
+        # clip the window to the raster
+        xOffset2 = max(xOffset, 0)
+        yOffset2 = max(yOffset, 0)
+        width2 = min(xOffset + width, self.width()) - xOffset2
+        height2 = min(yOffset + height, self.height()) - yOffset2
+        isClipped = (xOffset2, yOffset2, width2, height2) != (xOffset, yOffset, width, height)
+        if isClipped:
+            for bandNo in bandList:
+                if not (self.provider.sourceHasNoDataValue(bandNo) and self.provider.useSourceNoDataValue(bandNo)):
+                    return None
+
+        # prepare buffer
+        shape = (len(bandList), height, width)
+        if buffer is None or buffer.dtype != dtype or buffer.size < np.prod(shape) or not buffer.flags.c_contiguous:
+            buffer = np.empty(shape, dtype)
+        else:
+            buffer = buffer.reshape(-1)[:np.prod(shape)].reshape(shape)
+
+        if isClipped:
+            for i, bandNo in enumerate(bandList):
+                buffer[i].fill(self.provider.sourceNoDataValue(bandNo))
+        if width2 > 0 and height2 > 0:
+            xStart = xOffset2 - xOffset
+            yStart = yOffset2 - yOffset
+            if isClipped:
+                window = np.empty((len(bandList), height2, width2), dtype)
+            else:
+                window = buffer
+            try:
+                self.gdalDataset.ReadAsArray(
+                    xOffset2, yOffset2, width2, height2, buf_obj=window, band_list=list(bandList)
+                )
+            except TypeError:  # band_list requires GDAL >= 3.5
+                for i, bandNo in enumerate(bandList):
+                    self.gdalBand(bandNo).ReadAsArray(xOffset2, yOffset2, width2, height2, buf_obj=window[i])
+            if isClipped:
+                buffer[:, yStart:yStart + height2, xStart:xStart + width2] = window
+
+        return list(buffer)
 
     def arrayFromPixelOffsetAndSize(
             self, xOffset: int, yOffset: int, width: int, height: int, bandList: List[int] = None, overlap: int = None,
@@ -236,6 +366,50 @@ class RasterReader(object):
         boundingBox = QgsRectangle(p1, p2)
         return self.arrayFromBoundingBoxAndSize(boundingBox, width, height, bandList, overlap, feedback)
 
+    def arrayFromPixelLocations(
+            self, xs: np.ndarray, ys: np.ndarray, bandList: List[int] = None, maximumMemoryUsage: int = None,
+            feedback: QgsProcessingFeedback = None
+    ) -> Array2d:
+        """
+        Return data for given pixel locations as (bands, pixels) array.
+
+        Pixel locations are grouped by the blocks of a memory bounded grid.
+        Blocks without any location are skipped,
+        for all other blocks only the window covering the locations is read, with all bands at once.
+        """
+        if bandList is None:
+            bandList = list(range(1, self.bandCount() + 1))
+        xs = np.asarray(xs, dtype=int)
+        ys = np.asarray(ys, dtype=int)
+        assert xs.shape == ys.shape
+
+        dtype = Utils.qgisDataTypeToNumpyDataType(self.dataType(bandList[0]))
+        values = np.empty((len(bandList), len(xs)), dtype)
+        if len(xs) == 0:
+            return values
+
+        blockSizeX, blockSizeY = self.blockSize(self.pixelMemoryUsage(len(bandList)), maximumMemoryUsage)
+        blockIds = (ys // blockSizeY) * (self.width() // blockSizeX + 1) + xs // blockSizeX
+        order = np.argsort(blockIds, kind='stable')
+        blockIdsSorted = blockIds[order]
+        starts = np.flatnonzero(np.diff(blockIdsSorted, prepend=-1))
+        ends = np.append(starts[1:], len(order))
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            if feedback is not None:
+                feedback.setProgress(i / len(starts) * 100)
+            indices = order[start:end]
+            xsBlock = xs[indices]
+            ysBlock = ys[indices]
+            xOffset = int(xsBlock.min())
+            yOffset = int(ysBlock.min())
+            width = int(xsBlock.max()) - xOffset + 1
+            height = int(ysBlock.max()) - yOffset + 1
+            array = np.asarray(self.arrayFromPixelOffsetAndSize(xOffset, yOffset, width, height, bandList))
+            if values.dtype != array.dtype:  # bands may have different data types
+                values = values.astype(np.result_type(values.dtype, array.dtype))
+            values[:, indices] = array[:, ysBlock - yOffset, xsBlock - xOffset]
+        return values
+
     def array(
             self, xOffset: int = None, yOffset: int = None, width: int = None, height: int = None,
             bandList: List[int] = None, boundingBox: QgsRectangle = None, overlap: int = None,
@@ -478,7 +652,10 @@ class RasterReader(object):
     def isSpectralRasterLayer(self, quickCheck=True):
         """Return whether a raster has wavelength information."""
         if quickCheck:
-            return self.wavelength(1) is not None
+            # only check the first band, instead of building the index for all bands
+            if self._metadataIndex('isForceTsi'):
+                return False
+            return self._scanBandMetadataItems(self.WavelengthKeys, bandList=[1])[0] is not None
         else:
             for bandNo in range(1, self.bandCount() + 1):
                 if self.wavelength(bandNo) is None:
@@ -494,23 +671,9 @@ class RasterReader(object):
 
     def wavelengthUnits(self, bandNo: int, guess=True) -> Optional[str]:
         """Return wavelength units."""
-
-        for key in [
-            'wavelength_units',
-            'Wavelength_unit',  # support for FORCE BOA files
-            'wavelength units'  # support for GDAL Metadata Editor dialog (by @jakimow)
-        ]:
-            # check band-level domains
-            for domain in set(self.metadataDomainKeys(bandNo) + ['']):
-                units = self.metadataItem(key, domain, bandNo)
-                if units is not None:
-                    return Utils.wavelengthUnitsLongName(units)
-
-            # check dataset-level domains
-            for domain in set(self.metadataDomainKeys() + ['']):
-                units = self.metadataItem(key, domain)
-                if units is not None:
-                    return Utils.wavelengthUnitsLongName(units)
+        units = self._metadataIndex('wavelengthUnits')[bandNo - 1]
+        if units is not None:
+            return units
 
         # finally, we try to guess the units from the actual value
         if guess:
@@ -522,8 +685,10 @@ class RasterReader(object):
                 else:
                     msg = 'wavelength units missing, assuming Nanometers'
                     units = 'Nanometers'
-                from enmapbox import messageLog
-                messageLog(msg, level=Qgis.MessageLevel.Warning)
+                if msg not in self._metadataWarnings:  # report only once per reader
+                    self._metadataWarnings.add(msg)
+                    from enmapbox import messageLog
+                    messageLog(msg, level=Qgis.MessageLevel.Warning)
                 return units
 
         return None
@@ -532,41 +697,25 @@ class RasterReader(object):
         """Return band center wavelength in nanometers. Optionally, specify destination units."""
 
         # special handling: FORCE TSI raster
-        enviDescription = self.metadataItem('description', 'ENVI')
-        if enviDescription is not None:
-            if enviDescription[0].startswith('FORCE') and enviDescription[0].endswith('Time Series Analysis'):
-                return None
+        if self._metadataIndex('isForceTsi'):
+            return None
+
+        wavelength = self._metadataIndex('wavelength')[bandNo - 1]
+        if isnan(wavelength):
+            return None
 
         if raw:
-            conversionFactor = 1.
-        else:
-            if units is None:
-                units = self.Nanometers
+            return float(wavelength)
 
-            wavelength_units = self.wavelengthUnits(bandNo)
-            if wavelength_units is None:
-                return None
+        if units is None:
+            units = self.Nanometers
 
-            conversionFactor = Utils.wavelengthUnitsConversionFactor(wavelength_units, units)
-
-        for key in [
-            'wavelength',
-            'Wavelength'  # support for FORCE BOA files
-        ]:
-            # check band-level domains
-            for domain in set(self.metadataDomainKeys(bandNo) + ['']):
-                wavelength = self.metadataItem(key, domain, bandNo)
-                if wavelength is not None:
-                    return conversionFactor * float(wavelength)
-
-            # check dataset-level domains
-            for domain in set(self.metadataDomainKeys() + ['']):
-                wavelengths = self.metadataItem(key, domain)
-                if wavelengths is not None:
-                    wavelength = wavelengths[bandNo - 1]
-                    return conversionFactor * float(wavelength)
+        wavelength_units = self.wavelengthUnits(bandNo)
+        if wavelength_units is None:
+            return None
 
-        return None
+        conversionFactor = Utils.wavelengthUnitsConversionFactor(wavelength_units, units)
+        return conversionFactor * float(wavelength)
 
     def findWavelength(self, wavelength: Optional[float], units: str = None) -> Optional[int]:
         """Find band number by wavelength."""
@@ -575,18 +724,12 @@ class RasterReader(object):
         if units is not None:
             wavelength = wavelength * Utils.wavelengthUnitsConversionFactor(units, 'nm')
 
-        bandNos = list()
-        distances = list()
-        for bandNo in range(1, self.bandCount() + 1):
-            wavelength_ = self.wavelength(bandNo)
-            if wavelength_ is None:
-                continue
-            bandNos.append(bandNo)
-            distances.append(abs(wavelength_ - wavelength))
-        if len(bandNos) == 0:
+        wavelengths = self._metadataIndex('wavelengthNanometers')
+        distances = np.abs(wavelengths - wavelength)
+        if np.all(np.isnan(distances)):
             return None
 
-        return bandNos[np.argmin(distances)]
+        return int(np.nanargmin(distances)) + 1
 
     def fwhm(self, bandNo: int, units: str = None) -> Optional[float]:
         """Return band FWHM in nanometers. Optionally, specify destination units."""
@@ -598,52 +741,189 @@ class RasterReader(object):
         if wavelength_units is None:
             return None
 
+        fwhm = self._metadataIndex('fwhm')[bandNo - 1]
+        if isnan(fwhm):
+            return None
+
         conversionFactor = Utils.wavelengthUnitsConversionFactor(wavelength_units, units)
+        return conversionFactor * float(fwhm)
 
-        # check band-level domains
-        for domain in set(self.metadataDomainKeys(bandNo) + ['']):
-            fwhm = self.metadataItem('fwhm', domain, bandNo)
-            if fwhm is not None:
-                return conversionFactor * float(fwhm)
+    def badBandMultiplier(self, bandNo: int) -> int:
+        """Return bad band multiplier, 0 for bad band and 1 for good band."""
+        return int(self._metadataIndex('badBandMultiplier')[bandNo - 1])
 
-        # check dataset-level domains
-        for domain in set(self.metadataDomainKeys() + ['']):
-            fwhm = self.metadataItem('fwhm', domain)
-            if fwhm is not None:
-                fwhm = fwhm[bandNo - 1]
-                return conversionFactor * float(fwhm)
+    def startTime(self, bandNo: int = None) -> Optional[QDateTime]:
+        """Return raster / band start time."""
+        if bandNo is None:
+            return self._readStartTime()
+        dateTime = self._metadataIndex('startTime')[bandNo - 1]
+        if dateTime is None:
+            return None
+        return QDateTime(dateTime)
 
-        return None
+    def endTime(self, bandNo: int = None) -> Optional[QDateTime]:
+        """Return raster / band end time."""
+        if bandNo is None:
+            return self._readEndTime()
+        dateTime = self._metadataIndex('endTime')[bandNo - 1]
+        if dateTime is None:
+            return None
+        return QDateTime(dateTime)
 
-    def badBandMultiplier(self, bandNo: int) -> int:
-        """Return bad band multiplier, 0 for bad band and 1 for good band."""
+    def centerTime(self, bandNo: int = None) -> Optional[QDateTime]:
+        """Return raster / band center time."""
 
-        # check band-level domains
-        for domain in set(self.metadataDomainKeys(bandNo) + ['']):
-            badBandMultiplier = self.metadataItem('bbl', domain, bandNo)
-            if badBandMultiplier is not None:
-                return int(badBandMultiplier)
+        startTime = self.startTime(bandNo)
+        if startTime is None:
+            return None
 
-        # check dataset-level domains
-        for domain in set(self.metadataDomainKeys() + ['']):
-            bbl = self.metadataItem('bbl', domain)
-            if bbl is not None:
-                badBandMultiplier = bbl[bandNo - 1]
-                return int(badBandMultiplier)
+        endTime = self.endTime(bandNo)
+        if endTime is None:
+            return startTime
 
-        return 1
+        msecs = startTime.msecsTo(endTime)
+        return startTime.addMSecs(int(msecs / 2))
 
-    def startTime(self, bandNo: int = None) -> Optional[QDateTime]:
-        """Return raster / band start time."""
+    def findTime(self, centerTime: Optional[QDateTime]) -> Optional[int]:
+        """Find band number by center time."""
+        if centerTime is None:
+            return None
 
-        if bandNo is not None:
+        centerTimes = self._metadataIndex('centerTimeMSecs')
+        distances = np.abs(centerTimes - float(centerTime.toMSecsSinceEpoch()))
+        if np.all(np.isnan(distances)):
+            return None
 
-            # special handling: FORCE TSI raster
+        return int(np.nanargmin(distances)) + 1
+
+    def invalidateMetadataIndex(self):
+        """Discard cached band metadata (wavelength, fwhm, bad band multiplier, times)."""
+        self._invalidateLayerMetadataIndex(self.layer.id())
+
+    @classmethod
+    def _invalidateLayerMetadataIndex(cls, layerId: str, key: str = 'QGISPAM/'):
+        if key.startswith('QGISPAM/') and layerId in cls._metadataIndexCaches:
+            cls._metadataIndexCaches[layerId]['index'].clear()
+
+    @classmethod
+    def _removeLayerMetadataIndex(cls, layerId: str, *args):
+        cls._metadataIndexCaches.pop(layerId, None)
+
+    def _metadataIndexCache(self) -> Dict[str, Any]:
+        """
+        Return metadata index of the layer.
+        The index is dropped, when QGIS PAM custom properties of the layer change,
+        or when metadata is written to the GDAL dataset via RasterWriter.
+        """
+        layerId = self.layer.id()
+        cache = self._metadataIndexCaches.get(layerId)
+        if cache is None:
+            cache = {'generation': None, 'index': dict()}
+            self._metadataIndexCaches[layerId] = cache
+            # connect only once per layer
+            self.layer.customPropertyChanged.connect(partial(RasterReader._invalidateLayerMetadataIndex, layerId))
+            self.layer.destroyed.connect(partial(RasterReader._removeLayerMetadataIndex, layerId))
+        generation = RasterWriter.metadataGeneration(self.gdalDataset.GetDescription())
+        if cache['generation'] != generation:
+            cache['index'].clear()
+            cache['generation'] = generation
+        return cache['index']
+
+    def _metadataIndex(self, name: str):
+        """Return lazily build per-band metadata vector. Each vector is build with a single metadata scan."""
+        cache = self._metadataIndexCache()
+        if name not in cache:
+            cache[name] = self._buildMetadataIndex(name)
+        return cache[name]
+
+    def _buildMetadataIndex(self, name: str):
+        bandCount = self.bandCount()
+        if name == 'isForceTsi':
             enviDescription = self.metadataItem('description', 'ENVI')
             if enviDescription is not None:
                 if enviDescription[0].startswith('FORCE') and enviDescription[0].endswith('Time Series Analysis'):
-                    decimalYear = float(self.metadataItem('wavelength', '', bandNo))
-                    return Utils.decimalYearToDateTime(decimalYear)
+                    return True
+            return False
+        elif name == 'wavelengthUnits':
+            values = self._scanBandMetadataItems([
+                'wavelength_units',
+                'Wavelength_unit',  # support for FORCE BOA files
+                'wavelength units'  # support for GDAL Metadata Editor dialog (by @jakimow)
+            ], False)
+            return [None if units is None else Utils.wavelengthUnitsLongName(units) for units in values]
+        elif name == 'wavelength':
+            values = self._scanBandMetadataItems(self.WavelengthKeys)
+            return np.array([nan if v is None else float(v) for v in values], dtype=float)
+        elif name == 'wavelengthNanometers':
+            values = [self.wavelength(bandNo) for bandNo in range(1, bandCount + 1)]
+            return np.array([nan if v is None else v for v in values], dtype=float)
+        elif name == 'fwhm':
+            values = self._scanBandMetadataItems(['fwhm'])
+            return np.array([nan if v is None else float(v) for v in values], dtype=float)
+        elif name == 'badBandMultiplier':
+            values = self._scanBandMetadataItems(['bbl'])
+            return np.array([1 if v is None else int(v) for v in values], dtype=int)
+        elif name == 'startTime':
+            return [self._readStartTime(bandNo) for bandNo in range(1, bandCount + 1)]
+        elif name == 'endTime':
+            return [self._readEndTime(bandNo) for bandNo in range(1, bandCount + 1)]
+        elif name == 'centerTimeMSecs':
+            values = [self.centerTime(bandNo) for bandNo in range(1, bandCount + 1)]
+            return np.array([nan if v is None else float(v.toMSecsSinceEpoch()) for v in values], dtype=float)
+        else:
+            raise ValueError(name)
+
+    def _scanBandMetadataItems(
+            self, keys: List[str], datasetLevelIsList=True, bandList: List[int] = None
+    ) -> List[Optional[MetadataValue]]:
+        """
+        Return the first matching metadata item for each band (or for the given bands).
+        For each key, band-level domains are checked first, followed by dataset-level domains.
+        Dataset-level items are read only once for all bands.
+        """
+        datasetDomains = set(self.metadataDomainKeys() + [''])
+        datasetValues = dict()
+        for key in keys:
+            datasetValues[key] = None
+            for domain in datasetDomains:
+                value = self.metadataItem(key, domain)
+                if value is not None:
+                    datasetValues[key] = value
+                    break
+
+        if bandList is None:
+            bandList = range(1, self.bandCount() + 1)
+        values = list()
+        for bandNo in bandList:
+            bandDomains = set(self.metadataDomainKeys(bandNo) + [''])
+            found = None
+            for key in keys:
+                # check band-level domains
+                for domain in bandDomains:
+                    found = self.metadataItem(key, domain, bandNo)
+                    if found is not None:
+                        break
+                if found is not None:
+                    break
+
+                # check dataset-level domains
+                found = datasetValues[key]
+                if found is not None:
+                    if datasetLevelIsList:
+                        if isinstance(found, list):
+                            found = found[bandNo - 1] if bandNo <= len(found) else None
+                    break
+            values.append(found)
+        return values
+
+    def _readStartTime(self, bandNo: int = None) -> Optional[QDateTime]:
+
+        if bandNo is not None:
+
+            # special handling: FORCE TSI raster
+            if self._metadataIndex('isForceTsi'):
+                decimalYear = float(self.metadataItem('wavelength', '', bandNo))
+                return Utils.decimalYearToDateTime(decimalYear)
 
             # check band-level default-domain
             dateTime = self.metadataItem('start_time', '', bandNo)
@@ -684,8 +964,7 @@ class RasterReader(object):
 
         return None
 
-    def endTime(self, bandNo: int = None) -> Optional[QDateTime]:
-        """Return raster / band end time."""
+    def _readEndTime(self, bandNo: int = None) -> Optional[QDateTime]:
 
         # check band-level domain
         if bandNo is not None:
@@ -701,38 +980,6 @@ class RasterReader(object):
 
         return None
 
-    def centerTime(self, bandNo: int = None) -> Optional[QDateTime]:
-        """Return raster / band center time."""
-
-        startTime = self.startTime(bandNo)
-        if startTime is None:
-            return None
-
-        endTime = self.endTime(bandNo)
-        if endTime is None:
-            return startTime
-
-        msecs = startTime.msecsTo(endTime)
-        return startTime.addMSecs(int(msecs / 2))
-
-    def findTime(self, centerTime: Optional[QDateTime]) -> Optional[int]:
-        """Find band number by center time."""
-        if centerTime is None:
-            return None
-
-        bandNos = list()
-        distances = list()
-        for bandNo in range(1, self.bandCount() + 1):
-            centerTime_ = self.centerTime(bandNo)
-            if centerTime_ is None:
-                continue
-            bandNos.append(bandNo)
-            distances.append(abs(centerTime_.msecsTo(centerTime)))
-        if len(bandNos) == 0:
-            return None
-
-        return bandNos[np.argmin(distances)]
-
     def lineMemoryUsage(self, nBands: int = None, dataTypeSize: int = None) -> int:
         """Returns the memory (in bytes) used to store a single raster line."""
         if nBands is None:
@@ -741,6 +988,14 @@ class RasterReader(object):
             dataTypeSize = self.dataTypeSize()
         return self.width() * nBands * dataTypeSize
 
+    def pixelMemoryUsage(self, nBands: int = None, dataTypeSize: int = None) -> int:
+        """Returns the memory (in bytes) used to store a single pixel profile."""
+        if nBands is None:
+            nBands = self.bandCount()
+        if dataTypeSize is None:
+            dataTypeSize = self.dataTypeSize()
+        return nBands * dataTypeSize
+
     def _gdalObject(self, bandNo: int = None) -> Union[gdal.Band, gdal.Dataset]:
         if bandNo is None:
             gdalObject = self.gdalDataset
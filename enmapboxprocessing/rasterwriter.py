@@ -1,7 +1,9 @@
-from typing import List, Union, Optional, Iterator
+from time import perf_counter
+from typing import List, Union, Optional, Iterator, Tuple, Dict
 
 from osgeo import gdal
 
+from enmapboxprocessing.profiler import Profiler
 from enmapboxprocessing.typing import Array3d, Array2d, MetadataValue, MetadataDomain, Metadata, Number
 from enmapboxprocessing.utils import Utils
 from qgis.PyQt.QtCore import QDateTime
@@ -12,6 +14,7 @@ from enmapbox.typeguard import typechecked
 
 @typechecked
 class RasterWriter(object):
+    _metadataGenerations: Dict[str, int] = dict()  # number of metadata writes by source
 
     def __init__(self, gdalDataset: gdal.Dataset):
         self.gdalDataset = gdalDataset
@@ -28,7 +31,9 @@ class RasterWriter(object):
         if overlap is not None:
             height, width = array.shape
             array = array[overlap:height - overlap, overlap:width - overlap]
+        t0 = perf_counter()
         self.gdalBand(bandNo).WriteArray(array, xOffset, yOffset)
+        Profiler.accountWritten(array.nbytes, perf_counter() - t0)
 
     def fill(self, value: float, bandNo: int):
         self.gdalBand(bandNo).Fill(value)
@@ -62,9 +67,11 @@ class RasterWriter(object):
             if key in ['offset', 'scale']:
                 return  # skip user offset and scale; will be set via gdal.Band.SetOffset/SetScale
         self._gdalObject(bandNo).SetMetadataItem(key, Utils.metadateValueToString(value), domain)
+        self._touchMetadata()
 
     def setMetadataDomain(self, metadata: MetadataDomain, domain: str = '', bandNo: int = None):
         self._gdalObject(bandNo).SetMetadata({}, domain)  # clear existing domain first
+        self._touchMetadata()
 
         deleteDomain = len(metadata) == 0
         if deleteDomain:
@@ -75,6 +82,14 @@ class RasterWriter(object):
                     continue
                 self.setMetadataItem(key, value, domain, bandNo)
 
+    @classmethod
+    def metadataGeneration(cls, source: str) -> int:
+        """Return the number of metadata writes to the given source. Used to invalidate cached metadata."""
+        return cls._metadataGenerations.get(source, 0)
+
+    def _touchMetadata(self):
+        self._metadataGenerations[self._source] = self.metadataGeneration(self._source) + 1
+
     def setMetadata(self, metadata: Metadata, bandNo: int = None):
         for domain, metadata_ in metadata.items():
             self.setMetadataDomain(metadata_, domain, bandNo)
@@ -167,6 +182,11 @@ class RasterWriter(object):
     def height(self) -> int:
         return self.gdalDataset.RasterYSize
 
+    def gdalBlockSize(self, bandNo: int = None) -> Tuple[int, int]:
+        """Return the natural block size (x, y) of the underlying GDAL band."""
+        blockSizeX, blockSizeY = self.gdalBand(bandNo if bandNo is not None else 1).GetBlockSize()
+        return blockSizeX, blockSizeY
+
     def _gdalObject(self, bandNo: int = None) -> Union[gdal.Dataset, gdal.Band]:
         if bandNo is None:
             return self.gdalDataset
@@ -13,6 +13,7 @@ from osgeo import gdal
 
 from enmapbox.qgispluginsupport.qps.utils import SpatialExtent, SpatialPoint
 from enmapbox.typeguard import typechecked
+from enmapboxprocessing.modelartifact import ModelArtifact
 from enmapboxprocessing.typing import (NumpyDataType, MetadataValue, GdalDataType,
                                        GdalResamplingAlgorithm, Categories, Category, Targets, Target)
 from qgis.PyQt.QtCore import QDateTime, QDate
@@ -167,18 +168,32 @@ class Utils(object):
             raise ValueError(f'unsupported data type: {dataType}')
 
     @classmethod
-    def qgsRasterBlockToNumpyArray(cls, block: QgsRasterBlock) -> np.ndarray:
+    def qgsRasterBlockToNumpyArray(cls, block: QgsRasterBlock, copy: bool = None) -> np.ndarray:
+        """
+        Return block data as 2d array.
+
+        The array is created via the buffer protocol of the block data.
+        Exporting the buffer detaches the byte array from the block, i.e. Qt copies the data once,
+        and the array never shares memory with the block.
+        Use copy=True to always return an array that owns its data (a second copy), and copy=False to never copy
+        in numpy (the result may be read-only).
+        By default, the data is only copied again if the view is read-only.
+        """
         dtype = cls.qgisDataTypeToNumpyDataType(block.dataType())
-        array = np.frombuffer(np.array(block.data()), dtype=dtype)
+        array = np.frombuffer(block.data(), dtype=dtype)
         array = np.reshape(array, (block.height(), block.width()))
+        if copy or (copy is None and not array.flags.writeable):
+            array = array.copy()
         return array
 
     @classmethod
     def numpyArrayToQgsRasterBlock(cls, array: np.ndarray, dataType: int = None) -> QgsRasterBlock:
+        """Return 2d array as block."""
         assert array.ndim == 2
         height, width = array.shape
         if dataType is None:
             dataType = cls.numpyDataTypeToQgisDataType(array.dtype)
+        array = np.ascontiguousarray(array, dtype=cls.qgisDataTypeToNumpyDataType(dataType))
         block = QgsRasterBlock(dataType, width, height)
         block.setData(array.tobytes())
         return block
@@ -647,6 +662,9 @@ class Utils(object):
 
     @classmethod
     def pickleLoad(cls, filename: str) -> Any:
+        if ModelArtifact.isModelArtifact(filename):
+            # don't memory-map the sample arrays, callers may dump the object back into the same file
+            return ModelArtifact.read(filename, mmap=False)
         with open(filename, 'rb') as file:
             return pickle.load(file)
 
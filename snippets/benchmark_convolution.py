@@ -0,0 +1,54 @@
+from time import time
+
+import numpy as np
+
+from enmapboxprocessing.algorithm.convolutionfilteralgorithmbase import ConvolutionFilterAlgorithmBase
+
+try:
+    from astropy.convolution import convolve, CustomKernel
+except ModuleNotFoundError:
+    convolve = None
+
+
+def gaussianKernel(size: int) -> np.ndarray:
+    x = np.arange(size) - size // 2
+    kernel1d = np.exp(-0.5 * (x / (size / 6)) ** 2)
+    return np.outer(kernel1d, kernel1d)[None]
+
+
+def benchmark(kernel: np.ndarray, array: np.ndarray, mask: np.ndarray, interpolate: bool):
+    alg = ConvolutionFilterAlgorithmBase
+    times = dict()
+    if convolve is not None:
+        t0 = time()
+        nan_treatment = 'interpolate' if interpolate else 'fill'
+        convolve(array, CustomKernel(kernel), fill_value=np.nan, nan_treatment=nan_treatment, mask=~mask)
+        times['direct'] = time() - t0
+    t0 = time()
+    alg.convolveMasked(array, mask, kernel, False, interpolate, True)
+    times['FFT'] = time() - t0
+    if alg.separableKernel(kernel) is not None:
+        t0 = time()
+        alg.convolveMasked(array, mask, kernel, False, interpolate, False)
+        times['separable'] = time() - t0
+    return times
+
+
+def main():
+    array = np.random.rand(10, 500, 500)
+    mask = np.random.rand(*array.shape) > 0.01
+    print('kernel size | automatic backend | direct [s] | FFT [s] | separable [s]')
+    for size in [3, 5, 7, 11, 15, 21, 31, 51]:
+        for kernel in [gaussianKernel(size), np.ones((size, 1, 1))]:
+            times = benchmark(kernel, array, mask, True)
+            backend = ConvolutionFilterAlgorithmBase.O_BACKEND[
+                ConvolutionFilterAlgorithmBase.selectBackend(kernel, True)
+            ]
+            print(
+                f'{"x".join(map(str, kernel.shape))} | {backend} | '
+                + ' | '.join(f'{times[key]:.3f}' if key in times else '-' for key in ['direct', 'FFT', 'separable'])
+            )
+
+
+if __name__ == '__main__':
+    main()
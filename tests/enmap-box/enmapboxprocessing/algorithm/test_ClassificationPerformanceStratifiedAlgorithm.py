@@ -2,7 +2,7 @@ import numpy as np
 
 from enmapboxtestdata import landcover_polygon
 from enmapboxprocessing.algorithm.classificationperformancestratifiedalgorithm import (
-    stratifiedAccuracyAssessment, ClassificationPerformanceStratifiedAlgorithm
+    stratifiedAccuracyAssessment, ClassificationPerformanceStratifiedAlgorithm, StratifiedSampleAccumulator
 )
 from enmapboxprocessing.algorithm.testcase import TestCase
 from enmapboxtestdata import landcover_map_l3
@@ -85,6 +85,38 @@ class Test_aa_stratified(TestCase):
         self.assertTrue(np.isnan(result.overall_accuracy_se))
 
 
+class TestStratifiedSampleAccumulator(TestCase):
+
+    def test_blockwiseEqualsDense(self):
+        arrayReference = np.array([[0, 1, 0], [2, 0, 0], [0, 0, 0], [1, 2, 9]])
+        arrayPrediction = np.array([[5, 6, 5], [5, 6, 6], [5, 5, 5], [6, 6, 6]])
+        arrayStratification = np.array([[1, 1, 2], [2, 2, 1], [1, 1, 1], [2, 2, 3]])
+        accumulator = StratifiedSampleAccumulator([1, 2], {5: 1, 6: 2}, [1, 2, 4])
+        for rows in [slice(0, 2), slice(2, 3), slice(3, 4)]:
+            accumulator.addStratumCounts(arrayStratification[rows], arrayStratification[rows].size)
+            valid = accumulator.referenceMask(arrayReference[rows])
+            if np.any(valid):
+                accumulator.addSample(valid, arrayReference[rows], arrayPrediction[rows], arrayStratification[rows])
+        stratum, reference, map, h, N_h = accumulator.sample()
+        self.assertArrayEqual(np.array([1, 2, 2, 2]), stratum)
+        self.assertArrayEqual(np.array([1, 2, 1, 2]), reference)
+        self.assertArrayEqual(np.array([2, 1, 2, 2]), map)
+        self.assertEqual([1, 2], h)  # stratum 3 is not a category and stratum 4 is empty
+        self.assertEqual([6, 5], N_h)
+
+    def test_withoutStratification(self):
+        accumulator = StratifiedSampleAccumulator([1, 2], {5: 1, 6: 2}, [1])
+        arrayReference = np.array([[0, 1], [2, 0]])
+        accumulator.addStratumCounts(None, arrayReference.size)
+        valid = accumulator.referenceMask(arrayReference)
+        accumulator.addSample(valid, arrayReference, np.array([[5, 5], [7, 6]]), None)
+        stratum, reference, map, h, N_h = accumulator.sample()
+        self.assertArrayEqual(np.array([1, 1]), stratum)
+        self.assertArrayEqual(np.array([1, 0]), map)  # unmatched prediction is mapped to 0
+        self.assertEqual([1], h)
+        self.assertEqual([4], N_h)
+
+
 class TestClassificationPerformanceAlgorithm(TestCase):
 
     def test_withStratification(self):
@@ -4,6 +4,7 @@ from enmapboxtestdata import enmap
 from enmapboxprocessing.algorithm.classificationworkflowalgorithm import ClassificationWorkflowAlgorithm
 from enmapboxprocessing.algorithm.fitclassifieralgorithmbase import FitClassifierAlgorithmBase
 from enmapboxprocessing.algorithm.testcase import TestCase
+from enmapboxprocessing.rasterreader import RasterReader
 from enmapboxtestdata import classifierDumpPkl
 
 
@@ -41,6 +42,20 @@ class TestClassificationAlgorithm(TestCase):
         }
         self.runalg(alg, parameters)
 
+    def test_uncertainty(self):
+        alg = ClassificationWorkflowAlgorithm()
+        parameters = {
+            alg.P_DATASET: classifierDumpPkl,
+            alg.P_CLASSIFIER: FitTestClassifierAlgorithm().defaultCodeAsString(),
+            alg.P_RASTER: enmap,
+            alg.P_OUTPUT_CLASSIFIER: self.filename('classifier.pkl'),
+            alg.P_OUTPUT_CLASSIFICATION: self.filename('classification.tif'),
+            alg.P_OUTPUT_PROBABILITY: self.filename('probability.tif'),
+            alg.P_OUTPUT_UNCERTAINTY: self.filename('uncertainty.tif')
+        }
+        result = self.runalg(alg, parameters)
+        self.assertEqual(2, RasterReader(result[alg.P_OUTPUT_UNCERTAINTY]).bandCount())
+
     def test_trainingOnly(self):
         alg = ClassificationWorkflowAlgorithm()
         parameters = {
@@ -1,8 +1,11 @@
 import unittest
 
+import numpy as np
+
 from enmapboxprocessing.algorithm.algorithms import algorithms
 from enmapboxprocessing.algorithm.convolutionfilteralgorithmbase import ConvolutionFilterAlgorithmBase
 from enmapboxprocessing.algorithm.testcase import TestCase
+from enmapboxprocessing.rasterreader import RasterReader
 from enmapboxtestdata import hires
 
 try:
@@ -73,3 +76,64 @@ class TestConvolutionFilterAlgorithm(TestCase):
                 alg.P_OUTPUT_RASTER: self.filename('filtered.tif')
             }
             self.runalg(alg, parameters)
+
+    def test_backends(self):
+        alg = ConvolutionFilterAlgorithm()
+        alg.initAlgorithm()
+        for interpolate in [True, False]:
+            arrays = list()
+            for backend in [alg.DirectBackend, alg.FftBackend, alg.SeparableBackend]:
+                parameters = {
+                    alg.P_RASTER: hires,
+                    alg.P_KERNEL: alg.defaultCodeAsString(),
+                    alg.P_INTERPOLATE: interpolate,
+                    alg.P_BACKEND: backend,
+                    alg.P_OUTPUT_RASTER: self.filename(f'filtered_{backend}_{interpolate}.tif')
+                }
+                result = self.runalg(alg, parameters)
+                arrays.append(RasterReader(result[alg.P_OUTPUT_RASTER]).array())
+            for array in arrays[1:]:
+                self.assertTrue(np.allclose(arrays[0], array, atol=1e-3))
+
+    def test_workerCount(self):
+        alg = ConvolutionFilterAlgorithm()
+        alg.initAlgorithm()
+        arrays = list()
+        for workerCount in [None, 4]:
+            parameters = {
+                alg.P_RASTER: hires,
+                alg.P_KERNEL: alg.defaultCodeAsString(),
+                alg.P_WORKER_COUNT: workerCount,
+                alg.P_OUTPUT_RASTER: self.filename(f'filtered_{workerCount}.tif')
+            }
+            result = self.runalg(alg, parameters)
+            arrays.append(RasterReader(result[alg.P_OUTPUT_RASTER]).array())
+        self.assertArrayEqual(arrays[0], arrays[1])
+
+
+class TestConvolveMasked(TestCase):
+
+    def test_separableKernel(self):
+        alg = ConvolutionFilterAlgorithmBase
+        kernel = np.outer([1., 2., 1.], [1., 4., 6., 4., 1.])[None]
+        kz, ky, kx = alg.separableKernel(kernel)
+        self.assertTrue(np.allclose(kernel[0], np.outer(ky, kx)))
+        self.assertIsNone(alg.separableKernel(np.eye(3)[None]))
+        self.assertEqual(alg.SeparableBackend, alg.selectBackend(np.ones((5, 1, 1)), True))
+        self.assertEqual(alg.FftBackend, alg.selectBackend(np.random.rand(1, 15, 15), True))
+        self.assertEqual(alg.DirectBackend, alg.selectBackend(np.random.rand(1, 3, 3), True))
+
+    def test_fftEqualsSeparable(self):
+        alg = ConvolutionFilterAlgorithmBase
+        array = np.random.rand(3, 20, 30)
+        mask = np.random.rand(*array.shape) > 0.1
+        kernel = np.outer([1., 2., 1.], [1., 4., 6., 4., 1.])[None]
+        for interpolate in [True, False]:
+            for normalize in [True, False]:
+                outarray1 = alg.convolveMasked(array, mask, kernel, normalize, interpolate, True)
+                outarray2 = alg.convolveMasked(array, mask, kernel, normalize, interpolate, False)
+                self.assertTrue(np.allclose(outarray1, outarray2, equal_nan=True))
+                if interpolate:
+                    self.assertFalse(np.any(np.isnan(outarray1)))  # all gaps are filled
+                else:
+                    self.assertTrue(np.all(np.isnan(outarray1[np.logical_not(mask)])))
@@ -1,6 +1,7 @@
 from os import chdir
 from os.path import dirname
 
+import numpy as np
 from osgeo import gdal
 
 from enmapboxtestdata import enmap
@@ -95,3 +96,38 @@ class TestCreateSpectralIndicesAlgorithm(TestCase):
         self.assertEqual('CUSTOM', reader.metadataItem('short_name', '', 1))
         self.assertIsNone(reader.metadataItem('long_name', '', 1))
         self.assertEqual('(B + r555 - r1640) / (r555 + r1640)', reader.metadataItem('formula', '', 1))
+
+    def test_raster_output(self):
+        alg = CreateSpectralIndicesAlgorithm()
+        alg.initAlgorithm()
+        parameters = {
+            alg.P_RASTER: enmap,
+            alg.P_INDICES: 'NDVI, EVI, MY_NDVI = (N - R)/(N + R)',
+            alg.P_OUTPUT_VRT: self.filename('indices.tif'),
+        }
+        result = self.runalg(alg, parameters)
+        reader = RasterReader(result[alg.P_OUTPUT_VRT])
+        self.assertEqual('GTiff', gdal.Open(result[alg.P_OUTPUT_VRT]).GetDriver().ShortName)
+        self.assertEqual(3, reader.bandCount())
+        self.assertEqual('NDVI', reader.metadataItem('short_name', '', 1))
+        self.assertEqual('MY_NDVI', reader.bandName(3))
+        self.assertEqual(-9999, reader.noDataValue(1))
+
+        # compare against the lazy VRT version
+        parameters[alg.P_OUTPUT_VRT] = self.filename('indices.vrt')
+        result2 = self.runalg(alg, parameters)
+        array = reader.array()
+        array2 = RasterReader(result2[alg.P_OUTPUT_VRT]).array()
+        self.assertTrue(np.allclose(array, array2, equal_nan=True))
+        self.assertArrayEqual(array[0], array[2])
+
+    def test_compileFormulas(self):
+        code = CreateSpectralIndicesAlgorithm.compileFormulas(['(N - R)/(N + R)', '(N - R) * 2', 'N + R + 1'])
+        self.assertEqual(2, len([name for name in code.co_names if name.startswith('_tmp')]))
+        N = np.array([[0.5, 0.4]])
+        R = np.array([[0.1, 0.2]])
+        namespace = {'N': N, 'R': R}
+        exec(code, namespace)
+        self.assertTrue(np.allclose((N - R) / (N + R), namespace['_index0']))
+        self.assertTrue(np.allclose((N - R) * 2, namespace['_index1']))
+        self.assertTrue(np.allclose(N + R + 1, namespace['_index2']))
@@ -49,3 +49,33 @@ class TestPredictClassProbabilityAlgorithm(TestCase):
         }
         result = self.runalg(alg, parameters)
         self.assertEqual(-13052, np.round(np.sum(RasterReader(result[alg.P_OUTPUT_PROBABILITY]).array())))
+
+    def test_classificationAndUncertainty(self):
+        algFit = FitTestClassifierAlgorithm()
+        algFit.initAlgorithm()
+        parametersFit = {
+            algFit.P_DATASET: classifierDumpPkl,
+            algFit.P_CLASSIFIER: algFit.defaultCodeAsString(),
+            algFit.P_OUTPUT_CLASSIFIER: self.filename('classifier.pkl'),
+        }
+        self.runalg(algFit, parametersFit)
+
+        alg = PredictClassPropabilityAlgorithm()
+        alg.initAlgorithm()
+        parameters = {
+            alg.P_RASTER: enmap,
+            alg.P_CLASSIFIER: parametersFit[algFit.P_OUTPUT_CLASSIFIER],
+            alg.P_OUTPUT_PROBABILITY: self.filename('probability2.tif'),
+            alg.P_OUTPUT_CLASSIFICATION: self.filename('classification2.tif'),
+            alg.P_OUTPUT_UNCERTAINTY: self.filename('uncertainty2.tif')
+        }
+        result = self.runalg(alg, parameters)
+        probability = RasterReader(result[alg.P_OUTPUT_PROBABILITY]).array()
+        classification = RasterReader(result[alg.P_OUTPUT_CLASSIFICATION]).array()[0]
+        uncertainty, margin = RasterReader(result[alg.P_OUTPUT_UNCERTAINTY]).array()
+        valid = probability[0] != -1
+        self.assertArrayEqual(np.argmax(probability, axis=0)[valid] + 1, classification[valid])
+        self.assertArrayEqual(0, classification[~valid])
+        self.assertTrue(np.allclose(1 - np.max(probability, axis=0)[valid], uncertainty[valid]))
+        sortedProbability = np.sort(probability, axis=0)
+        self.assertTrue(np.allclose((sortedProbability[-1] - sortedProbability[-2])[valid], margin[valid]))
@@ -1,3 +1,5 @@
+import json
+
 import numpy as np
 from sklearn.base import ClassifierMixin
 
@@ -48,6 +50,31 @@ class TestPredictClassificationAlgorithm(TestCase):
         result = self.runalg(alg, parameters)
         self.assertEqual(127249, np.sum(RasterReader(result[alg.P_OUTPUT_CLASSIFICATION]).array()))
 
+    def test_profile(self):
+        algFit = FitTestClassifierAlgorithm()
+        algFit.initAlgorithm()
+        parametersFit = {
+            algFit.P_DATASET: classifierDumpPkl,
+            algFit.P_CLASSIFIER: algFit.defaultCodeAsString(),
+            algFit.P_OUTPUT_CLASSIFIER: self.filename('classifier.pkl')
+        }
+        self.runalg(algFit, parametersFit)
+
+        alg = PredictClassificationAlgorithm()
+        alg.initAlgorithm()
+        parameters = {
+            alg.P_RASTER: enmap,
+            alg.P_CLASSIFIER: parametersFit[algFit.P_OUTPUT_CLASSIFIER],
+            alg.P_OUTPUT_CLASSIFICATION: self.filename('classification.tif')
+        }
+        self.runalg(alg, parameters)
+        with open(alg.profileFilename(parameters[alg.P_OUTPUT_CLASSIFICATION] + '.log')) as file:
+            profile = json.load(file)
+        self.assertEqual(['mask', 'predict'], list(profile['stages']))
+        self.assertGreater(profile['read']['bytes'], 0)
+        self.assertGreater(profile['written']['bytes'], 0)
+        self.assertGreater(profile['blocks'], 0)
+
     def test_rasterMask(self):
         algFit = FitTestClassifierAlgorithm()
         algFit.initAlgorithm()
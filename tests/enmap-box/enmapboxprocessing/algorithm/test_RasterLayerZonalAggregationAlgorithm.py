@@ -1,7 +1,11 @@
+import numpy as np
+
 from enmapboxtestdata import enmap
 from enmapboxprocessing.algorithm.rasterlayerzonalaggregationalgorithm import RasterLayerZonalAggregationAlgorithm
 from enmapboxprocessing.algorithm.testcase import TestCase
+from enmapboxprocessing.rasterreader import RasterReader
 from enmapboxtestdata import landcover_map_l3
+from qgis.core import QgsVectorLayer
 
 
 class TestRasterLayerZonalAggregationAlgorithm(TestCase):
@@ -15,6 +19,51 @@ class TestRasterLayerZonalAggregationAlgorithm(TestCase):
         }
         result = self.runalg(alg, parameters)
 
+    def test_statistics(self):
+        alg = RasterLayerZonalAggregationAlgorithm()
+        alg.initAlgorithm()
+        parameters = {
+            alg.P_RASTER: enmap,
+            alg.P_CATEGORIZED_RASTER: landcover_map_l3,
+            alg.P_STATISTIC: [alg.ArithmeticMeanStatistic, alg.MinimumStatistic, alg.CountStatistic,
+                              alg.MedianStatistic],
+            alg.P_OUTPUT_TABLE: self.filename('table2.csv'),
+        }
+        result = self.runalg(alg, parameters)
+        table = QgsVectorLayer(result[alg.P_OUTPUT_TABLE])
+        names = table.fields().names()
+        self.assertIn('Band 1', names)
+        self.assertIn('Band 1 minimum', names)
+        self.assertIn('Band 177 count', names)
+        self.assertIn('Band 177 median (approximated)', names)
+
+        # compare with numpy
+        zones = RasterReader(landcover_map_l3).array()[0]
+        array = RasterReader(enmap).array()[0]
+        feature = next(table.getFeatures())
+        valid = np.logical_and(zones == int(feature.attribute('Zone Value')), array != -99)
+        self.assertEqual(np.sum(valid), int(feature.attribute('Band 1 count')))
+        self.assertAlmostEqual(np.mean(array[valid]), float(feature.attribute('Band 1')), 4)
+        self.assertEqual(np.min(array[valid]), float(feature.attribute('Band 1 minimum')))
+
+    def test_noCategories(self):
+        writer = self.rasterFromArray(np.ones((2, 5, 5)), 'raster.tif')
+        writer.close()
+        zoneWriter = self.rasterFromArray(np.zeros((1, 5, 5), np.uint8), 'zones.tif')  # zero is no data
+        zoneWriter.close()
+        alg = RasterLayerZonalAggregationAlgorithm()
+        alg.initAlgorithm()
+        parameters = {
+            alg.P_RASTER: writer.source(),
+            alg.P_CATEGORIZED_RASTER: zoneWriter.source(),
+            alg.P_STATISTIC: [alg.ArithmeticMeanStatistic, alg.MedianStatistic],
+            alg.P_OUTPUT_TABLE: self.filename('table3.csv'),
+        }
+        result = self.runalg(alg, parameters)
+        table = QgsVectorLayer(result[alg.P_OUTPUT_TABLE])
+        self.assertIn('Band 2 median (approximated)', table.fields().names())
+        self.assertEqual(0, table.featureCount())
+
     def _test_issue1406(self):
         alg = RasterLayerZonalAggregationAlgorithm()
         parameters = {
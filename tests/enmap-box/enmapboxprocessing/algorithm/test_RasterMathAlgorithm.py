@@ -132,6 +132,20 @@ class TestRasterMathAlgorithm(TestCase):
         result = self.runalg(alg, parameters)
         # self.assertEqual(631209052, np.sum(RasterReader(result[alg.P_OUTPUT_RASTER]).array(), dtype=float))
 
+    def test_workerCount(self):
+        alg = RasterMathAlgorithm()
+        arrays = list()
+        for workerCount in [None, 4]:
+            parameters = {
+                alg.P_R1: enmap,
+                alg.P_CODE: 'R1 * 2',
+                alg.P_WORKER_COUNT: workerCount,
+                alg.P_OUTPUT_RASTER: self.filename(f'enmap_{workerCount}.tif')
+            }
+            result = self.runalg(alg, parameters)
+            arrays.append(RasterReader(result[alg.P_OUTPUT_RASTER]).array())
+        self.assertArrayEqual(arrays[0], arrays[1])
+
     def test_stats(self):
         alg = RasterMathAlgorithm()
         parameters = {
@@ -284,3 +298,15 @@ class TestRasterMathAlgorithm(TestCase):
         }
         result = self.runalg(alg, parameters)
         self.assertArrayEqual(-99, RasterReader(result[alg.P_OUTPUT_RASTER]).array(0, 0, 1, 1))
+
+    def test_compileCode(self):
+        alg = RasterMathAlgorithm()
+        readers = {'R1': RasterReader(enmap)}
+        plan = alg.compileCode('R1@1 + R1@655nm', readers, {})
+        self.assertFalse(plan.needAllData['R1'])
+        bandNo = readers['R1'].findWavelength(655)
+        self.assertDictEqual({(1,): ['R1@1'], (bandNo,): ['R1@655nm']}, dict(plan.atBands['R1']))
+        self.assertTrue(plan.isSingleLineCode)
+
+        plan = alg.compileCode('outputRaster = R1 * R1Mask', readers, {})
+        self.assertTrue(plan.needAllData['R1'])
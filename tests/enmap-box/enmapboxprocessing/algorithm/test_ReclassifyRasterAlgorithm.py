@@ -37,3 +37,21 @@ class TestReclassifyRasterAlgorithm(TestCase):
         }
         self.runalg(alg, parameters)
         self.assertEqual(2910, np.sum(RasterReader(parameters[alg.P_OUTPUT_CLASSIFICATION]).array()))
+
+    def test_makeReclassifier(self):
+        mapping = {1: 10, 3: 30, 1000000000: 40, 2.5: 50}
+        inarray = np.array([[0, 1, 2, 3], [1000000000, 3, 1, -1]])
+
+        # integer input with large range uses binary search
+        reclassify = ReclassifyRasterAlgorithm.makeReclassifier(mapping, -9, inarray.dtype)
+        self.assertArrayEqual(np.array([[-9, 10, -9, 30], [40, 30, 10, -9]]), reclassify(inarray))
+
+        # integer input with small range uses a lookup table
+        reclassify = ReclassifyRasterAlgorithm.makeReclassifier(mapping, -9, np.dtype(np.uint8))
+        self.assertArrayEqual(np.array([[-9, 10, -9, 30]]), reclassify(inarray[:1].astype(np.uint8)))
+
+        # float input
+        reclassify = ReclassifyRasterAlgorithm.makeReclassifier(mapping, -9, np.dtype(np.float32))
+        self.assertArrayEqual(
+            np.array([[-9, 10, 50, 30, -9]]), reclassify(np.array([[0, 1, 2.5, 3, np.nan]], np.float32))
+        )
@@ -1,5 +1,6 @@
 from enmapboxprocessing.algorithm.samplerastervaluesalgorithm import SampleRasterValuesAlgorithm
 from enmapboxprocessing.algorithm.testcase import TestCase
+from enmapboxprocessing.rasterreader import RasterReader
 from enmapboxtestdata import enmap, landcover_polygon, hires_potsdom
 from enmapboxtestdata import landcover_points_singlepart_epsg3035
 from qgis.core import (QgsRasterLayer, QgsVectorLayer)
@@ -46,6 +47,25 @@ class TestSampleRasterValuesAlgorithm(TestCase):
             points.fields().names()[:8]
         )
 
+    def test_polygonValues(self):
+        alg = SampleRasterValuesAlgorithm()
+        alg.initAlgorithm()
+        parameters = {
+            alg.P_RASTER: enmap,
+            alg.P_VECTOR: landcover_polygon,
+            alg.P_COVERAGE_RANGE: [0, 100],
+            alg.P_OUTPUT_POINTS: self.filename('sample_values.gpkg')
+        }
+        result = self.runalg(alg, parameters)
+        points = QgsVectorLayer(result[alg.P_OUTPUT_POINTS])
+        array = RasterReader(enmap).array()
+        for feature in points.getFeatures():
+            x = feature.attribute('PIXEL_X')
+            y = feature.attribute('PIXEL_Y')
+            self.assertTrue(0 < feature.attribute('COVER') <= 100)
+            self.assertEqual(array[0][y, x], feature.attribute('SAMPLE_1'))
+            self.assertEqual(array[176][y, x], feature.attribute('SAMPLE_177'))
+
     def test_skipNoDataPixel(self):
         # create locations: one inside, one outside of the valid data region
         locations = self.filename('locations.geojson')
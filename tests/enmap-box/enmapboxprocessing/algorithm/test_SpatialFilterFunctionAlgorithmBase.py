@@ -1,3 +1,6 @@
+import numpy as np
+from osgeo import gdal
+
 from enmapboxtestdata import hires
 from enmapboxprocessing.algorithm.spatialgaussiangradientmagnitudealgorithm import \
     SpatialGaussianGradientMagnitudeAlgorithm
@@ -33,6 +36,7 @@ from enmapboxprocessing.algorithm.spatialpercentilealgorithm import SpatialPerce
 from enmapboxprocessing.algorithm.spatialprewittalgorithm import SpatialPrewittAlgorithm
 from enmapboxprocessing.algorithm.spatialsobelalgorithm import SpatialSobelAlgorithm
 from enmapboxprocessing.algorithm.testcase import TestCase
+from enmapboxprocessing.rasterreader import RasterReader
 
 
 class TestSpatialFilterFunctionAlgorithm(TestCase):
@@ -74,3 +78,32 @@ class TestSpatialFilterFunctionAlgorithm(TestCase):
             self.runalg(alg, parameters)
 
             break  # comment out to check all filter algos
+
+    def test_tiled(self):
+        algs = [
+            SpatialMedianAlgorithm(),
+            SpatialMorphologicalGreyOpeningAlgorithm(),
+            SpatialGaussianGradientMagnitudeAlgorithm(),
+            SpatialMorphologicalBinaryFillHolesAlgorithm(),  # not tileable
+        ]
+        cacheMax = gdal.GetCacheMax()
+        for alg in algs:
+            alg.initAlgorithm()
+            parameters = {
+                alg.P_RASTER: hires,
+                alg.P_FUNCTION: alg.defaultCodeAsString(),
+                alg.P_OUTPUT_RASTER: self.filename('untiled.tif')
+            }
+            result = self.runalg(alg, parameters)
+            array = RasterReader(result[alg.P_OUTPUT_RASTER]).array()
+
+            # force small blocks and run in parallel
+            gdal.SetCacheMax(2 ** 20)
+            try:
+                parameters[alg.P_WORKER_COUNT] = 2
+                parameters[alg.P_OUTPUT_RASTER] = self.filename('tiled.tif')
+                result = self.runalg(alg, parameters)
+            finally:
+                gdal.SetCacheMax(cacheMax)
+            array2 = RasterReader(result[alg.P_OUTPUT_RASTER]).array()
+            self.assertTrue(np.allclose(array, array2, atol=1e-5), alg.displayName())
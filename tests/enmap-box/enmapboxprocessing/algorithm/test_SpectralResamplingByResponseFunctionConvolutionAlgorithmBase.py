@@ -5,6 +5,7 @@ from enmapboxprocessing.algorithm.spectralresamplingtolandsatalgorithm import Sp
 from enmapboxprocessing.algorithm.testcase import TestCase
 from enmapboxprocessing.rasterreader import RasterReader
 from enmapboxtestdata import enmap
+from qgis.core import QgsProcessingFeedback
 
 
 class TestSpectralResamplingByResponseFunctionConvolutionAlgorithmBase(TestCase):
@@ -26,3 +27,34 @@ class TestSpectralResamplingByResponseFunctionConvolutionAlgorithmBase(TestCase)
         }
         result = self.runalg(alg, parameters)
         self.assertEqual(-8712000, np.round(np.sum(RasterReader(result[alg.P_OUTPUT_RASTER]).array()[0])))
+
+    def test_workerCount(self):
+        alg = SpectralResamplingToLandsatOliAlgorithm()
+        arrays = list()
+        for workerCount in [None, 4]:
+            parameters = {
+                alg.P_RASTER: enmap,
+                alg.P_WORKER_COUNT: workerCount,
+                alg.P_OUTPUT_RASTER: self.filename(f'resampled_{workerCount}.tif')
+            }
+            result = self.runalg(alg, parameters)
+            arrays.append(RasterReader(result[alg.P_OUTPUT_RASTER]).array())
+        self.assertArrayEqual(arrays[0], arrays[1])
+
+    def test_resampleData(self):
+        responses = {
+            'a': [(400, 0.5), (401, 1.0), (402, 0.5)],
+            'b': [(402, 1.0), (403, 1.0)],
+            'c': [(900, 1.0)],  # not covered by any source band
+        }
+        wavelength = [400, 401, 402, 403]
+        array = np.array([[[1, 1]], [[2, 2]], [[3, 3]], [[4, 4]]])
+        marray = np.full_like(array, True, bool)
+        marray[1, 0, 1] = False  # invalid 401 nm value
+        marray[2:, 0, 1] = False  # invalid 402 and 403 nm values
+        weights = SpectralResamplingToEnmapAlgorithm.responseMatrix(wavelength, responses)
+        self.assertEqual((3, 4), weights.shape)
+        outarray = SpectralResamplingToEnmapAlgorithm.resampleData(
+            array, marray, wavelength, responses, -1, QgsProcessingFeedback(), False, weights
+        )
+        self.assertArrayEqual(np.array([[[2, 1]], [[3.5, -1]], [[-1, -1]]]), outarray)
@@ -1,7 +1,10 @@
+import numpy as np
+
 from enmapboxtestdata import enmap, hires
 from enmapboxprocessing.algorithm.stackrasterlayersalgorithm import StackRasterLayersAlgorithm
 from enmapboxprocessing.algorithm.testcase import TestCase
 from enmapboxprocessing.rasterreader import RasterReader
+from qgis.core import QgsCoordinateReferenceSystem, QgsProcessingException
 
 
 class TestSubsetRasterBandsAlgorithm(TestCase):
@@ -43,3 +46,45 @@ class TestSubsetRasterBandsAlgorithm(TestCase):
         result = self.runalg(alg, parameters)
         reader = RasterReader(result[alg.P_OUTPUT_RASTER])
         self.assertEqual(RasterReader(hires).extent(), reader.extent())
+
+    def test_values(self):
+        alg = StackRasterLayersAlgorithm()
+        parameters = {
+            alg.P_RASTERS: [hires, hires],
+            alg.P_OUTPUT_RASTER: self.filename('stack.vrt')
+        }
+        result = self.runalg(alg, parameters)
+        reader = RasterReader(result[alg.P_OUTPUT_RASTER])
+        gold = RasterReader(hires).array()
+        self.assertArrayEqual(np.concatenate([gold, gold]), np.array(reader.array()))
+
+    def test_scaleAndOffset(self):
+        writer = self.rasterFromArray(np.ones((2, 10, 10)), 'scaled.tif')
+        writer.setScale(0.01, 1)
+        writer.setOffset(5, 1)
+        writer.close()
+        alg = StackRasterLayersAlgorithm()
+        parameters = {
+            alg.P_RASTERS: [writer.source(), writer.source()],
+            alg.P_OUTPUT_RASTER: self.filename('stack.vrt')
+        }
+        result = self.runalg(alg, parameters)
+        reader = RasterReader(result[alg.P_OUTPUT_RASTER])
+        for bandNo in [1, 3]:
+            self.assertEqual(0.01, reader.scale(bandNo))
+            self.assertEqual(5, reader.offset(bandNo))
+        for bandNo in [2, 4]:
+            self.assertIn(reader.scale(bandNo), [None, 1])
+            self.assertIn(reader.offset(bandNo), [None, 0])
+
+    def test_differentCrsWithoutGrid(self):
+        crs = QgsCoordinateReferenceSystem.fromEpsgId(4326)
+        writer = self.rasterFromArray(np.zeros((1, 10, 10)), 'epsg4326.tif', RasterReader(hires).extent(), crs)
+        writer.close()
+        alg = StackRasterLayersAlgorithm()
+        parameters = {
+            alg.P_RASTERS: [hires, writer.source()],
+            alg.P_OUTPUT_RASTER: self.filename('stack.vrt')
+        }
+        with self.assertRaises(QgsProcessingException):
+            self.runalg(alg, parameters)
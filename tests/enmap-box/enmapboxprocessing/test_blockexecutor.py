@@ -0,0 +1,59 @@
+from math import ceil
+
+import numpy as np
+
+from enmapboxprocessing.blockexecutor import BlockExecutor
+from enmapboxprocessing.rasterreader import RasterReader
+from enmapboxprocessing.testcase import TestCase
+from enmapboxtestdata import enmap
+from qgis.core import QgsProcessingFeedback, QgsProcessingException
+
+
+class TestBlockExecutor(TestCase):
+
+    def runExecutor(self, executor: BlockExecutor):
+        reader = RasterReader(enmap)
+        array = np.zeros((reader.height(), reader.width()), np.float32)
+
+        def read(block):
+            return reader.arrayFromBlock(block, [1])[0]
+
+        def compute(data):
+            return data * 2
+
+        def write(block, result):
+            array[block.yOffset:block.yOffset + block.height, block.xOffset:block.xOffset + block.width] = result
+
+        n = executor.run(reader.walkGrid(reader.width(), 10), read, compute, write)
+        self.assertEqual(ceil(reader.height() / 10), n)
+        return array
+
+    def test_serial(self):
+        gold = RasterReader(enmap).array(bandList=[1])[0] * 2
+        self.assertArrayEqual(gold, self.runExecutor(BlockExecutor()))
+
+    def test_threads(self):
+        gold = self.runExecutor(BlockExecutor())
+        self.assertArrayEqual(gold, self.runExecutor(BlockExecutor(4, maxInFlight=3)))
+        self.assertArrayEqual(gold, self.runExecutor(BlockExecutor(-1)))
+
+    def test_canceled(self):
+        feedback = QgsProcessingFeedback()
+        feedback.cancel()
+        with self.assertRaises(QgsProcessingException):
+            self.runExecutor(BlockExecutor(2, feedback=feedback))
+
+    def test_tupleItems(self):
+        reader = RasterReader(enmap)
+        tasks = [(block, [bandNo]) for block in reader.walkGrid(reader.width(), 10) for bandNo in [1, 2]]
+        written = list()
+
+        def read(task):
+            block, bandList = task
+            return reader.arrayFromBlock(block, bandList)
+
+        def write(task, result):
+            written.append((task[1], result.shape))
+
+        BlockExecutor(3, maxInFlight=2).run(tasks, read, lambda data: data, write)
+        self.assertEqual([task[1] for task in tasks], [bandList for bandList, shape in written])
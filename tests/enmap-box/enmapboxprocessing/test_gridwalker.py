@@ -14,3 +14,20 @@ class TestGridWalker(TestCase):
         gridWalker = GridWalker(extent, blockSizeX, blockSizeY, pixelSizeX, pixelSizeY)
         self.assertEqual(gridWalker.nBlocksX(), 1)
         self.assertEqual(gridWalker.nBlocksY(), 2)
+
+    def test_planBlockSize_strips(self):
+        # strips: full width, height as large as the memory budget allows
+        self.assertEqual((1000, 100), GridWalker.planBlockSize(1000, 1000, 10, 1000 * 100 * 10, [(1000, 1)]))
+        # strips aligned to the strip height of the output
+        self.assertEqual((1000, 96), GridWalker.planBlockSize(1000, 1000, 10, 1000 * 100 * 10, [(1000, 16)]))
+
+    def test_planBlockSize_tiles(self):
+        # whole rows of tiles, if they fit into memory
+        self.assertEqual((1000, 512), GridWalker.planBlockSize(1000, 1000, 1, 1000 * 600, [(256, 256)]))
+        # square blocks of whole tiles otherwise
+        self.assertEqual((512, 512), GridWalker.planBlockSize(10000, 10000, 1, 4 * 256 * 256, [(256, 256)]))
+        # sub-tile blocks, if not even a single tile fits
+        self.assertEqual((100, 100), GridWalker.planBlockSize(10000, 10000, 1, 100 * 100, [(256, 256)]))
+
+    def test_planBlockSize_clippedToRasterSize(self):
+        self.assertEqual((10, 5), GridWalker.planBlockSize(10, 5, 1, 10 ** 9, [(256, 256)]))
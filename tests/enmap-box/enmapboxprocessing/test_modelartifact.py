@@ -0,0 +1,63 @@
+from typing import Tuple
+
+import numpy as np
+
+from enmapboxprocessing.modelartifact import ModelArtifact
+from enmapboxprocessing.testcase import TestCase
+from enmapboxprocessing.typing import ClassifierDump
+from enmapboxprocessing.utils import Utils
+from enmapboxtestdata import classifierDumpPkl
+
+
+class TestModelArtifact(TestCase):
+
+    def writeArtifact(self) -> Tuple[str, ClassifierDump]:
+        from sklearn.ensemble import RandomForestClassifier
+        dump = ClassifierDump(**Utils.pickleLoad(classifierDumpPkl))
+        dump.classifier = RandomForestClassifier(n_estimators=10, random_state=42).fit(dump.X, dump.y.ravel())
+        filename = self.filename('classifier.pkl')
+        ModelArtifact.write(dump.__dict__, filename)
+        return filename, dump
+
+    def test_read(self):
+        filename, gold = self.writeArtifact()
+        self.assertTrue(ModelArtifact.isModelArtifact(filename))
+        self.assertFalse(ModelArtifact.isModelArtifact(classifierDumpPkl))
+
+        dump = ClassifierDump(**ModelArtifact.read(filename))
+        self.assertIsInstance(dump.X, np.memmap)
+        self.assertArrayEqual(gold.X, dump.X)
+        self.assertArrayEqual(gold.y, dump.y)
+        self.assertEqual(gold.categories, dump.categories)
+        self.assertEqual(gold.features, dump.features)
+        self.assertArrayEqual(gold.classifier.predict(gold.X), dump.classifier.predict(gold.X))
+
+        dump = ClassifierDump(**Utils.pickleLoad(filename))  # old reader still works
+        self.assertArrayEqual(gold.X, dump.X)
+
+    def test_readOnlyEstimator(self):
+        filename, gold = self.writeArtifact()
+        dump = ClassifierDump(**ModelArtifact.read(filename, ['classifier']))
+        self.assertIsNone(dump.X)
+        self.assertIsNone(dump.y)
+        self.assertIsNotNone(dump.classifier)
+        self.assertIsNotNone(dump.categories)
+
+        dump = ClassifierDump(**ModelArtifact.read(classifierDumpPkl, ['classifier']))  # plain pickle
+        self.assertIsNone(dump.X)
+
+    def test_readMetadata(self):
+        filename, gold = self.writeArtifact()
+        metadata = ModelArtifact.readMetadata(filename)
+        self.assertIsInstance(metadata['X'], str)
+        self.assertIsInstance(metadata['classifier'], str)
+        self.assertEqual(gold.features, metadata['features'])
+
+    def test_pickleLoad_andDumpToSameFile(self):
+        filename, gold = self.writeArtifact()
+        dump = ClassifierDump(**Utils.pickleLoad(filename))
+        self.assertNotIsInstance(dump.X, np.memmap)
+        Utils.pickleDump(dump.__dict__, filename)  # must not read from the truncated file
+        dump = ClassifierDump(**Utils.pickleLoad(filename))
+        self.assertArrayEqual(gold.X, dump.X)
+        self.assertArrayEqual(gold.y, dump.y)
@@ -31,3 +31,12 @@ class TestNumpyUtils(TestCase):
     def test_rebinSum(self):
         a = np.array(list(range(16))).reshape(4, 4)
         self.assertTrue(np.all(np.equal([[10, 18], [42, 50]], NumpyUtils.rebinSum(a, (2, 2)))))
+
+    def test_upperConvexHull(self):
+        x = np.array([1., 2., 3., 4., 5.])
+        profiles = np.array([[1., 0., 3., 1., 1.], [2., 2., 2., 2., 2.], [0., 4., 0., 4., 0.]])
+        hull = NumpyUtils.upperConvexHull(profiles, x)
+        self.assertTrue(np.allclose([[1., 2., 3., 2., 1.], [2., 2., 2., 2., 2.], [0., 4., 4., 4., 0.]], hull))
+
+    def test_upperConvexHull_empty(self):
+        self.assertEqual((0, 3), NumpyUtils.upperConvexHull(np.zeros((0, 3)), np.array([1., 2., 3.])).shape)
@@ -0,0 +1,37 @@
+from os import environ
+from os.path import exists, dirname, join
+
+from enmapboxprocessing.pipeline import Pipeline
+from enmapboxprocessing.testcase import TestCase
+
+
+class TestPipeline(TestCase):
+
+    def writeIntermediates(self, pipeline: Pipeline):
+        filename = pipeline.intermediateFilename('a.tif')
+        for sidecar in [filename, filename + '.log', filename + '.aux.xml', join(dirname(filename), 'a.qml')]:
+            with open(sidecar, 'w') as file:
+                file.write('')
+        return filename
+
+    def test_intermediatesAreRemoved(self):
+        with Pipeline(self.filename('pipeline/output.tif'), False) as pipeline:
+            filename = self.writeIntermediates(pipeline)
+            self.assertTrue(exists(filename))
+        self.assertFalse(exists(filename))
+        self.assertFalse(exists(filename + '.log'))
+        self.assertFalse(exists(dirname(filename)))
+
+    def test_keepIntermediates(self):
+        with Pipeline(self.filename('pipeline/output.tif'), True) as pipeline:
+            filename = self.writeIntermediates(pipeline)
+        self.assertTrue(exists(filename))
+        self.assertTrue(exists(filename + '.log'))
+
+    def test_keepIntermediatesFromEnvironment(self):
+        environ[Pipeline.KeepIntermediatesVariable] = '1'
+        try:
+            self.assertTrue(Pipeline(self.filename('pipeline/output.tif')).keepIntermediates)
+        finally:
+            del environ[Pipeline.KeepIntermediatesVariable]
+        self.assertFalse(Pipeline(self.filename('pipeline/output.tif')).keepIntermediates)
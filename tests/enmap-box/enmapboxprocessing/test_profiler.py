@@ -0,0 +1,56 @@
+import json
+
+from enmapboxprocessing.profiler import Profiler
+from enmapboxprocessing.testcase import TestCase
+
+
+class TestProfiler(TestCase):
+
+    def test_stagesAndCounters(self):
+        profiler = Profiler('parent')
+        profiler.start()
+        with profiler.stage('a'):
+            with profiler.stage('b'):
+                Profiler.accountRead(100, 0.5)
+        with profiler.stage('a'):
+            Profiler.accountWritten(50, 0.25)
+        Profiler.accountBlocks(3)
+        profiler.stop()
+        Profiler.accountRead(100, 0.5)  # not counted anymore
+
+        self.assertEqual(['a/b', 'a'], list(profiler.stages))
+        self.assertEqual(2, profiler.stages['a']['calls'])
+        self.assertEqual(100, profiler.bytesRead)
+        self.assertEqual(50, profiler.bytesWritten)
+        self.assertEqual(3, profiler.blockCount)
+        self.assertIsNone(Profiler.current())
+
+    def test_children(self):
+        profiler = Profiler('parent')
+        profiler.start()
+        with profiler.child('child'):
+            child = Profiler('child')
+            child.start()
+            self.assertIs(child, Profiler.current())
+            Profiler.accountRead(100, 0.5)
+            child.stop()
+        with profiler.child('failing'):
+            Profiler('failing').start()  # never stopped
+        self.assertIs(profiler, Profiler.current())
+        profiler.stop()
+
+        self.assertEqual(100, profiler.bytesRead)  # includes child I/O
+        self.assertEqual(['child', 'failing'], [child['algorithm'] for child in profiler.children])
+        self.assertEqual(100, profiler.children[0]['profile']['read']['bytes'])
+        self.assertNotIn('profile', profiler.children[1])
+
+    def test_writeJson(self):
+        profiler = Profiler('alg')
+        profiler.start()
+        profiler.stop()
+        filename = self.filename('profile.json')
+        profiler.writeJson(filename)
+        with open(filename) as file:
+            profile = json.load(file)
+        self.assertEqual('alg', profile['algorithm'])
+        self.assertEqual(['Profile:'], profiler.summary()[:1])
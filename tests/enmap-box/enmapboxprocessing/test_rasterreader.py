@@ -4,6 +4,7 @@ from osgeo import gdal
 from enmapboxtestdata import enmap
 from enmapboxprocessing.rasterblockinfo import RasterBlockInfo
 from enmapboxprocessing.rasterreader import RasterReader
+from enmapboxprocessing.rasterwriter import RasterWriter
 from enmapboxprocessing.testcase import TestCase
 from enmapboxprocessing.utils import Utils
 from enmapboxtestdata import fraction_polygon_l3
@@ -151,6 +152,29 @@ class TestRasterReader(TestCase):
         lead[0][10:-10, 10:-10] = reader.noDataValue(1)
         self.assertTrue(np.all(np.equal(reader.noDataValue(1), lead)))
 
+    def test_arrayFromBoundingBoxAndSize_gdalFastPath(self):
+        reader = RasterReader(enmap)
+        gold = reader.gdalDataset.ReadAsArray()
+        bandList = [1, 10, 100]
+
+        # multi-band read into a reused buffer
+        buffer = np.empty((len(bandList), 400, 220), gold.dtype)
+        lead = reader.arrayFromBoundingBoxAndSize(reader.extent(), 220, 400, bandList, buffer=buffer)
+        self.assertTrue(np.all(np.equal(gold[[0, 9, 99]], lead)))
+        self.assertTrue(np.shares_memory(buffer, lead[0]))
+
+        # same result as the provider
+        block = next(reader.walkGrid(100, 100))
+        lead = reader.arrayFromBlock(block, bandList, overlap=5)
+        provider = reader.provider
+        for bandNo, array in zip(bandList, lead):
+            extent = QgsRectangle(
+                block.extent.xMinimum() - 5 * 30, block.extent.yMinimum() - 5 * 30,
+                block.extent.xMaximum() + 5 * 30, block.extent.yMaximum() + 5 * 30
+            )
+            gold2 = Utils.qgsRasterBlockToNumpyArray(provider.block(bandNo, extent, 110, 110))
+            self.assertTrue(np.all(np.equal(gold2, array)))
+
     def test_arrayFromPixelOffsetAndSize(self):
         array = np.zeros((1, 5, 5))
         array[0, 0] = 1
@@ -161,6 +185,23 @@ class TestRasterReader(TestCase):
         self.assertEqual(3, np.sum(reader.array(xOffset=1, width=3)))
         self.assertEqual(0, np.sum(reader.array(yOffset=1, height=3)))
 
+    def test_arrayFromPixelLocations(self):
+        reader = RasterReader(enmap)
+        array = reader.array()
+        xs = np.array([0, 219, 5, 100, 5])
+        ys = np.array([0, 399, 300, 1, 300])
+        values = reader.arrayFromPixelLocations(xs, ys, maximumMemoryUsage=1000 * 177 * 2)
+        self.assertEqual((177, 5), values.shape)
+        self.assertArrayEqual(np.array(array)[:, ys, xs], values)
+
+        # subset of bands
+        values = reader.arrayFromPixelLocations(xs, ys, [3, 1])
+        self.assertArrayEqual(np.array(array)[[2, 0]][:, ys, xs], values)
+
+        # no locations
+        values = reader.arrayFromPixelLocations(np.array([], int), np.array([], int))
+        self.assertEqual((177, 0), values.shape)
+
     def test_array(self):
         reader = RasterReader(enmap)
         gold = reader.gdalDataset.ReadAsArray()
@@ -533,6 +574,21 @@ class TestRasterReader(TestCase):
         self.assertEqual(gold * 2, reader.lineMemoryUsage(nBands=bandCount * 2))
         self.assertEqual(gold * 2, reader.lineMemoryUsage(dataTypeSize=8))
 
+    def test_pixelMemoryUsage(self):
+        writer = self.rasterFromArray(np.zeros((4, 1, 10), np.int32))
+        writer.close()
+        reader = RasterReader(writer.source())
+        self.assertEqual(4 * 4, reader.pixelMemoryUsage())
+        self.assertEqual(2 * 4, reader.pixelMemoryUsage(nBands=2))
+        self.assertEqual(4 * 8, reader.pixelMemoryUsage(dataTypeSize=8))
+
+    def test_blockSize(self):
+        reader = RasterReader(enmap)
+        blockSizeX, blockSizeY = reader.gdalBlockSize()
+        self.assertEqual((220, 400), reader.blockSize(1, 10 ** 9))
+        self.assertEqual((220, blockSizeY), reader.blockSize(1, 220 * blockSizeY))
+        self.assertEqual((220, 1), reader.blockSize(reader.pixelMemoryUsage(), reader.lineMemoryUsage()))
+
     def test_pamMetadata(self):
         layer = QgsRasterLayer(enmap)
         reader = RasterReader(layer)
@@ -547,3 +603,52 @@ class TestRasterReader(TestCase):
         wavelength2 = reader.wavelength(42, wavelengthUnits2)
         self.assertEqual(wavelength1, wavelength2)
         self.assertEqual(wavelengthUnits1, wavelengthUnits2)
+
+    def test_metadataIndex_invalidatedByPamMetadata(self):
+        layer = QgsRasterLayer(enmap)
+        reader = RasterReader(layer)
+        self.assertEqual(177, reader.findWavelength(2600))  # builds the index
+        layer.setCustomProperty('QGISPAM/band/42//wavelength', 2600)
+        layer.setCustomProperty('QGISPAM/band/42//wavelength_units', 'Nanometers')
+        self.assertEqual(2600, reader.wavelength(42))
+        self.assertEqual(42, reader.findWavelength(2600))
+
+    def test_invalidateMetadataIndex(self):
+        writer = self.rasterFromArray(np.zeros((3, 1, 1)))
+        writer.setWavelength(100, 1)
+        writer.setWavelength(200, 2)
+        writer.setWavelength(300, 3)
+        writer.close()
+        ds = gdal.Open(writer.source())
+        reader = RasterReader(ds)
+        self.assertEqual(3, reader.findWavelength(290))
+        ds.GetRasterBand(3).SetMetadataItem('wavelength', '250')
+        self.assertEqual(300, reader.wavelength(3))  # still cached
+        reader.invalidateMetadataIndex()
+        self.assertEqual(250, reader.wavelength(3))
+
+    def test_metadataIndex_invalidatedByRasterWriter(self):
+        writer = self.rasterFromArray(np.zeros((3, 1, 1)))
+        writer.setWavelength(100, 1)
+        writer.setWavelength(200, 2)
+        writer.setWavelength(300, 3)
+        writer.close()
+        ds = gdal.Open(writer.source())
+        reader = RasterReader(ds)
+        self.assertEqual(3, reader.findWavelength(290))
+        RasterWriter(ds).setWavelength(250, 3)
+        self.assertEqual(250, reader.wavelength(3))
+        self.assertEqual(2, reader.findWavelength(240))
+
+    def test_metadataIndex_connectedOncePerLayer(self):
+        layer = QgsRasterLayer(enmap)
+        RasterReader(layer).wavelength(1)
+        receivers = layer.receivers(layer.customPropertyChanged)
+        for i in range(10):
+            RasterReader(layer).wavelength(1)
+        self.assertEqual(receivers, layer.receivers(layer.customPropertyChanged))
+
+    def test_isSpectralRasterLayer_quickCheck(self):
+        reader = RasterReader(enmap)
+        self.assertTrue(reader.isSpectralRasterLayer(quickCheck=True))
+        self.assertNotIn('wavelength', reader._metadataIndexCache())  # index not build
@@ -111,6 +111,29 @@ class TestUtils(TestCase):
         self.assertTrue(np.all(array == array2))
         self.assertEqual(array.dtype, array2.dtype)
 
+    def test_qgsRasterBlockToNumpyArray_copy(self):
+        array = np.arange(12, dtype=np.float32).reshape((3, 4))
+        block = Utils.numpyArrayToQgsRasterBlock(array)
+        for copy in [None, True, False]:
+            array2 = Utils.qgsRasterBlockToNumpyArray(block, copy)
+            self.assertTrue(np.all(array == array2))
+        self.assertTrue(Utils.qgsRasterBlockToNumpyArray(block).flags.writeable)
+        self.assertTrue(Utils.qgsRasterBlockToNumpyArray(block, True).flags.owndata)
+
+    def test_qgsRasterBlockToNumpyArray_copyCount(self):
+        # Qt copies the data when the buffer is exported (tracemalloc can't see that allocation),
+        # so copy=False must not add a numpy copy and the array must not write through to the block
+        array = np.arange(12, dtype=np.float32).reshape((3, 4))
+        block = Utils.numpyArrayToQgsRasterBlock(array)
+        array2 = Utils.qgsRasterBlockToNumpyArray(block, copy=False)
+        self.assertFalse(array2.flags.owndata)
+        self.assertTrue(np.all(array == array2))
+
+        array3 = Utils.qgsRasterBlockToNumpyArray(block)
+        array3[0, 0] = 42
+        self.assertEqual(0, block.value(0, 0))
+        self.assertEqual(0, Utils.qgsRasterBlockToNumpyArray(block)[0, 0])
+
     def test_metadateValueToString(self):
         self.assertEqual('1', Utils.metadateValueToString(1))
         self.assertEqual('1', Utils.metadateValueToString('1'))
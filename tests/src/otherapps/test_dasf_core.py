@@ -0,0 +1,55 @@
+# coding=utf-8
+"""Tests for the block-wise linear regression of the DASF retrieval.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+import unittest
+
+import numpy as np
+from scipy import stats
+
+from enmapbox.apps.DASFEnMAPbox.core import linregress_block
+
+
+class test_linregress_block(unittest.TestCase):
+
+    def assertMatchesScipy(self, x, y):
+        results = linregress_block(x, y)
+        for row in range(x.shape[1]):
+            for column in range(x.shape[2]):
+                gold = stats.linregress(x[:, row, column], y[:, row, column])
+                values = [result[row, column] for result in results]
+                np.testing.assert_allclose(
+                    [gold.slope, gold.intercept, gold.rvalue, gold.pvalue, gold.stderr], values,
+                    rtol=1e-7, atol=1e-12
+                )
+
+    def test_randomProfiles(self):
+        rng = np.random.default_rng(42)
+        x = rng.random((10, 3, 4))
+        y = 2 * x + rng.normal(0, 0.1, (10, 3, 4))
+        self.assertMatchesScipy(x, y)
+
+    def test_twoBands(self):
+        rng = np.random.default_rng(42)
+        x = rng.random((2, 3, 4))
+        y = rng.random((2, 3, 4))
+        self.assertMatchesScipy(x, y)
+
+    def test_constantX(self):
+        x = np.ones((5, 1, 2))
+        y = np.random.default_rng(42).random((5, 1, 2))
+        with self.assertRaises(ValueError):
+            stats.linregress(x[:, 0, 0], y[:, 0, 0])  # scipy refuses identical x values
+        slope, intercept, r_value, p_value, std_err = linregress_block(x, y)
+        for result in [slope, intercept, r_value, p_value, std_err]:
+            self.assertTrue(np.all(np.isnan(result)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+# coding=utf-8
+"""Tests for the batched ONNS neural network evaluation.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+import os
+import unittest
+
+import numpy as np
+
+from enmapbox.apps.hzg_onns.nnhs import load_nnhs
+
+NETS = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'enmapbox', 'apps', 'hzg_onns', 'nets')
+
+
+class test_nnhs(unittest.TestCase):
+
+    def test_ff_nnhs_batch(self):
+        net = load_nnhs(os.path.join(NETS, 'C2X_OLCI_20161013_Conc_WC01_23x76x55x36_58.5.net'))
+        rng = np.random.default_rng(42)
+        inp = net.inrange[0, :] + rng.random((25, net.ninp)) * (net.inrange[1, :] - net.inrange[0, :])
+        out = net.ff_nnhs_batch(inp)
+        self.assertEqual((25, net.noutp), out.shape)
+        for i in range(inp.shape[0]):
+            np.testing.assert_allclose(net.ff_nnhs(inp[i]), out[i], rtol=1e-12, atol=1e-12)
+
+    def test_load_nnhs_cache(self):
+        filename = os.path.join(NETS, 'C2X_OLCI_20161013_Conc_WC01_23x76x55x36_58.5.net')
+        self.assertIs(load_nnhs(filename), load_nnhs(filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
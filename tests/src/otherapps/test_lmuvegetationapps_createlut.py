@@ -0,0 +1,57 @@
+# coding=utf-8
+"""Tests for the PROSAIL look-up-table creation.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from enmapbox.apps.lmuvegetationapps.Resources.PROSAIL.call_model import InitModel, read_lut_ensemble
+
+
+class test_call_model(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.lut_dir = self.tmpdir.name + os.sep
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def createLut(self, name, store="npy", n_jobs=1):
+        # 2 geometry ensembles of 4 runs each, split into 2 files of at most 3 runs; all parameters are fixed or
+        # logically distributed, so that all LUTs have the same para_grid
+        model = InitModel(lop="prospectD", canopy_arch="sail")
+        model.initialize_vectorized(LUT_dir=self.lut_dir, LUT_name=name, ns=1, max_per_file=3, soil=[0.1] * 2101,
+                                    depends=0, n_jobs=n_jobs, store=store,
+                                    tts=[20.0, 40.0, 2], tto=[0.0], psi=[0.0], N=[1.5], cab=[40.0], cw=[0.01],
+                                    cm=[0.005], LAI=[1.0, 4.0, 4], LIDF=[45.0], typeLIDF=[2], hspot=[0.1], psoil=[0.5],
+                                    car=[8.0], cbrown=[0.0], anth=[0.0], cp=[0.0], cbc=[0.0])
+        return [np.array(read_lut_ensemble(self.lut_dir + name, geo_ensemble, 2, store)) for geo_ensemble in range(2)]
+
+    def test_memmapStore(self):
+        gold = self.createLut("npy")
+        luts = self.createLut("memmap", store="memmap")
+        for lut, gold_lut in zip(luts, gold):
+            self.assertEqual(gold_lut.dtype, lut.dtype)
+            self.assertEqual((21 + 2101, 4), lut.shape)
+            np.testing.assert_array_equal(gold_lut, lut)
+
+    def test_parallel(self):
+        gold = self.createLut("serial")
+        for store in ["npy", "memmap"]:
+            luts = self.createLut("parallel_" + store, store=store, n_jobs=2)
+            for lut, gold_lut in zip(luts, gold):
+                np.testing.assert_array_equal(gold_lut, lut)
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=False)
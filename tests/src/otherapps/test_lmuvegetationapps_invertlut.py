@@ -0,0 +1,47 @@
+# coding=utf-8
+"""Tests for the batched look-up-table inversion.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+import unittest
+
+import numpy as np
+
+from enmapbox.apps.lmuvegetationapps.LUT.InvertLUT_core import RTMInversion
+
+
+class test_InvertLUT_core(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.lut = rng.random((20, 50))  # nbands x nlut
+        self.image = rng.random((7, 20))  # npixel x nbands
+
+    def test_costfun_batch(self):
+        for ctype in [1, 2, 3]:
+            estimates = RTMInversion._costfun_batch(image_ref=self.image, model_ref=self.lut, ctype=ctype)
+            self.assertEqual((7, 50), estimates.shape)
+            for ipixel, mydata in enumerate(self.image):
+                gold = RTMInversion._costfun(image_ref=mydata[:, np.newaxis], model_ref=self.lut, ctype=ctype)
+                np.testing.assert_allclose(gold, estimates[ipixel])
+
+    def test_nbest_fits(self):
+        inversion = RTMInversion()
+        inversion.nbfits = 5
+        for ctype in [1, 2, 3]:
+            inversion.ctype = ctype
+            nbest_subset = inversion._nbest_fits(image_ref=self.image, lut=self.lut)
+            self.assertEqual((7, 5), nbest_subset.shape)
+            for ipixel, mydata in enumerate(self.image):
+                estimates = RTMInversion._costfun(image_ref=mydata[:, np.newaxis], model_ref=self.lut, ctype=ctype)
+                gold = np.argpartition(estimates, inversion.nbfits)[0:inversion.nbfits]
+                self.assertEqual(sorted(gold), sorted(nbest_subset[ipixel]))
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=False)